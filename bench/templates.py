@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Template Benchmark for BlockchainPlus Bot
+Per-render cost of the static screens: the old handlers (templates_baseline.py,
+run verbatim) vs a lookup in the pre-rendered screen registry.
+
+Usage: python bench/templates.py [iterations]
+Needs the same environment variables as the bot; main.py is imported, not started.
+"""
+import json
+import os
+import sys
+import tempfile
+import timeit
+from types import SimpleNamespace
+
+# Keep the throwaway database out of the working directory
+os.environ.setdefault('DATABASE_PATH', tempfile.mkdtemp(prefix='bench_templates_'))
+
+# The bot's modules live one directory up
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+import templates_baseline as baseline
+
+UID = 1
+
+class RecordingBot:
+    """Stands in for telebot: keeps what would be sent, markup serialized as telebot does"""
+    
+    def send_message(self, chat_id, text, parse_mode=None, reply_markup=None):
+        self.sent = (text, reply_markup.to_json() if reply_markup else None)
+    
+    def edit_message_text(self, text, chat_id=None, message_id=None, parse_mode=None, reply_markup=None):
+        self.sent = (text, reply_markup.to_json() if reply_markup else None)
+    
+    def answer_callback_query(self, *args, **kwargs):
+        pass
+
+class FixedUser:
+    def __init__(self):
+        self.user = {}
+    
+    def fetch_user(self, uid):
+        return self.user
+
+baseline.bot = RecordingBot()
+baseline.user_db = FixedUser()
+baseline.PRICING = main.PRICING
+baseline.TUTORIALS = main.tutorial_catalog
+baseline.commission_engine = main.commission_engine
+baseline.MINIMUM_PAYOUT = main.MINIMUM_PAYOUT
+
+def help_call(topic: str):
+    return SimpleNamespace(id='0', data=topic, from_user=SimpleNamespace(id=UID),
+                           message=SimpleNamespace(message_id=1))
+
+# (screen, registry params, user seen by the old handler, old handler call)
+SCREENS = [
+    ('main_menu', {'program': 'crypto', 'affiliate': 'none'}, {'program': 'crypto'},
+     lambda: baseline.show_main_menu_from_callback(UID, 1)),
+    ('compact_menu', {'program': 'forex', 'is_affiliate': True}, {'is_affiliate': True},
+     lambda: baseline.send_compact_menu(UID, 'forex')),
+    ('welcome', {'program': 'crypto'}, {'program': 'crypto'},
+     lambda: baseline.show_welcome(UID, 1)),
+    ('help_menu', {}, {}, lambda: baseline.show_help_menu(UID, 1)),
+    ('help_topic', {'topic': 'help_faq'}, {}, lambda: baseline.handle_help_callback(help_call('help_faq'))),
+    ('tutorials_menu', {}, {}, lambda: baseline.show_tutorials_menu(UID, 1)),
+    ('commission_structure', {'on_date': main.datetime.now().strftime('%Y-%m-%d')}, {},
+     lambda: baseline.show_commission_structure(UID, 1))
+]
+
+def main_bench(iterations: int):
+    print(f"{'screen':<22}{'before (us)':>14}{'after (us)':>14}{'speedup':>10}")
+    for name, params, user, legacy in SCREENS:
+        baseline.user_db.user = user
+        legacy()
+        text, markup = main.screens.render(name, **params)
+        if baseline.bot.sent[0] != text or json.loads(baseline.bot.sent[1]) != json.loads(markup):
+            print(f"{name:<22}(baseline output differs from the registry)")
+        before = timeit.timeit(legacy, number=iterations)
+        after = timeit.timeit(lambda: main.screens.render(name, **params), number=iterations)
+        before_us = before / iterations * 1e6
+        after_us = after / iterations * 1e6
+        print(f"{name:<22}{before_us:>14.2f}{after_us:>14.2f}{before_us / after_us:>9.0f}x")
+
+if __name__ == "__main__":
+    main_bench(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
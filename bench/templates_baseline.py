@@ -0,0 +1,603 @@
+#!/usr/bin/env python3
+"""
+Baseline for bench/templates.py: the screen handlers as they were before the
+screen registry, copied verbatim from main.py (only the help handler's
+@bot.callback_query_handler decorator is dropped).
+
+The handlers' globals are supplied by templates.py: `bot` records what
+telebot would send (the reply_markup serialized with to_json, as telebot does),
+`user_db` returns a fixed user; PRICING, commission_engine, MINIMUM_PAYOUT and
+TUTORIALS (now the tutorial catalog, only its len is used) come from main.
+"""
+import logging
+
+from telebot import types
+
+logger = logging.getLogger(__name__)
+
+# Set by templates.py
+bot = None
+user_db = None
+PRICING = TUTORIALS = commission_engine = MINIMUM_PAYOUT = None
+
+def show_commission_structure(uid: int, message_id: int = None):
+    """Show commission structure to user"""
+    # Rates currently in effect (the engine applies any scheduled changes)
+    sections = [("📚 <b>Academy Subscription</b>", 'academy', None)] + [
+        (f"💎 <b>VIP Signals - {label}</b>", 'vip', duration)
+        for duration, label in (('monthly', 'Monthly'), ('3_months', '3 Months'),
+                                ('6_months', '6 Months'), ('yearly', '1 Year'))
+    ]
+    
+    text = (
+        "💰 <b>Affiliate Commission Structure</b>\n\n"
+        "<b>Earn commissions on every successful referral:</b>\n\n"
+    )
+    for title, plan_type, duration in sections:
+        plan = PRICING['crypto'][plan_type] if plan_type == 'academy' else PRICING['crypto']['vip'][duration]
+        price = commission_engine.price_ngn(plan['ngn'])
+        rate = commission_engine.rate_for(plan_type, duration)
+        text += (
+            f"{title}\n"
+            f"• Commission Rate: <b>{rate*100}%</b>\n"
+            f"• Example: ₦{price:,.0f} × {rate*100}% = <b>₦{price * rate:,.0f}</b>\n\n"
+        )
+    
+    text += (
+        f"🎯 <b>Minimum Payout:</b> ₦{MINIMUM_PAYOUT:,.2f}\n"
+        f"⏰ <b>Payout Processing:</b> 7 business days\n\n"
+        
+        "<b>How It Works:</b>\n"
+        "1. Share your unique referral link\n"
+        "2. When someone clicks and subscribes\n"
+        "3. You earn commission automatically!\n"
+        "4. Request payout when you reach minimum\n"
+        "5. Get paid within 7 business days\n\n"
+        
+        "Start earning today by sharing your referral link! 🚀"
+    )
+    
+    kb = types.InlineKeyboardMarkup()
+    kb.row(
+        types.InlineKeyboardButton("🤝 Apply to Become Affiliate", callback_data="affiliate_apply"),
+        types.InlineKeyboardButton("📱 Back to Menu", callback_data="mainmenu_back")
+    )
+    
+    if message_id:
+        bot.edit_message_text(text, uid, message_id, parse_mode='HTML', reply_markup=kb)
+    else:
+        bot.send_message(uid, text, parse_mode='HTML', reply_markup=kb)
+
+def send_compact_menu(uid: int, program: str):
+    """Send compact menu with main menu button - FIXED AFFILIATE BUTTON LOGIC"""
+    program_name = "Crypto" if program == "crypto" else "Forex"
+    
+    # Check if user is affiliate
+    user = user_db.fetch_user(uid)
+    is_affiliate = user and user.get('is_affiliate')
+    affiliate_pending = user and user.get('affiliate_status') == 'pending'
+    
+    # Compact keyboard
+    kb = types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
+    kb.row("📱 Main Menu", "📌 Contact Admin")
+    
+    # FIXED: Show "Affiliate Dashboard" if user is approved affiliate
+    # Show "Become an Affiliate" if user is not approved (including pending and rejected)
+    if is_affiliate:
+        kb.row("🤝 Affiliate Dashboard", "❓ Help")
+    else:
+        kb.row("🤝 Become an Affiliate", "❓ Help")
+    
+    welcome_text = (
+        f"👋 Welcome to BlockchainPlus {program_name} Program!\n\n"
+        f"🔹 <b>Main Menu:</b> Access all features\n"
+        f"🔹 <b>Contact Admin:</b> Get support\n"
+    )
+    
+    if is_affiliate:
+        welcome_text += f"🔹 <b>Affiliate Dashboard:</b> Track earnings & referrals\n"
+    else:
+        welcome_text += f"🔹 <b>Become an Affiliate:</b> Earn commissions\n"
+    
+    welcome_text += f"🔹 <b>Help:</b> Quick assistance\n\n"
+    welcome_text += f"Tap <b>📱 Main Menu</b> to get started!"
+    
+    bot.send_message(uid, welcome_text, parse_mode='HTML', reply_markup=kb)
+
+def show_main_menu_from_callback(uid: int, message_id: int):
+    """Show main menu from callback - FIXED AFFILIATE BUTTON LOGIC"""
+    try:
+        user = user_db.fetch_user(uid)
+        program = user.get('program', 'crypto') if user else 'crypto'
+        
+        program_name = "Crypto" if program == "crypto" else "Forex"
+        
+        # Main menu dashboard
+        menu_text = (
+            f"📱 <b>{program_name} Program Dashboard</b>\n\n"
+            f"Select an option below:\n\n"
+            f"🔹 <b>Account & Subscriptions</b>\n"
+            f"• 👋 Welcome: Program overview\n"
+            f"• ⏳ Check Status: Subscription details\n"
+            f"• 💳 Make Payment: Subscribe/renew\n\n"
+            f"🔹 <b>Learning Resources</b>\n"
+            f"• 🎥 Tutorials: Video learning\n"
+            f"• 🆘 Help: Support & assistance\n\n"
+            f"🔹 <b>Settings & Support</b>\n"
+            f"• 📌 Contact: Admin support\n"
+            f"• 🔄 Switch: Change program\n"
+            f"• ❓ Help: Quick assistance\n"
+        )
+        
+        # Add affiliate option based on user status
+        if user and user.get('is_affiliate'):
+            menu_text += f"\n🔹 <b>Affiliate Program</b>\n• 🤝 Affiliate Dashboard: Track earnings\n"
+        elif user and user.get('affiliate_status') == 'pending':
+            menu_text += f"\n🔹 <b>Affiliate Program</b>\n• ⏳ Affiliate Application: Pending approval\n"
+        else:
+            menu_text += f"\n🔹 <b>Affiliate Program</b>\n• 🤝 Become an Affiliate: Earn commissions\n"
+        
+        # Add recommended exchanges option
+        menu_text += f"\n🔹 <b>Trading Platforms</b>\n• 🚀 Recommended Exchanges: Best platforms to trade\n"
+        
+        # Create inline keyboard for main menu
+        kb = types.InlineKeyboardMarkup(row_width=2)
+        
+        # Account & Subscriptions
+        kb.row(
+            types.InlineKeyboardButton("👋 Welcome", callback_data="mainmenu_welcome"),
+            types.InlineKeyboardButton("⏳ Check Status", callback_data="mainmenu_status")
+        )
+        kb.row(
+            types.InlineKeyboardButton("💳 Make Payment", callback_data="mainmenu_payment"),
+            types.InlineKeyboardButton("🎥 Tutorials", callback_data="mainmenu_tutorials")
+        )
+        kb.row(
+            types.InlineKeyboardButton("🆘 Help Center", callback_data="mainmenu_help"),
+            types.InlineKeyboardButton("📌 Contact Admin", callback_data="mainmenu_contact")
+        )
+        kb.row(
+            types.InlineKeyboardButton("🔄 Switch Program", callback_data="mainmenu_switch"),
+            types.InlineKeyboardButton("🚀 Exchanges", callback_data="mainmenu_exchanges")
+        )
+        
+        # FIXED: Add affiliate button based on user status
+        if user and user.get('is_affiliate'):
+            kb.row(types.InlineKeyboardButton("🤝 Affiliate Dashboard", callback_data="affiliate_dashboard"))
+        elif user and user.get('affiliate_status') == 'pending':
+            kb.row(types.InlineKeyboardButton("⏳ Affiliate Pending", callback_data="affiliate_pending"))
+        else:
+            kb.row(types.InlineKeyboardButton("🤝 Become an Affiliate", callback_data="affiliate_apply"))
+        
+        bot.edit_message_text(
+            menu_text,
+            uid,
+            message_id,
+            parse_mode='HTML',
+            reply_markup=kb
+        )
+        
+    except Exception as e:
+        logger.error(f"Error showing main menu from callback: {e}")
+        bot.send_message(uid, "Error loading menu. Please try again.")
+
+def show_welcome(uid: int, message_id: int = None):
+    """Show welcome message"""
+    user = user_db.fetch_user(uid)
+    program = user.get('program', 'crypto') if user else 'crypto'
+    
+    if program == 'crypto':
+        text = (
+            "🚀 <b>Welcome to BlockchainPlus Crypto Program</b>\n\n"
+            "📚 <b>Crypto Academy</b>\n"
+            "• Learn blockchain and crypto trading step-by-step\n"
+            "• Live Q&A sessions with experts\n"
+            "• Practical trading strategies & risk management\n"
+            "• Access to growing community of crypto traders\n"
+            "• Regular market updates & analysis\n\n"
+            "💎 <b>Crypto VIP Signals</b>\n"
+            "• Premium crypto signals with 70%+ accuracy\n"
+            "• Exclusive DeGen Group for high-reward plays\n"
+            "• Early access to presales & new listings\n"
+            "• Real-time market analysis & alerts\n"
+            "• Priority support from expert traders\n\n"
+            "🔥 <b>DeGen/DeFi Group</b>\n"
+            "• High-risk, high-reward plays\n"
+            "• Included with Crypto VIP Signals\n\n"
+            "✨ <b>Special Bonus:</b> First-time Crypto Academy subscribers receive 3 months FREE VIP Signals + DeGen!\n\n"
+            "<b>Use the Main Menu to:</b>\n"
+            "• Check your subscription status\n"
+            "• Make payment to subscribe\n"
+            "• Access tutorial videos\n"
+            "• Get help and support\n"
+            "• View recommended exchanges"
+        )
+    else:
+        text = (
+            "📈 <b>Welcome to BlockchainPlus Forex Program</b>\n\n"
+            "📚 <b>Forex Academy</b>\n"
+            "• Learn forex trading step-by-step\n"
+            "• Live trading sessions & market analysis\n"
+            "• Risk management & psychology training\n"
+            "• Proven entry/exit strategies\n"
+            "• Community support & peer learning\n\n"
+            "💎 <b>Forex VIP Signals</b>\n"
+            "• High-probability forex signals\n"
+            "• Real-time trade setups & alerts\n"
+            "• Economic calendar analysis\n"
+            "• Risk-reward ratio guidance\n"
+            "• VIP community & mastermind sessions\n\n"
+            "✨ <b>Special Bonus:</b> First-time Forex Academy subscribers receive 3 months FREE VIP Signals!\n\n"
+            "<b>Use the Main Menu to:</b>\n"
+            "• Check your subscription status\n"
+            "• Make payment to subscribe\n"
+            "• Access tutorial videos\n"
+            "• Get help and support\n"
+            "• View recommended exchanges"
+        )
+    
+    kb = types.InlineKeyboardMarkup()
+    kb.row(
+        types.InlineKeyboardButton("📱 Back to Menu", callback_data="mainmenu_back"),
+        types.InlineKeyboardButton("💳 Make Payment", callback_data="mainmenu_payment")
+    )
+    kb.row(
+        types.InlineKeyboardButton("🚀 Exchanges", callback_data="mainmenu_exchanges"),
+        types.InlineKeyboardButton("🎥 Tutorials", callback_data="mainmenu_tutorials")
+    )
+    
+    if message_id:
+        bot.edit_message_text(text, uid, message_id, parse_mode='HTML', reply_markup=kb)
+    else:
+        bot.send_message(uid, text, parse_mode='HTML', reply_markup=kb)
+
+def show_tutorials_menu(uid: int, message_id: int = None):
+    """Show tutorials menu"""
+    text = (
+        "🎬 <b>BlockchainPlus Tutorial Library</b>\n\n"
+        f"Access our comprehensive collection of {len(TUTORIALS)} trading tutorials:\n\n"
+        "📊 <b>Bybit Tutorials:</b> Complete trading guides\n"
+        "💼 <b>Binance Tutorials:</b> Exchange walkthroughs\n"
+        "🔄 <b>Other Exchanges:</b> Ourbit, Bitunix, MEXC\n"
+        "📈 <b>Trading Strategies:</b> Risk management, profits\n"
+        "📚 <b>Trading Education:</b> Beginner to advanced\n"
+        "🔒 <b>Security Guides:</b> Stay safe while trading\n\n"
+        "Select a category below:"
+    )
+    
+    kb = types.InlineKeyboardMarkup(row_width=2)
+    kb.add(types.InlineKeyboardButton("📊 Bybit Tutorials", callback_data="tut_cat:bybit"))
+    kb.add(types.InlineKeyboardButton("💼 Binance Tutorials", callback_data="tut_cat:binance"))
+    kb.add(types.InlineKeyboardButton("🔄 Other Exchanges", callback_data="tut_cat:exchanges"))
+    kb.add(types.InlineKeyboardButton("📈 Trading Strategies", callback_data="tut_cat:strategies"))
+    kb.add(types.InlineKeyboardButton("📚 Trading Education", callback_data="tut_cat:education"))
+    kb.add(types.InlineKeyboardButton("🔒 Security Guides", callback_data="tut_cat:security"))
+    kb.add(types.InlineKeyboardButton("🔍 Search Tutorials", callback_data="tut_search"))
+    kb.add(types.InlineKeyboardButton("📱 Back to Menu", callback_data="mainmenu_back"))
+    
+    if message_id:
+        bot.edit_message_text(text, uid, message_id, parse_mode='HTML', reply_markup=kb)
+    else:
+        bot.send_message(uid, text, parse_mode='HTML', reply_markup=kb)
+
+def show_help_menu(uid: int, message_id: int = None):
+    """Show help menu"""
+    text = (
+        "🆘 <b>BlockchainPlus Help Center</b>\n\n"
+        "Get assistance for:\n\n"
+        "🔹 <b>Technical Issues:</b>\n"
+        "• Problems joining groups\n"
+        "• Payment verification\n"
+        "• Subscription status\n\n"
+        "🔹 <b>Trading Assistance:</b>\n"
+        "• Understanding trading concepts\n"
+        "• Platform navigation\n"
+        "• Strategy explanations\n\n"
+        "🔹 <b>Account & Billing:</b>\n"
+        "• Payment methods\n"
+        "• Subscription renewals\n"
+        "• Account access\n\n"
+        "Select an option below:"
+    )
+    
+    kb = types.InlineKeyboardMarkup(row_width=2)
+    kb.add(
+        types.InlineKeyboardButton("📞 Contact Support", url="https://t.me/blockchainpluspro"),
+        types.InlineKeyboardButton("📚 FAQ & Guides", callback_data="help_faq")
+    )
+    kb.add(
+        types.InlineKeyboardButton("💳 Payment Help", callback_data="help_payment"),
+        types.InlineKeyboardButton("🚀 Getting Started", callback_data="help_started")
+    )
+    kb.add(
+        types.InlineKeyboardButton("🎯 Trading Basics", callback_data="help_trading"),
+        types.InlineKeyboardButton("🔐 Account Security", callback_data="help_security")
+    )
+    kb.add(
+        types.InlineKeyboardButton("📧 Email Support", callback_data="help_email"),
+        types.InlineKeyboardButton("🔗 Official Channels", callback_data="help_official")
+    )
+    kb.add(types.InlineKeyboardButton("📱 Back to Menu", callback_data="mainmenu_back"))
+    
+    if message_id:
+        bot.edit_message_text(text, uid, message_id, parse_mode='HTML', reply_markup=kb)
+    else:
+        bot.send_message(uid, text, parse_mode='HTML', reply_markup=kb)
+
+def handle_help_callback(call: types.CallbackQuery):
+    """Handle all help-related callbacks"""
+    try:
+        uid = call.from_user.id
+        help_type = call.data
+        
+        help_responses = {
+            "help_faq": {
+                "title": "📚 <b>Blockchain Plus Hub – Frequently Asked Questions (FAQs)</b>",
+                "content": (
+                    "<b>📋 General Information</b>\n\n"
+                    "<b>Q: What is Blockchain Plus Hub?</b>\n"
+                    "A: Blockchain Plus Hub is an educational and trading-focused platform designed to help individuals learn, grow, and earn through Forex trading and Cryptocurrency trading & investing.\n\n"
+                    
+                    "<b>Q: Who is Blockchain Plus Hub for?</b>\n"
+                    "A: Blockchain Plus Hub is for:\n"
+                    "• Beginners who want to learn Forex or Crypto from scratch\n"
+                    "• Intermediate traders looking to improve consistency\n"
+                    "• Advanced traders seeking structured systems and discipline\n"
+                    "• Investors who want to understand crypto markets properly\n\n"
+                    
+                    "<b>Q: Is Blockchain Plus Hub an investment company?</b>\n"
+                    "A: No. We are NOT an investment firm and do not accept funds to trade on behalf of members. We are an education, signals, and mentorship platform.\n\n"
+                    
+                    "<b>💱 Forex Trading Program FAQs</b>\n\n"
+                    "<b>Q: What is the Forex Trading Program about?</b>\n"
+                    "A: The Forex Trading Program teaches members how to trade the foreign exchange market using proven strategies, proper risk management, and market psychology.\n\n"
+                    
+                    "<b>Q: Is the Forex program suitable for beginners?</b>\n"
+                    "A: Yes. The Forex program starts from the basics and gradually moves to advanced concepts.\n\n"
+                    
+                    "<b>Q: Do you provide Forex trading signals?</b>\n"
+                    "A: Yes. Members may receive Forex trading signals including entry points, stop loss, and take profit levels.\n\n"
+                    
+                    "<b>🚀 Cryptocurrency Program FAQs</b>\n\n"
+                    "<b>Q: What is the Crypto Trading & Investment Program about?</b>\n"
+                    "A: The Crypto program focuses on helping members understand and profit from the cryptocurrency market through spot trading, futures trading, and long-term investing.\n\n"
+                    
+                    "<b>Q: Do you provide crypto signals?</b>\n"
+                    "A: Yes. Crypto signals may include spot trade entries, futures trade setups, and market structure updates.\n\n"
+                    "<b>Q: Is Futures trading included?</b>\n"
+                    "A: Yes, but Futures trading is recommended only for experienced traders.\n\n"
+                    
+                    "<b>📝 Membership & Access</b>\n\n"
+                    "<b>Q: What do I get when I join?</b>\n"
+                    "A: Depending on your subscription, you may receive educational materials, trading signals, community support via Telegram, mentorship, and challenges.\n\n"
+                    
+                    "<b>⚠️ Risk & Disclaimer</b>\n\n"
+                    "<b>Q: Are profits guaranteed?</b>\n"
+                    "A: NO. There are NO guaranteed profits in trading or investing. Results vary based on market conditions, discipline, capital, and risk management.\n\n"
+                    
+                    "<b>Q: Can I lose money?</b>\n"
+                    "A: Yes. Trading involves risk, and losses are possible. Never trade with money you cannot afford to lose.\n\n"
+                    
+                    "<b>👥 Community & Support</b>\n\n"
+                    "<b>Q: Is there a community I can join?</b>\n"
+                    "A: Yes. Members gain access to our Telegram community for market updates, questions, and experience sharing.\n\n"
+                    
+                    "<b>🎯 Getting Started</b>\n\n"
+                    "<b>Q: How do I join Blockchain Plus Hub?</b>\n"
+                    "A: You can join by following the official registration or subscription links shared by Blockchain Plus Hub admins.\n\n"
+                    
+                    "<b>📢 Final Note:</b> Blockchain Plus Hub is built to educate, guide, and empower traders—not to promise unrealistic profits. Success comes from consistency, patience, and continuous learning."
+                ),
+                "buttons": [
+                    {"text": "📞 Contact Support", "url": "https://t.me/blockchainpluspro"},
+                    {"text": "📱 Back to Menu", "callback_data": "mainmenu_back"}
+                ]
+            },
+            "help_payment": {
+                "title": "💳 <b>Payment Help & Support</b>",
+                "content": (
+                    "<b>Payment Issues & Solutions:</b>\n\n"
+                    
+                    "🔸 <b>Payment Not Verified?</b>\n"
+                    "• Upload clear POP (Proof of Payment)\n"
+                    "• Include transaction ID and amount\n"
+                    "• Allow 1 hour for verification\n\n"
+                    
+                    "🔸 <b>Accepted Payment Methods:</b>\n"
+                    "• 🇳🇬 NGN: Opay & MoniePoint\n"
+                    "• 💎 USDT: BEP20, TRC20, or TON\n\n"
+                    
+                    "🔸 <b>Payment Security Tips:</b>\n"
+                    "• Verify account details before sending\n"
+                    "• Keep transaction screenshots\n"
+                    "• Contact us immediately for issues\n\n"
+                    
+                    "<b>Need help?</b> Contact @blockchainpluspro"
+                ),
+                "buttons": [
+                    {"text": "📞 Payment Support", "url": "https://t.me/blockchainpluspro"},
+                    {"text": "💳 Make Payment", "callback_data": "mainmenu_payment"},
+                    {"text": "📱 Back to Menu", "callback_data": "mainmenu_back"}
+                ]
+            },
+            "help_started": {
+                "title": "🚀 <b>Getting Started Guide</b>",
+                "content": (
+                    "<b>Welcome! Follow these steps:</b>\n\n"
+                    
+                    "1️⃣ <b>Choose Your Program</b>\n"
+                    "• Select Crypto or Forex\n"
+                    "• Use 'Switch Program' to change later\n\n"
+                    
+                    "2️⃣ <b>Subscribe to a Plan</b>\n"
+                    "• Academy: Complete education (1 year)\n"
+                    "• VIP: Premium signals (choose duration)\n"
+                    "• Use 'Make Payment' to subscribe\n\n"
+                    
+                    "3️⃣ <b>Join Your Groups</b>\n"
+                    "• Added automatically after approval\n"
+                    "• Save group links for easy access\n\n"
+                    
+                    "4️⃣ <b>Learn & Trade</b>\n"
+                    "• Watch tutorials in 'Tutorials'\n"
+                    "• Check subscription status anytime\n"
+                    "• Contact admin for guidance\n\n"
+                    
+                    "<b>Pro Tip:</b> Start with Academy + FREE VIP trial!"
+                ),
+                "buttons": [
+                    {"text": "🎥 Watch Tutorials", "callback_data": "mainmenu_tutorials"},
+                    {"text": "💳 Subscribe Now", "callback_data": "mainmenu_payment"},
+                    {"text": "📱 Back to Menu", "callback_data": "mainmenu_back"}
+                ]
+            },
+            "help_trading": {
+                "title": "🎯 <b>Trading Basics & Essentials</b>",
+                "content": (
+                    "<b>Essential Trading Knowledge:</b>\n\n"
+                    
+                    "📊 <b>Key Concepts:</b>\n"
+                    "• Spot vs Futures trading\n"
+                    "• Risk management strategies\n"
+                    "• Market analysis techniques\n"
+                    "• Position sizing basics\n\n"
+                    
+                    "🛡️ <b>Risk Management:</b>\n"
+                    "• Never risk more than 2% per trade\n"
+                    "• Always use stop-loss orders\n"
+                    "• Diversify your portfolio\n"
+                    "• Keep emotions in check\n\n"
+                    
+                    "📈 <b>Learning Path:</b>\n"
+                    "1. Start with our tutorial videos\n"
+                    "2. Join Academy for structured learning\n"
+                    "3. Practice with demo accounts first\n"
+                    "4. Apply VIP signals with small amounts\n"
+                ),
+                "buttons": [
+                    {"text": "🎬 Watch Tutorials", "callback_data": "tut_cat:strategies"},
+                    {"text": "📚 Beginner Guides", "callback_data": "tut_cat:education"},
+                    {"text": "📱 Back to Menu", "callback_data": "mainmenu_back"}
+                ]
+            },
+            "help_security": {
+                "title": "🔐 <b>Account Security Guide</b>",
+                "content": (
+                    "<b>Protect Your Accounts & Funds:</b>\n\n"
+                    
+                    "🛡️ <b>Essential Security:</b>\n"
+                    "• Use strong, unique passwords\n"
+                    "• Enable 2FA on all exchanges\n"
+                    "• Never share full-permission API keys\n"
+                    "• Beware of phishing links\n\n"
+                    
+                    "🚫 <b>Common Scams to Avoid:</b>\n"
+                    "• Fake support accounts\n"
+                    "• 'Guaranteed profit' schemes\n"
+                    "• Unverified investment opportunities\n"
+                    "• Impersonation of our team\n\n"
+                    
+                    "✅ <b>Official Channels Only:</b>\n"
+                    "• This bot is official\n"
+                    "• Admin: @blockchainpluspro\n"
+                    "• Never send funds to random addresses\n"
+                ),
+                "buttons": [
+                    {"text": "🎥 Security Tutorial", "callback_data": "tut_cat:security"},
+                    {"text": "📞 Report Issue", "url": "https://t.me/blockchainpluspro"},
+                    {"text": "📱 Back to Menu", "callback_data": "mainmenu_back"}
+                ]
+            },
+            "help_email": {
+                "title": "📧 <b>Email Support</b>",
+                "content": (
+                    "<b>For comprehensive support, email:</b>\n\n"
+                    "📨 <b>Support Email:</b>\n"
+                    "blockchainplushub@gmail.com\n\n"
+                    
+                    "<b>Include in your email:</b>\n"
+                    "1. Your Telegram ID\n"
+                    "2. Brief description of issue\n"
+                    "3. Screenshots if applicable\n"
+                    "4. Transaction IDs for payments\n\n"
+                    
+                    "<b>Response Time:</b>\n"
+                    "• Usually within 24 hours\n"
+                    "• Faster via Telegram\n"
+                    "• Business hours: 9 AM - 6 PM GMT+1\n"
+                ),
+                "buttons": [
+                    {"text": "📞 Telegram Support", "url": "https://t.me/blockchainpluspro"},
+                    {"text": "📱 Back to Menu", "callback_data": "mainmenu_back"}
+                ]
+            },
+            "help_official": {
+                "title": "🔗 <b>Official Channels & Social Media</b>",
+                "content": (
+                    "<b>Stay Connected with Blockchain Plus Hub:</b>\n\n"
+                    
+                    "📢 <b>Official Telegram Channel:</b>\n"
+                    "Get updates, announcements, and market insights\n\n"
+                    
+                    "🎬 <b>YouTube Channel:</b>\n"
+                    "Watch our latest tutorials, trading guides, and educational content\n\n"
+                    
+                    "🎵 <b>TikTok:</b>\n"
+                    "Short-form trading tips and market updates\n\n"
+                    
+                    "🐦 <b>Twitter/X:</b>\n"
+                    "Follow for crypto news, trading insights, and community updates\n\n"
+                    
+                    "📍 <b>Always verify you're following our official channels to avoid scams!</b>"
+                ),
+                "buttons": [
+                    {"text": "📢 Telegram Channel", "url": "https://t.me/blockchainplushub"},
+                    {"text": "🎬 YouTube Channel", "url": "https://www.youtube.com/@Blockchainplushub"},
+                    {"text": "🎵 TikTok", "url": "https://www.tiktok.com/@blockchainplus?_r=1&_t=ZS-92vZFPIWKV2"},
+                    {"text": "🐦 Twitter/X", "url": "https://x.com/bcplushub?t=aiphzEilvUyoptHO64MyEA&s=09"},
+                    {"text": "📞 Contact Admin", "url": "https://t.me/blockchainpluspro"},
+                    {"text": "📱 Back to Menu", "callback_data": "mainmenu_back"}
+                ]
+            }
+        }
+        
+        response = help_responses.get(help_type)
+        if not response:
+            bot.answer_callback_query(call.id, "Help topic not found.")
+            return
+        
+        # Create message text
+        message_text = f"{response['title']}\n\n{response['content']}"
+        
+        # Create keyboard
+        kb = types.InlineKeyboardMarkup(row_width=2)
+        
+        # Add buttons in rows
+        buttons = []
+        for btn in response.get("buttons", []):
+            if 'url' in btn:
+                buttons.append(types.InlineKeyboardButton(btn['text'], url=btn['url']))
+            else:
+                buttons.append(types.InlineKeyboardButton(btn['text'], callback_data=btn['callback_data']))
+        
+        # Arrange buttons in rows of 2
+        for i in range(0, len(buttons), 2):
+            if i + 1 < len(buttons):
+                kb.row(buttons[i], buttons[i+1])
+            else:
+                kb.row(buttons[i])
+        
+        # Edit the message
+        bot.edit_message_text(
+            message_text,
+            uid,
+            call.message.message_id,
+            parse_mode='HTML',
+            reply_markup=kb
+        )
+        
+        bot.answer_callback_query(call.id)
+        
+    except Exception as e:
+        logger.error(f"Error in help callback: {e}")
+        bot.answer_callback_query(call.id, "Error loading help information.")
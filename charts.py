@@ -0,0 +1,158 @@
+# charts.py - Server-rendered PNG charts for admin reports
+import io
+import logging
+import multiprocessing
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Optional, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+CHART_SIZE = (800, 450)
+CHART_COLORS = [(46, 134, 222), (39, 174, 96), (231, 76, 60), (243, 156, 18)]
+
+# ====================
+# RENDERING (runs in worker processes)
+# ====================
+
+def render_series_chart(title: str, labels: List[str], series: List[Tuple[str, List[float]]]) -> bytes:
+    """Render a grouped bar chart to PNG bytes"""
+    # Imported here so only the worker processes pay for Pillow
+    from PIL import Image, ImageDraw, ImageFont
+
+    width, height = CHART_SIZE
+    left, right, top, bottom = 90, 20, 50, 45
+    plot_w = width - left - right
+    plot_h = height - top - bottom
+    x0, y0 = left, height - bottom
+
+    img = Image.new('RGB', CHART_SIZE, 'white')
+    draw = ImageDraw.Draw(img)
+    font = ImageFont.load_default()
+
+    draw.text((left, 15), title, fill='black', font=font)
+
+    max_value = max([max(values) for _, values in series if values] + [0]) or 1
+
+    # Gridlines and Y axis labels
+    for step in range(5):
+        value = max_value * step / 4
+        y = y0 - plot_h * step / 4
+        draw.line([(x0, y), (width - right, y)], fill=(230, 230, 230))
+        draw.text((8, y - 6), f"{value:,.0f}", fill='black', font=font)
+    draw.line([(x0, top), (x0, y0), (width - right, y0)], fill='black')
+
+    # Bars
+    count = max(len(labels), 1)
+    group_w = plot_w / count
+    bar_w = max(group_w / (len(series) + 1), 1)
+    for s_idx, (_, values) in enumerate(series):
+        color = CHART_COLORS[s_idx % len(CHART_COLORS)]
+        for i, value in enumerate(values):
+            if value <= 0:
+                continue
+            bar_left = x0 + i * group_w + (s_idx + 0.5) * bar_w
+            bar_top = y0 - plot_h * value / max_value
+            draw.rectangle([bar_left, bar_top, bar_left + bar_w - 1, y0 - 1], fill=color)
+
+    # X axis labels (thinned so they don't overlap)
+    label_every = max(1, count // 10)
+    for i, label in enumerate(labels):
+        if i % label_every == 0:
+            draw.text((x0 + i * group_w + 2, y0 + 6), label, fill='black', font=font)
+
+    # Legend
+    legend_x = width - right - 150 * len(series)
+    for s_idx, (name, _) in enumerate(series):
+        color = CHART_COLORS[s_idx % len(CHART_COLORS)]
+        x = legend_x + s_idx * 150
+        draw.rectangle([x, 18, x + 10, 28], fill=color)
+        draw.text((x + 15, 17), name, fill='black', font=font)
+
+    out = io.BytesIO()
+    img.save(out, format='PNG', optimize=True)
+    return out.getvalue()
+
+# ====================
+# CHART CACHE
+# ====================
+
+class ChartCache:
+    """Renders charts in a process pool and caches PNGs / Telegram file_ids.
+
+    Keys are (report, time bucket, data version) tuples, so a chart is only
+    rendered once per bucket until the underlying data changes.
+    Workers are spawned, not forked: the bot process runs many threads, and a
+    forked child can deadlock on a lock one of them held.
+    """
+
+    def __init__(self, max_workers: int = 2, max_entries: int = 64):
+        self.max_workers = max_workers
+        self.max_entries = max_entries
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._pngs: 'OrderedDict[Tuple, bytes]' = OrderedDict()
+        self._file_ids: 'OrderedDict[Tuple, str]' = OrderedDict()
+        self._in_flight = {}
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers, mp_context=multiprocessing.get_context('spawn')
+            )
+        return self._executor
+
+    def _trim(self, cache: OrderedDict):
+        while len(cache) > self.max_entries:
+            cache.popitem(last=False)
+
+    def get_file_id(self, key) -> Optional[str]:
+        """Telegram file_id of an already uploaded chart, if any"""
+        with self._lock:
+            file_id = self._file_ids.get(key)
+            if file_id:
+                self._file_ids.move_to_end(key)
+            return file_id
+
+    def set_file_id(self, key, file_id: str):
+        """Remember the file_id Telegram assigned after the first upload"""
+        with self._lock:
+            self._file_ids[key] = file_id
+            self._trim(self._file_ids)
+            # The PNG is no longer needed once Telegram has it
+            self._pngs.pop(key, None)
+
+    def render(self, key, title: str, labels: List[str], series: List[Tuple[str, List[float]]]) -> Future:
+        """Return a future resolving to PNG bytes; concurrent requests share one render"""
+        with self._lock:
+            png = self._pngs.get(key)
+            if png is not None:
+                future = Future()
+                future.set_result(png)
+                return future
+
+            future = self._in_flight.get(key)
+            if future is not None:
+                return future
+
+            future = self._get_executor().submit(render_series_chart, title, labels, series)
+            self._in_flight[key] = future
+
+        future.add_done_callback(lambda f: self._store(key, f))
+        return future
+
+    def _store(self, key, future: Future):
+        with self._lock:
+            self._in_flight.pop(key, None)
+            if future.cancelled() or future.exception() is not None:
+                logger.error(f"Chart render failed for {key}: {future.exception()}")
+                return
+            self._pngs[key] = future.result()
+            self._trim(self._pngs)
+
+    def shutdown(self):
+        """Stop the worker processes"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,171 @@
+# commission_engine.py - Precompiled pricing/commission tables and what-if recalculation
+import bisect
+import json
+import logging
+import re
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Used when a plan/duration has no configured rate
+DEFAULT_RATE = 0.15
+
+CURRENCY_SYMBOLS = {'₦': 'ngn', '$': 'usd'}
+
+PRICE_RE = re.compile(r'([₦$])\s*([\d,]+(?:\.\d+)?)')
+
+@lru_cache(maxsize=256)
+def parse_price(text: str) -> Optional[Tuple[float, str]]:
+    """'₦35,000' -> (35000.0, 'ngn'), '$30' -> (30.0, 'usd'), else None"""
+    match = PRICE_RE.search(text or '')
+    if not match:
+        return None
+    return float(match.group(2).replace(',', '')), CURRENCY_SYMBOLS[match.group(1)]
+
+def flatten_rates(rates: Dict) -> Dict[Tuple[str, Optional[str]], float]:
+    """COMMISSION_RATES shape -> {(plan_type, vip_duration): rate}"""
+    flat = {}
+    for plan_type, rate in rates.items():
+        if isinstance(rate, dict):
+            for duration, duration_rate in rate.items():
+                flat[(plan_type, duration)] = float(duration_rate)
+        else:
+            flat[(plan_type, None)] = float(rate)
+    return flat
+
+def load_rate_schedule(path: str) -> List[Tuple[str, Dict]]:
+    """Read [{"effective_from": "YYYY-MM-DD", "rates": {...}}, ...] from a JSON file"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            entries = json.load(f)
+        return [(entry['effective_from'], entry['rates']) for entry in entries]
+    except Exception as e:
+        logger.error(f"Error loading commission rate schedule {path}: {e}")
+        return []
+
+class CommissionEngine:
+    """Commission lookups from tables compiled once from PRICING and COMMISSION_RATES.
+
+    Rates can change over time: `schedule` is a list of (effective_from
+    'YYYY-MM-DD', rates) pairs layered over the base rates, and the rate
+    applied to a sale is the one in effect on the sale date.
+    """
+
+    def __init__(self, pricing: Dict, rates: Dict, fx_rates: Dict[str, float] = None,
+                 schedule: List[Tuple[str, Dict]] = None):
+        self.fx_rates = {'ngn': 1.0}
+        self.fx_rates.update(fx_rates or {})
+
+        # Base rates apply from the beginning of time ('' sorts first)
+        base = flatten_rates(rates)
+        self._effective_dates: List[str] = ['']
+        self._rate_tables: List[Dict[Tuple[str, Optional[str]], float]] = [base]
+        for effective_from, schedule_rates in sorted(schedule or [], key=lambda entry: entry[0]):
+            table = dict(self._rate_tables[-1])
+            table.update(flatten_rates(schedule_rates))
+            self._effective_dates.append(effective_from)
+            self._rate_tables.append(table)
+
+        # Every price string the bot shows, pre-parsed and converted to NGN
+        self._prices: Dict[str, Tuple[float, str]] = {}
+        for program in pricing.values():
+            plans = [program['academy']] + list(program['vip'].values())
+            for plan in plans:
+                for key in ('ngn', 'usd'):
+                    parsed = parse_price(plan[key])
+                    if parsed:
+                        self._prices[plan[key]] = parsed
+
+    def to_ngn(self, amount: float, currency: str) -> float:
+        return amount * self.fx_rates.get(currency, 1.0)
+
+    def price_ngn(self, amount_text: str) -> Optional[float]:
+        """NGN value of a price string; known plan prices skip parsing"""
+        parsed = self._prices.get(amount_text) or parse_price(amount_text)
+        if not parsed:
+            return None
+        return self.to_ngn(*parsed)
+
+    def _table_for(self, on_date: str = None) -> Dict[Tuple[str, Optional[str]], float]:
+        # Scheduled changes only apply once their date arrives
+        on_date = on_date or datetime.now().strftime('%Y-%m-%d')
+        return self._rate_tables[bisect.bisect_right(self._effective_dates, on_date[:10]) - 1]
+
+    def rate_for(self, plan_type: str, vip_duration: Optional[str], on_date: str = None) -> float:
+        """Commission rate for a plan on a date ('YYYY-MM-DD...'; default: latest)"""
+        table = self._table_for(on_date)
+        key = (plan_type, vip_duration if plan_type != 'academy' else None)
+        return table.get(key, DEFAULT_RATE)
+
+    def calculate(self, plan_type: str, vip_duration: Optional[str], amount_text: str,
+                  on_date: str = None) -> Optional[Dict]:
+        """Quote for a sale: commission, base_amount (NGN), rate, currency, fx_rate.
+
+        None if the price can't be read.
+        """
+        parsed = self._prices.get(amount_text) or parse_price(amount_text)
+        if not parsed:
+            return None
+        amount, currency = parsed
+        base = self.to_ngn(amount, currency)
+        rate = self.rate_for(plan_type, vip_duration, on_date)
+        return {
+            'commission': round(base * rate, 2),
+            'base_amount': base,
+            'rate': rate,
+            'currency': currency,
+            'fx_rate': self.fx_rates.get(currency, 1.0)
+        }
+
+    def what_if(self, commissions: Iterable[Dict], rates: Dict = None,
+                fx_rates: Dict[str, float] = None) -> Dict:
+        """Re-price historical commissions under different rates and/or FX.
+
+        Commissions are bucketed by (plan, duration, currency, FX, rate) and each
+        bucket is re-priced once, so the cost is one pass plus one multiply
+        per bucket. Sales recorded before base amounts were stored are backed
+        out from the commission and the rate in effect on their date.
+        """
+        overrides = flatten_rates(rates or {})
+        new_fx = dict(self.fx_rates, **(fx_rates or {}))
+
+        buckets: Dict[Tuple, List[float]] = {}
+        for comm in commissions:
+            plan_type = comm.get('plan_type')
+            duration = comm.get('vip_duration') if plan_type != 'academy' else None
+            rate = comm.get('rate') or self.rate_for(plan_type, duration, comm.get('date'))
+            base = comm.get('base_amount') or (comm['amount'] / rate if rate else 0.0)
+            currency = comm.get('currency') or 'ngn'
+            fx_rate = comm.get('fx_rate') or self.fx_rates.get(currency, 1.0)
+            bucket = buckets.setdefault((plan_type, duration, currency, fx_rate, rate), [0.0, 0.0, 0])
+            bucket[0] += base
+            bucket[1] += comm['amount']
+            bucket[2] += 1
+
+        by_plan: Dict[str, Dict] = {}
+        current_total = proposed_total = 0.0
+        count = 0
+        for (plan_type, duration, currency, fx_rate, rate), (base, current, n) in buckets.items():
+            new_rate = overrides.get((plan_type, duration), rate)
+            # Base amounts are NGN at the FX rate of the sale; rescale foreign ones
+            fx_factor = new_fx.get(currency, 1.0) / fx_rate
+            proposed = base * fx_factor * new_rate
+
+            label = f"{plan_type} {duration}" if duration else plan_type
+            entry = by_plan.setdefault(label, {'count': 0, 'current': 0.0, 'proposed': 0.0})
+            entry['count'] += n
+            entry['current'] += current
+            entry['proposed'] += proposed
+            current_total += current
+            proposed_total += proposed
+            count += n
+
+        return {
+            'count': count,
+            'current_total': round(current_total, 2),
+            'proposed_total': round(proposed_total, 2),
+            'difference': round(proposed_total - current_total, 2),
+            'by_plan': by_plan
+        }
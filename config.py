@@ -67,6 +67,12 @@ if not ton_addr:
 # Database configuration
 DB_FILE = os.getenv('DB_FILE', 'users.json')
 
+# Commission settings
+USD_NGN_RATE = float(os.getenv('USD_NGN_RATE', '1400'))  # FX used to value USD payments in NGN
+COMMISSION_SCHEDULE_FILE = os.getenv('COMMISSION_SCHEDULE_FILE')  # optional JSON of dated rate changes
+TUTORIALS_FILE = os.getenv('TUTORIALS_FILE', 'tutorials.json')  # tutorial library, hot-reloaded on change
+MEDIA_CACHE_CHAT_ID = int(os.getenv('MEDIA_CACHE_CHAT_ID', admin_id))  # chat used to pre-upload tutorial media
+
 # Optional: Add logging configuration
 import logging
 def setup_logging():
@@ -0,0 +1,96 @@
+# conversations.py - Persisted per-chat conversation states (multi-step prompts)
+import logging
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Seconds a prompt waits for its answer before the conversation is dropped
+DEFAULT_TTL = 15 * 60
+
+class ConversationManager:
+    """Routes a chat's next message to the step it is waiting in.
+
+    Each chat has at most one state: a step name, the keyword data that
+    step needs and an expiry time. States live in `store`
+    (get_conversation / set_conversation / clear_conversation /
+    purge_conversations), so a prompt survives restarts. Steps are
+    registered by name; routing a message is one dict lookup.
+
+    A state is taken before its step runs (like telebot's next-step
+    handlers): a step that wants another answer calls `start` again. The
+    take is atomic, so with several worker threads only one of a chat's
+    messages ever consumes a prompt.
+    """
+
+    def __init__(self, store, default_ttl: int = DEFAULT_TTL):
+        self.store = store
+        self.default_ttl = default_ttl
+        self._steps: Dict[str, Callable] = {}
+        self._lock = threading.Lock()
+
+    def step(self, name: str):
+        """Decorator registering `func(message, **data)` as the handler for state `name`"""
+        def decorator(func):
+            self._steps[name] = func
+            return func
+        return decorator
+
+    def start(self, chat_id: int, state: str, ttl: Optional[int] = None, **data):
+        """Wait for the chat's next message in `state`"""
+        if state not in self._steps:
+            raise KeyError(f"Unknown conversation state: {state}")
+        expires_at = int(time.time()) + (ttl or self.default_ttl)
+        with self._lock:
+            self.store.set_conversation(chat_id, state, data, expires_at)
+
+    def finish(self, chat_id: int):
+        """Drop the chat's pending prompt, if any"""
+        with self._lock:
+            self.store.clear_conversation(chat_id)
+
+    def current(self, chat_id: int) -> Optional[str]:
+        """State the chat is waiting in, or None"""
+        entry = self.store.get_conversation(chat_id)
+        if not entry or entry['expires_at'] <= time.time():
+            return None
+        return entry['state']
+
+    def is_waiting(self, message) -> bool:
+        """Handler filter: the message answers a pending prompt"""
+        return self.current(message.chat.id) is not None
+
+    def _take(self, chat_id: int) -> Optional[Dict]:
+        with self._lock:
+            entry = self.store.get_conversation(chat_id)
+            if entry:
+                self.store.clear_conversation(chat_id)
+        if entry and entry['expires_at'] > time.time():
+            return entry
+        return None
+
+    def dispatch(self, message) -> bool:
+        """Run the step the message's chat is waiting in; False if there was none"""
+        entry = self._take(message.chat.id)
+        if not entry:
+            return False
+
+        handler = self._steps.get(entry['state'])
+        if handler is None:
+            logger.warning(f"No step registered for conversation state {entry['state']}")
+            return False
+
+        try:
+            handler(message, **entry['data'])
+        except Exception as e:
+            logger.error(f"Error in conversation step {entry['state']} for {message.chat.id}: {e}")
+        return True
+
+    def purge_expired(self) -> int:
+        """Remove expired states from the store; returns how many"""
+        with self._lock:
+            removed = self.store.purge_conversations(int(time.time()))
+        if removed:
+            logger.info(f"Purged {removed} expired conversation states")
+        return removed
@@ -1,4 +1,6 @@
 # database.py - FULLY FIXED AFFILIATE SYSTEM WITH PROPER COMMISSION TRACKING
+import bisect
+import hashlib
 import json
 import logging
 import os
@@ -6,11 +8,24 @@ import shutil
 import time
 import random
 import string
+import threading
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 from typing import Optional, Dict, List, Tuple, Any
+from search_index import UserSearchIndex
+from leaderboard import LeaderboardSet
+from referral_graph import ReferralGraph
+from fraud_rules import FraudRules, HOLD_REASONS
+from money import to_minor, from_minor
 
 logger = logging.getLogger(__name__)
 
+# Commission statuses that are not (yet) owed to the affiliate
+UNCREDITED_STATUSES = ('held', 'void')
+
+# Minutes after which an approval stuck in 'processing' (e.g. after a crash) can be claimed again
+APPROVAL_CLAIM_MINUTES = 10
+
 class UserDatabase:
     def __init__(self, db_file: str = None):
         # Use DATABASE_PATH environment variable or default to current directory
@@ -41,14 +56,67 @@ class UserDatabase:
         self.payouts = self.db.get('payouts', {})
         self.commissions = self.db.get('commissions', {})
         self.referrals = self.db.get('referrals', {})
+        self.approvals = self.db.get('approvals', {})
+        self.proofs = self.db.get('proofs', {})
+        self.media = self.db.get('media', {})
+        self.conversations = self.db.get('conversations', {})
+        self.deferred = self.db.get('deferred', {})
+        self.memberships = self.db.get('memberships', {})
+        self.reconcile = self.db.get('reconcile', {})
         
         # Track changes for auto-save
         self.changes_since_save = 0
         self.last_save_time = time.time()
         
+        # Bumped on every real mutation so caches can key on it
+        self.data_version = 0
+        
+        # Bumped only when commissions or payouts change (report charts key on it)
+        self.ledger_version = 0
+        
+        # Per-thread batch() depth; >0 defers that thread's auto-saves to a single write
+        self._batch = threading.local()
+        
+        # Admin list views: (view, filter) -> (data_version, sorted user ids)
+        self._list_views = {}
+        
+        # Affiliate dashboard snapshots: id -> {'version', 'stats' / 'referrals' / 'history'}.
+        # A snapshot is stale once _touch_affiliate bumps that affiliate's version.
+        self._dashboards: Dict[str, Dict] = {}
+        self._affiliate_versions: Dict[str, int] = {}
+        
+        # Pending commission ids per affiliate (ordered dict used as a set)
+        self._pending_commissions: Dict[str, Dict[str, None]] = {}
+        
+        # Commission ids held by the fraud rules for admin review
+        self._held_commissions: Dict[str, None] = {}
+        self.fraud_rules = FraudRules()
+        
+        # Allocation ledger totals per affiliate in kobo: earned / paid / reserved
+        self._ledger: Dict[str, Dict[str, int]] = {}
+        self._ledger_lock = threading.RLock()
+        
+        # Guards compare-and-set transitions of payment approvals
+        self._approval_lock = threading.Lock()
+        
+        # Referrer <-> referred adjacency, built during integrity check
+        self.referral_graph = ReferralGraph()
+        
         # Verify database integrity after loading
         self.verify_database_integrity()
         
+        # Admin search index, maintained incrementally by the mutators
+        self.search_index = UserSearchIndex()
+        self._rebuild_search_index()
+        
+        # Week / month / all-time leaderboards, updated by add_commission
+        self.leaderboards = LeaderboardSet()
+        self._rebuild_leaderboards()
+        
+        # Group chat id -> {user id: membership record}, over the 'memberships' collection
+        self._chat_members: Dict[str, Dict[int, Dict]] = {}
+        self._rebuild_membership_index()
+        
         logger.info(f"Database initialized at: {self.db_file}")
 
     def _load_database(self):
@@ -106,6 +174,13 @@ class UserDatabase:
             'payouts': {},
             'commissions': {},
             'referrals': {},
+            'approvals': {},
+            'proofs': {},
+            'media': {},
+            'conversations': {},
+            'deferred': {},
+            'memberships': {},
+            'reconcile': {},
             'metadata': {
                 'created_at': datetime.now().isoformat(),
                 'updated_at': None,
@@ -122,7 +197,7 @@ class UserDatabase:
             logger.info("Verifying database integrity...")
             
             # Ensure all required keys exist
-            required_keys = ['users', 'payouts', 'commissions', 'referrals', 'metadata']
+            required_keys = ['users', 'payouts', 'commissions', 'referrals', 'approvals', 'proofs', 'media', 'conversations', 'deferred', 'memberships', 'reconcile', 'metadata']
             base_db = self._create_empty_db()
             
             for key in required_keys:
@@ -164,6 +239,14 @@ class UserDatabase:
                 if 'tg_id' not in user:
                     user['tg_id'] = int(user_id_str)
             
+            # commission_history holds commission ids; convert old embedded copies
+            self._migrate_commission_history()
+            self._migrate_money()
+            self._build_commission_index()
+            self._build_ledger()
+            self._allocate_legacy_payouts()
+            self._build_referral_graph()
+            
             # After loading, recalculate all affiliate balances from commissions
             # to ensure data consistency (fixes old manual updates)
             for user_id_str, user in self.db['users'].items():
@@ -175,6 +258,13 @@ class UserDatabase:
             self.payouts = self.db.get('payouts', {})
             self.commissions = self.db.get('commissions', {})
             self.referrals = self.db.get('referrals', {})
+            self.approvals = self.db.get('approvals', {})
+            self.proofs = self.db.get('proofs', {})
+            self.media = self.db.get('media', {})
+            self.conversations = self.db.get('conversations', {})
+            self.deferred = self.db.get('deferred', {})
+            self.memberships = self.db.get('memberships', {})
+            self.reconcile = self.db.get('reconcile', {})
             
             # Save if any changes were made
             if self.changes_since_save > 0:
@@ -186,6 +276,239 @@ class UserDatabase:
             logger.error(f"Error verifying database integrity: {e}")
             return False
 
+    def _migrate_commission_history(self):
+        """Replace duplicated commission_history dicts with commission ids (one pass)"""
+        try:
+            ids_by_affiliate: Dict[str, List[Tuple[str, str]]] = {}
+            lookup: Dict[Tuple, List[str]] = {}
+            for comm_id, comm in self.db['commissions'].items():
+                aff = str(comm['affiliate_id'])
+                ids_by_affiliate.setdefault(aff, []).append((comm.get('date') or '', comm_id))
+                key = (aff, str(comm.get('user_id')), comm.get('amount'), comm.get('date'))
+                lookup.setdefault(key, []).append(comm_id)
+            
+            migrated = 0
+            for user_id_str, user in self.db['users'].items():
+                history = user.get('commission_history')
+                ids = [comm_id for _, comm_id in sorted(ids_by_affiliate.get(user_id_str, []))]
+                
+                if history and any(isinstance(entry, dict) for entry in history):
+                    # Keep any copy that has no matching record instead of dropping it
+                    orphans = []
+                    for entry in history:
+                        if not isinstance(entry, dict):
+                            continue
+                        key = (user_id_str, str(entry.get('referral_id')), entry.get('amount'), entry.get('date'))
+                        matches = lookup.get(key)
+                        if matches:
+                            matches.pop()
+                        else:
+                            orphans.append(entry)
+                    if orphans:
+                        user['commission_history_orphans'] = user.get('commission_history_orphans', []) + orphans
+                        logger.warning(f"{len(orphans)} commission_history entries for {user_id_str} had no commission record")
+                    migrated += 1
+                
+                if (history is not None or ids) and history != ids:
+                    user['commission_history'] = ids
+                    self.changes_since_save += 1
+            
+            if migrated:
+                logger.info(f"Migrated commission_history to commission ids for {migrated} affiliates")
+        except Exception as e:
+            logger.error(f"Error migrating commission history: {e}")
+
+    def _build_commission_index(self):
+        """Index pending commission ids per affiliate, and held ones for review"""
+        self._pending_commissions = {}
+        self._held_commissions = {}
+        for comm_id, comm in sorted(self.db['commissions'].items(), key=lambda item: item[1].get('date') or ''):
+            if comm.get('status') == 'pending':
+                self._pending_commissions.setdefault(str(comm['affiliate_id']), {})[comm_id] = None
+            elif comm.get('status') == 'held':
+                self._held_commissions[comm_id] = None
+
+    def _migrate_money(self):
+        """Give amounts an integer kobo field (*_minor); float fields become display copies"""
+        migrated = 0
+        for comm in self.db['commissions'].values():
+            if 'amount_minor' in comm:
+                continue
+            comm['amount_minor'] = to_minor(comm.get('amount'))
+            comm['amount'] = from_minor(comm['amount_minor'])
+            # Commissions settled before the ledger existed were paid in full
+            if 'paid_amount' in comm:
+                comm['paid_minor'] = to_minor(comm.pop('paid_amount'))
+            else:
+                comm['paid_minor'] = comm['amount_minor'] if comm.get('status') == 'paid' else 0
+            comm['allocated_minor'] = to_minor(comm.pop('allocated', 0))
+            migrated += 1
+        
+        for payout in self.db['payouts'].values():
+            if 'amount_minor' in payout:
+                continue
+            payout['amount_minor'] = to_minor(payout.get('amount'))
+            payout['amount'] = from_minor(payout['amount_minor'])
+            for allocation in payout.get('allocations', []):
+                allocation['amount_minor'] = to_minor(allocation.pop('amount', 0))
+            migrated += 1
+        
+        for referral in self.db['referrals'].values():
+            if 'commission_earned_minor' not in referral:
+                referral['commission_earned_minor'] = to_minor(referral.get('commission_earned'))
+                referral['commission_earned'] = from_minor(referral['commission_earned_minor'])
+                migrated += 1
+        
+        if migrated:
+            logger.info(f"Converted {migrated} records to integer kobo amounts")
+            self.changes_since_save += migrated
+
+    def _build_ledger(self):
+        """Ledger totals from commission records (startup only), in kobo"""
+        self._ledger = {}
+        for comm in self.db['commissions'].values():
+            if comm.get('status') in UNCREDITED_STATUSES:
+                continue
+            entry = self._ledger_entry(comm['affiliate_id'])
+            entry['earned'] += comm['amount_minor']
+            entry['paid'] += comm['paid_minor']
+            entry['reserved'] += comm['allocated_minor']
+
+    def _allocate_legacy_payouts(self):
+        """Reserve commissions for pending payouts created before the ledger"""
+        for payout in self.db['payouts'].values():
+            if payout.get('status') == 'pending' and 'allocations' not in payout:
+                allocations, shortfall = self._allocate(payout['user_id'], payout['amount_minor'])
+                payout['allocations'] = allocations
+                if shortfall > 0:
+                    payout['allocation_shortfall'] = from_minor(shortfall)
+                    logger.warning(f"Payout {payout['id']} exceeds unreserved balance by {from_minor(shortfall):,.2f}")
+                self.changes_since_save += 1
+
+    def _build_referral_graph(self):
+        """Build the referral graph and rewrite users' referral lists as plain ids"""
+        # Chronological, so each referrer's children keep the order they joined in
+        dated = [(ref.get('referral_date') or '', ref['affiliate_id'], ref['user_id'])
+                 for ref in self.db['referrals'].values()]
+        dated += [(comm.get('date') or '', comm['affiliate_id'], comm['user_id'])
+                  for comm in self.db['commissions'].values()]
+        edges = [(affiliate_id, user_id) for _, affiliate_id, user_id in sorted(dated, key=lambda e: e[0])]
+        # referred_by is authoritative, so it is applied last
+        for user_id_str, user in self.db['users'].items():
+            if user.get('referred_by'):
+                edges.append((user['referred_by'], int(user_id_str)))
+        self.referral_graph.build(edges)
+        
+        # Old lists mixed int ids (set_referred_by) and dicts (add_commission)
+        for user_id_str, user in self.db['users'].items():
+            referrals = self.referral_graph.direct(int(user_id_str))
+            if user.get('referrals') != referrals or user.get('referral_count') != len(referrals):
+                user['referrals'] = referrals
+                user['referral_count'] = len(referrals)
+                self.changes_since_save += 1
+
+    def _link_referral(self, affiliate_id: int, user_id: int) -> bool:
+        """Record affiliate -> user in the graph and refresh the affected referral lists"""
+        linked, previous = self.referral_graph.link(affiliate_id, user_id)
+        if not linked:
+            logger.warning(f"Refused referral link {affiliate_id} -> {user_id} (self or circular referral)")
+            return False
+        for referrer_id in {int(affiliate_id), previous} - {None}:
+            referrer = self.users.get(str(referrer_id))
+            if referrer:
+                referrer['referrals'] = self.referral_graph.direct(referrer_id)
+                referrer['referral_count'] = len(referrer['referrals'])
+            self._touch_affiliate(referrer_id)
+        return True
+
+    def _ledger_entry(self, affiliate_id) -> Dict[str, int]:
+        return self._ledger.setdefault(str(affiliate_id), {'earned': 0, 'paid': 0, 'reserved': 0})
+
+    def _allocate(self, affiliate_id, amount_minor: int) -> Tuple[List[Dict], int]:
+        """Reserve unpaid commission kobo, oldest first. Returns (allocations, shortfall)"""
+        allocations = []
+        remaining = amount_minor
+        for comm_id in self._pending_commissions.get(str(affiliate_id), {}):
+            if remaining <= 0:
+                break
+            comm = self.commissions[comm_id]
+            free = comm['amount_minor'] - comm['paid_minor'] - comm['allocated_minor']
+            if free <= 0:
+                continue
+            take = min(free, remaining)
+            comm['allocated_minor'] += take
+            allocations.append({'commission_id': comm_id, 'amount_minor': take})
+            remaining -= take
+        
+        self._ledger_entry(affiliate_id)['reserved'] += amount_minor - remaining
+        return allocations, remaining
+
+    def _release(self, payout: Dict):
+        """Return a payout's reserved commission amounts to the available balance"""
+        released = 0
+        for allocation in payout.get('allocations', []):
+            comm = self.commissions.get(allocation['commission_id'])
+            if comm:
+                comm['allocated_minor'] = max(comm['allocated_minor'] - allocation['amount_minor'], 0)
+                released += allocation['amount_minor']
+        self._ledger_entry(payout['user_id'])['reserved'] -= released
+
+    def get_ledger_balance_minor(self, affiliate_id: int) -> Dict[str, int]:
+        """O(1) balance in kobo: earned, paid, reserved, unpaid (earned - paid), available (unpaid - reserved)"""
+        with self._ledger_lock:
+            entry = dict(self._ledger.get(str(affiliate_id), {'earned': 0, 'paid': 0, 'reserved': 0}))
+        entry['unpaid'] = entry['earned'] - entry['paid']
+        entry['available'] = max(entry['unpaid'] - entry['reserved'], 0)
+        return entry
+
+    def get_ledger_balance(self, affiliate_id: int) -> Dict[str, float]:
+        """get_ledger_balance_minor in naira"""
+        return {key: from_minor(value) for key, value in self.get_ledger_balance_minor(affiliate_id).items()}
+
+    def _affiliate_commissions(self, affiliate_id: int) -> List[Dict]:
+        """Commission records for an affiliate, oldest first, via commission_history ids"""
+        user = self.users.get(str(affiliate_id))
+        if not user:
+            return []
+        return [
+            self.commissions[comm_id] for comm_id in user.get('commission_history') or []
+            if comm_id in self.commissions
+        ]
+
+    @staticmethod
+    def _history_entry(comm: Dict) -> Dict:
+        """Commission record in the shape commission history callers expect"""
+        return {
+            'id': comm['id'],
+            'date': comm['date'],
+            'referral_id': comm['user_id'],
+            'user_id': comm['user_id'],
+            'amount': comm['amount'],
+            'program': comm.get('program'),
+            'plan_type': comm['plan_type'],
+            'vip_duration': comm.get('vip_duration'),
+            'status': comm.get('status', 'pending')
+        }
+
+    def _touch_affiliate(self, affiliate_id):
+        """Invalidate an affiliate's dashboard snapshot (call after changing their data)"""
+        key = str(affiliate_id)
+        self._affiliate_versions[key] = self._affiliate_versions.get(key, 0) + 1
+        self._dashboards.pop(key, None)
+
+    def _dashboard_part(self, affiliate_id, part: str, build):
+        """Cached part of an affiliate's dashboard snapshot, built on first use"""
+        key = str(affiliate_id)
+        version = self._affiliate_versions.get(key, 0)
+        snapshot = self._dashboards.get(key)
+        if not snapshot or snapshot['version'] != version:
+            snapshot = {'version': version}
+            self._dashboards[key] = snapshot
+        if part not in snapshot:
+            # Built from the data as of `version`; a concurrent touch just leaves it stale
+            snapshot[part] = build(int(affiliate_id))
+        return snapshot[part]
+
     def _save_database(self):
         """Save database to file"""
         try:
@@ -243,13 +566,29 @@ class UserDatabase:
             logger.error(f"Error in auto-save check: {e}")
             return False
 
-    def mark_changed(self):
+    def mark_changed(self, bump_version: bool = True):
         """Mark that a change has been made to the database"""
         self.changes_since_save += 1
-        self.auto_save_check()
+        if bump_version:
+            self.data_version += 1
+        if getattr(self._batch, 'depth', 0) == 0:
+            self.auto_save_check()
+
+    @contextmanager
+    def batch(self):
+        """Group many mutations into one persistence write"""
+        self._batch.depth = getattr(self._batch, 'depth', 0) + 1
+        try:
+            yield self
+        finally:
+            self._batch.depth -= 1
+            if self._batch.depth == 0 and self.changes_since_save > 0:
+                self._save_database()
 
     def save_database(self):
         """Manual save - forces immediate save"""
+        # Callers save after editing user dicts directly
+        self.data_version += 1
         return self._save_database()
 
     # ====================
@@ -294,6 +633,7 @@ class UserDatabase:
             
             self.users[user_id_str] = user_data
             self.db['users'] = self.users
+            self.search_index.index_user(user_id, user_data)
             self.mark_changed()
             
             logger.info(f"New user inserted: {user_id} ({name})")
@@ -310,7 +650,8 @@ class UserDatabase:
                 # Update last active
                 user_data['last_active'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
                 self.users[str(user_id)] = user_data
-                self.mark_changed()
+                # Activity timestamp only - don't invalidate cached views
+                self.mark_changed(bump_version=False)
             return user_data
         except Exception as e:
             logger.error(f"Error fetching user {user_id}: {e}")
@@ -324,6 +665,10 @@ class UserDatabase:
                 self.users[user_id_str].update(updates)
                 self.users[user_id_str]['last_active'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
                 self.db['users'] = self.users
+                self.search_index.index_user(user_id, self.users[user_id_str])
+                if any(field == 'is_affiliate' or field.startswith(('affiliate_', 'referral', 'commission_'))
+                       for field in updates):
+                    self._touch_affiliate(user_id)
                 self.mark_changed()
                 return True
             return False
@@ -339,6 +684,89 @@ class UserDatabase:
         """Set user's program preference"""
         return self.update_user(user_id, {'program': program})
 
+    # ====================
+    # ADMIN SEARCH
+    # ====================
+
+    def _rebuild_search_index(self):
+        """Index every user and payout (startup only; mutators keep it current)"""
+        try:
+            self.search_index.build(
+                self.users,
+                [(payout['user_id'], payout_id) for payout_id, payout in self.payouts.items()]
+            )
+            logger.info(f"Search index built for {len(self.search_index)} users")
+        except Exception as e:
+            logger.error(f"Error building search index: {e}")
+
+    def search_users(self, query: str, limit: int = 200) -> List[Tuple[int, float]]:
+        """Ranked (user_id, score) matches by name, @username, affiliate code, ID or payout ID"""
+        try:
+            return [
+                (user_id, score) for user_id, score in self.search_index.search(query, limit)
+                if str(user_id) in self.users
+            ]
+        except Exception as e:
+            logger.error(f"Error searching users for '{query}': {e}")
+            return []
+
+    # ====================
+    # ADMIN LIST VIEWS
+    # ====================
+
+    @staticmethod
+    def user_has_active_subscription(user: Dict, today=None) -> bool:
+        """Check a user record for any unexpired academy/VIP subscription"""
+        today = today or datetime.now().date()
+        for program in ['crypto', 'forex']:
+            for plan_type in ['academy', 'vip']:
+                expiry = user.get(f'{program}_{plan_type}_expiry_date')
+                if not expiry:
+                    continue
+                try:
+                    if datetime.strptime(expiry, '%Y-%m-%d').date() >= today:
+                        return True
+                except (ValueError, TypeError):
+                    # If date parsing fails, assume active if key exists
+                    return True
+        return False
+
+    def get_sorted_user_ids(self, view: str) -> List[int]:
+        """Sorted user ids for an admin list view ('all' or 'subscribed'), cached per data version"""
+        # Subscriptions lapse with the calendar, so the date is part of the key
+        filter_key = datetime.now().strftime('%Y-%m-%d') if view == 'subscribed' else ''
+        key = (view, filter_key)
+        
+        cached = self._list_views.get(key)
+        if cached and cached[0] == self.data_version:
+            return cached[1]
+        
+        if view == 'subscribed':
+            today = datetime.now().date()
+            ids = sorted(
+                int(uid) for uid, user in self.users.items()
+                if self.user_has_active_subscription(user, today)
+            )
+        else:
+            ids = sorted(int(uid) for uid in self.users)
+        
+        views = {k: v for k, v in self._list_views.items() if k[0] != view}
+        views[key] = (self.data_version, ids)
+        self._list_views = views
+        return ids
+
+    def get_user_id_page(self, view: str, cursor: int = None, direction: str = 'next',
+                         per_page: int = 10) -> Tuple[List[int], int, int]:
+        """Page of ids after (or before) a cursor id. Returns (ids, start_index, total)"""
+        ids = self.get_sorted_user_ids(view)
+        if cursor is None:
+            start = 0
+        elif direction == 'prev':
+            start = max(0, bisect.bisect_left(ids, cursor) - per_page)
+        else:
+            start = bisect.bisect_right(ids, cursor)
+        return ids[start:start + per_page], start, len(ids)
+
     # ====================
     # SUBSCRIPTION MANAGEMENT
     # ====================
@@ -455,6 +883,250 @@ class UserDatabase:
             logger.error(f"Error clearing pending POP for {user_id}: {e}")
             return False
 
+    # ====================
+    # PAYMENT APPROVALS (IDEMPOTENT)
+    # ====================
+
+    @staticmethod
+    def approval_key(user_id: int, pending_pop: Optional[Dict]) -> Optional[str]:
+        """Idempotency key for one uploaded POP (None until a real file is uploaded)"""
+        file_id = (pending_pop or {}).get('file_id')
+        if not file_id or file_id == 'PENDING':
+            return None
+        raw = f"{user_id}:{file_id}:{pending_pop.get('uploaded_at', '')}"
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:20]
+
+    def begin_approval(self, user_id: int, admin_id: int, action: str) -> Tuple[Optional[str], Optional[Dict]]:
+        """Claim the user's pending POP for approve/reject (compare-and-set).
+        
+        Returns (key, None) to the one caller that should run the side effects,
+        (None, record) to everyone else, and (None, None) if nothing is pending.
+        A 'failed' attempt, or one left 'processing' for APPROVAL_CLAIM_MINUTES,
+        can be claimed again; once some of its steps have completed only the
+        same action can retry it, and completed steps stay recorded. A taken-over
+        attempt may still be running; its commission is deduplicated by key.
+        """
+        with self._approval_lock:
+            user = self.users.get(str(user_id))
+            key = self.approval_key(user_id, user.get('pending_pop') if user else None)
+            if not key:
+                return None, None
+            
+            record = self.approvals.get(key)
+            if record:
+                stale = (
+                    record['state'] == 'processing' and
+                    datetime.strptime(record['started'], '%Y-%m-%d %H:%M:%S')
+                    < datetime.now() - timedelta(minutes=APPROVAL_CLAIM_MINUTES)
+                )
+                if record['state'] != 'failed' and not stale:
+                    return None, record
+                if record.get('steps') and record['action'] != action:
+                    return None, record
+                if stale:
+                    logger.warning(f"Re-claiming approval {key} left processing since {record['started']}")
+            
+            self.approvals[key] = {
+                'user_id': user_id,
+                'admin_id': admin_id,
+                'action': action,
+                'state': 'processing',
+                'started': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                'finished': None,
+                'steps': (record or {}).get('steps', [])
+            }
+            if (record or {}).get('commission_id'):
+                self.approvals[key]['commission_id'] = record['commission_id']
+            self.db['approvals'] = self.approvals
+        
+        self.mark_changed()
+        return key, None
+
+    def approval_step_done(self, key: str, step: str) -> bool:
+        """Whether a side effect of this approval already ran (in this or an earlier attempt)"""
+        with self._approval_lock:
+            return step in (self.approvals.get(key) or {}).get('steps', [])
+
+    def complete_approval_step(self, key: str, step: str):
+        """Record a finished side effect so a retry skips it (flushed by finish_approval)"""
+        with self._approval_lock:
+            record = self.approvals.get(key)
+            if not record:
+                return
+            record.setdefault('steps', []).append(step)
+        
+        self.mark_changed()
+
+    def finish_approval(self, key: str, state: str) -> bool:
+        """Move a claimed approval from 'processing' to 'approved', 'rejected' or 'failed'"""
+        with self._approval_lock:
+            record = self.approvals.get(key)
+            if not record or record['state'] != 'processing':
+                return False
+            record['state'] = state
+            record['finished'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        
+        # One write for the whole approval and its recorded steps
+        self.mark_changed()
+        self._save_database()
+        return True
+
+    def commission_for_approval(self, key: str) -> Optional[str]:
+        """Id of the commission already created for this approval, if any"""
+        return (self.approvals.get(key) or {}).get('commission_id')
+
+    # ====================
+    # PAYMENT PROOF HASHES
+    # ====================
+
+    def record_proof(self, user_id: int, pending_pop: Dict, phash: Optional[int]) -> Optional[str]:
+        """Store the perceptual hash of an uploaded POP under its approval key"""
+        try:
+            key = self.approval_key(user_id, pending_pop)
+            if not key:
+                return None
+            
+            self.proofs[key] = {
+                'user_id': user_id,
+                'file_id': pending_pop['file_id'],
+                'phash': f"{phash:016x}" if phash is not None else None,
+                'program': pending_pop.get('program'),
+                'plan_choice': pending_pop.get('plan_choice'),
+                'uploaded_at': pending_pop.get('uploaded_at')
+            }
+            self.db['proofs'] = self.proofs
+            self.mark_changed()
+            return key
+        except Exception as e:
+            logger.error(f"Error recording proof for {user_id}: {e}")
+            return None
+
+    def get_proof(self, key: str) -> Optional[Dict]:
+        return self.proofs.get(key)
+
+    def get_proof_hashes(self) -> List[Tuple[str, int]]:
+        """(approval key, hash) for every hashed proof, for rebuilding the lookup index"""
+        return [(key, int(proof['phash'], 16)) for key, proof in self.proofs.items() if proof.get('phash')]
+
+    # ====================
+    # TELEGRAM MEDIA FILE IDS
+    # ====================
+
+    def get_media_file_id(self, source: str) -> Optional[str]:
+        """Telegram file_id of an asset (URL) the bot has already uploaded"""
+        entry = self.media.get(source)
+        return entry['file_id'] if entry else None
+
+    def set_media_file_id(self, source: str, kind: str, file_id: str):
+        self.media[source] = {
+            'kind': kind,
+            'file_id': file_id,
+            'cached_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        }
+        self.db['media'] = self.media
+        self.mark_changed(bump_version=False)
+
+    def forget_media(self, source: str):
+        if self.media.pop(source, None):
+            self.mark_changed(bump_version=False)
+
+    # ====================
+    # CONVERSATION STATES
+    # ====================
+
+    def get_conversation(self, chat_id: int) -> Optional[Dict]:
+        """{'state', 'data', 'expires_at'} of the chat's pending prompt"""
+        return self.conversations.get(str(chat_id))
+
+    def set_conversation(self, chat_id: int, state: str, data: Dict, expires_at: int):
+        self.conversations[str(chat_id)] = {'state': state, 'data': data, 'expires_at': expires_at}
+        self.db['conversations'] = self.conversations
+        self.mark_changed(bump_version=False)
+
+    def clear_conversation(self, chat_id: int):
+        if self.conversations.pop(str(chat_id), None):
+            self.mark_changed(bump_version=False)
+
+    def purge_conversations(self, now: int) -> int:
+        """Drop states that expired before `now` (epoch seconds)"""
+        expired = [chat_id for chat_id, entry in self.conversations.items() if entry['expires_at'] <= now]
+        for chat_id in expired:
+            del self.conversations[chat_id]
+        if expired:
+            self.mark_changed(bump_version=False)
+        return len(expired)
+
+    # ====================
+    # DEFERRED ACTIONS
+    # ====================
+
+    def add_deferred(self, task_id: str, action: str, kwargs: Dict, run_at: int):
+        self.deferred[task_id] = {'action': action, 'kwargs': kwargs, 'run_at': run_at}
+        self.db['deferred'] = self.deferred
+        self.mark_changed(bump_version=False)
+
+    def remove_deferred(self, task_id: str):
+        if self.deferred.pop(task_id, None):
+            self.mark_changed(bump_version=False)
+
+    def get_deferred(self) -> Dict[str, Dict]:
+        """task id -> {'action', 'kwargs', 'run_at'} of stored delayed actions"""
+        return dict(self.deferred)
+
+    # ====================
+    # GROUP MEMBERSHIPS
+    # ====================
+
+    def _rebuild_membership_index(self):
+        self._chat_members = {}
+        for key, record in self.memberships.items():
+            chat_id, _, user_id = key.rpartition(':')
+            self._chat_members.setdefault(chat_id, {})[int(user_id)] = record
+
+    def get_membership(self, chat_id: int, user_id: int) -> Optional[Dict]:
+        """Last known {'state', 'invite_link', 'updated_at'} of a user in a group"""
+        return self.memberships.get(f"{chat_id}:{user_id}")
+
+    def set_membership(self, chat_id: int, user_id: int, state: str, invite_link: str = None):
+        """state: invited / member / admin / left / removed (banned by an admin) / revoked (removed by the bot)"""
+        record = {
+            'state': state,
+            'invite_link': invite_link,
+            'updated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        }
+        self.memberships[f"{chat_id}:{user_id}"] = record
+        self._chat_members.setdefault(str(chat_id), {})[user_id] = record
+        self.db['memberships'] = self.memberships
+        self.mark_changed(bump_version=False)
+
+    def get_chat_memberships(self, chat_id: int) -> Dict[int, Dict]:
+        """user id -> membership record for one group"""
+        return dict(self._chat_members.get(str(chat_id), {}))
+
+    def count_chat_members(self, chat_id: int) -> Dict[str, int]:
+        """Tracked users per membership state in one group"""
+        counts: Dict[str, int] = {}
+        for record in self._chat_members.get(str(chat_id), {}).values():
+            counts[record['state']] = counts.get(record['state'], 0) + 1
+        return counts
+
+    def get_entitled_users(self, program: str, plan_type: str, grace_days: int = 0) -> List[int]:
+        """Sorted ids of users whose subscription (plus grace period) is still running"""
+        cutoff = (datetime.now() - timedelta(days=grace_days)).strftime('%Y-%m-%d')
+        field = f'{program}_{plan_type}_expiry_date'
+        return sorted(
+            int(user_id) for user_id, user in self.users.items()
+            if (user.get(field) or '') >= cutoff
+        )
+
+    def get_reconcile_checkpoint(self, key: str) -> Optional[int]:
+        return self.reconcile.get(key)
+
+    def set_reconcile_checkpoint(self, key: str, user_id: int):
+        self.reconcile[key] = user_id
+        self.db['reconcile'] = self.reconcile
+        self.mark_changed(bump_version=False)
+
     # ====================
     # AFFILIATE SYSTEM METHODS (FIXED)
     # ====================
@@ -482,6 +1154,8 @@ class UserDatabase:
                 else:
                     user['is_affiliate'] = False
                 
+                self.search_index.index_user(user_id, user)
+                self._touch_affiliate(user_id)
                 self.mark_changed()
                 return True
             return False
@@ -503,6 +1177,8 @@ class UserDatabase:
             
             self.users[str(user_id)] = user
             self.db['users'] = self.users
+            self.search_index.index_user(user_id, user)
+            self._touch_affiliate(user_id)
             self.mark_changed()
             return True
         except Exception as e:
@@ -529,31 +1205,26 @@ class UserDatabase:
             if not user or not referred_by_user:
                 return False
             
+            # Graph keeps the affiliate's referrals list and count in sync
+            if not self._link_referral(referred_by_id, user_id):
+                return False
+            
             # Set referred_by for the new user
             user['referred_by'] = referred_by_id
             
-            # Add to referrals list of the affiliate
-            if 'referrals' not in referred_by_user:
-                referred_by_user['referrals'] = []
-            
-            if user_id not in referred_by_user['referrals']:
-                referred_by_user['referrals'].append(user_id)
-                referred_by_user['referral_count'] = len(referred_by_user['referrals'])
-            
-            self.users[str(user_id)] = user
-            self.users[str(referred_by_id)] = referred_by_user
-            self.db['users'] = self.users
-            
-            # Also store in referrals collection for easier querying
+            # Also store in referrals collection for easier querying (keep existing stats)
             referral_id = f"{referred_by_id}_{user_id}"
-            self.referrals[referral_id] = {
-                'affiliate_id': referred_by_id,
-                'user_id': user_id,
-                'referral_date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                'has_subscribed': False,
-                'commission_earned': 0.0
-            }
+            if referral_id not in self.referrals:
+                self.referrals[referral_id] = {
+                    'affiliate_id': referred_by_id,
+                    'user_id': user_id,
+                    'referral_date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                    'has_subscribed': False,
+                    'commission_earned': 0.0,
+                    'commission_earned_minor': 0
+                }
             self.db['referrals'] = self.referrals
+            self._touch_affiliate(referred_by_id)
             
             self.mark_changed()
             return True
@@ -562,19 +1233,38 @@ class UserDatabase:
             return False
 
     def add_referral(self, affiliate_id: int, user_id: int):
-        """Add a referral (user clicked affiliate link but hasn't subscribed yet)"""
+        """Add a referral (user clicked affiliate link but hasn't subscribed yet).
+        
+        Returns False when the fraud rules reject it (self-referral, already referred).
+        """
         try:
-            referral_id = f"{affiliate_id}_{user_id}"
+            decision, reason = self.fraud_rules.check_referral(
+                affiliate_id, user_id, self.referral_graph.referrer(user_id),
+                is_new_user=str(user_id) not in self.users
+            )
+            if decision == 'reject':
+                logger.info(f"Referral {affiliate_id} -> {user_id} rejected: {reason}")
+                return False
             
+            if not self._link_referral(affiliate_id, user_id):
+                return False
+            
+            referral_id = f"{affiliate_id}_{user_id}"
             self.referrals[referral_id] = {
                 'affiliate_id': affiliate_id,
                 'user_id': user_id,
                 'referral_date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
                 'has_subscribed': False,
-                'commission_earned': 0.0
+                'commission_earned': 0.0,
+                'commission_earned_minor': 0
             }
+            if decision == 'flag':
+                # Commissions from this referral will be held for review
+                self.referrals[referral_id]['flag'] = reason
+                logger.warning(f"Referral {affiliate_id} -> {user_id} flagged: {reason}")
             
             self.db['referrals'] = self.referrals
+            self._touch_affiliate(affiliate_id)
             self.mark_changed()
             return True
         except Exception as e:
@@ -583,308 +1273,384 @@ class UserDatabase:
 
     # ========== FIXED: COMMISSION WITH STATUS ==========
     def add_commission(self, affiliate_id: int, user_id: int, amount: float, 
-                      program: str, plan_type: str, vip_duration: Optional[str] = None):
-        """Add commission for an affiliate with 'pending' status"""
+                      program: str, plan_type: str, vip_duration: Optional[str] = None,
+                      sale: Optional[Dict] = None, approval_key: Optional[str] = None) -> Optional[str]:
+        """Add a 'pending' commission, or a 'held' one if the fraud rules flag it.
+        
+        `sale` is the commission engine quote (base_amount, rate, currency, fx_rate).
+        With `approval_key`, at most one commission is created per payment approval,
+        even if a taken-over approval runs the commission step twice.
+        Returns the commission id.
+        """
+        if approval_key:
+            with self._approval_lock:
+                existing = self.commission_for_approval(approval_key)
+                if existing:
+                    return existing
+                commission_id = self.add_commission(affiliate_id, user_id, amount, program, plan_type, vip_duration, sale)
+                if commission_id and approval_key in self.approvals:
+                    self.approvals[approval_key]['commission_id'] = commission_id
+                return commission_id
+        
         try:
-            # Update affiliate's earnings (total earned ever)
             affiliate = self.fetch_user(affiliate_id)
             if not affiliate:
-                return False
-            
-            # Update total earnings (never reset)
-            affiliate['affiliate_earnings'] = affiliate.get('affiliate_earnings', 0.0) + amount
-            
-            # Add to affiliate's referral record (for display)
-            if 'referrals' not in affiliate:
-                affiliate['referrals'] = []
-            
-            referral_found = False
-            for ref in affiliate['referrals']:
-                if ref.get('user_id') == user_id:
-                    ref['has_subscribed'] = True
-                    ref['commission_earned'] = ref.get('commission_earned', 0.0) + amount
-                    ref['last_commission_date'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                    referral_found = True
-                    break
+                return None
             
-            if not referral_found:
-                affiliate['referrals'].append({
-                    'user_id': user_id,
-                    'date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                    'has_subscribed': True,
-                    'commission_earned': amount
-                })
+            amount_minor = to_minor(amount)
+            amount = from_minor(amount_minor)
+            referral_id = f"{affiliate_id}_{user_id}"
+            referrer_id = self.referral_graph.referrer(user_id)
+            hold_reason = self.fraud_rules.check_commission(
+                affiliate_id, user_id, referrer_id, self.referrals.get(referral_id, {}).get('flag')
+            )
             
-            # Add to affiliate's commission history (for quick access)
-            if 'commission_history' not in affiliate:
-                affiliate['commission_history'] = []
-            
-            affiliate['commission_history'].append({
-                'date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                'referral_id': user_id,
-                'amount': amount,
-                'program': program,
-                'plan_type': plan_type,
-                'vip_duration': vip_duration,
-                'status': 'pending'   # ← track status in history too
-            })
+            # Commission for a user nobody was recorded as referring attributes them here
+            if referrer_id is None and hold_reason != 'self_referral':
+                self._link_referral(affiliate_id, user_id)
             
             self.users[str(affiliate_id)] = affiliate
             self.db['users'] = self.users
             
-            # Update referral record
-            referral_id = f"{affiliate_id}_{user_id}"
-            if referral_id in self.referrals:
-                self.referrals[referral_id]['has_subscribed'] = True
-                self.referrals[referral_id]['commission_earned'] = self.referrals[referral_id].get('commission_earned', 0.0) + amount
-                self.referrals[referral_id]['subscription_date'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            # Update referral record (the per-referral stats live here only)
+            referral = self.referrals.setdefault(referral_id, {
+                'affiliate_id': affiliate_id,
+                'user_id': user_id,
+                'referral_date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                'commission_earned_minor': 0
+            })
+            referral['has_subscribed'] = True
+            referral['commission_earned_minor'] = referral.get('commission_earned_minor', 0) + amount_minor
+            referral['commission_earned'] = from_minor(referral['commission_earned_minor'])
+            referral['subscription_date'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
             
             # Create commission record with status='pending'
             commission_id = f"COMM_{datetime.now().strftime('%Y%m%d%H%M%S')}_{affiliate_id}_{user_id}_{random.randint(1000,9999)}"
+            self.ledger_version += 1
             self.commissions[commission_id] = {
                 'id': commission_id,
                 'affiliate_id': affiliate_id,
                 'user_id': user_id,
                 'amount': amount,
+                'amount_minor': amount_minor,
                 'program': program,
                 'plan_type': plan_type,
                 'vip_duration': vip_duration,
                 'date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                'status': 'pending'   # NEW: pending/paid
+                'status': 'held' if hold_reason else 'pending',   # pending/held/paid/void
+                'allocated_minor': 0,  # kobo reserved by pending payout requests
+                'paid_minor': 0        # kobo settled by paid payouts
             }
+            commission = self.commissions[commission_id]
+            if sale:
+                for field in ('base_amount', 'rate', 'currency', 'fx_rate'):
+                    commission[field] = sale.get(field)
             
             self.db['commissions'] = self.commissions
             self.db['referrals'] = self.referrals
             
-            # Recalculate affiliate's balances from commissions (ensures integrity)
-            self.recalculate_affiliate_balance(affiliate_id)
+            # Affiliate's history references the record by id
+            affiliate.setdefault('commission_history', []).append(commission_id)
             
+            if hold_reason:
+                # Not credited until an admin releases it
+                commission['hold_reason'] = hold_reason
+                self._held_commissions[commission_id] = None
+                logger.warning(f"Commission {commission_id} held for review: {hold_reason}")
+            else:
+                self._credit_commission(commission)
+            
+            self._touch_affiliate(affiliate_id)
             self.mark_changed()
             
-            logger.info(f"Commission added: {amount} for affiliate {affiliate_id}, status=pending")
-            return True
+            logger.info(f"Commission added: {amount} for affiliate {affiliate_id}, status={commission['status']}")
+            return commission_id
         except Exception as e:
             logger.error(f"Error adding commission: {e}")
-            return False
+            return None
+
+    def _credit_commission(self, commission: Dict):
+        """Count a pending commission in the ledger, pending index and leaderboards"""
+        affiliate_id = commission['affiliate_id']
+        with self._ledger_lock:
+            self._pending_commissions.setdefault(str(affiliate_id), {})[commission['id']] = None
+            self._ledger_entry(affiliate_id)['earned'] += commission['amount_minor']
+        
+        self.leaderboards.record(affiliate_id, commission['amount_minor'], commission['date'], commission.get('plan_type'))
+        self.recalculate_affiliate_balance(affiliate_id)
+
+    # ========== Fraud review: held commissions ==========
+    def get_held_commissions(self) -> List[Dict]:
+        """Commissions awaiting admin review, oldest first"""
+        held = []
+        for comm_id in self._held_commissions:
+            comm = self.commissions.get(comm_id)
+            if comm:
+                held.append(dict(comm, hold_reason_text=HOLD_REASONS.get(comm.get('hold_reason'), comm.get('hold_reason'))))
+        return held
+
+    def _take_held(self, commission_id: str, status: str) -> Optional[Dict]:
+        """Move a held commission to `status`; only one concurrent reviewer gets it back"""
+        with self._ledger_lock:
+            comm = self.commissions.get(commission_id)
+            if not comm or comm.get('status') != 'held':
+                return None
+            comm['status'] = status
+            self.ledger_version += 1
+            comm['reviewed_date'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            self._held_commissions.pop(commission_id, None)
+            return comm
+
+    def release_commission(self, commission_id: str) -> Optional[Dict]:
+        """Credit a held commission to its affiliate. Returns the commission"""
+        try:
+            comm = self._take_held(commission_id, 'pending')
+            if not comm:
+                return None
+            self._credit_commission(comm)
+            self.mark_changed()
+            
+            logger.info(f"Held commission {commission_id} released")
+            return comm
+        except Exception as e:
+            logger.error(f"Error releasing commission {commission_id}: {e}")
+            return None
+
+    def void_commission(self, commission_id: str) -> Optional[Dict]:
+        """Reject a held commission; it is never credited. Returns the commission"""
+        try:
+            comm = self._take_held(commission_id, 'void')
+            if not comm:
+                return None
+            
+            referral = self.referrals.get(f"{comm['affiliate_id']}_{comm['user_id']}")
+            if referral:
+                referral['commission_earned_minor'] = max(referral.get('commission_earned_minor', 0) - comm['amount_minor'], 0)
+                referral['commission_earned'] = from_minor(referral['commission_earned_minor'])
+            self._touch_affiliate(comm['affiliate_id'])
+            self.mark_changed()
+            
+            logger.info(f"Held commission {commission_id} voided")
+            return comm
+        except Exception as e:
+            logger.error(f"Error voiding commission {commission_id}: {e}")
+            return None
 
-    # ========== NEW: Recalculate balances from commission records ==========
+    # ========== Balances from the allocation ledger ==========
     def recalculate_affiliate_balance(self, affiliate_id: int):
-        """Sum all pending and paid commissions to update user's fields."""
-        user = self.fetch_user(affiliate_id)
+        """Copy the affiliate's ledger totals onto the user's balance fields.
+        
+        Every ledger change (credit, payout request, settlement, rejection)
+        ends here, so this is also where their dashboard snapshot goes stale.
+        """
+        user = self.users.get(str(affiliate_id))
         if not user:
             return False
 
-        pending_sum = 0.0
-        paid_sum = 0.0
-        total_earned = 0.0
-
-        for comm in self.commissions.values():
-            if str(comm['affiliate_id']) == str(affiliate_id):
-                total_earned += comm['amount']
-                if comm.get('status') == 'pending':
-                    pending_sum += comm['amount']
-                elif comm.get('status') == 'paid':
-                    paid_sum += comm['amount']
-
-        # Update user fields
-        user['affiliate_earnings'] = total_earned
-        user['affiliate_pending'] = pending_sum
-        user['affiliate_paid'] = paid_sum
-        user['affiliate_available'] = pending_sum   # available for payout = pending
-
-        self.users[str(affiliate_id)] = user
-        self.db['users'] = self.users
-        self.mark_changed()
+        balance = self.get_ledger_balance(affiliate_id)
+        fields = {
+            'affiliate_earnings': balance['earned'],
+            'affiliate_pending': balance['unpaid'],
+            'affiliate_paid': balance['paid'],
+            'affiliate_available': balance['available']   # unpaid and not reserved by a payout request
+        }
+        if any(user.get(field) != value for field, value in fields.items()):
+            user.update(fields)
+            self.mark_changed()
+        self._touch_affiliate(affiliate_id)
         return True
 
+    # ========== Dashboard snapshot (cached per affiliate) ==========
+    # Readers get the shared snapshot objects; treat them as read-only.
     def get_affiliate_stats(self, user_id: int) -> Dict:
-        """Get affiliate statistics – ensures recalc first for accuracy"""
+        """Get affiliate statistics from the dashboard snapshot"""
         try:
-            # Ensure balances are correct before returning stats
-            self.recalculate_affiliate_balance(user_id)
-            
-            user = self.fetch_user(user_id)
-            if not user or not user.get('is_affiliate'):
-                return {
-                    'total_referrals': 0,
-                    'active_referrals': 0,
-                    'total_earnings': 0.0,
-                    'pending_payout': 0.0,
-                    'total_paid': 0.0,
-                    'available_balance': 0.0
-                }
-            
-            # Count referrals
-            total_referrals = user.get('referral_count', 0)
-            
-            # Count active referrals (those who have at least one commission)
-            active_referrals = 0
-            for referral_id, referral in self.referrals.items():
-                if str(referral['affiliate_id']) == str(user_id) and referral.get('has_subscribed', False):
-                    active_referrals += 1
-            
-            return {
-                'total_referrals': total_referrals,
-                'active_referrals': active_referrals,
-                'total_earnings': user.get('affiliate_earnings', 0.0),
-                'pending_payout': user.get('affiliate_pending', 0.0),
-                'total_paid': user.get('affiliate_paid', 0.0),
-                'available_balance': user.get('affiliate_available', 0.0)
-            }
+            return self._dashboard_part(user_id, 'stats', self._build_affiliate_stats)
         except Exception as e:
             logger.error(f"Error getting affiliate stats for {user_id}: {e}")
             return {}
 
     def get_recent_commissions(self, user_id: int, limit: int = 10) -> List[Dict]:
         """Get recent commissions for an affiliate (includes status)"""
-        try:
-            # Use user's commission history first (already includes status)
-            user = self.fetch_user(user_id)
-            if user and 'commission_history' in user:
-                commissions = user['commission_history']
-                commissions.sort(key=lambda x: x.get('date', ''), reverse=True)
-                return commissions[:limit]
-            
-            # Fallback to commission collection
-            commissions = []
-            for commission in self.commissions.values():
-                if str(commission['affiliate_id']) == str(user_id):
-                    commissions.append({
-                        'amount': commission['amount'],
-                        'plan_type': commission['plan_type'],
-                        'date': commission['date'],
-                        'user_id': commission['user_id'],
-                        'status': commission.get('status', 'pending')
-                    })
-            
-            commissions.sort(key=lambda x: x['date'], reverse=True)
-            return commissions[:limit]
-        except Exception as e:
-            logger.error(f"Error getting recent commissions for {user_id}: {e}")
-            return []
+        return self.get_commission_history(user_id)[:limit]
 
     def get_all_referrals(self, user_id: int) -> List[Dict]:
-        """Get all referrals for an affiliate with per-referral commission details (enhanced)"""
+        """Get all referrals for an affiliate with per-referral commission details"""
         try:
-            # Build a dictionary keyed by referred user_id
-            referrals_dict = {}
-            
-            # First, gather from the referrals collection (basic info)
-            for ref_id, ref in self.referrals.items():
-                if str(ref['affiliate_id']) == str(user_id):
-                    uid = ref['user_id']
-                    referrals_dict[uid] = {
-                        'user_id': uid,
-                        'referral_date': ref.get('referral_date'),
-                        'has_subscribed': ref.get('has_subscribed', False),
-                        'total_commission': 0.0,
-                        'subscriptions': [],
-                        'status': 'pending'  # overall status
-                    }
-            
-            # Then, enrich with commission details
-            for comm in self.commissions.values():
-                if str(comm['affiliate_id']) == str(user_id):
-                    uid = comm['user_id']
-                    if uid not in referrals_dict:
-                        # This can happen if commission added before referral record
-                        referrals_dict[uid] = {
-                            'user_id': uid,
-                            'referral_date': comm['date'],
-                            'has_subscribed': True,
-                            'total_commission': 0.0,
-                            'subscriptions': [],
-                            'status': 'pending'
-                        }
-                    
-                    plan_name = f"{comm['program']} {comm['plan_type']}"
-                    if comm.get('vip_duration'):
-                        plan_name += f" ({comm['vip_duration']})"
-                    
-                    referrals_dict[uid]['subscriptions'].append({
-                        'plan': plan_name,
-                        'amount': comm['amount'],
-                        'date': comm['date'],
-                        'status': comm.get('status', 'pending')
-                    })
-                    referrals_dict[uid]['total_commission'] += comm['amount']
-                    
-                    # Determine overall status: if any commission pending -> pending, else paid
-                    if comm.get('status') == 'pending':
-                        referrals_dict[uid]['status'] = 'pending'
-                    else:
-                        # if all commissions are paid, set to 'paid'
-                        all_paid = all(s['status'] == 'paid' for s in referrals_dict[uid]['subscriptions'])
-                        if all_paid:
-                            referrals_dict[uid]['status'] = 'paid'
-            
-            # Convert to list and sort by referral date (most recent first)
-            result = list(referrals_dict.values())
-            result.sort(key=lambda x: x['referral_date'] or '', reverse=True)
-            return result
+            return self._dashboard_part(user_id, 'referrals', self._build_all_referrals)
         except Exception as e:
             logger.error(f"Error getting referrals for {user_id}: {e}")
             return []
 
     def get_commission_history(self, user_id: int) -> List[Dict]:
-        """Get commission history for an affiliate (includes status)"""
+        """Get commission history for an affiliate (includes status), newest first"""
         try:
-            user = self.fetch_user(user_id)
-            if user and 'commission_history' in user:
-                history = user['commission_history']
-                history.sort(key=lambda x: x.get('date', ''), reverse=True)
-                return history
-            
-            history = []
-            for commission in self.commissions.values():
-                if str(commission['affiliate_id']) == str(user_id):
-                    history.append({
-                        'amount': commission['amount'],
-                        'plan_type': commission['plan_type'],
-                        'vip_duration': commission.get('vip_duration'),
-                        'date': commission['date'],
-                        'user_id': commission['user_id'],
-                        'status': commission.get('status', 'pending')
-                    })
-            
-            history.sort(key=lambda x: x['date'], reverse=True)
-            return history
+            return self._dashboard_part(user_id, 'history', self._build_commission_history)
         except Exception as e:
             logger.error(f"Error getting commission history for {user_id}: {e}")
             return []
 
+    def _build_affiliate_stats(self, user_id: int) -> Dict:
+        """Stats from the ledger-maintained balance fields and referral records"""
+        user = self.fetch_user(user_id)
+        if not user or not user.get('is_affiliate'):
+            return {
+                'total_referrals': 0,
+                'active_referrals': 0,
+                'total_earnings': 0.0,
+                'pending_payout': 0.0,
+                'total_paid': 0.0,
+                'available_balance': 0.0
+            }
+        
+        # Count referrals
+        total_referrals = user.get('referral_count', 0)
+        
+        # Count active referrals (those who have at least one commission)
+        active_referrals = 0
+        for referred_id in self.referral_graph.direct(user_id):
+            if self.referrals.get(f"{user_id}_{referred_id}", {}).get('has_subscribed', False):
+                active_referrals += 1
+        
+        return {
+            'total_referrals': total_referrals,
+            'active_referrals': active_referrals,
+            'total_earnings': user.get('affiliate_earnings', 0.0),
+            'pending_payout': user.get('affiliate_pending', 0.0),
+            'total_paid': user.get('affiliate_paid', 0.0),
+            'available_balance': user.get('affiliate_available', 0.0)
+        }
+
+    def _build_all_referrals(self, user_id: int) -> List[Dict]:
+        """Per-referral commission details, most recently referred first"""
+        # Build a dictionary keyed by referred user_id
+        referrals_dict = {}
+        
+        # First, direct referrals from the graph with their referral record (basic info)
+        for uid in self.referral_graph.direct(user_id):
+            ref = self.referrals.get(f"{user_id}_{uid}", {})
+            referrals_dict[uid] = {
+                'user_id': uid,
+                'referral_date': ref.get('referral_date'),
+                'has_subscribed': ref.get('has_subscribed', False),
+                'total_commission_minor': 0,
+                'subscriptions': [],
+                'status': 'pending'  # overall status
+            }
+        
+        # Then, enrich with this affiliate's commission details
+        for comm in self._affiliate_commissions(user_id):
+            uid = comm['user_id']
+            if uid not in referrals_dict:
+                # This can happen if the user was later re-attributed to another affiliate
+                referrals_dict[uid] = {
+                    'user_id': uid,
+                    'referral_date': comm['date'],
+                    'has_subscribed': True,
+                    'total_commission_minor': 0,
+                    'subscriptions': [],
+                    'status': 'pending'
+                }
+        
+            plan_name = f"{comm['program']} {comm['plan_type']}"
+            if comm.get('vip_duration'):
+                plan_name += f" ({comm['vip_duration']})"
+        
+            referrals_dict[uid]['subscriptions'].append({
+                'plan': plan_name,
+                'amount': comm['amount'],
+                'date': comm['date'],
+                'status': comm.get('status', 'pending')
+            })
+            referrals_dict[uid]['total_commission_minor'] += comm['amount_minor']
+        
+            # Determine overall status: if any commission pending -> pending, else paid
+            if comm.get('status') == 'pending':
+                referrals_dict[uid]['status'] = 'pending'
+            else:
+                # if all commissions are paid, set to 'paid'
+                all_paid = all(s['status'] == 'paid' for s in referrals_dict[uid]['subscriptions'])
+                if all_paid:
+                    referrals_dict[uid]['status'] = 'paid'
+        
+        # Convert to list and sort by referral date (most recent first)
+        result = list(referrals_dict.values())
+        for entry in result:
+            entry['total_commission'] = from_minor(entry.pop('total_commission_minor'))
+        result.sort(key=lambda x: x['referral_date'] or '', reverse=True)
+        return result
+
+    def _build_commission_history(self, user_id: int) -> List[Dict]:
+        return [self._history_entry(comm) for comm in reversed(self._affiliate_commissions(user_id))]
+
+    def get_direct_referrals(self, user_id: int) -> List[int]:
+        """Ids of users this affiliate referred directly, oldest first"""
+        return self.referral_graph.direct(user_id)
+
+    def get_referrer(self, user_id: int) -> Optional[int]:
+        """Id of the affiliate who referred this user, if any"""
+        return self.referral_graph.referrer(user_id)
+
+    def get_upline(self, user_id: int, max_levels: int = None) -> List[int]:
+        """Referrer chain above a user, nearest first (for multi-tier commissions)"""
+        return self.referral_graph.upline(user_id, max_levels)
+
+    def get_referral_depth(self, user_id: int) -> int:
+        """How many referrers sit above this user"""
+        return self.referral_graph.depth(user_id)
+
+    def get_referral_tree_stats(self, user_id: int, max_depth: int = 3) -> Dict:
+        """Downline size per level below an affiliate, plus the affiliate's own depth"""
+        levels = self.referral_graph.level_counts(user_id, max_depth)
+        return {
+            'levels': levels,
+            'total': sum(levels.values()),
+            'depth': self.referral_graph.depth(user_id)
+        }
+
     # ====================
     # PAYOUT SYSTEM METHODS (FIXED)
     # ====================
 
     def create_payout_request(self, user_id: int, amount: float, method: str, details: str) -> Optional[str]:
-        """Create a new payout request. Does NOT modify balances."""
+        """Create a payout request, reserving commission amounts from the available balance."""
         try:
             user = self.fetch_user(user_id)
-            if not user:
+            amount_minor = to_minor(amount)
+            if not user or amount_minor <= 0:
                 return None
             
             # Generate payout ID
-            import random
-            import string
             payout_id = f"PAYOUT_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{user_id}_{''.join(random.choices(string.ascii_uppercase + string.digits, k=4))}"
             
-            # Create payout record
-            self.payouts[payout_id] = {
-                'id': payout_id,
-                'user_id': user_id,
-                'affiliate_name': user.get('name', 'Unknown'),
-                'amount': amount,
-                'method': method,
-                'details': details,
-                'status': 'pending',
-                'request_date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                'processed_date': None,
-                'proof_file_id': None
-            }
+            # Check and reserve under one lock so concurrent requests can't double-claim
+            with self._ledger_lock:
+                available = self.get_ledger_balance_minor(user_id)['available']
+                if amount_minor > available:
+                    logger.warning(f"Payout request for {user_id} of {amount} exceeds available {from_minor(available)}")
+                    return None
+                allocations, _ = self._allocate(user_id, amount_minor)
+                
+                # Create payout record
+                self.ledger_version += 1
+                self.payouts[payout_id] = {
+                    'id': payout_id,
+                    'user_id': user_id,
+                    'affiliate_name': user.get('name', 'Unknown'),
+                    'amount': from_minor(amount_minor),
+                    'amount_minor': amount_minor,
+                    'method': method,
+                    'details': details,
+                    'status': 'pending',
+                    'request_date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                    'processed_date': None,
+                    'proof_file_id': None,
+                    'allocations': allocations
+                }
             
-            # Do NOT touch affiliate_pending/available here – they are derived from commissions.
+            self.recalculate_affiliate_balance(user_id)
             self.db['payouts'] = self.payouts
+            self.search_index.index_payout(user_id, payout_id)
             self.mark_changed()
             
             logger.info(f"Payout request created: {payout_id} for user {user_id}, amount: {amount}")
@@ -897,42 +1663,50 @@ class UserDatabase:
         """Mark a payout as paid (without proof) – also marks commissions as paid."""
         return self.mark_payout_paid_with_proof(payout_id, proof_file_id=None)
 
+    def _settle_payout(self, payout: Dict, paid_date: str, proof_file_id: str = None):
+        """Pay the commission amounts allocated to one payout (no recalc / save)"""
+        user_id = payout['user_id']
+        
+        with self._ledger_lock:
+            pending = self._pending_commissions.get(str(user_id), {})
+            paid_total = 0
+            for allocation in payout.get('allocations', []):
+                comm = self.commissions.get(allocation['commission_id'])
+                if not comm:
+                    continue
+                comm['allocated_minor'] = max(comm['allocated_minor'] - allocation['amount_minor'], 0)
+                comm['paid_minor'] += allocation['amount_minor']
+                paid_total += allocation['amount_minor']
+                
+                # Fully paid commissions leave the pending index
+                if comm['paid_minor'] >= comm['amount_minor']:
+                    comm['status'] = 'paid'
+                    comm['paid_date'] = paid_date
+                    pending.pop(comm['id'], None)
+            
+            entry = self._ledger_entry(user_id)
+            entry['reserved'] -= paid_total
+            entry['paid'] += paid_total
+        
+        if not payout.get('allocations'):
+            logger.warning(f"Payout {payout['id']} for affiliate {user_id} has no allocated commissions")
+        
+        # Update payout record
+        self.ledger_version += 1
+        payout['status'] = 'paid'
+        payout['processed_date'] = paid_date
+        if proof_file_id:
+            payout['proof_file_id'] = proof_file_id
+
     def mark_payout_paid_with_proof(self, payout_id: str, proof_file_id: str = None) -> bool:
-        """Mark a payout as paid with proof, mark all pending commissions as paid, and recalc balance."""
+        """Mark a payout as paid with proof, pay its allocated commissions, and recalc balance."""
         try:
-            if payout_id not in self.payouts:
+            if payout_id not in self.payouts or self.payouts[payout_id].get('status') != 'pending':
                 return False
             
             payout = self.payouts[payout_id]
             user_id = payout['user_id']
-            
-            # Mark all pending commissions for this affiliate as paid
-            updated_any = False
-            for comm_id, comm in self.commissions.items():
-                if str(comm['affiliate_id']) == str(user_id) and comm.get('status') == 'pending':
-                    comm['status'] = 'paid'
-                    comm['paid_date'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                    updated_any = True
-                    
-                    # Also update the user's commission_history entry (if present)
-                    affiliate = self.fetch_user(user_id)
-                    if affiliate and 'commission_history' in affiliate:
-                        for entry in affiliate['commission_history']:
-                            if (entry.get('referral_id') == comm['user_id'] and 
-                                entry.get('amount') == comm['amount'] and
-                                entry.get('date') == comm['date']):
-                                entry['status'] = 'paid'
-                                break
-                        self.users[str(user_id)] = affiliate
-            
-            if not updated_any:
-                logger.warning(f"No pending commissions found for affiliate {user_id} when processing payout {payout_id}")
-            
-            # Update payout record
-            self.payouts[payout_id]['status'] = 'paid'
-            self.payouts[payout_id]['processed_date'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            if proof_file_id:
-                self.payouts[payout_id]['proof_file_id'] = proof_file_id
+            self._settle_payout(payout, datetime.now().strftime('%Y-%m-%d %H:%M:%S'), proof_file_id)
             
             # Recalculate affiliate balances from commissions (resets pending/available to zero if all paid)
             self.recalculate_affiliate_balance(user_id)
@@ -941,23 +1715,64 @@ class UserDatabase:
             self.db['payouts'] = self.payouts
             self.mark_changed()
             
-            logger.info(f"Payout {payout_id} marked as paid, all pending commissions for user {user_id} set to paid.")
+            logger.info(f"Payout {payout_id} marked as paid, allocated commissions for user {user_id} settled.")
             return True
         except Exception as e:
             logger.error(f"Error marking payout paid with proof: {e}")
             return False
 
+    def settle_payouts(self, payout_ids: List[str]) -> Dict:
+        """Settle many pending payouts in one pass with a single save.
+
+        Returns {'settled': [payout dicts], 'skipped': [ids], 'total': amount, 'seconds': elapsed}
+        """
+        started = time.time()
+        settled, skipped = [], []
+        try:
+            paid_date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            affiliates = set()
+            
+            with self.batch():
+                for payout_id in dict.fromkeys(payout_ids):
+                    payout = self.payouts.get(payout_id)
+                    if not payout or payout.get('status') != 'pending':
+                        skipped.append(payout_id)
+                        continue
+                    self._settle_payout(payout, paid_date)
+                    affiliates.add(payout['user_id'])
+                    settled.append(payout)
+                
+                for user_id in affiliates:
+                    self.recalculate_affiliate_balance(user_id)
+                
+                if settled:
+                    self.mark_changed()
+            
+            logger.info(f"Bulk settled {len(settled)} payouts for {len(affiliates)} affiliates in {time.time() - started:.3f}s")
+        except Exception as e:
+            logger.error(f"Error in bulk payout settlement: {e}")
+        
+        return {
+            'settled': settled,
+            'skipped': skipped,
+            'total': from_minor(sum(p['amount_minor'] for p in settled)),
+            'seconds': time.time() - started
+        }
+
     def reject_payout_request(self, payout_id: str) -> bool:
-        """Reject a payout request. Does NOT modify balances because commissions remain pending."""
+        """Reject a payout request and release its reserved commission amounts."""
         try:
-            if payout_id not in self.payouts:
+            payout = self.payouts.get(payout_id)
+            if not payout or payout.get('status') != 'pending':
                 return False
             
-            # Update payout status
-            self.payouts[payout_id]['status'] = 'rejected'
-            self.payouts[payout_id]['processed_date'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            with self._ledger_lock:
+                self._release(payout)
+                payout['status'] = 'rejected'
+                self.ledger_version += 1
+                payout['processed_date'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
             
-            # No need to modify affiliate balances – commissions are still pending.
+            self.recalculate_affiliate_balance(payout['user_id'])
             self.db['payouts'] = self.payouts
             self.mark_changed()
             return True
@@ -1011,20 +1826,20 @@ class UserDatabase:
     def get_commission_report(self) -> Dict:
         """Get commission report for admin"""
         try:
-            total_commissions = sum(commission['amount'] for commission in self.commissions.values())
+            credited = [c for c in self.commissions.values() if c.get('status') not in UNCREDITED_STATUSES]
+            total_commissions = from_minor(sum(commission['amount_minor'] for commission in credited))
             total_affiliates = len([u for u in self.users.values() if u.get('is_affiliate', False)])
             
-            # Count by plan type
+            # Count by plan type (kobo, converted once)
             by_plan_type = {}
-            for commission in self.commissions.values():
+            for commission in credited:
                 plan_type = commission['plan_type']
-                if plan_type not in by_plan_type:
-                    by_plan_type[plan_type] = 0.0
-                by_plan_type[plan_type] += commission['amount']
+                by_plan_type[plan_type] = by_plan_type.get(plan_type, 0) + commission['amount_minor']
+            by_plan_type = {plan_type: from_minor(total) for plan_type, total in by_plan_type.items()}
             
             # Get recent commissions
             recent_commissions = sorted(
-                self.commissions.values(),
+                credited,
                 key=lambda x: x['date'],
                 reverse=True
             )[:10]
@@ -1044,7 +1859,8 @@ class UserDatabase:
                 'total_affiliates': total_affiliates,
                 'total_referrals': len(self.referrals),
                 'by_plan_type': by_plan_type,
-                'recent_commissions': formatted_recent
+                'recent_commissions': formatted_recent,
+                'held_count': len(self._held_commissions)
             }
         except Exception as e:
             logger.error(f"Error generating commission report: {e}")
@@ -1081,38 +1897,29 @@ class UserDatabase:
             
             conversion_rate = (active_referrals / len(self.referrals) * 100) if self.referrals else 0.0
             
-            # Get top performers (this month)
-            current_month = datetime.now().strftime('%Y-%m')
-            monthly_commissions = {}
-            
-            for commission in self.commissions.values():
-                commission_month = commission['date'][:7]  # Get YYYY-MM
-                if commission_month == current_month:
-                    affiliate_id = commission['affiliate_id']
-                    if affiliate_id not in monthly_commissions:
-                        monthly_commissions[affiliate_id] = 0.0
-                    monthly_commissions[affiliate_id] += commission['amount']
-            
-            # Get top 5 performers
-            top_performers = []
-            for affiliate_id, earnings in sorted(monthly_commissions.items(), key=lambda x: x[1], reverse=True)[:5]:
-                affiliate = self.fetch_user(affiliate_id)
-                if affiliate:
-                    top_performers.append({
-                        'name': affiliate.get('name', 'Unknown'),
-                        'earnings': earnings,
-                        'referrals': affiliate.get('referral_count', 0)
-                    })
+            # Get top 5 performers (this month) from the leaderboard
+            top_performers = [
+                {
+                    'name': entry['name'],
+                    'earnings': entry['total'],
+                    'referrals': entry['referrals']
+                }
+                for entry in self.get_leaderboard('month', 5)
+            ]
             
             # Calculate commission distribution
-            academy_commissions = 0.0
-            vip_commissions = 0.0
+            academy_minor = 0
+            vip_minor = 0
             
             for commission in self.commissions.values():
+                if commission.get('status') in UNCREDITED_STATUSES:
+                    continue
                 if commission['plan_type'] == 'academy':
-                    academy_commissions += commission['amount']
+                    academy_minor += commission['amount_minor']
                 else:
-                    vip_commissions += commission['amount']
+                    vip_minor += commission['amount_minor']
+            academy_commissions = from_minor(academy_minor)
+            vip_commissions = from_minor(vip_minor)
             
             return {
                 'active_affiliates': len(active_affiliates),
@@ -1127,6 +1934,56 @@ class UserDatabase:
             logger.error(f"Error getting affiliate performance stats: {e}")
             return {}
 
+    # ========== LEADERBOARDS ==========
+    def _rebuild_leaderboards(self):
+        """Load current-period totals from the commission records (startup only)"""
+        try:
+            for commission in self.commissions.values():
+                if commission.get('status') in UNCREDITED_STATUSES:
+                    continue
+                self.leaderboards.record(
+                    commission['affiliate_id'], commission['amount_minor'],
+                    commission.get('date', ''), commission.get('plan_type')
+                )
+        except Exception as e:
+            logger.error(f"Error building leaderboards: {e}")
+
+    def get_leaderboard(self, period: str = 'month', limit: int = 10) -> List[Dict]:
+        """Top affiliates for 'week', 'month' or 'all' with names attached"""
+        try:
+            leaders = []
+            for affiliate_id, total in self.leaderboards.top(period, limit):
+                affiliate = self.users.get(str(affiliate_id), {})
+                leaders.append({
+                    'affiliate_id': affiliate_id,
+                    'name': affiliate.get('name', f'User {affiliate_id}'),
+                    'total': from_minor(total),
+                    'referrals': affiliate.get('referral_count', 0)
+                })
+            return leaders
+        except Exception as e:
+            logger.error(f"Error getting {period} leaderboard: {e}")
+            return []
+
+    def get_leaderboard_summary(self, period: str = 'month') -> Dict:
+        """Totals for the current period: amount, transactions, affiliates, per-plan split"""
+        board = self.leaderboards.board(period)
+        return {
+            'total': from_minor(board.total_amount),
+            'transactions': board.entry_count,
+            'affiliates': len(board),
+            'by_plan': {plan: from_minor(total) for plan, total in board.by_plan.items()}
+        }
+
+    def get_affiliate_rank(self, affiliate_id: int, period: str = 'month') -> Tuple[Optional[int], float, int]:
+        """(rank, period total, ranked affiliates) for one affiliate"""
+        try:
+            rank, total, size = self.leaderboards.rank(period, affiliate_id)
+            return rank, from_minor(total), size
+        except Exception as e:
+            logger.error(f"Error getting rank for {affiliate_id}: {e}")
+            return None, 0.0, 0
+
     def get_payout_requests_by_status(self, status: str = 'pending') -> List[Dict]:
         """Get payout requests by status"""
         return [
@@ -1141,23 +1998,19 @@ class UserDatabase:
         if not user or not user.get('is_affiliate'):
             return {}
         
-        # Calculate monthly earnings
+        # Calculate monthly earnings and top earning plans
         monthly_earnings = {}
-        for commission in self.commissions.values():
-            if str(commission['affiliate_id']) == str(user_id):
-                month = commission['date'][:7]  # YYYY-MM
-                if month not in monthly_earnings:
-                    monthly_earnings[month] = 0.0
-                monthly_earnings[month] += commission['amount']
-        
-        # Get top earning plans
         plan_earnings = {}
-        for commission in self.commissions.values():
-            if str(commission['affiliate_id']) == str(user_id):
-                plan_key = f"{commission['plan_type']}_{commission.get('vip_duration', '')}"
-                if plan_key not in plan_earnings:
-                    plan_earnings[plan_key] = 0.0
-                plan_earnings[plan_key] += commission['amount']
+        for commission in self._affiliate_commissions(user_id):
+            if commission.get('status') in UNCREDITED_STATUSES:
+                continue
+            month = commission['date'][:7]  # YYYY-MM
+            monthly_earnings[month] = monthly_earnings.get(month, 0) + commission['amount_minor']
+            
+            plan_key = f"{commission['plan_type']}_{commission.get('vip_duration', '')}"
+            plan_earnings[plan_key] = plan_earnings.get(plan_key, 0) + commission['amount_minor']
+        monthly_earnings = {month: from_minor(total) for month, total in monthly_earnings.items()}
+        plan_earnings = {plan: from_minor(total) for plan, total in plan_earnings.items()}
         
         return {
             'total_earnings': user.get('affiliate_earnings', 0.0),
@@ -1174,8 +2027,13 @@ class UserDatabase:
         try:
             total_users = len(self.users)
             total_affiliates = len([u for u in self.users.values() if u.get('is_affiliate', False)])
-            total_commissions = sum(commission['amount'] for commission in self.commissions.values())
-            total_payouts = sum(payout['amount'] for payout in self.payouts.values() if payout['status'] == 'paid')
+            total_commissions = from_minor(sum(
+                commission['amount_minor'] for commission in self.commissions.values()
+                if commission.get('status') not in UNCREDITED_STATUSES
+            ))
+            total_payouts = from_minor(sum(
+                payout['amount_minor'] for payout in self.payouts.values() if payout['status'] == 'paid'
+            ))
             
             # Calculate active subscriptions
             active_subscriptions = 0
@@ -1204,6 +2062,42 @@ class UserDatabase:
             logger.error(f"Error getting database stats: {e}")
             return {}
 
+    def get_daily_series(self, days: int, end_date: datetime = None) -> Dict[str, List]:
+        """Daily commission and payout totals for the last `days` days (oldest first)"""
+        try:
+            end = (end_date or datetime.now()).date()
+            dates = [end - timedelta(days=offset) for offset in range(days - 1, -1, -1)]
+            index = {day.strftime('%Y-%m-%d'): i for i, day in enumerate(dates)}
+
+            # Summed in kobo, converted per day at the end
+            commissions = [0] * days
+            payouts_requested = [0] * days
+            payouts_paid = [0] * days
+
+            for commission in self.commissions.values():
+                i = index.get((commission.get('date') or '')[:10])
+                if i is not None and commission.get('status') not in UNCREDITED_STATUSES:
+                    commissions[i] += commission['amount_minor']
+
+            for payout in self.payouts.values():
+                i = index.get((payout.get('request_date') or '')[:10])
+                if i is not None:
+                    payouts_requested[i] += payout['amount_minor']
+                if payout.get('status') == 'paid':
+                    i = index.get((payout.get('processed_date') or '')[:10])
+                    if i is not None:
+                        payouts_paid[i] += payout['amount_minor']
+
+            return {
+                'labels': [day.strftime('%m-%d') for day in dates],
+                'commissions': [from_minor(v) for v in commissions],
+                'payouts_requested': [from_minor(v) for v in payouts_requested],
+                'payouts_paid': [from_minor(v) for v in payouts_paid]
+            }
+        except Exception as e:
+            logger.error(f"Error building daily series: {e}")
+            return {'labels': [], 'commissions': [], 'payouts_requested': [], 'payouts_paid': []}
+
     # ====================
     # BACKUP AND MAINTENANCE
     # ====================
@@ -0,0 +1,96 @@
+# deferred_actions.py - Delayed Telegram actions (delete / edit / follow-up) run off the handler threads
+import logging
+import time
+import uuid
+from datetime import datetime
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+# Action name -> bot method; arguments are passed as keywords
+ACTIONS = {
+    'delete': 'delete_message',
+    'edit_text': 'edit_message_text',
+    'edit_markup': 'edit_message_reply_markup',
+    'send': 'send_message'
+}
+
+# Delays at least this long (seconds) are stored so they survive a restart
+PERSIST_AFTER = 60
+
+class DeferredActions:
+    """Schedules bot calls for later as one-shot jobs on the APScheduler thread pool.
+
+    Handlers call e.g. `delete(chat_id, message_id, delay=5)` and return
+    at once. Actions due `persist_after` seconds or more from now are also
+    written to `store` (add_deferred / remove_deferred / get_deferred) and
+    re-scheduled by `restore()` at startup; shorter ones only live in memory.
+    Keyword arguments must be JSON-serializable (e.g. reply_markup as JSON).
+    """
+
+    def __init__(self, bot, scheduler, store, persist_after: int = PERSIST_AFTER):
+        self.bot = bot
+        self.scheduler = scheduler
+        self.store = store
+        self.persist_after = persist_after
+
+    def schedule(self, action: str, delay: float, **kwargs) -> str:
+        """Run bot action `action` with `kwargs` in `delay` seconds; returns the task id"""
+        if action not in ACTIONS:
+            raise KeyError(f"Unknown deferred action: {action}")
+        task_id = uuid.uuid4().hex[:12]
+        run_at = time.time() + delay
+        if delay >= self.persist_after:
+            self.store.add_deferred(task_id, action, kwargs, int(run_at))
+        self._add_job(task_id, action, kwargs, run_at)
+        return task_id
+
+    def _add_job(self, task_id: str, action: str, kwargs: Dict, run_at: float):
+        self.scheduler.add_job(
+            self._run,
+            trigger='date',
+            run_date=datetime.fromtimestamp(run_at),
+            args=[task_id, action, kwargs],
+            id=f"deferred_{task_id}",
+            misfire_grace_time=None,
+            replace_existing=True
+        )
+
+    def _run(self, task_id: str, action: str, kwargs: Dict):
+        try:
+            getattr(self.bot, ACTIONS[action])(**kwargs)
+        except Exception as e:
+            # Usually the message is already gone or unchanged
+            logger.warning(f"Deferred {action} {task_id} failed: {e}")
+        finally:
+            self.store.remove_deferred(task_id)
+
+    def cancel(self, task_id: str):
+        try:
+            self.scheduler.remove_job(f"deferred_{task_id}")
+        except Exception:
+            pass
+        self.store.remove_deferred(task_id)
+
+    def restore(self) -> int:
+        """Re-schedule stored actions after a restart; overdue ones run right away"""
+        now = time.time()
+        tasks = self.store.get_deferred()
+        for task_id, task in tasks.items():
+            self._add_job(task_id, task['action'], task['kwargs'], max(task['run_at'], now))
+        if tasks:
+            logger.info(f"Restored {len(tasks)} deferred actions")
+        return len(tasks)
+
+    # ====================
+    # SHORTCUTS
+    # ====================
+
+    def delete(self, chat_id: int, message_id: int, delay: float) -> str:
+        return self.schedule('delete', delay, chat_id=chat_id, message_id=message_id)
+
+    def edit_text(self, chat_id: int, message_id: int, text: str, delay: float, **kwargs) -> str:
+        return self.schedule('edit_text', delay, text=text, chat_id=chat_id, message_id=message_id, **kwargs)
+
+    def send(self, chat_id: int, text: str, delay: float, **kwargs) -> str:
+        return self.schedule('send', delay, chat_id=chat_id, text=text, **kwargs)
@@ -0,0 +1,238 @@
+# flood_control.py - Per-user debounce / token buckets for updates and de-duplicated message edits
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from telebot import TeleBot, types
+from telebot.apihelper import ApiTelegramException
+from telebot.handler_backends import BaseMiddleware, CancelUpdate
+
+logger = logging.getLogger(__name__)
+
+# Identical taps / texts from one user within this many seconds count once
+DEBOUNCE_SECONDS = 1.0
+
+# Token bucket per user: sustained updates per second and burst size
+RATE_PER_SECOND = 2.0
+BURST = 8
+
+# Users (and messages) whose recent state is remembered
+MAX_TRACKED = 10000
+
+class TokenBucket:
+    """Classic token bucket; `take` refills by elapsed time, then spends a token if there is one"""
+
+    __slots__ = ('tokens', 'updated')
+
+    def __init__(self, burst: int):
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def take(self, rate: float, burst: int) -> bool:
+        now = time.monotonic()
+        self.tokens = min(burst, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+class FloodControl(BaseMiddleware):
+    """Drops repeated taps and rate-limits each user before any handler runs.
+
+    - A callback with the same data on the same message (or the same text
+      message) within `debounce` seconds is coalesced into the first one.
+    - Each user gets a token bucket; updates beyond it are dropped.
+    Dropped callbacks are still answered so the client stops its spinner.
+    Needs TeleBot(use_class_middlewares=True).
+    """
+
+    def __init__(self, bot, debounce: float = DEBOUNCE_SECONDS, rate: float = RATE_PER_SECOND,
+                 burst: int = BURST, exempt: Iterable[int] = ()):
+        super().__init__()
+        self.update_types = ['message', 'callback_query']
+        self.bot = bot
+        self.debounce = debounce
+        self.rate = rate
+        self.burst = burst
+        self.exempt = set(exempt)
+        self._last: 'OrderedDict[int, Tuple[Tuple, float]]' = OrderedDict()
+        self._buckets: 'OrderedDict[int, TokenBucket]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'passed': 0, 'coalesced': 0, 'throttled': 0}
+
+    @staticmethod
+    def _fingerprint(update) -> Optional[Tuple]:
+        if isinstance(update, types.CallbackQuery):
+            message_id = update.message.message_id if update.message else None
+            return ('callback', update.data, message_id)
+        if getattr(update, 'content_type', None) == 'text':
+            return ('text', update.text)
+        return None
+
+    def _verdict(self, user_id: int, fingerprint: Optional[Tuple]) -> Optional[str]:
+        now = time.monotonic()
+        with self._lock:
+            last = self._last.get(user_id)
+            if fingerprint and last and last[0] == fingerprint and now - last[1] < self.debounce:
+                self.stats['coalesced'] += 1
+                return 'coalesced'
+
+            bucket = self._buckets.get(user_id)
+            if bucket is None:
+                bucket = self._buckets[user_id] = TokenBucket(self.burst)
+                if len(self._buckets) > MAX_TRACKED:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(user_id)
+            if not bucket.take(self.rate, self.burst):
+                self.stats['throttled'] += 1
+                return 'throttled'
+
+            self._last[user_id] = (fingerprint, now)
+            self._last.move_to_end(user_id)
+            if len(self._last) > MAX_TRACKED:
+                self._last.popitem(last=False)
+            self.stats['passed'] += 1
+            return None
+
+    def pre_process(self, update, data):
+        user = getattr(update, 'from_user', None)
+        if user is None or user.id in self.exempt:
+            return None
+
+        verdict = self._verdict(user.id, self._fingerprint(update))
+        if verdict is None:
+            return None
+
+        if isinstance(update, types.CallbackQuery):
+            try:
+                text = "⏳ Too many taps, please slow down." if verdict == 'throttled' else None
+                self.bot.answer_callback_query(update.id, text)
+            except Exception as e:
+                logger.debug(f"Could not answer dropped callback: {e}")
+        return CancelUpdate()
+
+    def post_process(self, update, data, exception):
+        pass
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.stats)
+
+def _markup_key(reply_markup) -> Optional[str]:
+    if reply_markup is None:
+        return None
+    if isinstance(reply_markup, str):
+        return reply_markup
+    return reply_markup.to_json()
+
+class EditDedupBot(TeleBot):
+    """TeleBot that skips edits which wouldn't change the message.
+
+    The content of each message the bot last edited is remembered, so an
+    identical edit (a repeated tap) is not sent, and Telegram's "message is
+    not modified" error is treated as success. Edits of one message are
+    serialized; one that was superseded by a newer edit while waiting is
+    dropped, so only the latest state is sent. `on_edit_sent`, when set,
+    is called for each of these edits that actually goes to Telegram.
+    """
+
+    # Edits that may be skipped; API call counters hook on_edit_sent instead of wrapping them
+    DEDUPED_EDITS = ('edit_message_text', 'edit_message_reply_markup')
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._edited: 'OrderedDict[Tuple, Tuple]' = OrderedDict()
+        self._edit_seq: Dict[Tuple, int] = {}
+        self._edit_lock = threading.Lock()
+        self._stripes = [threading.Lock() for _ in range(64)]
+        self.edit_stats = {'sent': 0, 'unchanged': 0, 'superseded': 0}
+        self.on_edit_sent: Optional[Callable[[], None]] = None
+
+    @staticmethod
+    def _edit_key(chat_id, message_id, inline_message_id) -> Tuple:
+        return (str(chat_id), message_id, inline_message_id)
+
+    def _count(self, outcome: str):
+        with self._edit_lock:
+            self.edit_stats[outcome] += 1
+
+    def _remember(self, key: Tuple, content: Tuple):
+        with self._edit_lock:
+            self._edited[key] = content
+            self._edited.move_to_end(key)
+            if len(self._edited) > MAX_TRACKED:
+                self._edited.popitem(last=False)
+
+    def _forget(self, key: Tuple):
+        with self._edit_lock:
+            self._edited.pop(key, None)
+
+    def _coalesced_edit(self, key: Tuple, content: Tuple, send):
+        with self._edit_lock:
+            seq = self._edit_seq.get(key, 0) + 1
+            self._edit_seq[key] = seq
+
+        with self._stripes[hash(key) % len(self._stripes)]:
+            with self._edit_lock:
+                superseded = self._edit_seq.get(key) != seq
+                unchanged = self._edited.get(key) == content
+                if self._edit_seq.get(key) == seq:
+                    del self._edit_seq[key]
+            if superseded:
+                self._count('superseded')
+                return None
+            if unchanged:
+                self._count('unchanged')
+                return None
+
+            if self.on_edit_sent:
+                self.on_edit_sent()
+            try:
+                result = send()
+            except ApiTelegramException as e:
+                if 'message is not modified' not in str(e):
+                    self._forget(key)
+                    raise
+                self._count('unchanged')
+                result = None
+            else:
+                self._count('sent')
+            self._remember(key, content)
+            return result
+
+    def edit_message_text(self, text, chat_id=None, message_id=None, inline_message_id=None, *args, **kwargs):
+        key = self._edit_key(chat_id, message_id, inline_message_id)
+        digest = hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+        content = ('text', digest, kwargs.get('parse_mode'), _markup_key(kwargs.get('reply_markup')), args)
+        return self._coalesced_edit(key, content, lambda: super(EditDedupBot, self).edit_message_text(
+            text, chat_id, message_id, inline_message_id, *args, **kwargs))
+
+    def edit_message_reply_markup(self, chat_id=None, message_id=None, inline_message_id=None, reply_markup=None):
+        key = self._edit_key(chat_id, message_id, inline_message_id)
+        with self._edit_lock:
+            previous = self._edited.get(key)
+        markup = _markup_key(reply_markup)
+        if previous and previous[0] == 'text':
+            # Same text, new keyboard: remember it as a text edit with that keyboard
+            content = previous[:3] + (markup,) + previous[4:]
+        else:
+            content = ('markup', markup)
+        return self._coalesced_edit(key, content, lambda: super(EditDedupBot, self).edit_message_reply_markup(
+            chat_id, message_id, inline_message_id, reply_markup))
+
+    def edit_message_media(self, media, chat_id=None, message_id=None, *args, **kwargs):
+        self._forget(self._edit_key(chat_id, message_id, kwargs.get('inline_message_id')))
+        return super().edit_message_media(media, chat_id, message_id, *args, **kwargs)
+
+    def edit_message_caption(self, caption, chat_id=None, message_id=None, *args, **kwargs):
+        self._forget(self._edit_key(chat_id, message_id, kwargs.get('inline_message_id')))
+        return super().edit_message_caption(caption, chat_id, message_id, *args, **kwargs)
+
+    def delete_message(self, chat_id, message_id, *args, **kwargs):
+        self._forget(self._edit_key(chat_id, message_id, None))
+        return super().delete_message(chat_id, message_id, *args, **kwargs)
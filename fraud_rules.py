@@ -0,0 +1,110 @@
+# fraud_rules.py - Streaming fraud checks for referral and commission events
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+# Default limits per affiliate within WINDOW_SECONDS
+REFERRAL_BURST_LIMIT = 15      # new accounts joining through one link
+COMMISSION_VELOCITY_LIMIT = 8  # commissions credited to one affiliate
+WINDOW_SECONDS = 3600
+
+# Affiliates tracked at once; least recently active are dropped first
+MAX_TRACKED = 10000
+
+HOLD_REASONS = {
+    'self_referral': "Affiliate referred themselves",
+    'referrer_mismatch': "User was referred by a different affiliate",
+    'referral_burst': "Burst of new accounts through this affiliate's link",
+    'commission_velocity': "Too many commissions in a short time"
+}
+
+class SlidingWindowCounter:
+    """Event count over the last `window` seconds using a fixed ring of buckets.
+
+    Memory is constant and add/count touch at most `buckets` slots, so both
+    are O(1) regardless of traffic.
+    """
+
+    def __init__(self, window: float, buckets: int = 12):
+        self.width = window / buckets
+        self.buckets = buckets
+        self._counts = [0] * buckets
+        self._epochs = [-1] * buckets
+
+    def add(self, now: float) -> int:
+        """Record one event and return the count in the window including it"""
+        epoch = int(now // self.width)
+        slot = epoch % self.buckets
+        if self._epochs[slot] != epoch:
+            self._epochs[slot] = epoch
+            self._counts[slot] = 0
+        self._counts[slot] += 1
+        return self.count(now)
+
+    def count(self, now: float) -> int:
+        oldest = int(now // self.width) - self.buckets
+        return sum(c for c, e in zip(self._counts, self._epochs) if e > oldest)
+
+class FraudRules:
+    """Rules applied to each referral click and commission as it happens"""
+
+    def __init__(self, referral_limit: int = REFERRAL_BURST_LIMIT,
+                 commission_limit: int = COMMISSION_VELOCITY_LIMIT,
+                 window_seconds: int = WINDOW_SECONDS, max_tracked: int = MAX_TRACKED):
+        self.referral_limit = referral_limit
+        self.commission_limit = commission_limit
+        self.window_seconds = window_seconds
+        self.max_tracked = max_tracked
+        self._referrals: 'OrderedDict[int, SlidingWindowCounter]' = OrderedDict()
+        self._commissions: 'OrderedDict[int, SlidingWindowCounter]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _hit(self, table: OrderedDict, affiliate_id: int, now: float) -> int:
+        counter = table.get(affiliate_id)
+        if counter is None:
+            counter = table[affiliate_id] = SlidingWindowCounter(self.window_seconds)
+            if len(table) > self.max_tracked:
+                table.popitem(last=False)
+        else:
+            table.move_to_end(affiliate_id)
+        return counter.add(now)
+
+    def check_referral(self, affiliate_id: int, user_id: int, current_referrer: Optional[int],
+                       is_new_user: bool, now: float = None) -> Tuple[str, Optional[str]]:
+        """Decide on a referral link click.
+
+        Returns ('allow' | 'flag' | 'reject', reason). Flagged referrals are
+        recorded, but their commissions are held for review.
+        """
+        affiliate_id, user_id = int(affiliate_id), int(user_id)
+        if affiliate_id == user_id:
+            return 'reject', 'self_referral'
+        if current_referrer is not None:
+            # Already attributed (to this affiliate or another): never re-attribute
+            return 'reject', 'already_referred'
+        if not is_new_user:
+            return 'allow', None
+
+        with self._lock:
+            count = self._hit(self._referrals, affiliate_id, now or time.time())
+        if count > self.referral_limit:
+            return 'flag', 'referral_burst'
+        return 'allow', None
+
+    def check_commission(self, affiliate_id: int, user_id: int, referrer_id: Optional[int],
+                         referral_flag: Optional[str] = None, now: float = None) -> Optional[str]:
+        """Hold reason for a new commission, or None if it can be credited"""
+        affiliate_id = int(affiliate_id)
+        if affiliate_id == int(user_id):
+            return 'self_referral'
+        if referrer_id is not None and int(referrer_id) != affiliate_id:
+            return 'referrer_mismatch'
+
+        with self._lock:
+            count = self._hit(self._commissions, affiliate_id, now or time.time())
+        if referral_flag:
+            return referral_flag
+        if count > self.commission_limit:
+            return 'commission_velocity'
+        return None
@@ -0,0 +1,115 @@
+# leaderboard.py - Incrementally maintained affiliate leaderboards per period
+import bisect
+import threading
+from datetime import datetime
+from typing import Optional, Dict, List, Tuple
+
+PERIODS = ('week', 'month', 'all')
+
+def period_key(period: str, date: datetime) -> str:
+    """Bucket identifier for a date: ISO week, calendar month or all time"""
+    if period == 'week':
+        year, week, _ = date.isocalendar()
+        return f"{year}-W{week:02d}"
+    if period == 'month':
+        return date.strftime('%Y-%m')
+    return 'all'
+
+class Leaderboard:
+    """Running commission totals for one period.
+
+    Ranking is a list of (-total, affiliate_id) kept sorted with bisect, so
+    top-k is a slice (O(k)) and an affiliate's rank is a binary search.
+    Amounts are integer kobo.
+    """
+
+    def __init__(self, key: str):
+        self.key = key
+        self.totals: Dict[int, int] = {}
+        self.counts: Dict[int, int] = {}
+        self.by_plan: Dict[str, int] = {}
+        self.total_amount = 0
+        self.entry_count = 0
+        self._ranking: List[Tuple[float, int]] = []
+
+    def add(self, affiliate_id: int, amount: int, plan_type: str = None):
+        """Add (or with a negative amount, remove) commission for an affiliate"""
+        old_total = self.totals.get(affiliate_id)
+        if old_total is not None:
+            i = bisect.bisect_left(self._ranking, (-old_total, affiliate_id))
+            if i < len(self._ranking) and self._ranking[i] == (-old_total, affiliate_id):
+                del self._ranking[i]
+
+        new_total = (old_total or 0) + amount
+        count = self.counts.get(affiliate_id, 0) + (1 if amount >= 0 else -1)
+        if count > 0:
+            self.totals[affiliate_id] = new_total
+            self.counts[affiliate_id] = count
+            bisect.insort(self._ranking, (-new_total, affiliate_id))
+        else:
+            self.totals.pop(affiliate_id, None)
+            self.counts.pop(affiliate_id, None)
+
+        if plan_type:
+            self.by_plan[plan_type] = self.by_plan.get(plan_type, 0) + amount
+        self.total_amount += amount
+        self.entry_count += 1 if amount >= 0 else -1
+
+    def top(self, k: int) -> List[Tuple[int, int]]:
+        """Top k (affiliate_id, total) pairs"""
+        return [(affiliate_id, -neg_total) for neg_total, affiliate_id in self._ranking[:k]]
+
+    def rank(self, affiliate_id: int) -> Optional[int]:
+        """1-based rank (ties share a rank), or None if the affiliate has no entries"""
+        total = self.totals.get(affiliate_id)
+        if total is None:
+            return None
+        return bisect.bisect_left(self._ranking, (-total, float('-inf'))) + 1
+
+    def __len__(self):
+        return len(self._ranking)
+
+class LeaderboardSet:
+    """Week / month / all-time leaderboards that roll over with the calendar"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        now = datetime.now()
+        self._boards = {period: Leaderboard(period_key(period, now)) for period in PERIODS}
+
+    def record(self, affiliate_id: int, amount: int, date_str: str, plan_type: str = None):
+        """Apply a commission (dated 'YYYY-MM-DD HH:MM:SS') to every period it falls in"""
+        try:
+            date = datetime.strptime(date_str[:19], '%Y-%m-%d %H:%M:%S')
+        except (ValueError, TypeError):
+            date = datetime.now()
+
+        with self._lock:
+            for period in PERIODS:
+                key = period_key(period, date)
+                board = self._boards[period]
+                if key > board.key:
+                    board = self._boards[period] = Leaderboard(key)
+                if key == board.key:
+                    board.add(int(affiliate_id), amount, plan_type)
+
+    def board(self, period: str) -> Leaderboard:
+        """Current board for a period (an empty one if the period has rolled over)"""
+        with self._lock:
+            key = period_key(period, datetime.now())
+            board = self._boards[period]
+            if key != board.key:
+                board = self._boards[period] = Leaderboard(key)
+            return board
+
+    def top(self, period: str, k: int) -> List[Tuple[int, int]]:
+        board = self.board(period)
+        with self._lock:
+            return board.top(k)
+
+    def rank(self, period: str, affiliate_id: int) -> Tuple[Optional[int], int, int]:
+        """(rank, total, number of ranked affiliates) for an affiliate"""
+        board = self.board(period)
+        with self._lock:
+            affiliate_id = int(affiliate_id)
+            return board.rank(affiliate_id), board.totals.get(affiliate_id, 0), len(board)
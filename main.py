@@ -3,8 +3,9 @@
 # FIXED: Admin "View User" and "Check History" buttons now working
 
 import time
-from typing import Optional, Dict, List, Tuple
-from telebot import TeleBot, types
+import functools
+from typing import Callable, Optional, Dict, List, Tuple
+from telebot import types
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
 from datetime import datetime, timedelta
@@ -14,9 +15,27 @@ import csv
 import io
 import config
 from database import UserDatabase
+from charts import ChartCache
+from report_jobs import ReportJobQueue
+from notifications import RateLimitedSender
+from fraud_rules import HOLD_REASONS
+from commission_engine import CommissionEngine, load_rate_schedule
+from database import UNCREDITED_STATUSES
+from money import from_minor
+from pop_store import PopStore
+from message_templates import ScreenRegistry, inline_keyboard, reply_keyboard, pairs
+from tutorial_catalog import TutorialCatalog
+from media_cache import MediaCache
+from message_composer import ApiCallMeter, MessageComposer
+from conversations import ConversationManager
+from deferred_actions import DeferredActions
+from flood_control import EditDedupBot, FloodControl
+from membership import MembershipService, STATUS_STATES
+from reconciliation import MembershipReconciler
 from threading import Thread
 from flask import Flask, request, Response
 import hashlib
+import html
 import random
 import string
 import os
@@ -44,11 +63,56 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # Bot initialization
-bot = TeleBot(config.bot_token, threaded=True, num_threads=5)
+bot = EditDedupBot(config.bot_token, threaded=True, num_threads=5, use_class_middlewares=True)
 user_db = UserDatabase(DB_FILE)
 scheduler = BackgroundScheduler()
+chart_cache = ChartCache()
+report_jobs = ReportJobQueue(max_workers=2, ttl_seconds=30)
+notifier = RateLimitedSender(per_second=20)
+
+# Repeated taps and floods are dropped before any handler runs (admins exempt)
+flood_control = FloodControl(bot, exempt=config.admin_ids)
+bot.setup_middleware(flood_control)
+
+# Bot API calls per user action (see /apistats); wraps the bot's methods, so created first
+api_meter = ApiCallMeter()
+api_meter.instrument(bot)
+
+# Static screens (text + keyboard JSON) rendered once at import
+screens = ScreenRegistry()
+
+# Telegram file_ids of uploaded tutorial media, persisted in the database
+media_cache = MediaCache(bot, user_db)
+
+# Sends/edits text, media and keyboards in as few calls as possible
+composer = MessageComposer(bot, media_cache)
+
+def download_pop(file_id: str) -> bytes:
+    return bot.download_file(bot.get_file(file_id).file_path)
+
+# Proof hashes for duplicate detection, indexed from earlier uploads
+pop_store = PopStore(download_pop, max_workers=2)
+pop_store.load(user_db.get_proof_hashes())
 ADMIN_IDS = config.admin_ids
 
+# Multi-step prompts (payout details, proofs, searches), persisted per chat
+conversations = ConversationManager(user_db)
+
+# Delayed deletes / edits / follow-ups, run by the scheduler instead of sleeping handlers
+deferred = DeferredActions(bot, scheduler, user_db)
+
+# Group grants / removals, queued off the approval and expiry handlers
+membership = MembershipService(bot, user_db)
+
+# ====================
+# CONVERSATION ROUTING
+# ====================
+
+# Registered before every other message handler so a pending prompt gets the answer
+@bot.message_handler(func=conversations.is_waiting, content_types=['text', 'photo', 'document'])
+def handle_conversation_step(message: types.Message):
+    conversations.dispatch(message)
+
 # ====================
 # CONSTANTS
 # ====================
@@ -88,240 +152,45 @@ COMMISSION_RATES = {
 
 MINIMUM_PAYOUT = 10000  # ₦10,000 minimum payout
 
-# Reminder settings
-REMINDER_DAYS = [7, 3, 1, 0]  # Days before expiry to send reminders
-GRACE_PERIOD_DAYS = 3  # Days after expiry before removal
+# Pricing x rates compiled once; rate changes go in COMMISSION_SCHEDULE_FILE
+commission_engine = CommissionEngine(
+    PRICING, COMMISSION_RATES,
+    fx_rates={'usd': config.USD_NGN_RATE},
+    schedule=load_rate_schedule(config.COMMISSION_SCHEDULE_FILE) if config.COMMISSION_SCHEDULE_FILE else None
+)
 
-# Tutorial videos data with improved display - FULL LIST RESTORED
-TUTORIALS = [
-    {
-        'id': 1,
-        'title': 'Complete Bybit Futures Trading Tutorial',
-        'url': 'https://youtu.be/V18dbSJAiSg?si=vpDzwUAUdxmKshUy',
-        'telegram_video_id': None,
-        'description': 'Learn everything about Bybit futures trading from scratch',
-        'category': 'bybit',
-        'thumbnail': 'https://img.youtube.com/vi/V18dbSJAiSg/maxresdefault.jpg'
-    },
-    {
-        'id': 2,
-        'title': 'How to Take Bybit Futures Trade',
-        'url': 'https://youtu.be/_mZpfmzJwNI?si=hu0unpTY61bo_Xyc',
-        'telegram_video_id': None,
-        'description': 'Step-by-step guide to executing trades on Bybit',
-        'category': 'bybit',
-        'thumbnail': 'https://img.youtube.com/vi/_mZpfmzJwNI/maxresdefault.jpg'
-    },
-    {
-        'id': 3,
-        'title': 'Risk Management in Trading',
-        'url': 'https://youtu.be/mrWATu8ArvQ?si=kxU5nmGXHYkoIEjK',
-        'telegram_video_id': None,
-        'description': 'Essential risk management strategies for traders',
-        'category': 'strategies',
-        'thumbnail': 'https://img.youtube.com/vi/mrWATu8ArvQ/maxresdefault.jpg'
-    },
-    {
-        'id': 4,
-        'title': 'Binance Futures Trading Tutorial',
-        'url': 'https://youtu.be/skR2iwjbyCk?si=SJNUs87z3GPfsd2P',
-        'telegram_video_id': None,
-        'description': 'Complete guide to Binance Futures trading',
-        'category': 'binance',
-        'thumbnail': 'https://img.youtube.com/vi/skR2iwjbyCk/maxresdefault.jpg'
-    },
-    {
-        'id': 5,
-        'title': 'Difference Between Futures and Spot Trading',
-        'url': 'https://youtu.be/uaRQHxnArXY?si=nc-pEz3FPBIgCH1t',
-        'telegram_video_id': None,
-        'description': 'Understand the key differences between trading styles',
-        'category': 'education',
-        'thumbnail': 'https://img.youtube.com/vi/uaRQHxnArXY/maxresdefault.jpg'
-    },
-    {
-        'id': 6,
-        'title': 'Solana Meme Coins Trading',
-        'url': 'https://youtu.be/XG-XkiEW7ow?si=etmoHICp0gES_teG',
-        'telegram_video_id': None,
-        'description': 'How to trade Solana meme coins effectively',
-        'category': 'strategies',
-        'thumbnail': 'https://img.youtube.com/vi/XG-XkiEW7ow/maxresdefault.jpg'
-    },
-    {
-        'id': 7,
-        'title': 'Top 3 Mistakes to Avoid as a Beginner',
-        'url': 'https://youtu.be/XbKyefl5eg8?si=DOsrmGBjPcHdCrwT',
-        'telegram_video_id': None,
-        'description': 'Avoid these common beginner mistakes',
-        'category': 'education',
-        'thumbnail': 'https://img.youtube.com/vi/XbKyefl5eg8/maxresdefault.jpg'
-    },
-    {
-        'id': 8,
-        'title': 'How to Make Money Trading Futures on Bybit',
-        'url': 'https://youtu.be/_mZpfmzJwNI?si=H645QCaKHQpqFez_',
-        'telegram_video_id': None,
-        'description': 'Profit strategies for Bybit Futures trading',
-        'category': 'bybit',
-        'thumbnail': 'https://img.youtube.com/vi/_mZpfmzJwNI/maxresdefault.jpg'
-    },
-    {
-        'id': 9,
-        'title': 'How to Buy Crypto and USDT on Bybit',
-        'url': 'https://youtu.be/DUbG2kRfWfo?si=T8dMHFF4_foSUf3c',
-        'telegram_video_id': None,
-        'description': 'Guide to purchasing crypto on Bybit',
-        'category': 'bybit',
-        'thumbnail': 'https://img.youtube.com/vi/DUbG2kRfWfo/maxresdefault.jpg'
-    },
-    {
-        'id': 10,
-        'title': 'How to Set Multiple Take Profit Levels',
-        'url': 'https://youtu.be/KQu-0gjyD_E?si=bE1d4Iwf5bdUH1_k',
-        'telegram_video_id': None,
-        'description': 'Advanced take profit strategies',
-        'category': 'strategies',
-        'thumbnail': 'https://img.youtube.com/vi/KQu-0gjyD_E/maxresdefault.jpg'
-    },
-    {
-        'id': 11,
-        'title': 'Ourbit Exchange Tutorial',
-        'url': 'https://www.youtube.com/watch?v=5bFTayPtYVo&t=33s',
-        'telegram_video_id': None,
-        'description': 'How to sign up, deposit, and trade on Ourbit Exchange',
-        'category': 'exchanges',
-        'thumbnail': 'https://img.youtube.com/vi/5bFTayPtYVo/maxresdefault.jpg'
-    },
-    {
-        'id': 12,
-        'title': 'How to Fund Your OurBit Account',
-        'url': 'https://youtu.be/rSs4XGBQjjE?si=SE-7_hmnkHfuD4Mm',
-        'telegram_video_id': None,
-        'description': 'Deposit funds into your OurBit account',
-        'category': 'exchanges',
-        'thumbnail': 'https://img.youtube.com/vi/rSs4XGBQjjE/maxresdefault.jpg'
-    },
-    {
-        'id': 13,
-        'title': 'Crypto Futures Trading for Beginners (Part 1)',
-        'url': 'https://www.youtube.com/watch?v=P_HCpTUpm14&t=495s',
-        'telegram_video_id': None,
-        'description': 'Learn How to Trade Futures on Ourbit - Part 1',
-        'category': 'exchanges',
-        'thumbnail': 'https://img.youtube.com/vi/P_HCpTUpm14/maxresdefault.jpg'
-    },
-    {
-        'id': 14,
-        'title': 'How to Trade Crypto Futures on Ourbit (Part 2)',
-        'url': 'https://www.youtube.com/watch?v=HUGeqkKUeVA&t=782s',
-        'telegram_video_id': None,
-        'description': 'Learn How to Trade Futures on Ourbit - Part 2',
-        'category': 'exchanges',
-        'thumbnail': 'https://img.youtube.com/vi/HUGeqkKUeVA/maxresdefault.jpg'
-    },
-    {
-        'id': 15,
-        'title': 'Cross Margin vs Isolated Margin Explained',
-        'url': 'https://youtu.be/Gx1nLTLEu0k',
-        'telegram_video_id': None,
-        'description': 'Understand different margin types',
-        'category': 'education',
-        'thumbnail': 'https://img.youtube.com/vi/Gx1nLTLEu0k/maxresdefault.jpg'
+# Chartable admin reports: title, days covered and series plotted
+REPORT_CHARTS = {
+    'monthly': {
+        'title': 'Commissions vs payouts - this month',
+        'days': lambda: datetime.now().day,
+        'series': ['commissions', 'payouts_paid']
     },
-    {
-        'id': 16,
-        'title': 'Bitunix Futures Trading Guide',
-        'url': 'https://www.youtube.com/watch?v=PXcdcwxpGhs&t=8s',
-        'telegram_video_id': None,
-        'description': 'Learn How to Trade Crypto Like a Pro on Bitunix',
-        'category': 'exchanges',
-        'thumbnail': 'https://img.youtube.com/vi/PXcdcwxpGhs/maxresdefault.jpg'
+    'payouts_weekly': {
+        'title': 'Payouts - last 7 days',
+        'days': lambda: 7,
+        'series': ['payouts_requested', 'payouts_paid']
     },
-    {
-        'id': 17,
-        'title': 'How to Buy and Sell Crypto Safely on Bybit P2P',
-        'url': 'https://www.youtube.com/watch?v=iFTvlWVuezk',
-        'telegram_video_id': None,
-        'description': 'Step-by-Step Beginner Tutorial for P2P trading',
-        'category': 'bybit',
-        'thumbnail': 'https://img.youtube.com/vi/iFTvlWVuezk/maxresdefault.jpg'
-    },
-    {
-        'id': 18,
-        'title': 'Day Trading vs Swing Trading',
-        'url': 'https://www.youtube.com/watch?v=60cvCpHYW5I',
-        'telegram_video_id': None,
-        'description': 'Which Trading Style Is More Profitable',
-        'category': 'strategies',
-        'thumbnail': 'https://img.youtube.com/vi/60cvCpHYW5I/maxresdefault.jpg'
-    },
-    {
-        'id': 19,
-        'title': 'Easy Steps to Fund Your Moonshot Account',
-        'url': 'https://www.youtube.com/watch?v=-bi8v8I0N2s',
-        'telegram_video_id': None,
-        'description': 'Without Any Hassle account funding',
-        'category': 'exchanges',
-        'thumbnail': 'https://img.youtube.com/vi/-bi8v8I0N2s/maxresdefault.jpg'
-    },
-    {
-        'id': 20,
-        'title': 'Futures Trading: How to Manually Close Your Trades',
-        'url': 'https://www.youtube.com/watch?v=jjJWiCWSKnA&t=7s',
-        'telegram_video_id': None,
-        'description': 'Or Take Partial Profit manually',
-        'category': 'strategies',
-        'thumbnail': 'https://img.youtube.com/vi/jjJWiCWSKnA/maxresdefault.jpg'
-    },
-    {
-        'id': 21,
-        'title': 'MEXC Exchange Tutorial',
-        'url': 'https://www.youtube.com/watch?v=o_wxdFVFtf0',
-        'telegram_video_id': None,
-        'description': 'How to trade crypto on MEXC Exchange',
-        'category': 'exchanges',
-        'thumbnail': 'https://img.youtube.com/vi/o_wxdFVFtf0/maxresdefault.jpg'
-    },
-    {
-        'id': 22,
-        'title': 'How To Avoid Bybit P2P Scams',
-        'url': 'https://www.youtube.com/watch?v=zBD5uxz_Gi8&t=10s',
-        'telegram_video_id': None,
-        'description': 'Stay safe from P2P scams',
-        'category': 'security',
-        'thumbnail': 'https://img.youtube.com/vi/zBD5uxz_Gi8/maxresdefault.jpg'
-    },
-    {
-        'id': 23,
-        'title': 'Mining vs Staking: Which Is More Profitable',
-        'url': 'https://www.youtube.com/watch?v=RZ3tEPA-qBc&t=8s',
-        'telegram_video_id': None,
-        'description': 'Compare mining and staking profitability',
-        'category': 'education',
-        'thumbnail': 'https://img.youtube.com/vi/RZ3tEPA-qBc/maxresdefault.jpg'
-    },
-    {
-        'id': 24,
-        'title': 'How to Set Multiple Take Profit on Bybit Futures',
-        'url': 'https://www.youtube.com/watch?v=KQu-0gjyD_E',
-        'telegram_video_id': None,
-        'description': 'Advanced take profit settings on Bybit',
-        'category': 'strategies',
-        'thumbnail': 'https://img.youtube.com/vi/KQu-0gjyD_E/maxresdefault.jpg'
+    'commission': {
+        'title': 'Commissions vs payouts - last 30 days',
+        'days': lambda: 30,
+        'series': ['commissions', 'payouts_paid']
     }
-]
+}
 
-# Tutorial categories
-TUTORIAL_CATEGORIES = {
-    'bybit': '📊 Bybit Tutorials',
-    'binance': '💼 Binance Tutorials',
-    'exchanges': '🔄 Other Exchanges',
-    'strategies': '📈 Trading Strategies',
-    'education': '📚 Trading Education',
-    'security': '🔒 Security Guides'
+CHART_SERIES_LABELS = {
+    'commissions': 'Commissions',
+    'payouts_requested': 'Payouts requested',
+    'payouts_paid': 'Payouts paid'
 }
 
+# Reminder settings
+REMINDER_DAYS = [7, 3, 1, 0]  # Days before expiry to send reminders
+GRACE_PERIOD_DAYS = 3  # Days after expiry before removal
+
+# Tutorial library: tutorials.json, reloaded when the file changes (no redeploy needed)
+tutorial_catalog = TutorialCatalog(config.TUTORIALS_FILE)
+
 # Recommended Exchange Links
 RECOMMENDED_EXCHANGES = [
     {"name": "🚀 Bybit Exchange", "url": "https://www.bybit.com/invite?ref=L7ZG7", "description": "One of the best futures trading platforms"},
@@ -391,40 +260,8 @@ def get_chat_ids(program: str, plan_type: str):
             return config.forex_vip_chat_id, config.forex_vip_invite
     return None, None
 
-def add_user_to_group(user_id: int, chat_id: int, chat_name: str) -> bool:
-    """Try to add user directly to a group/channel"""
-    try:
-        # First try to unban if previously banned
-        try:
-            bot.unban_chat_member(chat_id, user_id, only_if_banned=True)
-        except Exception:
-            pass
-        
-        # Try to add user to chat
-        bot.add_chat_members(chat_id, [user_id])
-        logger.info(f"Successfully added user {user_id} to {chat_name}")
-        return True
-        
-    except Exception as e:
-        error_msg = str(e)
-        logger.warning(f"Could not add user {user_id} to {chat_name}: {error_msg}")
-        
-        # Check specific error types
-        if "USER_ALREADY_PARTICIPANT" in error_msg:
-            logger.info(f"User {user_id} is already in {chat_name}")
-            return True
-        elif "USER_NOT_MUTUAL_CONTACT" in error_msg or "USER_PRIVACY_RESTRICTED" in error_msg:
-            logger.info(f"User {user_id} has privacy restrictions for {chat_name}")
-            return False
-        elif "CHAT_ADMIN_REQUIRED" in error_msg:
-            logger.error(f"Bot is not admin in {chat_name}")
-            return False
-        else:
-            logger.error(f"Error adding user to {chat_name}: {error_msg}")
-            return False
-
 def send_group_access(user_id: int, program: str, plan_type: str, days: int = None):
-    """Handle sending group access to user - FIXED VERSION"""
+    """Queue group access for a user; one DM with the join links follows once it's done"""
     program_name = "Crypto" if program == "crypto" else "Forex"
     plan_name = plan_display_name(plan_type, None)
     
@@ -438,41 +275,39 @@ def send_group_access(user_id: int, program: str, plan_type: str, days: int = No
     # Format expiry text
     expiry_text = f" until {(datetime.now() + timedelta(days=days)).strftime('%Y-%m-%d')}" if days else ""
     
-    # SPECIAL FIX: For Crypto Academy, always use invite link (not direct addition)
-    if program == 'crypto' and plan_type == 'academy':
-        if invite_link:
-            # Test if the link is valid by checking if it contains the correct format
-            if invite_link.startswith('https://t.me/+'):
-                bot.send_message(user_id, f"✅ You have been approved for {program_name} {plan_name}!\n\nJoin here: {invite_link}")
-                logger.info(f"Sent Crypto Academy invite link to user {user_id}: {invite_link}")
-            else:
-                bot.send_message(user_id, f"✅ Approved for {program_name} {plan_name}! Please use this link to join: {invite_link}")
-        else:
-            bot.send_message(user_id, f"✅ Approved for {program_name} {plan_name}! Please contact admin for access link.")
-        return
-    
-    # For other groups, try direct addition first
-    chat_name = f"{program_name} {plan_name}"
-    if add_user_to_group(user_id, chat_id, chat_name):
-        bot.send_message(user_id, f"✅ You have been added to {program_name} {plan_name}{expiry_text}!")
-    else:
-        # Fallback to invite link
-        if invite_link:
-            bot.send_message(user_id, f"✅ You have {program_name} {plan_name} access{expiry_text}!\n\nJoin here: {invite_link}")
-        else:
-            bot.send_message(user_id, f"✅ Approved for {program_name} {plan_name}{expiry_text}! Please contact admin for access link.")
+    targets = [(chat_id, f"{program_name} {plan_name}", invite_link)]
     
-    # If crypto VIP, also handle degen group
+    # Crypto VIP includes the DeGen group
     if program == 'crypto' and plan_type == 'vip':
         degen_chat_id, degen_invite = get_chat_ids(program, 'degen')
         if degen_chat_id:
-            degen_name = "Crypto DeGen Group"
-            if add_user_to_group(user_id, degen_chat_id, degen_name):
-                bot.send_message(user_id, f"🔥 Added to Crypto DeGen Group!")
-            elif degen_invite:
-                bot.send_message(user_id, f"🔥 Crypto DeGen Group (included with VIP Signals): {degen_invite}")
+            targets.append((degen_chat_id, "Crypto DeGen Group", degen_invite))
+    
+    def on_done(results: List[Dict]):
+        main_result, extras = results[0], results[1:]
+        if main_result.get('already_member'):
+            text = f"✅ Your {program_name} {plan_name} access has been extended{expiry_text}. You're already in the group!"
+        elif main_result['invite_link']:
+            text = f"✅ You have been approved for {program_name} {plan_name}{expiry_text}!\n\nJoin here: {main_result['invite_link']}"
+            if main_result['ok']:
+                text += "\n\n🔒 This link is just for you and works once."
+        else:
+            text = f"✅ Approved for {program_name} {plan_name}{expiry_text}! Please contact admin for access link."
+        
+        for extra in extras:
+            if extra.get('already_member'):
+                continue
+            if extra['invite_link']:
+                text += f"\n\n🔥 {extra['chat_name']} (included with VIP Signals): {extra['invite_link']}"
             else:
-                bot.send_message(user_id, "🔥 Crypto DeGen Group access granted!")
+                text += f"\n\n🔥 {extra['chat_name']} access granted! Please contact admin for the link."
+        
+        try:
+            bot.send_message(user_id, text)
+        except Exception as e:
+            logger.error(f"Could not send group access to user {user_id}: {e}")
+    
+    membership.grant(user_id, targets, on_done)
 
 # ====================
 # AFFILIATE SYSTEM FUNCTIONS
@@ -488,47 +323,65 @@ def generate_affiliate_code(user_id: int) -> str:
 def calculate_commission(plan_type: str, vip_duration: Optional[str], amount_text: str) -> float:
     """Calculate commission based on plan type and duration"""
     try:
-        # Extract numeric amount from amount text (e.g., "₦35,000" -> 35000)
-        if '₦' in amount_text:
-            amount_str = amount_text.replace('₦', '').replace(',', '')
-            amount = float(amount_str)
-            currency = 'naira'
-        elif '$' in amount_text:
-            amount_str = amount_text.replace('$', '').replace(',', '')
-            amount = float(amount_str) * 1400  # Convert USD to NGN at approximate rate
-            currency = 'usd'
-        else:
-            return 0.0
-        
-        # Calculate commission based on plan type
-        if plan_type == 'academy':
-            commission_rate = COMMISSION_RATES['academy']
-        elif plan_type == 'vip' and vip_duration:
-            commission_rate = COMMISSION_RATES['vip'].get(vip_duration, 0.15)
-        else:
-            commission_rate = 0.15  # Default 15%
-        
-        commission = amount * commission_rate
-        return round(commission, 2)
+        quote = commission_engine.calculate(plan_type, vip_duration, amount_text)
+        return quote['commission'] if quote else 0.0
         
     except Exception as e:
         logger.error(f"Error calculating commission: {e}")
         return 0.0
 
+def notify_admins_held_commission(commission: Dict, affiliate: Dict):
+    """Ask admins to review a commission the fraud rules held back"""
+    kb = types.InlineKeyboardMarkup()
+    kb.row(
+        types.InlineKeyboardButton("✅ Release", callback_data=f"admin_held_ok:{commission['id']}"),
+        types.InlineKeyboardButton("🚫 Void", callback_data=f"admin_held_void:{commission['id']}")
+    )
+    kb.row(types.InlineKeyboardButton("🚩 All Held Commissions", callback_data="admin_held_commissions"))
+    
+    for admin_id in ADMIN_IDS:
+        try:
+            bot.send_message(
+                admin_id,
+                f"🚩 <b>Commission Held for Review</b>\n\n"
+                f"Affiliate: {html.escape(affiliate.get('name', 'Unknown'))} (ID: {commission['affiliate_id']})\n"
+                f"Referral: {commission['user_id']}\n"
+                f"Plan: {commission['program']} {commission['plan_type']} {commission.get('vip_duration') or ''}\n"
+                f"Commission: ₦{commission['amount']:,.2f}\n"
+                f"Reason: {HOLD_REASONS.get(commission['hold_reason'], commission['hold_reason'])}",
+                parse_mode='HTML',
+                reply_markup=kb
+            )
+        except Exception as e:
+            logger.error(f"Could not notify admin {admin_id}: {e}")
+
 def add_commission_to_affiliate(referred_by_id: int, user_id: int, program: str, plan_type: str, 
-                               vip_duration: Optional[str], amount_text: str):
+                               vip_duration: Optional[str], amount_text: str, approval_key: Optional[str] = None):
     """Add commission to affiliate when referral makes payment"""
     try:
-        # Calculate commission
-        commission_amount = calculate_commission(plan_type, vip_duration, amount_text)
+        # Already credited by an earlier attempt of this approval
+        if approval_key and user_db.commission_for_approval(approval_key):
+            return True
+        
+        # Calculate commission (the quote keeps the sale price, rate and FX for what-if reports)
+        quote = commission_engine.calculate(plan_type, vip_duration, amount_text)
+        commission_amount = quote['commission'] if quote else 0.0
         
         if commission_amount > 0:
             # Add commission to affiliate's earnings
-            user_db.add_commission(referred_by_id, user_id, commission_amount, program, plan_type, vip_duration)
+            commission_id = user_db.add_commission(
+                referred_by_id, user_id, commission_amount, program, plan_type, vip_duration, sale=quote,
+                approval_key=approval_key
+            )
+            if not commission_id:
+                return False
             
             # Get affiliate details
             affiliate = user_db.fetch_user(referred_by_id)
-            if affiliate:
+            commission = user_db.commissions[commission_id]
+            if affiliate and commission['status'] == 'held':
+                notify_admins_held_commission(commission, affiliate)
+            elif affiliate:
                 # Notify affiliate
                 try:
                     plan_name = plan_display_name(plan_type, vip_duration)
@@ -664,8 +517,9 @@ def get_program_benefits(program: str, plan_type: str) -> dict:
         ]
     }
 
-def remove_user_from_group(user_id: int, program: str, plan_type: str):
-    """Remove user from group when subscription expires"""
+def remove_user_from_group(user_id: int, program: str, plan_type: str,
+                           on_removed: Optional[Callable[[], None]] = None) -> bool:
+    """Queue removal of a user from a group when the subscription expires; on_removed runs once it's done"""
     try:
         chat_id, invite_link = get_chat_ids(program, plan_type)
         if not chat_id:
@@ -676,27 +530,144 @@ def remove_user_from_group(user_id: int, program: str, plan_type: str):
         plan_name = plan_display_name(plan_type, None)
         chat_name = f"{program_name} {plan_name}"
         
-        try:
-            # Ban user to remove them from the group
-            bot.ban_chat_member(chat_id, user_id)
-            logger.info(f"Removed user {user_id} from {chat_name}")
-            return True
-        except Exception as e:
-            error_msg = str(e)
-            if "USER_NOT_PARTICIPANT" in error_msg or "Chat not found" in error_msg:
-                logger.info(f"User {user_id} is not in {chat_name} or left already")
-                return True
-            elif "CHAT_ADMIN_REQUIRED" in error_msg:
-                logger.error(f"Bot is not admin in {chat_name}, cannot remove user")
-                return False
-            else:
-                logger.error(f"Error removing user {user_id} from {chat_name}: {error_msg}")
-                return False
+        def on_done(results: List[Dict]):
+            if results[0]['ok'] and on_removed:
+                on_removed()
+        
+        membership.revoke(user_id, [(chat_id, chat_name)], on_done)
+        return True
                 
     except Exception as e:
         logger.error(f"Error in remove_user_from_group for user {user_id}: {e}")
         return False
 
+# ====================
+# MEMBERSHIP RECONCILIATION
+# ====================
+
+def group_chats() -> List[Tuple[str, str, int, str, Optional[str]]]:
+    """(program, plan_type, chat_id, chat_name, invite link) for every configured group"""
+    chats = []
+    for program in ('crypto', 'forex'):
+        program_name = "Crypto" if program == "crypto" else "Forex"
+        for plan_type in ('academy', 'vip', 'degen'):
+            if plan_type == 'degen' and program != 'crypto':
+                continue
+            chat_id, invite_link = get_chat_ids(program, plan_type)
+            if not chat_id:
+                continue
+            chat_name = "Crypto DeGen Group" if plan_type == 'degen' else f"{program_name} {plan_display_name(plan_type, None)}"
+            chats.append((program, plan_type, chat_id, chat_name, invite_link))
+    return chats
+
+def membership_groups() -> List[Tuple]:
+    """(key, chat_id, chat_name, invite link, entitled user ids) for every configured group"""
+    groups = []
+    for program, plan_type, chat_id, chat_name, invite_link in group_chats():
+        # DeGen access comes with Crypto VIP; removal only happens after the grace period
+        entitled = user_db.get_entitled_users(program, 'vip' if plan_type == 'degen' else plan_type,
+                                              GRACE_PERIOD_DAYS)
+        groups.append((f"{program}_{plan_type}", chat_id, chat_name, invite_link, entitled))
+    return groups
+
+def _group_name(chat_id: int) -> Optional[str]:
+    for _, _, group_chat_id, chat_name, _ in group_chats():
+        if str(group_chat_id) == str(chat_id):
+            return chat_name
+    return None
+
+@bot.chat_member_handler()
+def on_group_member_update(update: types.ChatMemberUpdated):
+    """Keep the membership table live as users join, leave or get removed"""
+    try:
+        member = update.new_chat_member
+        if member.user.is_bot or not _group_name(update.chat.id):
+            return
+        
+        state = STATUS_STATES.get(member.status, 'left')
+        previous = user_db.get_membership(update.chat.id, member.user.id) or {}
+        # The bot's own bans stay 'revoked' so reconciliation may lift them later
+        if state == 'removed' and (update.from_user.id == bot.user.id or previous.get('state') == 'revoked'):
+            state = 'revoked'
+        if previous.get('state') != state:
+            user_db.set_membership(update.chat.id, member.user.id, state,
+                                   invite_link=previous.get('invite_link'))
+    except Exception as e:
+        logger.error(f"Error handling chat member update: {e}")
+
+@bot.my_chat_member_handler()
+def on_bot_member_update(update: types.ChatMemberUpdated):
+    """Track whether the bot can still manage each group; warn admins when it can't"""
+    try:
+        chat_name = _group_name(update.chat.id)
+        if not chat_name:
+            return
+        
+        is_admin = update.new_chat_member.status in ('administrator', 'creator')
+        membership.set_bot_status(update.chat.id, is_admin)
+        logger.info(f"Bot status in {chat_name}: {update.new_chat_member.status}")
+        
+        if not is_admin:
+            for admin_id in ADMIN_IDS:
+                try:
+                    bot.send_message(
+                        admin_id,
+                        f"⚠️ The bot is no longer an admin in {chat_name} "
+                        f"(status: {update.new_chat_member.status}). Invites and removals there will fail."
+                    )
+                except Exception as e:
+                    logger.error(f"Could not notify admin {admin_id}: {e}")
+    except Exception as e:
+        logger.error(f"Error handling bot member update: {e}")
+
+def notify_access_restored(user_id: int, results: List[Dict]):
+    """DM a subscriber whose group access the reconciliation restored"""
+    result = results[0]
+    if result['invite_link']:
+        text = f"✅ Your {result['chat_name']} access is active again.\n\nJoin here: {result['invite_link']}"
+    else:
+        text = f"✅ Your {result['chat_name']} access is active again. Please contact admin for the link."
+    try:
+        bot.send_message(user_id, text)
+    except Exception as e:
+        logger.error(f"Could not notify user {user_id} of restored access: {e}")
+
+reconciler = MembershipReconciler(bot, user_db, membership, exempt=ADMIN_IDS, on_granted=notify_access_restored)
+
+def run_membership_reconciliation(admin_id: int = None):
+    """Reconcile all groups; the report goes to admin_id, or to all admins when something changed"""
+    try:
+        report = reconciler.run(membership_groups())
+        
+        text = "🔄 <b>Membership Reconciliation</b>\n\n"
+        changed = False
+        for chat_name, summary in report.items():
+            if 'error' in summary:
+                changed = True
+                text += f"<b>{html.escape(chat_name)}</b>: ❌ {html.escape(summary['error'])}\n\n"
+                continue
+            
+            changed = changed or bool(summary['granted'] or summary['revoked'])
+            deferred_text = f" (+{summary['revokes_deferred']} next run)" if summary['revokes_deferred'] else ""
+            text += (
+                f"<b>{html.escape(chat_name)}</b>\n"
+                f"• Active subscribers: {summary['entitled']}, tracked members: {summary['known']}\n"
+                f"• Access restored: {summary['granted']}, removed: {summary['revoked']}{deferred_text}\n"
+                f"• Checked with Telegram: {summary['checked']} of {summary['unknown']} unknown\n\n"
+            )
+        if not report:
+            text += "No groups are configured."
+        
+        recipients = [admin_id] if admin_id else (ADMIN_IDS if changed else [])
+        for aid in recipients:
+            try:
+                bot.send_message(aid, text, parse_mode='HTML')
+            except Exception as e:
+                logger.error(f"Could not send reconciliation report to {aid}: {e}")
+    except Exception as e:
+        logger.error(f"Error in membership reconciliation: {e}")
+        logger.error(traceback.format_exc())
+
 def send_expiry_reminder(user_id: int, program: str, plan_type: str, days_left: int):
     """Send compelling reminder message to user about expiry"""
     try:
@@ -783,6 +754,45 @@ def send_expiry_reminder(user_id: int, program: str, plan_type: str, days_left:
     except Exception as e:
         logger.error(f"Error sending expiry reminder to user {user_id}: {e}")
 
+def finish_expired_removal(user_id: int, program: str, plan_type: str):
+    """Clear an expired subscription and tell the user and admins, once the removal went through"""
+    # Clear subscription in database
+    if plan_type == 'academy':
+        user_db.set_subscription(user_id, program, 'academy', 0)
+    else:
+        user_db.set_subscription(user_id, program, 'vip', 0)
+    
+    # Send final removal notice to user
+    program_name = "Crypto" if program == "crypto" else "Forex"
+    plan_name = plan_display_name(plan_type, None)
+    
+    removal_message = (
+        f"🎯 <b>We Miss You Already!</b>\n\n"
+        f"Your {program_name} {plan_name} access has been temporarily paused.\n\n"
+        f"<b>As a valued member, you enjoyed:</b>\n"
+        f"• Premium {'signals' if plan_type == 'vip' else 'education'} during your time with us\n"
+        f"• Growth opportunities that helped your development\n"
+        f"• Access to our exclusive trading community\n\n"
+        f"We'd love to welcome you back! Your participation made our community richer.\n\n"
+        f"<b>Ready to return?</b> Use \"Make Payment\" anytime to restart your journey with us. "
+        f"We're here to support your success! 🤝"
+    )
+    
+    try:
+        bot.send_message(user_id, removal_message, parse_mode='HTML')
+    except Exception as e:
+        logger.error(f"Could not send removal message to user {user_id}: {e}")
+    
+    # Notify admin
+    for admin_id in ADMIN_IDS:
+        try:
+            bot.send_message(
+                admin_id,
+                f"🔄 Auto-removed user {user_id} from {program_name} {plan_name} (expired beyond grace period)"
+            )
+        except Exception as e:
+            logger.error(f"Could not notify admin {admin_id}: {e}")
+
 def check_expiring_subscriptions():
     """Check for expiring subscriptions and send reminders"""
     try:
@@ -843,51 +853,15 @@ def check_expiring_subscriptions():
         # Process removals
         for user_id, program, plan_type in expired_users_to_remove:
             try:
-                # Remove from group
-                removed = remove_user_from_group(user_id, program, plan_type)
-                
-                if removed:
-                    # Clear subscription in database
-                    if plan_type == 'academy':
-                        user_db.set_subscription(user_id, program, 'academy', 0)
-                    else:
-                        user_db.set_subscription(user_id, program, 'vip', 0)
-                    
-                    # Send final removal notice to user
-                    program_name = "Crypto" if program == "crypto" else "Forex"
-                    plan_name = plan_display_name(plan_type, None)
-                    
-                    removal_message = (
-                        f"🎯 <b>We Miss You Already!</b>\n\n"
-                        f"Your {program_name} {plan_name} access has been temporarily paused.\n\n"
-                        f"<b>As a valued member, you enjoyed:</b>\n"
-                        f"• Premium {'signals' if plan_type == 'vip' else 'education'} during your time with us\n"
-                        f"• Growth opportunities that helped your development\n"
-                        f"• Access to our exclusive trading community\n\n"
-                        f"We'd love to welcome you back! Your participation made our community richer.\n\n"
-                        f"<b>Ready to return?</b> Use \"Make Payment\" anytime to restart your journey with us. "
-                        f"We're here to support your success! 🤝"
-                    )
-                    
-                    try:
-                        bot.send_message(user_id, removal_message, parse_mode='HTML')
-                    except Exception as e:
-                        logger.error(f"Could not send removal message to user {user_id}: {e}")
-                    
-                    # Notify admin
-                    for admin_id in ADMIN_IDS:
-                        try:
-                            bot.send_message(
-                                admin_id,
-                                f"🔄 Auto-removed user {user_id} from {program_name} {plan_name} (expired beyond grace period)"
-                            )
-                        except Exception as e:
-                            logger.error(f"Could not notify admin {admin_id}: {e}")
-                
+                # Remove from group; the subscription is cleared once that's done
+                remove_user_from_group(
+                    user_id, program, plan_type,
+                    on_removed=functools.partial(finish_expired_removal, user_id, program, plan_type)
+                )
             except Exception as e:
                 logger.error(f"Error removing user {user_id} from {program} {plan_type}: {e}")
         
-        logger.info(f"Expiry check completed. Processed {len(expired_users_to_remove)} expired subscriptions.")
+        logger.info(f"Expiry check completed. Queued {len(expired_users_to_remove)} expired subscriptions for removal.")
         
     except Exception as e:
         logger.error(f"Error in check_expiring_subscriptions: {e}")
@@ -993,8 +967,8 @@ def handle_payment_method(call: types.CallbackQuery):
             parse_mode='HTML'
         )
         
-        # Register next step handler to receive payment details
-        bot.register_next_step_handler(call.message, process_payment_details, method, uid)
+        # Next message from this chat is the payment details
+        conversations.start(call.message.chat.id, 'payout_details', method=method, uid=uid)
         
         bot.answer_callback_query(call.id)
         
@@ -1002,6 +976,7 @@ def handle_payment_method(call: types.CallbackQuery):
         logger.error(f"Error handling payment method: {e}")
         bot.answer_callback_query(call.id, "Error processing request.")
 
+@conversations.step('payout_details')
 def process_payment_details(message: types.Message, method: str, uid: int):
     """Process payment details from affiliate"""
     try:
@@ -1022,7 +997,7 @@ def process_payment_details(message: types.Message, method: str, uid: int):
                 "Try again:",
                 parse_mode='HTML'
             )
-            bot.register_next_step_handler(message, process_payment_details, method, uid)
+            conversations.start(message.chat.id, 'payout_details', method=method, uid=uid)
             return
         elif method == "usdt" and len(lines) < 2:
             bot.send_message(
@@ -1033,14 +1008,24 @@ def process_payment_details(message: types.Message, method: str, uid: int):
                 "Try again:",
                 parse_mode='HTML'
             )
-            bot.register_next_step_handler(message, process_payment_details, method, uid)
+            conversations.start(message.chat.id, 'payout_details', method=method, uid=uid)
             return
         
         # Get affiliate stats
         stats = user_db.get_affiliate_stats(uid)
         available_balance = stats.get('available_balance', 0)
         
-        # Create payout request with details
+        # Balance may already be reserved by a request made in the meantime
+        if available_balance < MINIMUM_PAYOUT:
+            bot.send_message(
+                uid,
+                f"❌ Your available balance (₦{available_balance:,.2f}) is below the minimum payout "
+                f"of ₦{MINIMUM_PAYOUT:,.2f}.\n\nAmounts in pending payout requests are reserved until processed.",
+                parse_mode='HTML'
+            )
+            return
+        
+        # Create payout request with details (reserves the commissions it covers)
         payout_id = user_db.create_payout_request(
             uid, 
             available_balance, 
@@ -1133,7 +1118,7 @@ def handle_admin_payout_paid_with_proof(call: types.CallbackQuery):
             f"Please upload proof of payment (photo or document) for payout {payout_id}.\n\n"
             f"After uploading, the system will:\n"
             f"1. Mark payout as paid\n"
-            f"2. Reset affiliate's balance to zero\n"
+            f"2. Mark the commissions reserved by this payout as paid\n"
             f"3. Send proof to affiliate\n\n"
             f"Upload proof now:",
             call.message.chat.id,
@@ -1141,14 +1126,15 @@ def handle_admin_payout_paid_with_proof(call: types.CallbackQuery):
             parse_mode='HTML'
         )
         
-        # Register next step to receive proof
-        bot.register_next_step_handler(call.message, process_payment_proof, payout_id)
+        # Next message from this chat is the proof
+        conversations.start(call.message.chat.id, 'payout_proof', payout_id=payout_id)
         
         bot.answer_callback_query(call.id)
         
     except Exception as e:
         logger.error(f"Error in admin payout with proof: {e}")
 
+@conversations.step('payout_proof')
 def process_payment_proof(message: types.Message, payout_id: str):
     """Process payment proof from admin"""
     try:
@@ -1189,7 +1175,7 @@ def process_payment_proof(message: types.Message, payout_id: str):
                             f"💰 Amount: <b>₦{payout['amount']:,.2f}</b>\n"
                             f"📅 Processed on: {datetime.now().strftime('%Y-%m-%d')}\n\n"
                             f"<b>Payment proof is attached.</b>\n\n"
-                            f"Your affiliate balance has been reset to zero.\n"
+                            f"This amount has been deducted from your affiliate balance.\n"
                             f"Keep sharing your referral link to earn more! 🚀"
                         ),
                         parse_mode='HTML'
@@ -1205,7 +1191,7 @@ def process_payment_proof(message: types.Message, payout_id: str):
                             f"💰 Amount: <b>₦{payout['amount']:,.2f}</b>\n"
                             f"📅 Processed on: {datetime.now().strftime('%Y-%m-%d')}\n\n"
                             f"<b>Payment proof is attached.</b>\n\n"
-                            f"Your affiliate balance has been reset to zero.\n"
+                            f"This amount has been deducted from your affiliate balance.\n"
                             f"Keep sharing your referral link to earn more! 🚀"
                         ),
                         parse_mode='HTML'
@@ -1220,7 +1206,7 @@ def process_payment_proof(message: types.Message, payout_id: str):
                 f"• Amount: ₦{payout['amount']:,.2f}\n"
                 f"• Affiliate: {payout['affiliate_name']}\n"
                 f"• Proof sent to affiliate\n"
-                f"• Balance reset to zero"
+                f"• Reserved commissions marked paid"
             )
         else:
             bot.send_message(message.chat.id, f"❌ Failed to process payout {payout_id}.")
@@ -1230,160 +1216,435 @@ def process_payment_proof(message: types.Message, payout_id: str):
         bot.send_message(message.chat.id, "❌ An error occurred.")
 
 # ====================
-# COMMISSION STRUCTURE VIEW
+# BULK PAYOUT SETTLEMENT
 # ====================
 
-def show_commission_structure(uid: int, message_id: int = None):
-    """Show commission structure to user"""
-    text = (
-        "💰 <b>Affiliate Commission Structure</b>\n\n"
-        "<b>Earn commissions on every successful referral:</b>\n\n"
-        
-        "📚 <b>Academy Subscription</b>\n"
-        f"• Commission Rate: <b>{COMMISSION_RATES['academy']*100}%</b>\n"
-        f"• Example: ₦35,000 × {COMMISSION_RATES['academy']*100}% = <b>₦{35000 * COMMISSION_RATES['academy']:,.0f}</b>\n\n"
-        
-        "💎 <b>VIP Signals - Monthly</b>\n"
-        f"• Commission Rate: <b>{COMMISSION_RATES['vip']['monthly']*100}%</b>\n"
-        f"• Example: ₦15,000 × {COMMISSION_RATES['vip']['monthly']*100}% = <b>₦{15000 * COMMISSION_RATES['vip']['monthly']:,.0f}</b>\n\n"
-        
-        "💎 <b>VIP Signals - 3 Months</b>\n"
-        f"• Commission Rate: <b>{COMMISSION_RATES['vip']['3_months']*100}%</b>\n"
-        f"• Example: ₦40,000 × {COMMISSION_RATES['vip']['3_months']*100}% = <b>₦{40000 * COMMISSION_RATES['vip']['3_months']:,.0f}</b>\n\n"
-        
-        "💎 <b>VIP Signals - 6 Months</b>\n"
-        f"• Commission Rate: <b>{COMMISSION_RATES['vip']['6_months']*100}%</b>\n"
-        f"• Example: ₦75,000 × {COMMISSION_RATES['vip']['6_months']*100}% = <b>₦{75000 * COMMISSION_RATES['vip']['6_months']:,.0f}</b>\n\n"
-        
-        "💎 <b>VIP Signals - 1 Year</b>\n"
-        f"• Commission Rate: <b>{COMMISSION_RATES['vip']['yearly']*100}%</b>\n"
-        f"• Example: ₦150,000 × {COMMISSION_RATES['vip']['yearly']*100}% = <b>₦{150000 * COMMISSION_RATES['vip']['yearly']:,.0f}</b>\n\n"
-        
-        f"🎯 <b>Minimum Payout:</b> ₦{MINIMUM_PAYOUT:,.2f}\n"
-        f"⏰ <b>Payout Processing:</b> 7 business days\n\n"
-        
-        "<b>How It Works:</b>\n"
-        "1. Share your unique referral link\n"
-        "2. When someone clicks and subscribes\n"
-        "3. You earn commission automatically!\n"
-        "4. Request payout when you reach minimum\n"
-        "5. Get paid within 7 business days\n\n"
-        
-        "Start earning today by sharing your referral link! 🚀"
-    )
-    
-    kb = types.InlineKeyboardMarkup()
-    kb.row(
-        types.InlineKeyboardButton("🤝 Apply to Become Affiliate", callback_data="affiliate_apply"),
-        types.InlineKeyboardButton("📱 Back to Menu", callback_data="mainmenu_back")
-    )
-    
-    if message_id:
-        bot.edit_message_text(text, uid, message_id, parse_mode='HTML', reply_markup=kb)
-    else:
-        bot.send_message(uid, text, parse_mode='HTML', reply_markup=kb)
+BULK_SETTLE_FILTERS = {
+    'all': 'All pending requests',
+    'older_7d': 'Requested 7+ days ago',
+    'csv': 'Payout IDs from uploaded CSV'
+}
 
-# ====================
-# FIXED: AFFILIATE BUTTON HANDLERS - ALL ISSUES FIXED
-# ====================
+# Minutes a previewed bulk selection can still be confirmed
+BULK_SETTLE_PREVIEW_MINUTES = 10
 
-@bot.callback_query_handler(func=lambda c: c.data == "affiliate_view_commission")
-def handle_view_commission_structure(call: types.CallbackQuery):
-    """Handle view commission structure callback"""
-    try:
-        uid = call.from_user.id
-        show_commission_structure(uid, call.message.message_id)
-        bot.answer_callback_query(call.id)
-    except Exception as e:
-        logger.error(f"Error showing commission structure: {e}")
-        bot.answer_callback_query(call.id, "Error loading commission structure.")
+# Payout ids parsed from an admin's uploaded CSV
+bulk_settle_uploads: Dict[int, List[str]] = {}
 
-# ====================
-# EXPORT FUNCTIONS
-# ====================
+# Snapshot of the payouts each admin was last shown on the confirm screen
+bulk_settle_selections: Dict[int, Dict] = {}
 
-def export_affiliates_to_csv(admin_id: int):
-    """Export affiliates data to CSV"""
+def select_bulk_payout_ids(admin_id: int, filter_key: str) -> List[str]:
+    """Pending payout ids matching a bulk settlement filter"""
+    if filter_key == 'csv':
+        return [
+            payout_id for payout_id in bulk_settle_uploads.get(admin_id, [])
+            if (user_db.get_payout_by_id(payout_id) or {}).get('status') == 'pending'
+        ]
+    
+    pending = user_db.get_payout_requests_by_status('pending')
+    if filter_key == 'older_7d':
+        cutoff = (datetime.now() - timedelta(days=7)).strftime('%Y-%m-%d %H:%M:%S')
+        pending = [p for p in pending if (p.get('request_date') or '') <= cutoff]
+    return [p['id'] for p in pending]
+
+def show_bulk_settle_menu(admin_id: int, message_id: int = None):
+    """Let admin pick which pending payouts to settle in one run"""
     try:
-        affiliates = user_db.get_all_affiliates()
-        
-        if not affiliates:
-            bot.send_message(admin_id, "❌ No affiliates to export.")
-            return
-        
-        # Create CSV in memory
-        output = io.StringIO()
-        fieldnames = ['ID', 'Name', 'Username', 'Affiliate Code', 'Earnings', 'Paid', 'Pending', 'Status']
-        writer = csv.DictWriter(output, fieldnames=fieldnames)
-        writer.writeheader()
-        
-        for affiliate in affiliates:
-            writer.writerow({
-                'ID': affiliate.get('tg_id'),
-                'Name': affiliate.get('name', 'N/A'),
-                'Username': affiliate.get('username', 'N/A'),
-                'Affiliate Code': affiliate.get('affiliate_code', 'N/A'),
-                'Earnings': affiliate.get('affiliate_earnings', 0),
-                'Paid': affiliate.get('affiliate_paid', 0),
-                'Pending': affiliate.get('affiliate_pending', 0),
-                'Status': 'Approved' if affiliate.get('is_affiliate') else 'Pending' if affiliate.get('affiliate_status') == 'pending' else 'Rejected'
-            })
-        
-        # Convert to bytes
-        csv_data = output.getvalue().encode('utf-8')
-        csv_file = io.BytesIO(csv_data)
-        csv_file.name = f'affiliates_export_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
+        text = (
+            f"⚡ <b>Bulk Payout Settlement</b>\n\n"
+            f"Settle many pending payouts at once. Commissions are marked paid, "
+            f"the database is written once and affiliates are notified in the background.\n\n"
+            f"<b>Choose which payouts to settle:</b>\n"
+        )
         
-        # Send file
-        bot.send_document(admin_id, csv_file, caption="📊 Affiliates Export - Generated on: " + datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+        kb = types.InlineKeyboardMarkup()
+        for filter_key in ['all', 'older_7d']:
+            payout_ids = select_bulk_payout_ids(admin_id, filter_key)
+            text += f"• {BULK_SETTLE_FILTERS[filter_key]}: {len(payout_ids)}\n"
+            kb.row(types.InlineKeyboardButton(
+                f"{BULK_SETTLE_FILTERS[filter_key]} ({len(payout_ids)})",
+                callback_data=f"admin_bulk_settle_preview:{filter_key}"
+            ))
         
-        logger.info(f"Exported affiliates data to admin {admin_id}")
+        kb.row(types.InlineKeyboardButton("📄 Upload CSV of Payout IDs", callback_data="admin_bulk_settle_csv"))
+        kb.row(types.InlineKeyboardButton("📋 Back to Payouts", callback_data="admin_view_payouts"))
         
+        if message_id:
+            bot.edit_message_text(text, admin_id, message_id, parse_mode='HTML', reply_markup=kb)
+        else:
+            bot.send_message(admin_id, text, parse_mode='HTML', reply_markup=kb)
+            
     except Exception as e:
-        logger.error(f"Error exporting affiliates to CSV: {e}")
-        bot.send_message(admin_id, f"❌ Error exporting data: {e}")
+        logger.error(f"Error showing bulk settle menu: {e}")
 
-def export_payouts_to_csv(admin_id: int):
-    """Export payouts data to CSV"""
+def show_bulk_settle_preview(admin_id: int, filter_key: str, message_id: int = None):
+    """Confirm screen: how many payouts and how much will be settled"""
     try:
-        payouts = user_db.get_all_payout_requests()
-        
-        if not payouts:
-            bot.send_message(admin_id, "❌ No payout data to export.")
-            return
-        
-        # Create CSV in memory
-        output = io.StringIO()
-        fieldnames = ['Payout ID', 'User ID', 'Affiliate Name', 'Amount', 'Method', 'Status', 'Request Date', 'Processed Date', 'Details']
-        writer = csv.DictWriter(output, fieldnames=fieldnames)
-        writer.writeheader()
+        payout_ids = select_bulk_payout_ids(admin_id, filter_key)
+        total = from_minor(sum(user_db.get_payout_by_id(pid)['amount_minor'] for pid in payout_ids))
+        
+        # Confirm settles exactly what is shown here, not whatever is pending by then
+        token = ''.join(random.choices(string.ascii_lowercase + string.digits, k=8))
+        bulk_settle_selections[admin_id] = {
+            'token': token,
+            'filter': filter_key,
+            'payout_ids': payout_ids,
+            'created': datetime.now()
+        }
         
-        for payout in payouts:
-            writer.writerow({
-                'Payout ID': payout.get('id', 'N/A'),
-                'User ID': payout.get('user_id', 'N/A'),
-                'Affiliate Name': payout.get('affiliate_name', 'N/A'),
-                'Amount': payout.get('amount', 0),
-                'Method': payout.get('method', 'N/A'),
-                'Status': payout.get('status', 'pending'),
-                'Request Date': payout.get('request_date', 'N/A'),
-                'Processed Date': payout.get('processed_date', 'N/A'),
-                'Details': payout.get('details', 'N/A')
-            })
+        kb = types.InlineKeyboardMarkup()
+        if payout_ids:
+            text = (
+                f"⚡ <b>Confirm Bulk Settlement</b>\n\n"
+                f"📋 Selection: {BULK_SETTLE_FILTERS.get(filter_key, filter_key)}\n"
+                f"💰 Payouts: {len(payout_ids)}\n"
+                f"💵 Total: ₦{total:,.2f}\n\n"
+                f"Only confirm after these transfers have been sent."
+            )
+            kb.row(types.InlineKeyboardButton(
+                f"✅ Settle {len(payout_ids)} Payouts", callback_data=f"admin_bulk_settle_confirm:{token}"
+            ))
+        else:
+            text = "⚡ <b>Bulk Settlement</b>\n\nNo pending payouts match this selection."
+        kb.row(types.InlineKeyboardButton("❌ Cancel", callback_data="admin_bulk_settle"))
         
-        # Convert to bytes
-        csv_data = output.getvalue().encode('utf-8')
-        csv_file = io.BytesIO(csv_data)
-        csv_file.name = f'payouts_export_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
+        if message_id:
+            bot.edit_message_text(text, admin_id, message_id, parse_mode='HTML', reply_markup=kb)
+        else:
+            bot.send_message(admin_id, text, parse_mode='HTML', reply_markup=kb)
+            
+    except Exception as e:
+        logger.error(f"Error showing bulk settle preview: {e}")
+
+def confirm_bulk_settlement(admin_id: int, token: str, message_id: int = None):
+    """Settle the previewed payouts in one transaction and queue affiliate notifications"""
+    try:
+        selection = bulk_settle_selections.pop(admin_id, None)
+        expired = (
+            selection is None or selection['token'] != token or
+            datetime.now() - selection['created'] > timedelta(minutes=BULK_SETTLE_PREVIEW_MINUTES)
+        )
+        if expired:
+            text = (
+                "⚠️ <b>Selection Expired</b>\n\n"
+                "This confirmation is out of date. Open the preview again and check the payouts before settling."
+            )
+            kb = types.InlineKeyboardMarkup()
+            kb.row(types.InlineKeyboardButton("⚡ Bulk Settle", callback_data="admin_bulk_settle"))
+            if message_id:
+                bot.edit_message_text(text, admin_id, message_id, parse_mode='HTML', reply_markup=kb)
+            else:
+                bot.send_message(admin_id, text, parse_mode='HTML', reply_markup=kb)
+            return
+        
+        result = user_db.settle_payouts(selection['payout_ids'])
+        bulk_settle_uploads.pop(admin_id, None)
+        
+        processed_on = datetime.now().strftime('%Y-%m-%d')
+        for payout in result['settled']:
+            notifier.enqueue(
+                bot.send_message,
+                payout['user_id'],
+                f"✅ <b>Payout Processed!</b>\n\n"
+                f"Your payout request has been processed.\n"
+                f"📄 Request ID: <code>{payout['id']}</code>\n"
+                f"💰 Amount: <b>₦{payout['amount']:,.2f}</b>\n"
+                f"📅 Processed on: {processed_on}\n\n"
+                f"Funds should reach your account within 3 business days.\n"
+                f"Contact @blockchainpluspro if you have any questions.",
+                parse_mode='HTML'
+            )
+        
+        settled = len(result['settled'])
+        seconds = result['seconds']
+        rate = settled / seconds if seconds > 0 else settled
+        text = (
+            f"✅ <b>Bulk Settlement Complete</b>\n\n"
+            f"• Settled: {settled} payouts\n"
+            f"• Total: ₦{result['total']:,.2f}\n"
+            f"• Skipped (not pending): {len(result['skipped'])}\n"
+            f"• Time: {seconds:.3f}s ({rate:,.0f} payouts/s)\n"
+            f"• Notifications queued: {settled} (sending in background)"
+        )
+        
+        kb = types.InlineKeyboardMarkup()
+        kb.row(
+            types.InlineKeyboardButton("📋 Back to Payouts", callback_data="admin_view_payouts"),
+            types.InlineKeyboardButton("📋 Processed Payouts", callback_data="admin_processed_payouts")
+        )
+        
+        if message_id:
+            bot.edit_message_text(text, admin_id, message_id, parse_mode='HTML', reply_markup=kb)
+        else:
+            bot.send_message(admin_id, text, parse_mode='HTML', reply_markup=kb)
+            
+    except Exception as e:
+        logger.error(f"Error in bulk settlement: {e}")
+        bot.send_message(admin_id, f"❌ Bulk settlement failed: {e}")
+
+def request_bulk_settle_csv(admin_id: int, message_id: int = None):
+    """Ask admin for a CSV whose cells contain payout IDs"""
+    try:
+        text = (
+            "📄 <b>Upload Payout IDs</b>\n\n"
+            "Send a CSV file containing the payout IDs to settle "
+            "(any column; cells starting with <code>PAYOUT_</code> are used).\n\n"
+            "You can use the Payouts CSV export as a template."
+        )
+        kb = types.InlineKeyboardMarkup()
+        kb.row(types.InlineKeyboardButton("❌ Cancel", callback_data="admin_bulk_settle"))
         
-        # Send file
-        bot.send_document(admin_id, csv_file, caption="💰 Payouts Export - Generated on: " + datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+        if message_id:
+            bot.edit_message_text(text, admin_id, message_id, parse_mode='HTML', reply_markup=kb)
+        else:
+            bot.send_message(admin_id, text, parse_mode='HTML', reply_markup=kb)
         
-        logger.info(f"Exported payouts data to admin {admin_id}")
+        conversations.start(admin_id, 'bulk_settle_csv')
         
     except Exception as e:
-        logger.error(f"Error exporting payouts to CSV: {e}")
-        bot.send_message(admin_id, f"❌ Error exporting data: {e}")
+        logger.error(f"Error requesting bulk settle CSV: {e}")
+
+@conversations.step('bulk_settle_csv')
+def process_bulk_settle_csv(message: types.Message):
+    """Parse payout IDs from an uploaded CSV and show the confirmation"""
+    try:
+        admin_id = message.from_user.id
+        if admin_id not in ADMIN_IDS:
+            return
+        
+        if message.content_type != 'document':
+            bot.send_message(admin_id, "❌ Please upload a CSV file. Open Bulk Settle again to retry.")
+            return
+        
+        file_info = bot.get_file(message.document.file_id)
+        content = bot.download_file(file_info.file_path).decode('utf-8-sig', errors='ignore')
+        
+        payout_ids = []
+        for row in csv.reader(io.StringIO(content)):
+            for cell in row:
+                cell = cell.strip()
+                if cell.startswith('PAYOUT_'):
+                    payout_ids.append(cell)
+        
+        bulk_settle_uploads[admin_id] = list(dict.fromkeys(payout_ids))
+        show_bulk_settle_preview(admin_id, 'csv')
+        
+    except Exception as e:
+        logger.error(f"Error processing bulk settle CSV: {e}")
+        bot.send_message(message.chat.id, f"❌ Could not read CSV: {e}")
+
+# ====================
+# HELD COMMISSION REVIEW
+# ====================
+
+def show_held_commissions(admin_id: int, message_id: int = None):
+    """List commissions held by the fraud rules with release / void buttons"""
+    held = user_db.get_held_commissions()
+    
+    text = f"🚩 <b>Held Commissions</b> ({len(held)})\n\n"
+    kb = types.InlineKeyboardMarkup()
+    
+    if not held:
+        text += "No commissions are waiting for review."
+    for comm in held[:10]:
+        affiliate = user_db.fetch_user(comm['affiliate_id']) or {}
+        text += (
+            f"<code>{comm['id']}</code>\n"
+            f"Affiliate: {html.escape(affiliate.get('name', 'Unknown'))} (ID: {comm['affiliate_id']})\n"
+            f"Referral: {comm['user_id']} • {comm['program']} {comm['plan_type']}\n"
+            f"Amount: ₦{comm['amount']:,.2f} • {comm['date']}\n"
+            f"Reason: {comm['hold_reason_text']}\n\n"
+        )
+        kb.row(
+            types.InlineKeyboardButton(f"✅ Release ₦{comm['amount']:,.0f}", callback_data=f"admin_held_ok:{comm['id']}"),
+            types.InlineKeyboardButton("🚫 Void", callback_data=f"admin_held_void:{comm['id']}")
+        )
+    if len(held) > 10:
+        text += f"... and {len(held) - 10} more (oldest shown first)"
+    
+    kb.row(
+        types.InlineKeyboardButton("🔄 Refresh", callback_data="admin_held_commissions"),
+        types.InlineKeyboardButton("🤝 Back to Management", callback_data="admin_affiliate_mgmt")
+    )
+    
+    if message_id:
+        bot.edit_message_text(text, admin_id, message_id, parse_mode='HTML', reply_markup=kb)
+    else:
+        bot.send_message(admin_id, text, parse_mode='HTML', reply_markup=kb)
+
+def review_held_commission(admin_id: int, commission_id: str, release: bool, message_id: int = None):
+    """Release or void a held commission, then refresh the review list"""
+    if release:
+        comm = user_db.release_commission(commission_id)
+    else:
+        comm = user_db.void_commission(commission_id)
+    
+    if not comm:
+        bot.send_message(admin_id, f"❌ Commission {commission_id} is no longer held.")
+    elif release:
+        try:
+            bot.send_message(
+                comm['affiliate_id'],
+                f"💰 <b>Commission Approved!</b>\n\n"
+                f"Your commission of <b>₦{comm['amount']:,.2f}</b> for referral {comm['user_id']} "
+                f"has been reviewed and added to your balance.",
+                parse_mode='HTML'
+            )
+        except Exception as e:
+            logger.error(f"Could not notify affiliate {comm['affiliate_id']}: {e}")
+    
+    show_held_commissions(admin_id, message_id)
+
+# ====================
+# COMMISSION STRUCTURE VIEW
+# ====================
+
+def _build_commission_structure(on_date: str) -> Tuple[str, str]:
+    # Rates in effect on the date (the engine applies any scheduled changes)
+    sections = [("📚 <b>Academy Subscription</b>", 'academy', None)] + [
+        (f"💎 <b>VIP Signals - {label}</b>", 'vip', duration)
+        for duration, label in (('monthly', 'Monthly'), ('3_months', '3 Months'),
+                                ('6_months', '6 Months'), ('yearly', '1 Year'))
+    ]
+    
+    text = (
+        "💰 <b>Affiliate Commission Structure</b>\n\n"
+        "<b>Earn commissions on every successful referral:</b>\n\n"
+    )
+    for title, plan_type, duration in sections:
+        plan = PRICING['crypto'][plan_type] if plan_type == 'academy' else PRICING['crypto']['vip'][duration]
+        price = commission_engine.price_ngn(plan['ngn'])
+        rate = commission_engine.rate_for(plan_type, duration, on_date)
+        text += (
+            f"{title}\n"
+            f"• Commission Rate: <b>{rate*100}%</b>\n"
+            f"• Example: ₦{price:,.0f} × {rate*100}% = <b>₦{price * rate:,.0f}</b>\n\n"
+        )
+    
+    text += (
+        f"🎯 <b>Minimum Payout:</b> ₦{MINIMUM_PAYOUT:,.2f}\n"
+        f"⏰ <b>Payout Processing:</b> 7 business days\n\n"
+        
+        "<b>How It Works:</b>\n"
+        "1. Share your unique referral link\n"
+        "2. When someone clicks and subscribes\n"
+        "3. You earn commission automatically!\n"
+        "4. Request payout when you reach minimum\n"
+        "5. Get paid within 7 business days\n\n"
+        
+        "Start earning today by sharing your referral link! 🚀"
+    )
+    
+    kb = inline_keyboard([
+        [("🤝 Apply to Become Affiliate", "affiliate_apply"), ("📱 Back to Menu", "mainmenu_back")]
+    ])
+    return text, kb
+
+# Rendered once per day, since scheduled rate changes take effect by date
+screens.register('commission_structure', _build_commission_structure, variants=())
+
+def show_commission_structure(uid: int, message_id: int = None):
+    """Show commission structure to user"""
+    text, kb = screens.render('commission_structure', on_date=datetime.now().strftime('%Y-%m-%d'))
+    if message_id:
+        bot.edit_message_text(text, uid, message_id, parse_mode='HTML', reply_markup=kb)
+    else:
+        bot.send_message(uid, text, parse_mode='HTML', reply_markup=kb)
+
+# ====================
+# FIXED: AFFILIATE BUTTON HANDLERS - ALL ISSUES FIXED
+# ====================
+
+@bot.callback_query_handler(func=lambda c: c.data == "affiliate_view_commission")
+def handle_view_commission_structure(call: types.CallbackQuery):
+    """Handle view commission structure callback"""
+    try:
+        uid = call.from_user.id
+        show_commission_structure(uid, call.message.message_id)
+        bot.answer_callback_query(call.id)
+    except Exception as e:
+        logger.error(f"Error showing commission structure: {e}")
+        bot.answer_callback_query(call.id, "Error loading commission structure.")
+
+# ====================
+# EXPORT FUNCTIONS
+# ====================
+
+def build_affiliates_csv() -> Dict:
+    """Build the affiliates CSV export"""
+    affiliates = user_db.get_all_affiliates()
+    
+    if not affiliates:
+        return {'text': "❌ No affiliates to export."}
+    
+    # Create CSV in memory
+    output = io.StringIO()
+    fieldnames = ['ID', 'Name', 'Username', 'Affiliate Code', 'Earnings', 'Paid', 'Pending', 'Status']
+    writer = csv.DictWriter(output, fieldnames=fieldnames)
+    writer.writeheader()
+    
+    for affiliate in affiliates:
+        writer.writerow({
+            'ID': affiliate.get('tg_id'),
+            'Name': affiliate.get('name', 'N/A'),
+            'Username': affiliate.get('username', 'N/A'),
+            'Affiliate Code': affiliate.get('affiliate_code', 'N/A'),
+            'Earnings': affiliate.get('affiliate_earnings', 0),
+            'Paid': affiliate.get('affiliate_paid', 0),
+            'Pending': affiliate.get('affiliate_pending', 0),
+            'Status': 'Approved' if affiliate.get('is_affiliate') else 'Pending' if affiliate.get('affiliate_status') == 'pending' else 'Rejected'
+        })
+    
+    # Convert to bytes
+    csv_data = output.getvalue().encode('utf-8')
+    return {
+        'document': csv_data,
+        'filename': f'affiliates_export_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv',
+        'caption': "📊 Affiliates Export - Generated on: " + datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    }
+
+def export_affiliates_to_csv(admin_id: int):
+    """Export affiliates data to CSV"""
+    run_export_job(admin_id, 'affiliates_csv', build_affiliates_csv)
+
+def build_payouts_csv() -> Dict:
+    """Build the payouts CSV export"""
+    payouts = user_db.get_all_payout_requests()
+    
+    if not payouts:
+        return {'text': "❌ No payout data to export."}
+    
+    # Create CSV in memory
+    output = io.StringIO()
+    fieldnames = ['Payout ID', 'User ID', 'Affiliate Name', 'Amount', 'Method', 'Status', 'Request Date', 'Processed Date', 'Details']
+    writer = csv.DictWriter(output, fieldnames=fieldnames)
+    writer.writeheader()
+    
+    for payout in payouts:
+        writer.writerow({
+            'Payout ID': payout.get('id', 'N/A'),
+            'User ID': payout.get('user_id', 'N/A'),
+            'Affiliate Name': payout.get('affiliate_name', 'N/A'),
+            'Amount': payout.get('amount', 0),
+            'Method': payout.get('method', 'N/A'),
+            'Status': payout.get('status', 'pending'),
+            'Request Date': payout.get('request_date', 'N/A'),
+            'Processed Date': payout.get('processed_date', 'N/A'),
+            'Details': payout.get('details', 'N/A')
+        })
+    
+    # Convert to bytes
+    csv_data = output.getvalue().encode('utf-8')
+    return {
+        'document': csv_data,
+        'filename': f'payouts_export_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv',
+        'caption': "💰 Payouts Export - Generated on: " + datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    }
+
+def export_payouts_to_csv(admin_id: int):
+    """Export payouts data to CSV"""
+    run_export_job(admin_id, 'payouts_csv', build_payouts_csv)
 
 # ====================
 # REPORT FUNCTIONS
@@ -1392,50 +1653,17 @@ def export_payouts_to_csv(admin_id: int):
 def show_monthly_report(admin_id: int, message_id: int = None):
     """Show monthly commission report"""
     try:
-        # Get current month data
-        current_month = datetime.now().month
-        current_year = datetime.now().year
-        
-        # Get all users to calculate commissions
-        all_users = user_db.get_all_users()
-        monthly_commissions = []
-        monthly_total = 0
-        
-        for user_id_str, user_data in all_users.items():
-            if 'commissions' in user_data:
-                for commission in user_data['commissions']:
-                    try:
-                        commission_date = datetime.strptime(commission.get('date', '2000-01-01'), '%Y-%m-%d')
-                        if commission_date.month == current_month and commission_date.year == current_year:
-                            commission['affiliate_id'] = int(user_id_str)
-                            monthly_commissions.append(commission)
-                            monthly_total += commission.get('amount', 0)
-                    except:
-                        pass
-        
-        # Get top affiliates for the month
-        affiliate_totals = {}
-        for commission in monthly_commissions:
-            affiliate_id = commission.get('affiliate_id')
-            if affiliate_id:
-                affiliate_totals[affiliate_id] = affiliate_totals.get(affiliate_id, 0) + commission.get('amount', 0)
-        
-        # Get affiliate names
-        top_affiliates = []
-        for affiliate_id, total in sorted(affiliate_totals.items(), key=lambda x: x[1], reverse=True)[:10]:
-            affiliate = user_db.fetch_user(affiliate_id)
-            if affiliate:
-                top_affiliates.append({
-                    'name': affiliate.get('name', f'User {affiliate_id}'),
-                    'total': total
-                })
+        # Month totals and top affiliates come from the incrementally maintained leaderboard
+        summary = user_db.get_leaderboard_summary('month')
+        monthly_total = summary['total']
+        top_affiliates = user_db.get_leaderboard('month', 10)
         
         text = (
             f"📅 <b>Monthly Commission Report - {datetime.now().strftime('%B %Y')}</b>\n\n"
             f"📊 <b>Monthly Summary:</b>\n"
             f"• Total Commissions: ₦{monthly_total:,.2f}\n"
-            f"• Total Transactions: {len(monthly_commissions)}\n"
-            f"• Active Affiliates: {len(affiliate_totals)}\n\n"
+            f"• Total Transactions: {summary['transactions']}\n"
+            f"• Active Affiliates: {summary['affiliates']}\n\n"
             f"🏆 <b>Top Affiliates This Month:</b>\n"
         )
         
@@ -1447,13 +1675,7 @@ def show_monthly_report(admin_id: int, message_id: int = None):
         
         text += f"\n📈 <b>Commission Distribution:</b>\n"
         
-        # Get breakdown by plan type
-        plan_breakdown = {}
-        for commission in monthly_commissions:
-            plan_type = commission.get('plan_type', 'Unknown')
-            plan_breakdown[plan_type] = plan_breakdown.get(plan_type, 0) + commission.get('amount', 0)
-        
-        for plan_type, amount in plan_breakdown.items():
+        for plan_type, amount in summary['by_plan'].items():
             percentage = (amount / monthly_total * 100) if monthly_total > 0 else 0
             text += f"• {plan_type}: ₦{amount:,.2f} ({percentage:.1f}%)\n"
         
@@ -1462,6 +1684,7 @@ def show_monthly_report(admin_id: int, message_id: int = None):
             types.InlineKeyboardButton("📊 Export to CSV", callback_data="admin_export_commissions_monthly"),
             types.InlineKeyboardButton("🔄 Refresh", callback_data="admin_monthly_report")
         )
+        kb.row(types.InlineKeyboardButton("📈 View Chart", callback_data="admin_chart:monthly"))
         kb.row(
             types.InlineKeyboardButton("🤝 Back to Management", callback_data="admin_affiliate_mgmt"),
             types.InlineKeyboardButton("📱 Admin Dashboard", callback_data="admin_back")
@@ -1480,64 +1703,61 @@ def show_monthly_report(admin_id: int, message_id: int = None):
         else:
             bot.send_message(admin_id, error_text)
 
+def build_detailed_stats() -> Tuple[str, types.InlineKeyboardMarkup]:
+    """Build the detailed affiliate statistics text and keyboard"""
+    # Get all affiliates
+    affiliates = user_db.get_all_affiliates()
+    
+    # Calculate stats
+    total_affiliates = len(affiliates)
+    active_affiliates = sum(1 for a in affiliates if a.get('is_affiliate'))
+    total_commissions = sum(a.get('affiliate_earnings', 0) for a in affiliates)
+    
+    # Get all users for referral stats
+    all_users = user_db.get_all_users()
+    total_referrals = 0
+    for user_data in all_users.values():
+        if 'referred_by' in user_data:
+            total_referrals += 1
+    
+    # Calculate averages
+    avg_commission = total_commissions / total_affiliates if total_affiliates > 0 else 0
+    avg_referrals = total_referrals / total_affiliates if total_affiliates > 0 else 0
+    
+    text = (
+        f"📈 <b>Detailed Affiliate Statistics</b>\n\n"
+        f"📊 <b>Overall Performance:</b>\n"
+        f"• Total Affiliates: {total_affiliates}\n"
+        f"• Active Affiliates: {active_affiliates}\n"
+        f"• Inactive Affiliates: {total_affiliates - active_affiliates}\n\n"
+        
+        f"💰 <b>Financial Performance:</b>\n"
+        f"• Total Commissions: ₦{total_commissions:,.2f}\n"
+        f"• Average per Affiliate: ₦{avg_commission:,.2f}\n\n"
+        
+        f"👥 <b>Referral Performance:</b>\n"
+        f"• Total Referrals: {total_referrals}\n"
+        f"• Avg. Referrals per Affiliate: {avg_referrals:.1f}\n\n"
+        
+        f"📅 <b>Time-based Analysis:</b>\n"
+        f"• Report Generated: {datetime.now().strftime('%Y-%m-%d %H:%M')}\n"
+    )
+    
+    kb = types.InlineKeyboardMarkup()
+    kb.row(
+        types.InlineKeyboardButton("📅 Monthly Trends", callback_data="admin_monthly_trends"),
+        types.InlineKeyboardButton("📊 Export Data", callback_data="admin_export_detailed_stats")
+    )
+    kb.row(
+        types.InlineKeyboardButton("🤝 Back to Management", callback_data="admin_affiliate_mgmt"),
+        types.InlineKeyboardButton("📱 Admin Dashboard", callback_data="admin_back")
+    )
+    
+    return text, kb
+
 def show_detailed_stats(admin_id: int, message_id: int = None):
     """Show detailed affiliate statistics"""
-    try:
-        # Get all affiliates
-        affiliates = user_db.get_all_affiliates()
-        
-        # Calculate stats
-        total_affiliates = len(affiliates)
-        active_affiliates = sum(1 for a in affiliates if a.get('is_affiliate'))
-        total_commissions = sum(a.get('affiliate_earnings', 0) for a in affiliates)
-        
-        # Get all users for referral stats
-        all_users = user_db.get_all_users()
-        total_referrals = 0
-        for user_data in all_users.values():
-            if 'referred_by' in user_data:
-                total_referrals += 1
-        
-        # Calculate averages
-        avg_commission = total_commissions / total_affiliates if total_affiliates > 0 else 0
-        avg_referrals = total_referrals / total_affiliates if total_affiliates > 0 else 0
-        
-        text = (
-            f"📈 <b>Detailed Affiliate Statistics</b>\n\n"
-            f"📊 <b>Overall Performance:</b>\n"
-            f"• Total Affiliates: {total_affiliates}\n"
-            f"• Active Affiliates: {active_affiliates}\n"
-            f"• Inactive Affiliates: {total_affiliates - active_affiliates}\n\n"
-            
-            f"💰 <b>Financial Performance:</b>\n"
-            f"• Total Commissions: ₦{total_commissions:,.2f}\n"
-            f"• Average per Affiliate: ₦{avg_commission:,.2f}\n\n"
-            
-            f"👥 <b>Referral Performance:</b>\n"
-            f"• Total Referrals: {total_referrals}\n"
-            f"• Avg. Referrals per Affiliate: {avg_referrals:.1f}\n\n"
-            
-            f"📅 <b>Time-based Analysis:</b>\n"
-            f"• Report Generated: {datetime.now().strftime('%Y-%m-%d %H:%M')}\n"
-        )
-        
-        kb = types.InlineKeyboardMarkup()
-        kb.row(
-            types.InlineKeyboardButton("📅 Monthly Trends", callback_data="admin_monthly_trends"),
-            types.InlineKeyboardButton("📊 Export Data", callback_data="admin_export_detailed_stats")
-        )
-        kb.row(
-            types.InlineKeyboardButton("🤝 Back to Management", callback_data="admin_affiliate_mgmt"),
-            types.InlineKeyboardButton("📱 Admin Dashboard", callback_data="admin_back")
-        )
-        
-        if message_id:
-            bot.edit_message_text(text, admin_id, message_id, parse_mode='HTML', reply_markup=kb)
-        else:
-            bot.send_message(admin_id, text, parse_mode='HTML', reply_markup=kb)
-            
-    except Exception as e:
-        logger.error(f"Error showing detailed stats: {e}")
+    run_report_job(admin_id, message_id, 'detailed_stats', build_detailed_stats)
 
 def show_payouts_monthly(admin_id: int, message_id: int = None):
     """Show monthly payout report"""
@@ -1665,6 +1885,7 @@ def show_payouts_weekly(admin_id: int, message_id: int = None):
             types.InlineKeyboardButton("📅 Monthly View", callback_data="admin_payouts_monthly"),
             types.InlineKeyboardButton("🔄 Refresh", callback_data="admin_payouts_weekly")
         )
+        kb.row(types.InlineKeyboardButton("📈 View Chart", callback_data="admin_chart:payouts_weekly"))
         kb.row(
             types.InlineKeyboardButton("📋 Back to Payouts", callback_data="admin_view_payouts"),
             types.InlineKeyboardButton("🤝 Affiliate Management", callback_data="admin_affiliate_mgmt")
@@ -1678,6 +1899,101 @@ def show_payouts_weekly(admin_id: int, message_id: int = None):
     except Exception as e:
         logger.error(f"Error showing weekly payouts: {e}")
 
+# ====================
+# REPORT JOBS
+# ====================
+
+def run_report_job(admin_id: int, message_id: Optional[int], report: str, build):
+    """Show a placeholder, build the report on the report pool, then edit it in place"""
+    try:
+        placeholder = "⏳ <b>Generating report...</b>"
+        if message_id:
+            bot.edit_message_text(placeholder, admin_id, message_id, parse_mode='HTML')
+        else:
+            message_id = bot.send_message(admin_id, placeholder, parse_mode='HTML').message_id
+        
+        def deliver(result):
+            text, kb = result
+            bot.edit_message_text(text, admin_id, message_id, parse_mode='HTML', reply_markup=kb)
+        
+        def on_error(error):
+            bot.edit_message_text(f"❌ Error generating report: {error}", admin_id, message_id)
+        
+        # The same report at the same data version is computed once and shared
+        report_jobs.submit((report, user_db.data_version), build, deliver, on_error)
+        
+    except Exception as e:
+        logger.error(f"Error queueing report {report}: {e}")
+
+def run_export_job(admin_id: int, export: str, build):
+    """Build a CSV export on the report pool and send it when ready"""
+    try:
+        def deliver(result):
+            if 'document' in result:
+                csv_file = io.BytesIO(result['document'])
+                csv_file.name = result['filename']
+                bot.send_document(admin_id, csv_file, caption=result['caption'])
+                logger.info(f"Sent {export} export to admin {admin_id}")
+            else:
+                bot.send_message(admin_id, result['text'])
+        
+        def on_error(error):
+            bot.send_message(admin_id, f"❌ Error exporting data: {error}")
+        
+        report_jobs.submit((export, user_db.data_version), build, deliver, on_error)
+        
+    except Exception as e:
+        logger.error(f"Error queueing export {export}: {e}")
+        bot.send_message(admin_id, f"❌ Error exporting data: {e}")
+
+# ====================
+# REPORT CHARTS
+# ====================
+
+def send_report_chart(admin_id: int, report: str):
+    """Send a PNG chart for an admin report, reusing the uploaded file when unchanged"""
+    try:
+        spec = REPORT_CHARTS.get(report)
+        if not spec:
+            bot.send_message(admin_id, "❌ Unknown chart.")
+            return
+        
+        key = (report, datetime.now().strftime('%Y-%m-%d'), user_db.ledger_version)
+        caption = f"📈 {spec['title']}"
+        
+        # Already uploaded for this ledger version - Telegram serves it from the file_id
+        file_id = chart_cache.get_file_id(key)
+        if file_id:
+            bot.send_photo(admin_id, file_id, caption=caption)
+            return
+        
+        data = user_db.get_daily_series(spec['days']())
+        series = [(CHART_SERIES_LABELS[name], data[name]) for name in spec['series']]
+        
+        # Rendered off the handler thread; delivered when the worker finishes
+        future = chart_cache.render(key, spec['title'], data['labels'], series)
+        future.add_done_callback(lambda f: deliver_report_chart(admin_id, key, caption, f))
+        
+    except Exception as e:
+        logger.error(f"Error sending report chart {report}: {e}")
+        bot.send_message(admin_id, f"❌ Error generating chart: {e}")
+
+def deliver_report_chart(admin_id: int, key: tuple, caption: str, future):
+    """Upload a rendered chart and remember its file_id"""
+    try:
+        png = future.result()
+        photo = io.BytesIO(png)
+        photo.name = f"{key[0]}_chart.png"
+        sent = bot.send_photo(admin_id, photo, caption=caption)
+        if sent and sent.photo:
+            chart_cache.set_file_id(key, sent.photo[-1].file_id)
+    except Exception as e:
+        logger.error(f"Error delivering report chart {key}: {e}")
+        try:
+            bot.send_message(admin_id, f"❌ Error generating chart: {e}")
+        except Exception:
+            pass
+
 # ====================
 # FIXED: HAS ACTIVE SUBSCRIPTION FUNCTION
 # ====================
@@ -1688,32 +2004,7 @@ def has_active_subscription(user_id: int) -> bool:
         user = user_db.fetch_user(user_id)
         if not user:
             return False
-        
-        # Check both programs
-        for program in ['crypto', 'forex']:
-            # Check Academy subscription
-            academy_exp = user.get(f'{program}_academy_expiry_date')
-            if academy_exp:
-                try:
-                    expiry_date = datetime.strptime(academy_exp, '%Y-%m-%d')
-                    if expiry_date.date() >= datetime.now().date():
-                        return True
-                except:
-                    # If date parsing fails, assume active if key exists
-                    return True
-            
-            # Check VIP subscription
-            vip_exp = user.get(f'{program}_vip_expiry_date')
-            if vip_exp:
-                try:
-                    expiry_date = datetime.strptime(vip_exp, '%Y-%m-%d')
-                    if expiry_date.date() >= datetime.now().date():
-                        return True
-                except:
-                    # If date parsing fails, assume active if key exists
-                    return True
-        
-        return False
+        return user_db.user_has_active_subscription(user)
     except Exception as e:
         logger.error(f"Error checking active subscription for user {user_id}: {e}")
         return False
@@ -1841,47 +2132,44 @@ def handle_admin_view_all_users(call: types.CallbackQuery):
         logger.error(f"Error showing all users: {e}")
         bot.answer_callback_query(call.id, "Error loading users.")
 
-def show_all_users_list(admin_id: int, message_id: int = None, page: int = 0):
+def build_list_nav_row(prefix: str, page_ids: List[int], start_idx: int, total: int, per_page: int) -> list:
+    """Cursor-based Previous / page / Next buttons for a paginated admin list"""
+    total_pages = (total + per_page - 1) // per_page
+    nav_buttons = []
+    if start_idx > 0:
+        nav_buttons.append(types.InlineKeyboardButton("⬅️ Previous", callback_data=f"{prefix}_prev:{page_ids[0]}"))
+    
+    nav_buttons.append(types.InlineKeyboardButton(f"📄 {start_idx // per_page + 1}/{total_pages}", callback_data="noop"))
+    
+    if start_idx + len(page_ids) < total:
+        nav_buttons.append(types.InlineKeyboardButton("Next ➡️", callback_data=f"{prefix}_next:{page_ids[-1]}"))
+    return nav_buttons
+
+def show_all_users_list(admin_id: int, message_id: int = None, cursor: int = None, direction: str = 'next'):
     """Show all users with details - FIXED VERSION with username display"""
     try:
-        # Get all users
-        all_users = user_db.get_all_users()
-        
-        # Initialize variables to prevent reference before assignment
-        total_pages = 1
-        end_idx = 0
-        total_users = 0
+        per_page = 10
+        # Sorted ids are cached per data version; only the page itself is rendered
+        page_ids, start_idx, total_users = user_db.get_user_id_page('all', cursor, direction, per_page)
         
-        if not all_users:
+        if not total_users:
             text = "👥 <b>All Users</b>\n\nNo users found in database."
         else:
-            # Sort users by ID
-            sorted_users = sorted(all_users.items(), key=lambda x: int(x[0]))
-            
-            # Pagination
-            per_page = 10
-            start_idx = page * per_page
-            end_idx = start_idx + per_page
-            current_page_users = sorted_users[start_idx:end_idx]
-            
-            # Create message
-            total_users = len(sorted_users)
             total_pages = (total_users + per_page - 1) // per_page
             
             message_text = (
                 f"👥 <b>All Users ({total_users})</b>\n"
-                f"📅 <i>Page {page + 1} of {total_pages}</i>\n\n"
+                f"📅 <i>Page {start_idx // per_page + 1} of {total_pages}</i>\n\n"
             )
             
             # Add user details with username
-            for i, (user_id_str, user_data) in enumerate(current_page_users, start=start_idx + 1):
-                user_id = int(user_id_str)
+            for i, user_id in enumerate(page_ids, start=start_idx + 1):
+                user_data = user_db.users.get(str(user_id), {})
                 name = user_data.get('name', 'Unknown')
                 username = f"@{user_data.get('username')}" if user_data.get('username') else 'No username'
                 registered = user_data.get('registered_date', 'Unknown')
                 
-                # Check subscription status using FIXED function
-                has_active = "✅" if has_active_subscription(user_id) else "❌"
+                has_active = "✅" if user_db.user_has_active_subscription(user_data) else "❌"
                 
                 message_text += (
                     f"<b>{i}. {name}</b>\n"
@@ -1895,19 +2183,9 @@ def show_all_users_list(admin_id: int, message_id: int = None, page: int = 0):
         # Create inline keyboard for navigation
         kb = types.InlineKeyboardMarkup()
         
-        # Navigation buttons (only show if there are users)
-        if all_users and total_pages > 1:
-            nav_buttons = []
-            if page > 0:
-                nav_buttons.append(types.InlineKeyboardButton("⬅️ Previous", callback_data=f"admin_all_users_page:{page-1}"))
-            
-            nav_buttons.append(types.InlineKeyboardButton(f"📄 {page+1}/{total_pages}", callback_data="noop"))
-            
-            if end_idx < total_users:
-                nav_buttons.append(types.InlineKeyboardButton("Next ➡️", callback_data=f"admin_all_users_page:{page+1}"))
-            
-            if nav_buttons:
-                kb.row(*nav_buttons)
+        # Navigation buttons (only show if there is more than one page)
+        if total_users > per_page:
+            kb.row(*build_list_nav_row("admin_all_users", page_ids, start_idx, total_users, per_page))
         
         # Add action buttons
         kb.row(
@@ -1950,45 +2228,27 @@ def handle_admin_view_subscribed_users(call: types.CallbackQuery):
         logger.error(f"Error showing subscribed users: {e}")
         bot.answer_callback_query(call.id, "Error loading subscribed users.")
 
-def show_subscribed_users_list(admin_id: int, message_id: int = None, page: int = 0):
+def show_subscribed_users_list(admin_id: int, message_id: int = None, cursor: int = None, direction: str = 'next'):
     """Show users with active subscriptions - FIXED VERSION with username display"""
     try:
-        # Get all users
-        all_users = user_db.get_all_users()
-        
-        # Filter users with active subscriptions using FIXED function
-        subscribed_users = []
-        for user_id_str, user_data in all_users.items():
-            user_id = int(user_id_str)
-            if has_active_subscription(user_id):
-                subscribed_users.append((user_id, user_data))
+        per_page = 10
+        # Filtered + sorted ids are cached per (day, data version)
+        page_ids, start_idx, total_users = user_db.get_user_id_page('subscribed', cursor, direction, per_page)
         
-        # Initialize variables
-        total_users = len(subscribed_users)
-        total_pages = 1
-        end_idx = 0
-        
-        if not subscribed_users:
+        if not total_users:
             text = "✅ <b>Active Subscriptions</b>\n\nNo users with active subscriptions found."
         else:
-            # Sort by user ID
-            subscribed_users.sort(key=lambda x: x[0])
-            
-            # Pagination
-            per_page = 10
-            start_idx = page * per_page
-            end_idx = start_idx + per_page
-            current_page_users = subscribed_users[start_idx:end_idx]
-            
             total_pages = (total_users + per_page - 1) // per_page
+            today = datetime.now().date()
             
             message_text = (
                 f"✅ <b>Active Subscriptions ({total_users})</b>\n"
-                f"📅 <i>Page {page + 1} of {total_pages}</i>\n\n"
+                f"📅 <i>Page {start_idx // per_page + 1} of {total_pages}</i>\n\n"
             )
             
             # Add user details with username
-            for i, (user_id, user_data) in enumerate(current_page_users, start=start_idx + 1):
+            for i, user_id in enumerate(page_ids, start=start_idx + 1):
+                user_data = user_db.users.get(str(user_id), {})
                 name = user_data.get('name', 'Unknown')
                 username = f"@{user_data.get('username')}" if user_data.get('username') else 'No username'
                 registered = user_data.get('registered_date', 'Unknown')
@@ -2001,7 +2261,7 @@ def show_subscribed_users_list(admin_id: int, message_id: int = None, page: int
                         if expiry_key in user_data and user_data[expiry_key]:
                             try:
                                 expiry_date = datetime.strptime(user_data[expiry_key], '%Y-%m-%d')
-                                if expiry_date.date() >= datetime.now().date():
+                                if expiry_date.date() >= today:
                                     active_subs.append(f"{program} {plan}")
                             except:
                                 active_subs.append(f"{program} {plan}")
@@ -2020,19 +2280,9 @@ def show_subscribed_users_list(admin_id: int, message_id: int = None, page: int
         # Create inline keyboard for navigation
         kb = types.InlineKeyboardMarkup()
         
-        # Navigation buttons (only show if there are users and more than one page)
-        if subscribed_users and total_pages > 1:
-            nav_buttons = []
-            if page > 0:
-                nav_buttons.append(types.InlineKeyboardButton("⬅️ Previous", callback_data=f"admin_subscribed_page:{page-1}"))
-            
-            nav_buttons.append(types.InlineKeyboardButton(f"📄 {page+1}/{total_pages}", callback_data="noop"))
-            
-            if end_idx < total_users:
-                nav_buttons.append(types.InlineKeyboardButton("Next ➡️", callback_data=f"admin_subscribed_page:{page+1}"))
-            
-            if nav_buttons:
-                kb.row(*nav_buttons)
+        # Navigation buttons (only show if there is more than one page)
+        if total_users > per_page:
+            kb.row(*build_list_nav_row("admin_subscribed", page_ids, start_idx, total_users, per_page))
         
         # Add action buttons
         kb.row(
@@ -2140,8 +2390,9 @@ def show_affiliate_management(admin_id: int, message_id: int = None):
     )
     kb.row(
         types.InlineKeyboardButton("⏳ Pending Applications", callback_data="admin_pending_applications"),
-        types.InlineKeyboardButton("📱 Back to Admin", callback_data="admin_back")
+        types.InlineKeyboardButton("🚩 Held Commissions", callback_data="admin_held_commissions")
     )
+    kb.row(types.InlineKeyboardButton("📱 Back to Admin", callback_data="admin_back"))
     
     if message_id:
         bot.edit_message_text(text, admin_id, message_id, parse_mode='HTML', reply_markup=kb)
@@ -2182,7 +2433,7 @@ def show_all_payout_requests(admin_id: int, message_id: int = None):
                 f"📊 <b>Summary:</b>\n"
                 f"• Pending: {len(pending)}\n"
                 f"• Processed: {len(processed)}\n"
-                f"• Total Amount: ₦{sum(p.get('amount', 0) for p in payouts):,.2f}\n\n"
+                f"• Total Amount: ₦{from_minor(sum(p['amount_minor'] for p in payouts)):,.2f}\n\n"
                 f"📋 <b>Pending Requests:</b>\n"
             )
             
@@ -2197,6 +2448,7 @@ def show_all_payout_requests(admin_id: int, message_id: int = None):
             types.InlineKeyboardButton("🔄 Refresh", callback_data="admin_refresh_payouts"),
             types.InlineKeyboardButton("📊 View All", callback_data="admin_view_all_payouts")
         )
+        kb.row(types.InlineKeyboardButton("⚡ Bulk Settle", callback_data="admin_bulk_settle"))
         kb.row(
             types.InlineKeyboardButton("📋 Processed Payouts", callback_data="admin_processed_payouts"),
             types.InlineKeyboardButton("🤝 Back to Management", callback_data="admin_affiliate_mgmt")
@@ -2214,25 +2466,16 @@ def show_all_payout_requests(admin_id: int, message_id: int = None):
 # FIXED: AFFILIATE BUTTON LOGIC IN COMPACT MENU
 # ====================
 
-def send_compact_menu(uid: int, program: str):
-    """Send compact menu with main menu button - FIXED AFFILIATE BUTTON LOGIC"""
+def _build_compact_menu(program: str, is_affiliate: bool) -> Tuple[str, str]:
     program_name = "Crypto" if program == "crypto" else "Forex"
     
-    # Check if user is affiliate
-    user = user_db.fetch_user(uid)
-    is_affiliate = user and user.get('is_affiliate')
-    affiliate_pending = user and user.get('affiliate_status') == 'pending'
-    
-    # Compact keyboard
-    kb = types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
-    kb.row("📱 Main Menu", "📌 Contact Admin")
-    
     # FIXED: Show "Affiliate Dashboard" if user is approved affiliate
     # Show "Become an Affiliate" if user is not approved (including pending and rejected)
-    if is_affiliate:
-        kb.row("🤝 Affiliate Dashboard", "❓ Help")
-    else:
-        kb.row("🤝 Become an Affiliate", "❓ Help")
+    affiliate_label = "🤝 Affiliate Dashboard" if is_affiliate else "🤝 Become an Affiliate"
+    kb = reply_keyboard([
+        ["📱 Main Menu", "📌 Contact Admin"],
+        [affiliate_label, "❓ Help"]
+    ])
     
     welcome_text = (
         f"👋 Welcome to BlockchainPlus {program_name} Program!\n\n"
@@ -2241,84 +2484,94 @@ def send_compact_menu(uid: int, program: str):
     )
     
     if is_affiliate:
-        welcome_text += f"🔹 <b>Affiliate Dashboard:</b> Track earnings & referrals\n"
+        welcome_text += "🔹 <b>Affiliate Dashboard:</b> Track earnings & referrals\n"
     else:
-        welcome_text += f"🔹 <b>Become an Affiliate:</b> Earn commissions\n"
+        welcome_text += "🔹 <b>Become an Affiliate:</b> Earn commissions\n"
     
-    welcome_text += f"🔹 <b>Help:</b> Quick assistance\n\n"
-    welcome_text += f"Tap <b>📱 Main Menu</b> to get started!"
+    welcome_text += "🔹 <b>Help:</b> Quick assistance\n\n"
+    welcome_text += "Tap <b>📱 Main Menu</b> to get started!"
+    return welcome_text, kb
+
+screens.register('compact_menu', _build_compact_menu, variants=[
+    {'program': program, 'is_affiliate': is_affiliate}
+    for program in PRICING for is_affiliate in (True, False)
+])
+
+def send_compact_menu(uid: int, program: str):
+    """Send compact menu with main menu button - FIXED AFFILIATE BUTTON LOGIC"""
+    user = user_db.fetch_user(uid)
+    is_affiliate = bool(user and user.get('is_affiliate'))
     
+    welcome_text, kb = screens.render('compact_menu', program=program, is_affiliate=is_affiliate)
     bot.send_message(uid, welcome_text, parse_mode='HTML', reply_markup=kb)
 
 # ====================
 # FIXED: AFFILIATE BUTTON LOGIC IN MAIN MENU
 # ====================
 
+def affiliate_menu_state(user: Optional[Dict]) -> str:
+    """'affiliate', 'pending' or 'none' - picks the affiliate row of the menus"""
+    if user and user.get('is_affiliate'):
+        return 'affiliate'
+    if user and user.get('affiliate_status') == 'pending':
+        return 'pending'
+    return 'none'
+
+def _build_main_menu(program: str, affiliate: str) -> Tuple[str, str]:
+    program_name = "Crypto" if program == "crypto" else "Forex"
+    
+    # Main menu dashboard
+    menu_text = (
+        f"📱 <b>{program_name} Program Dashboard</b>\n\n"
+        f"Select an option below:\n\n"
+        f"🔹 <b>Account & Subscriptions</b>\n"
+        f"• 👋 Welcome: Program overview\n"
+        f"• ⏳ Check Status: Subscription details\n"
+        f"• 💳 Make Payment: Subscribe/renew\n\n"
+        f"🔹 <b>Learning Resources</b>\n"
+        f"• 🎥 Tutorials: Video learning\n"
+        f"• 🆘 Help: Support & assistance\n\n"
+        f"🔹 <b>Settings & Support</b>\n"
+        f"• 📌 Contact: Admin support\n"
+        f"• 🔄 Switch: Change program\n"
+        f"• ❓ Help: Quick assistance\n"
+    )
+    
+    # Add affiliate option based on user status
+    if affiliate == 'affiliate':
+        menu_text += "\n🔹 <b>Affiliate Program</b>\n• 🤝 Affiliate Dashboard: Track earnings\n"
+        affiliate_button = ("🤝 Affiliate Dashboard", "affiliate_dashboard")
+    elif affiliate == 'pending':
+        menu_text += "\n🔹 <b>Affiliate Program</b>\n• ⏳ Affiliate Application: Pending approval\n"
+        affiliate_button = ("⏳ Affiliate Pending", "affiliate_pending")
+    else:
+        menu_text += "\n🔹 <b>Affiliate Program</b>\n• 🤝 Become an Affiliate: Earn commissions\n"
+        affiliate_button = ("🤝 Become an Affiliate", "affiliate_apply")
+    
+    # Add recommended exchanges option
+    menu_text += "\n🔹 <b>Trading Platforms</b>\n• 🚀 Recommended Exchanges: Best platforms to trade\n"
+    
+    kb = inline_keyboard([
+        [("👋 Welcome", "mainmenu_welcome"), ("⏳ Check Status", "mainmenu_status")],
+        [("💳 Make Payment", "mainmenu_payment"), ("🎥 Tutorials", "mainmenu_tutorials")],
+        [("🆘 Help Center", "mainmenu_help"), ("📌 Contact Admin", "mainmenu_contact")],
+        [("🔄 Switch Program", "mainmenu_switch"), ("🚀 Exchanges", "mainmenu_exchanges")],
+        [affiliate_button]
+    ])
+    return menu_text, kb
+
+screens.register('main_menu', _build_main_menu, variants=[
+    {'program': program, 'affiliate': affiliate}
+    for program in PRICING for affiliate in ('affiliate', 'pending', 'none')
+])
+
 def show_main_menu_from_callback(uid: int, message_id: int):
     """Show main menu from callback - FIXED AFFILIATE BUTTON LOGIC"""
     try:
         user = user_db.fetch_user(uid)
         program = user.get('program', 'crypto') if user else 'crypto'
         
-        program_name = "Crypto" if program == "crypto" else "Forex"
-        
-        # Main menu dashboard
-        menu_text = (
-            f"📱 <b>{program_name} Program Dashboard</b>\n\n"
-            f"Select an option below:\n\n"
-            f"🔹 <b>Account & Subscriptions</b>\n"
-            f"• 👋 Welcome: Program overview\n"
-            f"• ⏳ Check Status: Subscription details\n"
-            f"• 💳 Make Payment: Subscribe/renew\n\n"
-            f"🔹 <b>Learning Resources</b>\n"
-            f"• 🎥 Tutorials: Video learning\n"
-            f"• 🆘 Help: Support & assistance\n\n"
-            f"🔹 <b>Settings & Support</b>\n"
-            f"• 📌 Contact: Admin support\n"
-            f"• 🔄 Switch: Change program\n"
-            f"• ❓ Help: Quick assistance\n"
-        )
-        
-        # Add affiliate option based on user status
-        if user and user.get('is_affiliate'):
-            menu_text += f"\n🔹 <b>Affiliate Program</b>\n• 🤝 Affiliate Dashboard: Track earnings\n"
-        elif user and user.get('affiliate_status') == 'pending':
-            menu_text += f"\n🔹 <b>Affiliate Program</b>\n• ⏳ Affiliate Application: Pending approval\n"
-        else:
-            menu_text += f"\n🔹 <b>Affiliate Program</b>\n• 🤝 Become an Affiliate: Earn commissions\n"
-        
-        # Add recommended exchanges option
-        menu_text += f"\n🔹 <b>Trading Platforms</b>\n• 🚀 Recommended Exchanges: Best platforms to trade\n"
-        
-        # Create inline keyboard for main menu
-        kb = types.InlineKeyboardMarkup(row_width=2)
-        
-        # Account & Subscriptions
-        kb.row(
-            types.InlineKeyboardButton("👋 Welcome", callback_data="mainmenu_welcome"),
-            types.InlineKeyboardButton("⏳ Check Status", callback_data="mainmenu_status")
-        )
-        kb.row(
-            types.InlineKeyboardButton("💳 Make Payment", callback_data="mainmenu_payment"),
-            types.InlineKeyboardButton("🎥 Tutorials", callback_data="mainmenu_tutorials")
-        )
-        kb.row(
-            types.InlineKeyboardButton("🆘 Help Center", callback_data="mainmenu_help"),
-            types.InlineKeyboardButton("📌 Contact Admin", callback_data="mainmenu_contact")
-        )
-        kb.row(
-            types.InlineKeyboardButton("🔄 Switch Program", callback_data="mainmenu_switch"),
-            types.InlineKeyboardButton("🚀 Exchanges", callback_data="mainmenu_exchanges")
-        )
-        
-        # FIXED: Add affiliate button based on user status
-        if user and user.get('is_affiliate'):
-            kb.row(types.InlineKeyboardButton("🤝 Affiliate Dashboard", callback_data="affiliate_dashboard"))
-        elif user and user.get('affiliate_status') == 'pending':
-            kb.row(types.InlineKeyboardButton("⏳ Affiliate Pending", callback_data="affiliate_pending"))
-        else:
-            kb.row(types.InlineKeyboardButton("🤝 Become an Affiliate", callback_data="affiliate_apply"))
-        
+        menu_text, kb = screens.render('main_menu', program=program, affiliate=affiliate_menu_state(user))
         bot.edit_message_text(
             menu_text,
             uid,
@@ -2343,65 +2596,7 @@ def show_main_menu(message: types.Message):
         user = user_db.fetch_user(uid)
         program = user.get('program', 'crypto') if user else 'crypto'
         
-        program_name = "Crypto" if program == "crypto" else "Forex"
-        
-        # Main menu dashboard
-        menu_text = (
-            f"📱 <b>{program_name} Program Dashboard</b>\n\n"
-            f"Select an option below:\n\n"
-            f"🔹 <b>Account & Subscriptions</b>\n"
-            f"• 👋 Welcome: Program overview\n"
-            f"• ⏳ Check Status: Subscription details\n"
-            f"• 💳 Make Payment: Subscribe/renew\n\n"
-            f"🔹 <b>Learning Resources</b>\n"
-            f"• 🎥 Tutorials: Video learning\n"
-            f"• 🆘 Help: Support & assistance\n\n"
-            f"🔹 <b>Settings & Support</b>\n"
-            f"• 📌 Contact: Admin support\n"
-            f"• 🔄 Switch: Change program\n"
-            f"• ❓ Help: Quick assistance\n"
-        )
-        
-        # Add affiliate option based on user status
-        if user and user.get('is_affiliate'):
-            menu_text += f"\n🔹 <b>Affiliate Program</b>\n• 🤝 Affiliate Dashboard: Track earnings\n"
-        elif user and user.get('affiliate_status') == 'pending':
-            menu_text += f"\n🔹 <b>Affiliate Program</b>\n• ⏳ Affiliate Application: Pending approval\n"
-        else:
-            menu_text += f"\n🔹 <b>Affiliate Program</b>\n• 🤝 Become an Affiliate: Earn commissions\n"
-        
-        # Add recommended exchanges option
-        menu_text += f"\n🔹 <b>Trading Platforms</b>\n• 🚀 Recommended Exchanges: Best platforms to trade\n"
-        
-        # Create inline keyboard for main menu
-        kb = types.InlineKeyboardMarkup(row_width=2)
-        
-        # Account & Subscriptions
-        kb.row(
-            types.InlineKeyboardButton("👋 Welcome", callback_data="mainmenu_welcome"),
-            types.InlineKeyboardButton("⏳ Check Status", callback_data="mainmenu_status")
-        )
-        kb.row(
-            types.InlineKeyboardButton("💳 Make Payment", callback_data="mainmenu_payment"),
-            types.InlineKeyboardButton("🎥 Tutorials", callback_data="mainmenu_tutorials")
-        )
-        kb.row(
-            types.InlineKeyboardButton("🆘 Help Center", callback_data="mainmenu_help"),
-            types.InlineKeyboardButton("📌 Contact Admin", callback_data="mainmenu_contact")
-        )
-        kb.row(
-            types.InlineKeyboardButton("🔄 Switch Program", callback_data="mainmenu_switch"),
-            types.InlineKeyboardButton("🚀 Exchanges", callback_data="mainmenu_exchanges")
-        )
-        
-        # FIXED: Add affiliate button based on user status
-        if user and user.get('is_affiliate'):
-            kb.row(types.InlineKeyboardButton("🤝 Affiliate Dashboard", callback_data="affiliate_dashboard"))
-        elif user and user.get('affiliate_status') == 'pending':
-            kb.row(types.InlineKeyboardButton("⏳ Affiliate Pending", callback_data="affiliate_pending"))
-        else:
-            kb.row(types.InlineKeyboardButton("🤝 Become an Affiliate", callback_data="affiliate_apply"))
-        
+        menu_text, kb = screens.render('main_menu', program=program, affiliate=affiliate_menu_state(user))
         bot.send_message(uid, menu_text, parse_mode='HTML', reply_markup=kb)
         
     except Exception as e:
@@ -2518,12 +2713,15 @@ def show_affiliate_dashboard(uid: int, message_id: int = None):
         
         # Get affiliate stats
         stats = user_db.get_affiliate_stats(uid)
+        rank, _, ranked = user_db.get_affiliate_rank(uid, 'month')
+        rank_text = f"🏆 <b>You are #{rank} of {ranked} this month</b>\n\n" if rank else ""
         
         text = (
             f"📊 <b>Affiliate Dashboard</b>\n\n"
             f"🔑 <b>Your Affiliate Code:</b> <code>{affiliate_code}</code>\n\n"
             f"🔗 <b>Your Referral Link:</b>\n"
             f"<code>{referral_link}</code>\n\n"
+            f"{rank_text}"
             f"📈 <b>Performance Stats:</b>\n"
             f"• Total Referrals: {stats.get('total_referrals', 0)}\n"
             f"• Active Referrals: {stats.get('active_referrals', 0)}\n"
@@ -3014,7 +3212,8 @@ def handle_admin_affiliate_callbacks(call: types.CallbackQuery):
             show_admin_dashboard(call.from_user.id, call.message.message_id)
         
         elif action == "admin_user_mgmt_back":
-            # Return to user management dashboard
+            # Return to user management dashboard (cancels a pending search)
+            conversations.finish(call.from_user.id)
             show_user_management_dashboard(call.from_user.id, call.message.message_id)
         
         elif action.startswith("admin_payout_paid:"):
@@ -3029,6 +3228,30 @@ def handle_admin_affiliate_callbacks(call: types.CallbackQuery):
             user_id = int(action.split(":")[1])
             show_affiliate_details(call.from_user.id, user_id, call.message.message_id)
         
+        elif action == "admin_bulk_settle":
+            bulk_settle_uploads.pop(call.from_user.id, None)
+            bulk_settle_selections.pop(call.from_user.id, None)
+            conversations.finish(call.from_user.id)
+            show_bulk_settle_menu(call.from_user.id, call.message.message_id)
+        
+        elif action.startswith("admin_bulk_settle_preview:"):
+            show_bulk_settle_preview(call.from_user.id, action.split(":")[1], call.message.message_id)
+        
+        elif action.startswith("admin_bulk_settle_confirm:"):
+            confirm_bulk_settlement(call.from_user.id, action.split(":")[1], call.message.message_id)
+        
+        elif action == "admin_bulk_settle_csv":
+            request_bulk_settle_csv(call.from_user.id, call.message.message_id)
+        
+        elif action == "admin_held_commissions":
+            show_held_commissions(call.from_user.id, call.message.message_id)
+        
+        elif action.startswith("admin_held_ok:"):
+            review_held_commission(call.from_user.id, action.split(":", 1)[1], True, call.message.message_id)
+        
+        elif action.startswith("admin_held_void:"):
+            review_held_commission(call.from_user.id, action.split(":", 1)[1], False, call.message.message_id)
+        
         elif action == "admin_refresh_payouts":
             show_all_payout_requests(call.from_user.id, call.message.message_id)
         
@@ -3058,6 +3281,9 @@ def handle_admin_affiliate_callbacks(call: types.CallbackQuery):
         elif action == "admin_payouts_weekly":
             show_payouts_weekly(call.from_user.id, call.message.message_id)
         
+        elif action.startswith("admin_chart:"):
+            send_report_chart(call.from_user.id, action.split(":")[1])
+        
         elif action == "admin_export_commissions_monthly":
             bot.answer_callback_query(call.id, "✅ Feature coming soon!")
         
@@ -3070,9 +3296,9 @@ def handle_admin_affiliate_callbacks(call: types.CallbackQuery):
         elif action == "admin_monthly_trends":
             bot.answer_callback_query(call.id, "✅ Feature coming soon!")
         
-        elif action.startswith("admin_all_users_page:"):
-            page = int(action.split(":")[1])
-            show_all_users_list(call.from_user.id, call.message.message_id, page)
+        elif action.startswith(("admin_all_users_next:", "admin_all_users_prev:")):
+            direction, cursor = action[len("admin_all_users_"):].split(":")
+            show_all_users_list(call.from_user.id, call.message.message_id, int(cursor), direction)
         
         elif action == "admin_export_all_users":
             export_all_users_to_csv(call.from_user.id)
@@ -3083,14 +3309,18 @@ def handle_admin_affiliate_callbacks(call: types.CallbackQuery):
             bot.answer_callback_query(call.id, "✅ Exporting users data...")
         
         elif action == "admin_view_user_detail_menu":
-            # Clear any existing step handlers first
-            bot.clear_step_handler_by_chat_id(call.from_user.id)
+            # Drop any pending prompt first
+            conversations.finish(call.from_user.id)
             show_user_detail_search(call.from_user.id, call.message.message_id)
         
         # NEW: Handle subscribed users pagination
-        elif action.startswith("admin_subscribed_page:"):
+        elif action.startswith(("admin_subscribed_next:", "admin_subscribed_prev:")):
+            direction, cursor = action[len("admin_subscribed_"):].split(":")
+            show_subscribed_users_list(call.from_user.id, call.message.message_id, int(cursor), direction)
+        
+        elif action.startswith("admin_search_page:"):
             page = int(action.split(":")[1])
-            show_subscribed_users_list(call.from_user.id, call.message.message_id, page)
+            show_user_search_results(call.from_user.id, call.message.message_id, page)
         
         elif action == "admin_export_subscribed":
             export_subscribed_users_to_csv(call.from_user.id)
@@ -3141,238 +3371,279 @@ def handle_admin_affiliate_callbacks(call: types.CallbackQuery):
 # EXPORT FUNCTIONS
 # ====================
 
+def build_all_users_csv() -> Dict:
+    """Build the all-users CSV export"""
+    all_users = user_db.get_all_users()
+    
+    if not all_users:
+        return {'text': "❌ No users to export."}
+    
+    # Create CSV in memory
+    output = io.StringIO()
+    fieldnames = ['ID', 'Name', 'Username', 'Program', 'Registered Date', 
+                 'Crypto Academy Expiry', 'Crypto VIP Expiry', 
+                 'Forex Academy Expiry', 'Forex VIP Expiry',
+                 'Is Affiliate', 'Affiliate Code', 'Affiliate Earnings']
+    writer = csv.DictWriter(output, fieldnames=fieldnames)
+    writer.writeheader()
+    
+    for user_id_str, user_data in all_users.items():
+        writer.writerow({
+            'ID': user_id_str,
+            'Name': user_data.get('name', 'N/A'),
+            'Username': user_data.get('username', 'N/A'),
+            'Program': user_data.get('program', 'N/A'),
+            'Registered Date': user_data.get('registered_date', 'N/A'),
+            'Crypto Academy Expiry': user_data.get('crypto_academy_expiry_date', ''),
+            'Crypto VIP Expiry': user_data.get('crypto_vip_expiry_date', ''),
+            'Forex Academy Expiry': user_data.get('forex_academy_expiry_date', ''),
+            'Forex VIP Expiry': user_data.get('forex_vip_expiry_date', ''),
+            'Is Affiliate': 'Yes' if user_data.get('is_affiliate') else 'No',
+            'Affiliate Code': user_data.get('affiliate_code', ''),
+            'Affiliate Earnings': user_data.get('affiliate_earnings', 0)
+        })
+    
+    # Convert to bytes
+    csv_data = output.getvalue().encode('utf-8')
+    return {
+        'document': csv_data,
+        'filename': f'all_users_export_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv',
+        'caption': "👥 All Users Export - Generated on: " + datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    }
+
 def export_all_users_to_csv(admin_id: int):
     """Export all users data to CSV"""
-    try:
-        all_users = user_db.get_all_users()
-        
-        if not all_users:
-            bot.send_message(admin_id, "❌ No users to export.")
-            return
-        
-        # Create CSV in memory
-        output = io.StringIO()
-        fieldnames = ['ID', 'Name', 'Username', 'Program', 'Registered Date', 
-                     'Crypto Academy Expiry', 'Crypto VIP Expiry', 
-                     'Forex Academy Expiry', 'Forex VIP Expiry',
-                     'Is Affiliate', 'Affiliate Code', 'Affiliate Earnings']
-        writer = csv.DictWriter(output, fieldnames=fieldnames)
-        writer.writeheader()
-        
-        for user_id_str, user_data in all_users.items():
-            writer.writerow({
-                'ID': user_id_str,
-                'Name': user_data.get('name', 'N/A'),
-                'Username': user_data.get('username', 'N/A'),
-                'Program': user_data.get('program', 'N/A'),
-                'Registered Date': user_data.get('registered_date', 'N/A'),
-                'Crypto Academy Expiry': user_data.get('crypto_academy_expiry_date', ''),
-                'Crypto VIP Expiry': user_data.get('crypto_vip_expiry_date', ''),
-                'Forex Academy Expiry': user_data.get('forex_academy_expiry_date', ''),
-                'Forex VIP Expiry': user_data.get('forex_vip_expiry_date', ''),
-                'Is Affiliate': 'Yes' if user_data.get('is_affiliate') else 'No',
-                'Affiliate Code': user_data.get('affiliate_code', ''),
-                'Affiliate Earnings': user_data.get('affiliate_earnings', 0)
+    run_export_job(admin_id, 'all_users_csv', build_all_users_csv)
+
+def build_subscribed_users_csv() -> Dict:
+    """Build the subscribed-users CSV export"""
+    # Filter subscribed users (cached id list, see get_sorted_user_ids)
+    subscribed_data = []
+    for user_id in user_db.get_sorted_user_ids('subscribed'):
+        try:
+            user_data = user_db.users.get(str(user_id), {})
+            
+            # Get subscription details
+            crypto_academy = user_data.get('crypto_academy_expiry_date', '')
+            crypto_vip = user_data.get('crypto_vip_expiry_date', '')
+            forex_academy = user_data.get('forex_academy_expiry_date', '')
+            forex_vip = user_data.get('forex_vip_expiry_date', '')
+            
+            subscribed_data.append({
+                'ID': user_id,
+                'Name': user_data.get('name', ''),
+                'Username': user_data.get('username', ''),
+                'Crypto Academy': crypto_academy,
+                'Crypto VIP': crypto_vip,
+                'Forex Academy': forex_academy,
+                'Forex VIP': forex_vip,
+                'Registered': user_data.get('registered_date', '')
             })
         
-        # Convert to bytes
-        csv_data = output.getvalue().encode('utf-8')
-        csv_file = io.BytesIO(csv_data)
-        csv_file.name = f'all_users_export_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
+        except Exception as e:
+            logger.error(f"Error processing user {user_id}: {e}")
+            continue
+    
+    if not subscribed_data:
+        return {'text': "❌ No subscribed users to export."}
+    
+    # Create CSV
+    output = io.StringIO()
+    fieldnames = ['ID', 'Name', 'Username', 'Crypto Academy', 'Crypto VIP', 'Forex Academy', 'Forex VIP', 'Registered']
+    writer = csv.DictWriter(output, fieldnames=fieldnames)
+    writer.writeheader()
+    
+    for user in subscribed_data:
+        writer.writerow(user)
+    
+    # Convert to bytes
+    csv_data = output.getvalue().encode('utf-8')
+    return {
+        'document': csv_data,
+        'filename': f'subscribed_users_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv',
+        'caption': f"📊 Subscribed Users Export\n📅 Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n👥 Total Users: {len(subscribed_data)}"
+    }
+
+def export_subscribed_users_to_csv(admin_id: int):
+    """Export subscribed users to CSV"""
+    run_export_job(admin_id, 'subscribed_users_csv', build_subscribed_users_csv)
+
+# ====================
+# FIXED: USER DETAIL SEARCH WITH CLEAR STEP HANDLERS AND CANCEL OPTION
+# ====================
+
+def show_user_detail_search(admin_id: int, message_id: int = None):
+    """Show user detail search interface - FIXED VERSION with cancel option"""
+    try:
+        text = (
+            "🔍 <b>User Detail Search</b>\n\n"
+            "Enter a User ID, name, @username, affiliate code or payout ID:\n\n"
+            "Examples: <code>123456789</code>, <code>@john</code>, <code>PAYOUT_20240101</code>\n\n"
+            "Send your search now:\n\n"
+            "<i>Click 'Cancel' below to go back without searching</i>"
+        )
         
-        # Send file
-        bot.send_document(admin_id, csv_file, caption="👥 All Users Export - Generated on: " + datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+        kb = types.InlineKeyboardMarkup()
+        kb.row(
+            types.InlineKeyboardButton("❌ Cancel", callback_data="admin_user_mgmt_back"),
+            types.InlineKeyboardButton("📋 All Users", callback_data="admin_view_all_users")
+        )
+        
+        if message_id:
+            bot.edit_message_text(text, admin_id, message_id, parse_mode='HTML', reply_markup=kb)
+        else:
+            msg = bot.send_message(admin_id, text, parse_mode='HTML', reply_markup=kb)
+            message_id = msg.message_id
         
-        logger.info(f"Exported all users data to admin {admin_id}")
+        # Next message is the query (replaces any other pending prompt)
+        conversations.start(admin_id, 'user_search', search_message_id=message_id)
         
     except Exception as e:
-        logger.error(f"Error exporting all users to CSV: {e}")
-        bot.send_message(admin_id, f"❌ Error exporting data: {e}")
+        logger.error(f"Error showing user detail search: {e}")
+        bot.send_message(admin_id, f"Error: {e}")
 
-def export_subscribed_users_to_csv(admin_id: int):
-    """Export subscribed users to CSV"""
+@conversations.step('user_search')
+def process_user_detail_search(message: types.Message, search_message_id: int):
+    """Process user detail search - FIXED VERSION with cancel handling"""
     try:
-        all_users = user_db.get_all_users()
+        admin_id = message.from_user.id
+        if admin_id not in ADMIN_IDS:
+            return
         
-        # Filter subscribed users
-        subscribed_data = []
-        for user_id_str, user_data in all_users.items():
-            try:
-                user_id = int(user_id_str)
-                if has_active_subscription(user_id):
-                    # Get subscription details
-                    crypto_academy = user_data.get('crypto_academy_expiry_date', '')
-                    crypto_vip = user_data.get('crypto_vip_expiry_date', '')
-                    forex_academy = user_data.get('forex_academy_expiry_date', '')
-                    forex_vip = user_data.get('forex_vip_expiry_date', '')
-                    
-                    subscribed_data.append({
-                        'ID': user_id,
-                        'Name': user_data.get('name', ''),
-                        'Username': user_data.get('username', ''),
-                        'Crypto Academy': crypto_academy,
-                        'Crypto VIP': crypto_vip,
-                        'Forex Academy': forex_academy,
-                        'Forex VIP': forex_vip,
-                        'Registered': user_data.get('registered_date', '')
-                    })
-            
-            except Exception as e:
-                logger.error(f"Error processing user {user_id_str}: {e}")
-                continue
+        user_id_str = (message.text or '').strip()
         
-        if not subscribed_data:
-            bot.send_message(admin_id, "❌ No subscribed users to export.")
+        # Check if user clicked cancel by sending command
+        if user_id_str.lower() in ['cancel', '/cancel', 'back']:
+            # Return to user management
+            show_user_management_dashboard(admin_id)
             return
         
-        # Create CSV
-        output = io.StringIO()
-        fieldnames = ['ID', 'Name', 'Username', 'Crypto Academy', 'Crypto VIP', 'Forex Academy', 'Forex VIP', 'Registered']
-        writer = csv.DictWriter(output, fieldnames=fieldnames)
-        writer.writeheader()
-        
-        for user in subscribed_data:
-            writer.writerow(user)
-        
-        # Convert to bytes
-        csv_data = output.getvalue().encode('utf-8')
-        csv_file = io.BytesIO(csv_data)
-        csv_file.name = f'subscribed_users_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
-        
-        # Send file
-        bot.send_document(
-            admin_id, 
-            csv_file, 
-            caption=f"📊 Subscribed Users Export\n📅 Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n👥 Total Users: {len(subscribed_data)}"
-        )
+        # Check if message is a command (starts with /)
+        if user_id_str.startswith('/'):
+            # This is a command, not a user ID, so ignore it
+            return
+        
+        # Exact Telegram ID goes straight to the user; anything else is a search
+        user = None
+        if user_id_str.isdigit():
+            user_id = int(user_id_str)
+            user = user_db.users.get(str(user_id))
+        
+        if not user:
+            matches = user_db.search_users(user_id_str)
+            
+            if not matches:
+                error_msg = bot.send_message(message.chat.id, f"❌ No users found matching '{user_id_str}'.")
+                deferred.delete(message.chat.id, error_msg.message_id, delay=2)
+                deferred.delete(message.chat.id, message.message_id, delay=2)
+                show_user_detail_search(admin_id, search_message_id)
+                return
+            
+            if len(matches) > 1:
+                try:
+                    bot.delete_message(admin_id, message.message_id)
+                except:
+                    pass
+                admin_search_results[admin_id] = (user_id_str, [uid for uid, _ in matches])
+                show_user_search_results(admin_id, search_message_id)
+                return
+            
+            user_id = matches[0][0]
+        
+        # Delete the search message and user's input
+        try:
+            bot.delete_message(admin_id, search_message_id)
+            bot.delete_message(admin_id, message.message_id)
+        except:
+            pass
+        
+        # Show user details
+        show_user_details(admin_id, user_id)
         
     except Exception as e:
-        logger.error(f"Error exporting subscribed users: {e}")
-        bot.send_message(admin_id, f"❌ Error exporting data: {e}")
+        logger.error(f"Error processing user detail search: {e}")
+        bot.send_message(message.chat.id, f"❌ Error: {e}")
 
-# ====================
-# FIXED: USER DETAIL SEARCH WITH CLEAR STEP HANDLERS AND CANCEL OPTION
-# ====================
+# Last search per admin: admin_id -> (query, ranked user ids)
+admin_search_results: Dict[int, Tuple[str, List[int]]] = {}
 
-def show_user_detail_search(admin_id: int, message_id: int = None):
-    """Show user detail search interface - FIXED VERSION with cancel option"""
+def show_user_search_results(admin_id: int, message_id: int = None, page: int = 0):
+    """Show a page of ranked user search matches"""
     try:
-        # Clear any existing step handlers first
-        try:
-            bot.clear_step_handler_by_chat_id(admin_id)
-        except:
-            pass
+        query, user_ids = admin_search_results.get(admin_id, ('', []))
+        per_page = 8
+        total = len(user_ids)
+        total_pages = max(1, (total + per_page - 1) // per_page)
+        page = max(0, min(page, total_pages - 1))
+        page_ids = user_ids[page * per_page:(page + 1) * per_page]
         
         text = (
-            "🔍 <b>User Detail Search</b>\n\n"
-            "Enter the User ID to view detailed information:\n\n"
-            "Format: <code>123456789</code>\n\n"
-            "Send the User ID now:\n\n"
-            "<i>Click 'Cancel' below to go back without entering ID</i>"
+            f"🔍 <b>Search Results for '{html.escape(query)}'</b>\n"
+            f"📊 {total} match(es) - Page {page + 1} of {total_pages}\n\n"
+            f"Tap a user to view details:"
         )
         
         kb = types.InlineKeyboardMarkup()
+        for user_id in page_ids:
+            user = user_db.users.get(str(user_id), {})
+            username = f" @{user['username']}" if user.get('username') else ""
+            code = f" [{user['affiliate_code']}]" if user.get('affiliate_code') else ""
+            kb.row(types.InlineKeyboardButton(
+                f"{user.get('name', 'Unknown')}{username}{code} - {user_id}"[:60],
+                callback_data=f"admin_view_user_detail:{user_id}"
+            ))
+        
+        if total_pages > 1:
+            nav_buttons = []
+            if page > 0:
+                nav_buttons.append(types.InlineKeyboardButton("⬅️ Previous", callback_data=f"admin_search_page:{page-1}"))
+            nav_buttons.append(types.InlineKeyboardButton(f"📄 {page+1}/{total_pages}", callback_data="noop"))
+            if page < total_pages - 1:
+                nav_buttons.append(types.InlineKeyboardButton("Next ➡️", callback_data=f"admin_search_page:{page+1}"))
+            kb.row(*nav_buttons)
+        
         kb.row(
-            types.InlineKeyboardButton("❌ Cancel", callback_data="admin_user_mgmt_back"),
-            types.InlineKeyboardButton("📋 All Users", callback_data="admin_view_all_users")
+            types.InlineKeyboardButton("🔍 New Search", callback_data="admin_view_user_detail_menu"),
+            types.InlineKeyboardButton("📋 Back to Management", callback_data="admin_user_mgmt_back")
         )
         
         if message_id:
             bot.edit_message_text(text, admin_id, message_id, parse_mode='HTML', reply_markup=kb)
         else:
-            msg = bot.send_message(admin_id, text, parse_mode='HTML', reply_markup=kb)
-            message_id = msg.message_id
-        
-        # Register next step handler with timeout
-        bot.register_next_step_handler_by_chat_id(admin_id, process_user_detail_search, message_id)
+            bot.send_message(admin_id, text, parse_mode='HTML', reply_markup=kb)
         
     except Exception as e:
-        logger.error(f"Error showing user detail search: {e}")
-        bot.send_message(admin_id, f"Error: {e}")
+        logger.error(f"Error showing search results: {e}")
+        bot.send_message(admin_id, f"❌ Error: {e}")
 
-def process_user_detail_search(message: types.Message, search_message_id: int):
-    """Process user detail search - FIXED VERSION with cancel handling"""
+@bot.message_handler(commands=['search'])
+def handle_search_command(message: types.Message):
+    """Admin search: /search <name | @username | code | ID | payout ID>"""
     try:
         admin_id = message.from_user.id
         if admin_id not in ADMIN_IDS:
             return
         
-        user_id_str = message.text.strip()
-        
-        # Check if user clicked cancel by sending command
-        if user_id_str.lower() in ['cancel', '/cancel', 'back']:
-            # Clear the step handler
-            try:
-                bot.clear_step_handler(message)
-            except:
-                pass
-            
-            # Return to user management
-            show_user_management_dashboard(admin_id)
-            return
-        
-        # Clear the step handler immediately
-        try:
-            bot.clear_step_handler(message)
-        except:
-            pass
-        
-        # Check if message is a command (starts with /)
-        if user_id_str.startswith('/'):
-            # This is a command, not a user ID, so ignore it
+        parts = message.text.split(maxsplit=1)
+        if len(parts) < 2:
+            show_user_detail_search(admin_id)
             return
         
-        try:
-            user_id = int(user_id_str)
-        except ValueError:
-            # Send error and restart the search
-            error_msg = bot.send_message(
-                message.chat.id,
-                "❌ Invalid User ID. Please enter a numeric ID.",
-                parse_mode='HTML'
-            )
-            # Wait a bit and then delete error message and restart search
-            time.sleep(2)
-            try:
-                bot.delete_message(message.chat.id, error_msg.message_id)
-                bot.delete_message(message.chat.id, message.message_id)
-            except:
-                pass
-            show_user_detail_search(admin_id, search_message_id)
+        query = parts[1].strip()
+        matches = user_db.search_users(query)
+        if not matches:
+            bot.send_message(admin_id, f"❌ No users found matching '{query}'.")
             return
         
-        # Fetch user data
-        user = user_db.fetch_user(user_id)
-        
-        if not user:
-            error_msg = bot.send_message(message.chat.id, f"❌ User with ID {user_id} not found.")
-            time.sleep(2)
-            try:
-                bot.delete_message(message.chat.id, error_msg.message_id)
-                bot.delete_message(message.chat.id, message.message_id)
-            except:
-                pass
-            show_user_detail_search(admin_id, search_message_id)
+        if len(matches) == 1:
+            show_user_details(admin_id, matches[0][0])
             return
         
-        # Delete the search message and user's input
-        try:
-            bot.delete_message(admin_id, search_message_id)
-            bot.delete_message(admin_id, message.message_id)
-        except:
-            pass
-        
-        # Show user details
-        show_user_details(admin_id, user_id)
-        
-        # Clear the step handler
-        try:
-            bot.clear_step_handler_by_chat_id(message.chat.id)
-        except:
-            pass
+        admin_search_results[admin_id] = (query, [uid for uid, _ in matches])
+        show_user_search_results(admin_id)
         
     except Exception as e:
-        logger.error(f"Error processing user detail search: {e}")
+        logger.error(f"Error in search command: {e}")
         bot.send_message(message.chat.id, f"❌ Error: {e}")
 
 # ====================
@@ -3568,92 +3839,239 @@ def reject_payout_request(admin_id: int, payout_id: str, message_id: int = None)
         logger.error(f"Error rejecting payout: {e}")
         bot.send_message(admin_id, f"Error: {e}")
 
+def build_commission_report() -> Tuple[str, types.InlineKeyboardMarkup]:
+    """Build the commission report text and keyboard"""
+    report = user_db.get_commission_report()
+    
+    text = (
+        f"📊 <b>Commission Report</b>\n\n"
+        f"💰 <b>Total Commissions Generated:</b> ₦{report.get('total_commissions', 0):,.2f}\n"
+        f"👥 <b>Total Affiliates:</b> {report.get('total_affiliates', 0)}\n"
+        f"📈 <b>Total Referrals:</b> {report.get('total_referrals', 0)}\n"
+        f"🚩 <b>Held for Review:</b> {report.get('held_count', 0)}\n\n"
+        f"<b>By Plan Type:</b>\n"
+    )
+    
+    for plan_type, amount in report.get('by_plan_type', {}).items():
+        text += f"• {plan_type}: ₦{amount:,.2f}\n"
+    
+    text += f"\n<b>Recent Commission Activity:</b>\n"
+    
+    recent = report.get('recent_commissions', [])
+    if recent:
+        for i, commission in enumerate(recent[:10], 1):
+            text += f"{i}. ₦{commission['amount']:,.2f} - {commission['affiliate_name']}\n"
+    else:
+        text += "No recent commissions.\n"
+    
+    kb = types.InlineKeyboardMarkup()
+    kb.row(
+        types.InlineKeyboardButton("🔄 Refresh", callback_data="admin_commission_report"),
+        types.InlineKeyboardButton("📅 Monthly Report", callback_data="admin_monthly_report")
+    )
+    kb.row(types.InlineKeyboardButton("📈 View Chart", callback_data="admin_chart:commission"))
+    kb.row(
+        types.InlineKeyboardButton("🤝 Back to Management", callback_data="admin_affiliate_mgmt"),
+        types.InlineKeyboardButton("📱 Admin Dashboard", callback_data="admin_back")
+    )
+    
+    return text, kb
+
 def show_commission_report(admin_id: int, message_id: int = None):
     """Show commission report to admin"""
+    run_report_job(admin_id, message_id, 'commission_report', build_commission_report)
+
+def parse_what_if_args(args: List[str]) -> Tuple[Dict, Dict]:
+    """'academy=0.25 vip.monthly=0.1 usd=1500' -> (rates, fx_rates); percentages allowed"""
+    rates, fx_rates = {}, {}
+    for arg in args:
+        key, _, value = arg.partition('=')
+        if key == 'usd':
+            fx_rates['usd'] = float(value)
+            continue
+        
+        rate = float(value.rstrip('%'))
+        if value.endswith('%') or rate > 1:
+            rate /= 100
+        if '.' in key:
+            plan_type, duration = key.split('.', 1)
+            rates.setdefault(plan_type, {})[duration] = rate
+        else:
+            rates[key] = rate
+    return rates, fx_rates
+
+def build_what_if_report(scenario: str, rates: Dict, fx_rates: Dict) -> Tuple[str, types.InlineKeyboardMarkup]:
+    """Re-price all credited commissions under proposed rates / FX"""
+    commissions = [c for c in list(user_db.commissions.values()) if c.get('status') not in UNCREDITED_STATUSES]
+    result = commission_engine.what_if(commissions, rates, fx_rates)
+    
+    text = (
+        f"🧮 <b>What-If Commission Report</b>\n\n"
+        f"Scenario: <code>{html.escape(scenario) or 'current rates'}</code>\n"
+        f"Commissions re-priced: {result['count']}\n\n"
+        f"💰 <b>Actual:</b> ₦{result['current_total']:,.2f}\n"
+        f"🧮 <b>Proposed:</b> ₦{result['proposed_total']:,.2f}\n"
+        f"📊 <b>Difference:</b> ₦{result['difference']:+,.2f}\n\n"
+        f"<b>By Plan:</b>\n"
+    )
+    for plan, entry in sorted(result['by_plan'].items()):
+        text += f"• {plan} ({entry['count']}): ₦{entry['current']:,.2f} → ₦{entry['proposed']:,.2f}\n"
+    
+    kb = types.InlineKeyboardMarkup()
+    kb.row(types.InlineKeyboardButton("📊 Commission Report", callback_data="admin_commission_report"))
+    return text, kb
+
+@bot.message_handler(commands=['whatif'])
+def handle_what_if_command(message: types.Message):
+    """Admin what-if: /whatif academy=25% vip.monthly=10% usd=1500"""
     try:
-        report = user_db.get_commission_report()
-        
-        text = (
-            f"📊 <b>Commission Report</b>\n\n"
-            f"💰 <b>Total Commissions Generated:</b> ₦{report.get('total_commissions', 0):,.2f}\n"
-            f"👥 <b>Total Affiliates:</b> {report.get('total_affiliates', 0)}\n"
-            f"📈 <b>Total Referrals:</b> {report.get('total_referrals', 0)}\n\n"
-            f"<b>By Plan Type:</b>\n"
-        )
-        
-        for plan_type, amount in report.get('by_plan_type', {}).items():
-            text += f"• {plan_type}: ₦{amount:,.2f}\n"
+        admin_id = message.from_user.id
+        if admin_id not in ADMIN_IDS:
+            return
         
-        text += f"\n<b>Recent Commission Activity:</b>\n"
+        args = message.text.split()[1:]
+        try:
+            rates, fx_rates = parse_what_if_args(args)
+        except ValueError:
+            bot.send_message(
+                admin_id,
+                "Usage: <code>/whatif academy=25% vip.monthly=10% vip.yearly=0.18 usd=1500</code>",
+                parse_mode='HTML'
+            )
+            return
         
-        recent = report.get('recent_commissions', [])
-        if recent:
-            for i, commission in enumerate(recent[:10], 1):
-                text += f"{i}. ₦{commission['amount']:,.2f} - {commission['affiliate_name']}\n"
-        else:
-            text += "No recent commissions.\n"
+        scenario = ' '.join(sorted(args))
+        run_report_job(admin_id, None, f"whatif:{scenario}",
+                       lambda: build_what_if_report(scenario, rates, fx_rates))
+    except Exception as e:
+        logger.error(f"Error in /whatif: {e}")
+        bot.send_message(message.chat.id, f"❌ Error: {e}")
+
+@bot.message_handler(commands=['apistats'])
+def handle_api_stats_command(message: types.Message):
+    """Admin: Bot API calls made per user action since startup"""
+    try:
+        admin_id = message.from_user.id
+        if admin_id not in ADMIN_IDS:
+            return
         
-        kb = types.InlineKeyboardMarkup()
-        kb.row(
-            types.InlineKeyboardButton("🔄 Refresh", callback_data="admin_commission_report"),
-            types.InlineKeyboardButton("📅 Monthly Report", callback_data="admin_monthly_report")
-        )
-        kb.row(
-            types.InlineKeyboardButton("🤝 Back to Management", callback_data="admin_affiliate_mgmt"),
-            types.InlineKeyboardButton("📱 Admin Dashboard", callback_data="admin_back")
+        stats = api_meter.snapshot()
+        text = "📡 <b>API Calls per Action</b>\n\n"
+        for name, entry in sorted(stats.items()):
+            text += f"• {name}: {entry['per_run']:.2f} calls/run ({entry['runs']} runs, {entry['calls']} calls)\n"
+        if not stats:
+            text += "No tracked actions yet.\n"
+        
+        updates = flood_control.snapshot()
+        edits = bot.edit_stats
+        text += (
+            f"\n🛡 <b>Flood Control</b>\n"
+            f"• Updates passed: {updates['passed']}\n"
+            f"• Repeated taps coalesced: {updates['coalesced']}\n"
+            f"• Throttled: {updates['throttled']}\n"
+            f"• Edits sent: {edits['sent']}, unchanged skipped: {edits['unchanged']}, "
+            f"superseded: {edits['superseded']}\n"
         )
+        bot.send_message(admin_id, text, parse_mode='HTML')
         
-        if message_id:
-            bot.edit_message_text(text, admin_id, message_id, parse_mode='HTML', reply_markup=kb)
-        else:
-            bot.send_message(admin_id, text, parse_mode='HTML', reply_markup=kb)
-            
     except Exception as e:
-        logger.error(f"Error showing commission report: {e}")
+        logger.error(f"Error in apistats command: {e}")
+        bot.send_message(message.chat.id, f"❌ Error: {e}")
 
-def show_affiliate_stats(admin_id: int, message_id: int = None):
-    """Show affiliate performance stats to admin"""
+@bot.message_handler(commands=['reconcile'])
+def handle_reconcile_command(message: types.Message):
+    """Admin: run the membership reconciliation now"""
     try:
-        stats = user_db.get_affiliate_performance_stats()
+        admin_id = message.from_user.id
+        if admin_id not in ADMIN_IDS:
+            return
         
-        text = (
-            f"📈 <b>Affiliate Performance Statistics</b>\n\n"
-            f"<b>Overall Performance:</b>\n"
-            f"• Active Affiliates: {stats.get('active_affiliates', 0)}\n"
-            f"• Total Referrals: {stats.get('total_referrals', 0)}\n"
-            f"• Conversion Rate: {stats.get('conversion_rate', 0):.1f}%\n"
-            f"• Avg. Commission per Affiliate: ₦{stats.get('avg_commission', 0):,.2f}\n\n"
-            f"<b>Top Performers (This Month):</b>\n"
+        scheduler.add_job(
+            run_membership_reconciliation,
+            trigger='date',
+            run_date=datetime.now(),
+            args=[admin_id],
+            id='membership_reconcile_now',
+            name='Membership reconciliation (manual)',
+            replace_existing=True
         )
+        bot.send_message(admin_id, "⏳ Reconciliation started. The report follows when it's done.")
         
-        top_performers = stats.get('top_performers', [])
-        if top_performers:
-            for i, performer in enumerate(top_performers[:5], 1):
-                text += f"{i}. {performer['name']}: ₦{performer['earnings']:,.2f} ({performer['referrals']} referrals)\n"
-        else:
-            text += "No performance data yet.\n"
-        
-        text += f"\n<b>Commission Distribution:</b>\n"
-        text += f"• Academy Commissions: ₦{stats.get('academy_commissions', 0):,.2f}\n"
-        text += f"• VIP Commissions: ₦{stats.get('vip_commissions', 0):,.2f}\n"
+    except Exception as e:
+        logger.error(f"Error in reconcile command: {e}")
+        bot.send_message(message.chat.id, f"❌ Error: {e}")
+
+@bot.message_handler(commands=['groupstats'])
+def handle_group_stats_command(message: types.Message):
+    """Admin: tracked members, grant / removal counts and latency per group"""
+    try:
+        admin_id = message.from_user.id
+        if admin_id not in ADMIN_IDS:
+            return
         
-        kb = types.InlineKeyboardMarkup()
-        kb.row(
-            types.InlineKeyboardButton("🔄 Refresh", callback_data="admin_affiliate_stats"),
-            types.InlineKeyboardButton("📊 Detailed Report", callback_data="admin_detailed_stats")
-        )
-        kb.row(
-            types.InlineKeyboardButton("🤝 Back to Management", callback_data="admin_affiliate_mgmt"),
-            types.InlineKeyboardButton("📱 Admin Dashboard", callback_data="admin_back")
-        )
+        stats = membership.snapshot()
+        text = "👥 <b>Group Membership</b>\n\n"
+        for _, _, chat_id, chat_name, _ in group_chats():
+            counts = user_db.count_chat_members(chat_id)
+            entry = stats.get(chat_name)
+            text += (
+                f"<b>{html.escape(chat_name)}</b>\n"
+                f"• Tracked: {counts.get('member', 0)} members, {counts.get('invited', 0)} invited, "
+                f"{counts.get('left', 0) + counts.get('removed', 0) + counts.get('revoked', 0)} out\n"
+            )
+            if entry:
+                text += (
+                    f"• Operations: {entry['ops']} ({entry['failures']} failed, {entry['failure_rate']:.0%}), "
+                    f"{entry['skipped']} skipped\n"
+                    f"• Latency: {entry['avg_ms']:.0f} ms avg, {entry['max_ms']:.0f} ms max\n"
+                )
+            text += "\n"
+        bot.send_message(admin_id, text, parse_mode='HTML')
         
-        if message_id:
-            bot.edit_message_text(text, admin_id, message_id, parse_mode='HTML', reply_markup=kb)
-        else:
-            bot.send_message(admin_id, text, parse_mode='HTML', reply_markup=kb)
-            
     except Exception as e:
-        logger.error(f"Error showing affiliate stats: {e}")
+        logger.error(f"Error in groupstats command: {e}")
+        bot.send_message(message.chat.id, f"❌ Error: {e}")
+
+def build_affiliate_stats() -> Tuple[str, types.InlineKeyboardMarkup]:
+    """Build the affiliate performance stats text and keyboard"""
+    stats = user_db.get_affiliate_performance_stats()
+    
+    text = (
+        f"📈 <b>Affiliate Performance Statistics</b>\n\n"
+        f"<b>Overall Performance:</b>\n"
+        f"• Active Affiliates: {stats.get('active_affiliates', 0)}\n"
+        f"• Total Referrals: {stats.get('total_referrals', 0)}\n"
+        f"• Conversion Rate: {stats.get('conversion_rate', 0):.1f}%\n"
+        f"• Avg. Commission per Affiliate: ₦{stats.get('avg_commission', 0):,.2f}\n\n"
+        f"<b>Top Performers (This Month):</b>\n"
+    )
+    
+    top_performers = stats.get('top_performers', [])
+    if top_performers:
+        for i, performer in enumerate(top_performers[:5], 1):
+            text += f"{i}. {performer['name']}: ₦{performer['earnings']:,.2f} ({performer['referrals']} referrals)\n"
+    else:
+        text += "No performance data yet.\n"
+    
+    text += f"\n<b>Commission Distribution:</b>\n"
+    text += f"• Academy Commissions: ₦{stats.get('academy_commissions', 0):,.2f}\n"
+    text += f"• VIP Commissions: ₦{stats.get('vip_commissions', 0):,.2f}\n"
+    
+    kb = types.InlineKeyboardMarkup()
+    kb.row(
+        types.InlineKeyboardButton("🔄 Refresh", callback_data="admin_affiliate_stats"),
+        types.InlineKeyboardButton("📊 Detailed Report", callback_data="admin_detailed_stats")
+    )
+    kb.row(
+        types.InlineKeyboardButton("🤝 Back to Management", callback_data="admin_affiliate_mgmt"),
+        types.InlineKeyboardButton("📱 Admin Dashboard", callback_data="admin_back")
+    )
+    
+    return text, kb
+
+def show_affiliate_stats(admin_id: int, message_id: int = None):
+    """Show affiliate performance stats to admin"""
+    run_report_job(admin_id, message_id, 'affiliate_stats', build_affiliate_stats)
 
 def show_pending_applications(admin_id: int, message_id: int = None):
     """Show pending affiliate applications to admin"""
@@ -3756,60 +4174,57 @@ def show_affiliate_details(admin_id: int, user_id: int, message_id: int = None):
     except Exception as e:
         logger.error(f"Error showing affiliate details: {e}")
 
-def show_all_payouts_detailed(admin_id: int, message_id: int = None):
-    """Show detailed payout information to admin"""
-    try:
-        payouts = user_db.get_all_payout_requests()
-        
-        if not payouts:
-            text = "💰 <b>All Payouts</b>\n\nNo payout requests found."
-        else:
-            text = f"💰 <b>All Payouts ({len(payouts)})</b>\n\n"
-            
-            pending_total = 0
-            paid_total = 0
-            rejected_total = 0
-            
-            for payout in payouts:
-                status = payout.get('status', 'pending')
-                amount = payout.get('amount', 0)
-                
-                if status == 'pending':
-                    pending_total += amount
-                elif status == 'paid':
-                    paid_total += amount
-                elif status == 'rejected':
-                    rejected_total += amount
-            
-            text += f"<b>Summary:</b>\n"
-            text += f"• Pending: ₦{pending_total:,.2f}\n"
-            text += f"• Paid: ₦{paid_total:,.2f}\n"
-            text += f"• Rejected: ₦{rejected_total:,.2f}\n"
-            text += f"• Total: ₦{pending_total + paid_total + rejected_total:,.2f}\n\n"
-            
-            text += f"<b>Recent Payouts:</b>\n"
-            
-            for i, payout in enumerate(payouts[:10], 1):
-                status_icon = "⏳" if payout['status'] == 'pending' else "✅" if payout['status'] == 'paid' else "❌"
-                text += f"{i}. {status_icon} {payout['id']} - ₦{payout['amount']:,.2f} - {payout['affiliate_name']}\n"
+def build_all_payouts_detailed() -> Tuple[str, types.InlineKeyboardMarkup]:
+    """Build the detailed payouts text and keyboard"""
+    payouts = user_db.get_all_payout_requests()
+    
+    if not payouts:
+        text = "💰 <b>All Payouts</b>\n\nNo payout requests found."
+    else:
+        text = f"💰 <b>All Payouts ({len(payouts)})</b>\n\n"
         
-        kb = types.InlineKeyboardMarkup()
-        kb.row(
-            types.InlineKeyboardButton("📊 Export to CSV", callback_data="admin_export_payouts"),
-            types.InlineKeyboardButton("🔄 Refresh", callback_data="admin_view_all_payouts")
-        )
-        kb.row(
-            types.InlineKeyboardButton("📋 Back to Payouts", callback_data="admin_view_payouts"),
-            types.InlineKeyboardButton("🤝 Affiliate Management", callback_data="admin_affiliate_mgmt")
-        )
+        pending_total = 0
+        paid_total = 0
+        rejected_total = 0
         
-        if message_id:
-            bot.edit_message_text(text, admin_id, message_id, parse_mode='HTML', reply_markup=kb)
-        else:
-            bot.send_message(admin_id, text, parse_mode='HTML', reply_markup=kb)
-            
-    except Exception as e:
-        logger.error(f"Error showing detailed payouts: {e}")
+        for payout in payouts:
+            status = payout.get('status', 'pending')
+            amount = payout.get('amount', 0)
+            
+            if status == 'pending':
+                pending_total += amount
+            elif status == 'paid':
+                paid_total += amount
+            elif status == 'rejected':
+                rejected_total += amount
+        
+        text += f"<b>Summary:</b>\n"
+        text += f"• Pending: ₦{pending_total:,.2f}\n"
+        text += f"• Paid: ₦{paid_total:,.2f}\n"
+        text += f"• Rejected: ₦{rejected_total:,.2f}\n"
+        text += f"• Total: ₦{pending_total + paid_total + rejected_total:,.2f}\n\n"
+        
+        text += f"<b>Recent Payouts:</b>\n"
+        
+        for i, payout in enumerate(payouts[:10], 1):
+            status_icon = "⏳" if payout['status'] == 'pending' else "✅" if payout['status'] == 'paid' else "❌"
+            text += f"{i}. {status_icon} {payout['id']} - ₦{payout['amount']:,.2f} - {payout['affiliate_name']}\n"
+    
+    kb = types.InlineKeyboardMarkup()
+    kb.row(
+        types.InlineKeyboardButton("📊 Export to CSV", callback_data="admin_export_payouts"),
+        types.InlineKeyboardButton("🔄 Refresh", callback_data="admin_view_all_payouts")
+    )
+    kb.row(
+        types.InlineKeyboardButton("📋 Back to Payouts", callback_data="admin_view_payouts"),
+        types.InlineKeyboardButton("🤝 Affiliate Management", callback_data="admin_affiliate_mgmt")
+    )
+    
+    return text, kb
+
+def show_all_payouts_detailed(admin_id: int, message_id: int = None):
+    """Show detailed payout information to admin"""
+    run_report_job(admin_id, message_id, 'all_payouts_detailed', build_all_payouts_detailed)
 
 def show_processed_payouts(admin_id: int, message_id: int = None):
     """Show processed payouts to admin"""
@@ -3893,10 +4308,11 @@ def handle_start(message: types.Message):
             referral_code = command_args[1].replace('ref_', '')
             referred_by = user_db.get_user_by_affiliate_code(referral_code)
             
+            # Store referral in database (self/repeat referrals are rejected by the fraud rules)
+            if referred_by and not user_db.add_referral(referred_by['tg_id'], uid):
+                referred_by = None
+            
             if referred_by:
-                # Store referral in database
-                user_db.add_referral(referred_by['tg_id'], uid)
-                
                 # Send welcome message with referral info
                 bot.send_message(
                     uid,
@@ -3998,11 +4414,7 @@ def handle_main_menu(call: types.CallbackQuery):
 # HELPER FUNCTIONS FOR MAIN MENU (KEPT FOR COMPLETENESS)
 # ====================
 
-def show_welcome(uid: int, message_id: int = None):
-    """Show welcome message"""
-    user = user_db.fetch_user(uid)
-    program = user.get('program', 'crypto') if user else 'crypto'
-    
+def _build_welcome(program: str) -> Tuple[str, str]:
     if program == 'crypto':
         text = (
             "🚀 <b>Welcome to BlockchainPlus Crypto Program</b>\n\n"
@@ -4053,16 +4465,20 @@ def show_welcome(uid: int, message_id: int = None):
             "• View recommended exchanges"
         )
     
-    kb = types.InlineKeyboardMarkup()
-    kb.row(
-        types.InlineKeyboardButton("📱 Back to Menu", callback_data="mainmenu_back"),
-        types.InlineKeyboardButton("💳 Make Payment", callback_data="mainmenu_payment")
-    )
-    kb.row(
-        types.InlineKeyboardButton("🚀 Exchanges", callback_data="mainmenu_exchanges"),
-        types.InlineKeyboardButton("🎥 Tutorials", callback_data="mainmenu_tutorials")
-    )
+    kb = inline_keyboard([
+        [("📱 Back to Menu", "mainmenu_back"), ("💳 Make Payment", "mainmenu_payment")],
+        [("🚀 Exchanges", "mainmenu_exchanges"), ("🎥 Tutorials", "mainmenu_tutorials")]
+    ])
+    return text, kb
+
+screens.register('welcome', _build_welcome, variants=[{'program': program} for program in PRICING])
+
+def show_welcome(uid: int, message_id: int = None):
+    """Show welcome message"""
+    user = user_db.fetch_user(uid)
+    program = user.get('program', 'crypto') if user else 'crypto'
     
+    text, kb = screens.render('welcome', program=program)
     if message_id:
         bot.edit_message_text(text, uid, message_id, parse_mode='HTML', reply_markup=kb)
     else:
@@ -4177,11 +4593,10 @@ def show_payment_menu(uid: int, message_id: int = None):
 # TUTORIALS SECTION (KEPT FOR COMPLETENESS)
 # ====================
 
-def show_tutorials_menu(uid: int, message_id: int = None):
-    """Show tutorials menu"""
+def _build_tutorials_menu() -> Tuple[str, str]:
     text = (
         "🎬 <b>BlockchainPlus Tutorial Library</b>\n\n"
-        f"Access our comprehensive collection of {len(TUTORIALS)} trading tutorials:\n\n"
+        f"Access our comprehensive collection of {len(tutorial_catalog)} trading tutorials:\n\n"
         "📊 <b>Bybit Tutorials:</b> Complete trading guides\n"
         "💼 <b>Binance Tutorials:</b> Exchange walkthroughs\n"
         "🔄 <b>Other Exchanges:</b> Ourbit, Bitunix, MEXC\n"
@@ -4191,16 +4606,25 @@ def show_tutorials_menu(uid: int, message_id: int = None):
         "Select a category below:"
     )
     
-    kb = types.InlineKeyboardMarkup(row_width=2)
-    kb.add(types.InlineKeyboardButton("📊 Bybit Tutorials", callback_data="tut_cat:bybit"))
-    kb.add(types.InlineKeyboardButton("💼 Binance Tutorials", callback_data="tut_cat:binance"))
-    kb.add(types.InlineKeyboardButton("🔄 Other Exchanges", callback_data="tut_cat:exchanges"))
-    kb.add(types.InlineKeyboardButton("📈 Trading Strategies", callback_data="tut_cat:strategies"))
-    kb.add(types.InlineKeyboardButton("📚 Trading Education", callback_data="tut_cat:education"))
-    kb.add(types.InlineKeyboardButton("🔒 Security Guides", callback_data="tut_cat:security"))
-    kb.add(types.InlineKeyboardButton("🔍 Search Tutorials", callback_data="tut_search"))
-    kb.add(types.InlineKeyboardButton("📱 Back to Menu", callback_data="mainmenu_back"))
-    
+    kb = inline_keyboard([
+        [("📊 Bybit Tutorials", "tut_cat:bybit")],
+        [("💼 Binance Tutorials", "tut_cat:binance")],
+        [("🔄 Other Exchanges", "tut_cat:exchanges")],
+        [("📈 Trading Strategies", "tut_cat:strategies")],
+        [("📚 Trading Education", "tut_cat:education")],
+        [("🔒 Security Guides", "tut_cat:security")],
+        [("🔍 Search Tutorials", "tut_search")],
+        [("📱 Back to Menu", "mainmenu_back")]
+    ])
+    return text, kb
+
+screens.register('tutorials_menu', _build_tutorials_menu)
+
+def show_tutorials_menu(uid: int, message_id: int = None):
+    """Show tutorials menu"""
+    # A changed tutorials.json re-renders the cached tutorial screens
+    tutorial_catalog.check_for_updates()
+    text, kb = screens.render('tutorials_menu')
     if message_id:
         bot.edit_message_text(text, uid, message_id, parse_mode='HTML', reply_markup=kb)
     else:
@@ -4222,6 +4646,10 @@ def handle_tutorial_callback(call: types.CallbackQuery):
             # Show search options
             show_tutorial_search(uid, call.message.message_id)
             
+        elif data == "tut_find":
+            # Free-text search
+            prompt_tutorial_search(uid, call.message.message_id)
+            
         elif data.startswith("tut_view:"):
             # View specific tutorial
             tutorial_id = int(data.split(":")[1])
@@ -4239,12 +4667,14 @@ def handle_tutorial_callback(call: types.CallbackQuery):
             show_tutorials_menu(uid, call.message.message_id)
             
         elif data.startswith("tut_back_cat:"):
-            # Back to category
+            # Back to category (from a tutorial's photo/video message)
             category = data.split(":")[1]
-            show_tutorials_by_category(uid, category, call.message.message_id)
+            show_tutorials_by_category(uid, category, call.message.message_id,
+                                       has_media=call.message.content_type != 'text')
             
         elif data == "tut_back_search":
-            # Back to search
+            # Back to search (dropping any pending keyword prompt)
+            conversations.finish(uid)
             show_tutorial_search(uid, call.message.message_id)
             
         bot.answer_callback_query(call.id)
@@ -4253,13 +4683,57 @@ def handle_tutorial_callback(call: types.CallbackQuery):
         logger.error(f"Error in tutorial callback: {e}")
         bot.answer_callback_query(call.id, "Error loading content. Please try again.")
 
-def show_tutorials_by_category(uid: int, category: str, message_id: int, page: int = 0):
+def _tutorial_button(number: int, tutorial: Dict) -> Tuple[str, str]:
+    # Truncate title if too long for button
+    title = tutorial['title']
+    if len(title) > 40:
+        title = title[:37] + "..."
+    return (f"🎬 {number}: {title}", f"tut_view:{tutorial['id']}")
+
+def _build_tutorial_page(category: str, page: int) -> Tuple[str, str]:
+    current_tutorials, total_pages, total = tutorial_catalog.page(category, page)
+    per_page = tutorial_catalog.per_page
+    start_idx = page * per_page
+    
+    # Create message
+    message_text = f"<b>{tutorial_catalog.category_name(category)}</b>\n\n"
+    
+    for i, tutorial in enumerate(current_tutorials, 1):
+        message_text += f"<b>{start_idx + i}. {tutorial['title']}</b>\n"
+        message_text += f"<i>{tutorial['description']}</i>\n\n"
+    
+    # Add pagination info
+    message_text += f"📄 Page {page + 1} of {total_pages}\n"
+    message_text += f"📹 Total videos: {total}"
+    
+    # Add tutorial buttons with full titles
+    rows = [[_tutorial_button(i, tutorial)] for i, tutorial in enumerate(current_tutorials, start=start_idx + 1)]
+    
+    # Add navigation buttons
+    nav_buttons = []
+    if page > 0:
+        nav_buttons.append(("⬅️ Previous", f"tut_page:{category}:{page-1}"))
+    nav_buttons.append(("📱 Back to Menu", "mainmenu_back"))
+    if page + 1 < total_pages:
+        nav_buttons.append(("Next ➡️", f"tut_page:{category}:{page+1}"))
+    rows.append(nav_buttons)
+    
+    return message_text, inline_keyboard(rows)
+
+# Pages are rendered on first view and cached until the catalog reloads
+screens.register('tutorial_page', _build_tutorial_page, variants=())
+
+def _refresh_tutorial_screens():
+    screens.refresh('tutorials_menu')
+    screens.refresh('tutorial_page')
+
+tutorial_catalog.on_reload(_refresh_tutorial_screens)
+
+def show_tutorials_by_category(uid: int, category: str, message_id: int, page: int = 0,
+                               has_media: bool = False):
     """Show tutorials by category with pagination"""
     try:
-        # Filter tutorials by category
-        category_tutorials = [t for t in TUTORIALS if t['category'] == category]
-        
-        if not category_tutorials:
+        if not tutorial_catalog.count(category):
             bot.edit_message_text(
                 "❌ No tutorials found in this category.",
                 uid,
@@ -4268,70 +4742,8 @@ def show_tutorials_by_category(uid: int, category: str, message_id: int, page: i
             )
             return
         
-        # Pagination
-        per_page = 5
-        start_idx = page * per_page
-        end_idx = start_idx + per_page
-        current_tutorials = category_tutorials[start_idx:end_idx]
-        
-        # Create message
-        category_name = TUTORIAL_CATEGORIES.get(category, category.title())
-        message_text = f"<b>{category_name}</b>\n\n"
-        
-        for i, tutorial in enumerate(current_tutorials, 1):
-            message_text += f"<b>{start_idx + i}. {tutorial['title']}</b>\n"
-            message_text += f"<i>{tutorial['description']}</i>\n\n"
-        
-        # Add pagination info
-        total_pages = (len(category_tutorials) + per_page - 1) // per_page
-        message_text += f"📄 Page {page + 1} of {total_pages}\n"
-        message_text += f"📹 Total videos: {len(category_tutorials)}"
-        
-        # Create keyboard
-        kb = types.InlineKeyboardMarkup(row_width=1)
-        
-        # Add tutorial buttons with full titles
-        for i, tutorial in enumerate(current_tutorials, start=start_idx + 1):
-            # Truncate title if too long for button
-            title = tutorial['title']
-            if len(title) > 40:
-                title = title[:37] + "..."
-            
-            kb.add(types.InlineKeyboardButton(
-                f"🎬 {i}: {title}",
-                callback_data=f"tut_view:{tutorial['id']}"
-            ))
-        
-        # Add navigation buttons
-        nav_buttons = []
-        if page > 0:
-            nav_buttons.append(types.InlineKeyboardButton(
-                "⬅️ Previous",
-                callback_data=f"tut_page:{category}:{page-1}"
-            ))
-        
-        nav_buttons.append(types.InlineKeyboardButton(
-            "📱 Back to Menu",
-            callback_data="mainmenu_back"
-        ))
-        
-        if end_idx < len(category_tutorials):
-            nav_buttons.append(types.InlineKeyboardButton(
-                "Next ➡️",
-                callback_data=f"tut_page:{category}:{page+1}"
-            ))
-        
-        if nav_buttons:
-            kb.row(*nav_buttons)
-        
-        # Edit the message
-        bot.edit_message_text(
-            message_text,
-            uid,
-            message_id,
-            parse_mode='HTML',
-            reply_markup=kb
-        )
+        message_text, kb = screens.render('tutorial_page', category=category, page=page)
+        composer.replace(uid, message_id, message_text, reply_markup=kb, has_media=has_media)
         
     except Exception as e:
         logger.error(f"Error showing tutorials by category: {e}")
@@ -4341,11 +4753,18 @@ def show_tutorials_by_category(uid: int, category: str, message_id: int, page: i
             message_id
         )
 
+def _tutorial_media_keyboard(tutorial: Dict) -> str:
+    return inline_keyboard([
+        [{"text": "📺 Watch on YouTube", "url": tutorial['url']}],
+        [("⬅️ Back to Category", f"tut_back_cat:{tutorial['category']}"), ("📱 Main Menu", "mainmenu_back")]
+    ])
+
+@api_meter.track('tutorial_view')
 def show_tutorial_detail(uid: int, tutorial_id: int, message_id: int):
     """Show detailed tutorial information with video playing directly in Telegram"""
     try:
         # Find tutorial
-        tutorial = next((t for t in TUTORIALS if t['id'] == tutorial_id), None)
+        tutorial = tutorial_catalog.get(tutorial_id)
         
         if not tutorial:
             bot.edit_message_text(
@@ -4356,55 +4775,34 @@ def show_tutorial_detail(uid: int, tutorial_id: int, message_id: int):
             )
             return
         
-        # First, send the video directly within Telegram
         video_caption = (
             f"🎬 <b>{tutorial['title']}</b>\n\n"
             f"📝 <b>Description:</b>\n"
             f"{tutorial['description']}\n\n"
-            f"📊 <b>Category:</b> {TUTORIAL_CATEGORIES.get(tutorial['category'], tutorial['category'].title())}"
+            f"📊 <b>Category:</b> {tutorial_catalog.category_name(tutorial['category'])}"
         )
+        kb = _tutorial_media_keyboard(tutorial)
         
-        # Try to send video directly if we have telegram_video_id
+        # Video, else thumbnail, with the caption and buttons on the same message
+        media_options = []
         if tutorial.get('telegram_video_id'):
+            media_options.append(('video', tutorial['telegram_video_id']))
+        if tutorial.get('thumbnail'):
+            media_options.append(('photo', tutorial['thumbnail']))
+        
+        for media in media_options:
             try:
-                # Send video directly within Telegram
-                bot.send_video(
-                    uid,
-                    tutorial['telegram_video_id'],
-                    caption=video_caption,
-                    parse_mode='HTML'
-                )
-                
-                # Send buttons in a separate message
-                buttons_text = "👇 <b>Additional Options:</b>"
-                
-                kb = types.InlineKeyboardMarkup(row_width=1)
-                kb.add(types.InlineKeyboardButton(
-                    "📺 Watch on YouTube",
-                    url=tutorial['url']
-                ))
-                
-                # Add navigation buttons
-                kb.row(
-                    types.InlineKeyboardButton("⬅️ Back to Category", callback_data=f"tut_back_cat:{tutorial['category']}"),
-                    types.InlineKeyboardButton("📱 Main Menu", callback_data="mainmenu_back")
-                )
-                
-                bot.send_message(uid, buttons_text, parse_mode='HTML', reply_markup=kb)
-                
+                composer.replace(uid, message_id, video_caption, media=media, reply_markup=kb)
+                return
             except Exception as e:
-                logger.error(f"Error sending Telegram video: {e}. Falling back to thumbnail.")
-                # Fallback to thumbnail
-                send_tutorial_fallback(uid, tutorial, video_caption)
-        else:
-            # If no Telegram video ID, use fallback
-            send_tutorial_fallback(uid, tutorial, video_caption)
+                logger.error(f"Error sending tutorial {media[0]}: {e}")
         
-        # Delete the original list message
-        try:
-            bot.delete_message(uid, message_id)
-        except Exception as e:
-            logger.error(f"Could not delete message: {e}")
+        # No usable media: the list message becomes the tutorial card
+        composer.replace(
+            uid, message_id,
+            video_caption + f"\n\nWatch on YouTube: {tutorial['url']}",
+            reply_markup=kb
+        )
         
     except Exception as e:
         logger.error(f"Error showing tutorial detail: {e}")
@@ -4414,65 +4812,38 @@ def show_tutorial_detail(uid: int, tutorial_id: int, message_id: int):
             message_id
         )
 
-def send_tutorial_fallback(uid: int, tutorial: dict, caption: str):
-    """Fallback method if Telegram video is not available"""
+def warm_up_tutorial_media():
+    """Pre-upload tutorial thumbnails/videos so views send a cached file_id"""
     try:
-        # Try to send thumbnail first
-        if tutorial.get('thumbnail'):
-            bot.send_photo(
-                uid,
-                tutorial['thumbnail'],
-                caption=caption,
-                parse_mode='HTML'
-            )
-        else:
-            # Send text message
-            bot.send_message(
-                uid,
-                caption,
-                parse_mode='HTML'
-            )
-        
-        # Send buttons below
-        buttons_text = "👇 <b>Watch this tutorial:</b>"
-        
-        kb = types.InlineKeyboardMarkup(row_width=1)
-        kb.add(types.InlineKeyboardButton(
-            "📺 Watch on YouTube",
-            url=tutorial['url']
-        ))
-        
-        # Add navigation buttons
-        kb.row(
-            types.InlineKeyboardButton("⬅️ Back to Category", callback_data=f"tut_back_cat:{tutorial['category']}"),
-            types.InlineKeyboardButton("📱 Main Menu", callback_data="mainmenu_back")
-        )
-        
-        bot.send_message(
-            uid,
-            buttons_text,
-            parse_mode='HTML',
-            reply_markup=kb
-        )
-        
+        assets = []
+        for tutorial in tutorial_catalog.all():
+            if tutorial.get('telegram_video_id'):
+                assets.append(('video', tutorial['telegram_video_id']))
+            if tutorial.get('thumbnail'):
+                assets.append(('photo', tutorial['thumbnail']))
+        media_cache.warm_up(assets, config.MEDIA_CACHE_CHAT_ID)
     except Exception as e:
-        logger.error(f"Error in tutorial fallback: {e}")
-        bot.send_message(
-            uid,
-            f"🎬 <b>{tutorial['title']}</b>\n\n"
-            f"📝 <b>Description:</b>\n"
-            f"{tutorial['description']}\n\n"
-            f"📊 <b>Category:</b> {TUTORIAL_CATEGORIES.get(tutorial['category'], tutorial['category'].title())}\n\n"
-            f"Watch on YouTube: {tutorial['url']}",
-            parse_mode='HTML'
-        )
+        logger.error(f"Error warming up tutorial media: {e}")
+
+def schedule_media_warm_up(delay_seconds: int = 30):
+    scheduler.add_job(
+        warm_up_tutorial_media,
+        trigger='date',
+        run_date=datetime.now() + timedelta(seconds=delay_seconds),
+        id='tutorial_media_warmup',
+        name='Tutorial media warm-up',
+        replace_existing=True
+    )
+
+# New thumbnails in a reloaded catalog get uploaded too
+tutorial_catalog.on_reload(schedule_media_warm_up)
 
 def show_tutorial_search(uid: int, message_id: int):
     """Show tutorial search interface"""
     try:
         message_text = (
             "🔍 <b>Tutorial Search</b>\n\n"
-            "Search tutorials by category:\n\n"
+            "Tap <b>Search by keyword</b> to search titles and descriptions, or browse by category:\n\n"
             "• <b>Bybit Tutorials:</b> Trading, P2P, futures\n"
             "• <b>Binance Tutorials:</b> Spot, futures, exchange\n"
             "• <b>Other Exchanges:</b> Ourbit, Bitunix, MEXC\n"
@@ -4484,6 +4855,8 @@ def show_tutorial_search(uid: int, message_id: int):
         
         kb = types.InlineKeyboardMarkup(row_width=2)
         
+        kb.add(types.InlineKeyboardButton("🔎 Search by keyword", callback_data="tut_find"))
+        
         # Add quick search buttons
         kb.add(
             types.InlineKeyboardButton("🔍 Bybit", callback_data="tut_cat:bybit"),
@@ -4518,12 +4891,58 @@ def show_tutorial_search(uid: int, message_id: int):
             message_id
         )
 
+def prompt_tutorial_search(uid: int, message_id: int):
+    """Ask for search keywords; the next message is the query"""
+    try:
+        kb = types.InlineKeyboardMarkup()
+        kb.add(types.InlineKeyboardButton("❌ Cancel", callback_data="tut_back_search"))
+        
+        bot.edit_message_text(
+            "🔎 <b>Search Tutorials</b>\n\n"
+            "Send a few keywords, e.g. <code>bybit futures</code> or <code>risk management</code>:",
+            uid,
+            message_id,
+            parse_mode='HTML',
+            reply_markup=kb
+        )
+        conversations.start(uid, 'tutorial_search')
+    except Exception as e:
+        logger.error(f"Error prompting tutorial search: {e}")
+
+@conversations.step('tutorial_search')
+def process_tutorial_search(message: types.Message):
+    """Show ranked tutorials matching the user's keywords"""
+    try:
+        uid = message.from_user.id
+        query = (message.text or '').strip()
+        if not query or query.startswith('/'):
+            return
+        
+        results = tutorial_catalog.search(query, limit=10)
+        
+        kb = types.InlineKeyboardMarkup(row_width=1)
+        if results:
+            text = f"🔎 <b>Results for</b> <i>{html.escape(query)}</i>\n\n"
+            for i, tutorial in enumerate(results, 1):
+                text += f"<b>{i}. {tutorial['title']}</b>\n<i>{tutorial['description']}</i>\n\n"
+                label, callback_data = _tutorial_button(i, tutorial)
+                kb.add(types.InlineKeyboardButton(label, callback_data=callback_data))
+        else:
+            text = f"❌ No tutorials found for <i>{html.escape(query)}</i>. Try other keywords or browse by category."
+        
+        kb.row(
+            types.InlineKeyboardButton("🔎 New Search", callback_data="tut_find"),
+            types.InlineKeyboardButton("⬅️ Back to Tutorials", callback_data="tut_back_menu")
+        )
+        bot.send_message(uid, text, parse_mode='HTML', reply_markup=kb)
+    except Exception as e:
+        logger.error(f"Error processing tutorial search: {e}")
+
 # ====================
 # HELP SECTION (KEPT FOR COMPLETENESS)
 # ====================
 
-def show_help_menu(uid: int, message_id: int = None):
-    """Show help menu"""
+def _build_help_menu() -> Tuple[str, str]:
     text = (
         "🆘 <b>BlockchainPlus Help Center</b>\n\n"
         "Get assistance for:\n\n"
@@ -4542,30 +4961,266 @@ def show_help_menu(uid: int, message_id: int = None):
         "Select an option below:"
     )
     
-    kb = types.InlineKeyboardMarkup(row_width=2)
-    kb.add(
-        types.InlineKeyboardButton("📞 Contact Support", url="https://t.me/blockchainpluspro"),
-        types.InlineKeyboardButton("📚 FAQ & Guides", callback_data="help_faq")
-    )
-    kb.add(
-        types.InlineKeyboardButton("💳 Payment Help", callback_data="help_payment"),
-        types.InlineKeyboardButton("🚀 Getting Started", callback_data="help_started")
-    )
-    kb.add(
-        types.InlineKeyboardButton("🎯 Trading Basics", callback_data="help_trading"),
-        types.InlineKeyboardButton("🔐 Account Security", callback_data="help_security")
-    )
-    kb.add(
-        types.InlineKeyboardButton("📧 Email Support", callback_data="help_email"),
-        types.InlineKeyboardButton("🔗 Official Channels", callback_data="help_official")
-    )
-    kb.add(types.InlineKeyboardButton("📱 Back to Menu", callback_data="mainmenu_back"))
-    
+    kb = inline_keyboard([
+        [{"text": "📞 Contact Support", "url": "https://t.me/blockchainpluspro"}, ("📚 FAQ & Guides", "help_faq")],
+        [("💳 Payment Help", "help_payment"), ("🚀 Getting Started", "help_started")],
+        [("🎯 Trading Basics", "help_trading"), ("🔐 Account Security", "help_security")],
+        [("📧 Email Support", "help_email"), ("🔗 Official Channels", "help_official")],
+        [("📱 Back to Menu", "mainmenu_back")]
+    ])
+    return text, kb
+
+screens.register('help_menu', _build_help_menu)
+
+def show_help_menu(uid: int, message_id: int = None):
+    """Show help menu"""
+    text, kb = screens.render('help_menu')
     if message_id:
         bot.edit_message_text(text, uid, message_id, parse_mode='HTML', reply_markup=kb)
     else:
         bot.send_message(uid, text, parse_mode='HTML', reply_markup=kb)
 
+# Help topics: title, body and buttons (url or callback_data) per help_* callback
+HELP_TOPICS = {
+    "help_faq": {
+        "title": "📚 <b>Blockchain Plus Hub – Frequently Asked Questions (FAQs)</b>",
+        "content": (
+            "<b>📋 General Information</b>\n\n"
+            "<b>Q: What is Blockchain Plus Hub?</b>\n"
+            "A: Blockchain Plus Hub is an educational and trading-focused platform designed to help individuals learn, grow, and earn through Forex trading and Cryptocurrency trading & investing.\n\n"
+            
+            "<b>Q: Who is Blockchain Plus Hub for?</b>\n"
+            "A: Blockchain Plus Hub is for:\n"
+            "• Beginners who want to learn Forex or Crypto from scratch\n"
+            "• Intermediate traders looking to improve consistency\n"
+            "• Advanced traders seeking structured systems and discipline\n"
+            "• Investors who want to understand crypto markets properly\n\n"
+            
+            "<b>Q: Is Blockchain Plus Hub an investment company?</b>\n"
+            "A: No. We are NOT an investment firm and do not accept funds to trade on behalf of members. We are an education, signals, and mentorship platform.\n\n"
+            
+            "<b>💱 Forex Trading Program FAQs</b>\n\n"
+            "<b>Q: What is the Forex Trading Program about?</b>\n"
+            "A: The Forex Trading Program teaches members how to trade the foreign exchange market using proven strategies, proper risk management, and market psychology.\n\n"
+            
+            "<b>Q: Is the Forex program suitable for beginners?</b>\n"
+            "A: Yes. The Forex program starts from the basics and gradually moves to advanced concepts.\n\n"
+            
+            "<b>Q: Do you provide Forex trading signals?</b>\n"
+            "A: Yes. Members may receive Forex trading signals including entry points, stop loss, and take profit levels.\n\n"
+            
+            "<b>🚀 Cryptocurrency Program FAQs</b>\n\n"
+            "<b>Q: What is the Crypto Trading & Investment Program about?</b>\n"
+            "A: The Crypto program focuses on helping members understand and profit from the cryptocurrency market through spot trading, futures trading, and long-term investing.\n\n"
+            
+            "<b>Q: Do you provide crypto signals?</b>\n"
+            "A: Yes. Crypto signals may include spot trade entries, futures trade setups, and market structure updates.\n\n"
+            "<b>Q: Is Futures trading included?</b>\n"
+            "A: Yes, but Futures trading is recommended only for experienced traders.\n\n"
+            
+            "<b>📝 Membership & Access</b>\n\n"
+            "<b>Q: What do I get when I join?</b>\n"
+            "A: Depending on your subscription, you may receive educational materials, trading signals, community support via Telegram, mentorship, and challenges.\n\n"
+            
+            "<b>⚠️ Risk & Disclaimer</b>\n\n"
+            "<b>Q: Are profits guaranteed?</b>\n"
+            "A: NO. There are NO guaranteed profits in trading or investing. Results vary based on market conditions, discipline, capital, and risk management.\n\n"
+            
+            "<b>Q: Can I lose money?</b>\n"
+            "A: Yes. Trading involves risk, and losses are possible. Never trade with money you cannot afford to lose.\n\n"
+            
+            "<b>👥 Community & Support</b>\n\n"
+            "<b>Q: Is there a community I can join?</b>\n"
+            "A: Yes. Members gain access to our Telegram community for market updates, questions, and experience sharing.\n\n"
+            
+            "<b>🎯 Getting Started</b>\n\n"
+            "<b>Q: How do I join Blockchain Plus Hub?</b>\n"
+            "A: You can join by following the official registration or subscription links shared by Blockchain Plus Hub admins.\n\n"
+            
+            "<b>📢 Final Note:</b> Blockchain Plus Hub is built to educate, guide, and empower traders—not to promise unrealistic profits. Success comes from consistency, patience, and continuous learning."
+        ),
+        "buttons": [
+            {"text": "📞 Contact Support", "url": "https://t.me/blockchainpluspro"},
+            {"text": "📱 Back to Menu", "callback_data": "mainmenu_back"}
+        ]
+    },
+    "help_payment": {
+        "title": "💳 <b>Payment Help & Support</b>",
+        "content": (
+            "<b>Payment Issues & Solutions:</b>\n\n"
+            
+            "🔸 <b>Payment Not Verified?</b>\n"
+            "• Upload clear POP (Proof of Payment)\n"
+            "• Include transaction ID and amount\n"
+            "• Allow 1 hour for verification\n\n"
+            
+            "🔸 <b>Accepted Payment Methods:</b>\n"
+            "• 🇳🇬 NGN: Opay & MoniePoint\n"
+            "• 💎 USDT: BEP20, TRC20, or TON\n\n"
+            
+            "🔸 <b>Payment Security Tips:</b>\n"
+            "• Verify account details before sending\n"
+            "• Keep transaction screenshots\n"
+            "• Contact us immediately for issues\n\n"
+            
+            "<b>Need help?</b> Contact @blockchainpluspro"
+        ),
+        "buttons": [
+            {"text": "📞 Payment Support", "url": "https://t.me/blockchainpluspro"},
+            {"text": "💳 Make Payment", "callback_data": "mainmenu_payment"},
+            {"text": "📱 Back to Menu", "callback_data": "mainmenu_back"}
+        ]
+    },
+    "help_started": {
+        "title": "🚀 <b>Getting Started Guide</b>",
+        "content": (
+            "<b>Welcome! Follow these steps:</b>\n\n"
+            
+            "1️⃣ <b>Choose Your Program</b>\n"
+            "• Select Crypto or Forex\n"
+            "• Use 'Switch Program' to change later\n\n"
+            
+            "2️⃣ <b>Subscribe to a Plan</b>\n"
+            "• Academy: Complete education (1 year)\n"
+            "• VIP: Premium signals (choose duration)\n"
+            "• Use 'Make Payment' to subscribe\n\n"
+            
+            "3️⃣ <b>Join Your Groups</b>\n"
+            "• Added automatically after approval\n"
+            "• Save group links for easy access\n\n"
+            
+            "4️⃣ <b>Learn & Trade</b>\n"
+            "• Watch tutorials in 'Tutorials'\n"
+            "• Check subscription status anytime\n"
+            "• Contact admin for guidance\n\n"
+            
+            "<b>Pro Tip:</b> Start with Academy + FREE VIP trial!"
+        ),
+        "buttons": [
+            {"text": "🎥 Watch Tutorials", "callback_data": "mainmenu_tutorials"},
+            {"text": "💳 Subscribe Now", "callback_data": "mainmenu_payment"},
+            {"text": "📱 Back to Menu", "callback_data": "mainmenu_back"}
+        ]
+    },
+    "help_trading": {
+        "title": "🎯 <b>Trading Basics & Essentials</b>",
+        "content": (
+            "<b>Essential Trading Knowledge:</b>\n\n"
+            
+            "📊 <b>Key Concepts:</b>\n"
+            "• Spot vs Futures trading\n"
+            "• Risk management strategies\n"
+            "• Market analysis techniques\n"
+            "• Position sizing basics\n\n"
+            
+            "🛡️ <b>Risk Management:</b>\n"
+            "• Never risk more than 2% per trade\n"
+            "• Always use stop-loss orders\n"
+            "• Diversify your portfolio\n"
+            "• Keep emotions in check\n\n"
+            
+            "📈 <b>Learning Path:</b>\n"
+            "1. Start with our tutorial videos\n"
+            "2. Join Academy for structured learning\n"
+            "3. Practice with demo accounts first\n"
+            "4. Apply VIP signals with small amounts\n"
+        ),
+        "buttons": [
+            {"text": "🎬 Watch Tutorials", "callback_data": "tut_cat:strategies"},
+            {"text": "📚 Beginner Guides", "callback_data": "tut_cat:education"},
+            {"text": "📱 Back to Menu", "callback_data": "mainmenu_back"}
+        ]
+    },
+    "help_security": {
+        "title": "🔐 <b>Account Security Guide</b>",
+        "content": (
+            "<b>Protect Your Accounts & Funds:</b>\n\n"
+            
+            "🛡️ <b>Essential Security:</b>\n"
+            "• Use strong, unique passwords\n"
+            "• Enable 2FA on all exchanges\n"
+            "• Never share full-permission API keys\n"
+            "• Beware of phishing links\n\n"
+            
+            "🚫 <b>Common Scams to Avoid:</b>\n"
+            "• Fake support accounts\n"
+            "• 'Guaranteed profit' schemes\n"
+            "• Unverified investment opportunities\n"
+            "• Impersonation of our team\n\n"
+            
+            "✅ <b>Official Channels Only:</b>\n"
+            "• This bot is official\n"
+            "• Admin: @blockchainpluspro\n"
+            "• Never send funds to random addresses\n"
+        ),
+        "buttons": [
+            {"text": "🎥 Security Tutorial", "callback_data": "tut_cat:security"},
+            {"text": "📞 Report Issue", "url": "https://t.me/blockchainpluspro"},
+            {"text": "📱 Back to Menu", "callback_data": "mainmenu_back"}
+        ]
+    },
+    "help_email": {
+        "title": "📧 <b>Email Support</b>",
+        "content": (
+            "<b>For comprehensive support, email:</b>\n\n"
+            "📨 <b>Support Email:</b>\n"
+            "blockchainplushub@gmail.com\n\n"
+            
+            "<b>Include in your email:</b>\n"
+            "1. Your Telegram ID\n"
+            "2. Brief description of issue\n"
+            "3. Screenshots if applicable\n"
+            "4. Transaction IDs for payments\n\n"
+            
+            "<b>Response Time:</b>\n"
+            "• Usually within 24 hours\n"
+            "• Faster via Telegram\n"
+            "• Business hours: 9 AM - 6 PM GMT+1\n"
+        ),
+        "buttons": [
+            {"text": "📞 Telegram Support", "url": "https://t.me/blockchainpluspro"},
+            {"text": "📱 Back to Menu", "callback_data": "mainmenu_back"}
+        ]
+    },
+    "help_official": {
+        "title": "🔗 <b>Official Channels & Social Media</b>",
+        "content": (
+            "<b>Stay Connected with Blockchain Plus Hub:</b>\n\n"
+            
+            "📢 <b>Official Telegram Channel:</b>\n"
+            "Get updates, announcements, and market insights\n\n"
+            
+            "🎬 <b>YouTube Channel:</b>\n"
+            "Watch our latest tutorials, trading guides, and educational content\n\n"
+            
+            "🎵 <b>TikTok:</b>\n"
+            "Short-form trading tips and market updates\n\n"
+            
+            "🐦 <b>Twitter/X:</b>\n"
+            "Follow for crypto news, trading insights, and community updates\n\n"
+            
+            "📍 <b>Always verify you're following our official channels to avoid scams!</b>"
+        ),
+        "buttons": [
+            {"text": "📢 Telegram Channel", "url": "https://t.me/blockchainplushub"},
+            {"text": "🎬 YouTube Channel", "url": "https://www.youtube.com/@Blockchainplushub"},
+            {"text": "🎵 TikTok", "url": "https://www.tiktok.com/@blockchainplus?_r=1&_t=ZS-92vZFPIWKV2"},
+            {"text": "🐦 Twitter/X", "url": "https://x.com/bcplushub?t=aiphzEilvUyoptHO64MyEA&s=09"},
+            {"text": "📞 Contact Admin", "url": "https://t.me/blockchainpluspro"},
+            {"text": "📱 Back to Menu", "callback_data": "mainmenu_back"}
+        ]
+    }
+}
+
+def _build_help_topic(topic: str) -> Tuple[str, str]:
+    response = HELP_TOPICS[topic]
+    message_text = f"{response['title']}\n\n{response['content']}"
+    
+    # Arrange buttons in rows of 2
+    return message_text, inline_keyboard(pairs(response.get("buttons", [])))
+
+screens.register('help_topic', _build_help_topic, variants=[{'topic': topic} for topic in HELP_TOPICS])
+
 @bot.callback_query_handler(func=lambda c: c.data.startswith("help_"))
 def handle_help_callback(call: types.CallbackQuery):
     """Handle all help-related callbacks"""
@@ -4573,262 +5228,11 @@ def handle_help_callback(call: types.CallbackQuery):
         uid = call.from_user.id
         help_type = call.data
         
-        help_responses = {
-            "help_faq": {
-                "title": "📚 <b>Blockchain Plus Hub – Frequently Asked Questions (FAQs)</b>",
-                "content": (
-                    "<b>📋 General Information</b>\n\n"
-                    "<b>Q: What is Blockchain Plus Hub?</b>\n"
-                    "A: Blockchain Plus Hub is an educational and trading-focused platform designed to help individuals learn, grow, and earn through Forex trading and Cryptocurrency trading & investing.\n\n"
-                    
-                    "<b>Q: Who is Blockchain Plus Hub for?</b>\n"
-                    "A: Blockchain Plus Hub is for:\n"
-                    "• Beginners who want to learn Forex or Crypto from scratch\n"
-                    "• Intermediate traders looking to improve consistency\n"
-                    "• Advanced traders seeking structured systems and discipline\n"
-                    "• Investors who want to understand crypto markets properly\n\n"
-                    
-                    "<b>Q: Is Blockchain Plus Hub an investment company?</b>\n"
-                    "A: No. We are NOT an investment firm and do not accept funds to trade on behalf of members. We are an education, signals, and mentorship platform.\n\n"
-                    
-                    "<b>💱 Forex Trading Program FAQs</b>\n\n"
-                    "<b>Q: What is the Forex Trading Program about?</b>\n"
-                    "A: The Forex Trading Program teaches members how to trade the foreign exchange market using proven strategies, proper risk management, and market psychology.\n\n"
-                    
-                    "<b>Q: Is the Forex program suitable for beginners?</b>\n"
-                    "A: Yes. The Forex program starts from the basics and gradually moves to advanced concepts.\n\n"
-                    
-                    "<b>Q: Do you provide Forex trading signals?</b>\n"
-                    "A: Yes. Members may receive Forex trading signals including entry points, stop loss, and take profit levels.\n\n"
-                    
-                    "<b>🚀 Cryptocurrency Program FAQs</b>\n\n"
-                    "<b>Q: What is the Crypto Trading & Investment Program about?</b>\n"
-                    "A: The Crypto program focuses on helping members understand and profit from the cryptocurrency market through spot trading, futures trading, and long-term investing.\n\n"
-                    
-                    "<b>Q: Do you provide crypto signals?</b>\n"
-                    "A: Yes. Crypto signals may include spot trade entries, futures trade setups, and market structure updates.\n\n"
-                    "<b>Q: Is Futures trading included?</b>\n"
-                    "A: Yes, but Futures trading is recommended only for experienced traders.\n\n"
-                    
-                    "<b>📝 Membership & Access</b>\n\n"
-                    "<b>Q: What do I get when I join?</b>\n"
-                    "A: Depending on your subscription, you may receive educational materials, trading signals, community support via Telegram, mentorship, and challenges.\n\n"
-                    
-                    "<b>⚠️ Risk & Disclaimer</b>\n\n"
-                    "<b>Q: Are profits guaranteed?</b>\n"
-                    "A: NO. There are NO guaranteed profits in trading or investing. Results vary based on market conditions, discipline, capital, and risk management.\n\n"
-                    
-                    "<b>Q: Can I lose money?</b>\n"
-                    "A: Yes. Trading involves risk, and losses are possible. Never trade with money you cannot afford to lose.\n\n"
-                    
-                    "<b>👥 Community & Support</b>\n\n"
-                    "<b>Q: Is there a community I can join?</b>\n"
-                    "A: Yes. Members gain access to our Telegram community for market updates, questions, and experience sharing.\n\n"
-                    
-                    "<b>🎯 Getting Started</b>\n\n"
-                    "<b>Q: How do I join Blockchain Plus Hub?</b>\n"
-                    "A: You can join by following the official registration or subscription links shared by Blockchain Plus Hub admins.\n\n"
-                    
-                    "<b>📢 Final Note:</b> Blockchain Plus Hub is built to educate, guide, and empower traders—not to promise unrealistic profits. Success comes from consistency, patience, and continuous learning."
-                ),
-                "buttons": [
-                    {"text": "📞 Contact Support", "url": "https://t.me/blockchainpluspro"},
-                    {"text": "📱 Back to Menu", "callback_data": "mainmenu_back"}
-                ]
-            },
-            "help_payment": {
-                "title": "💳 <b>Payment Help & Support</b>",
-                "content": (
-                    "<b>Payment Issues & Solutions:</b>\n\n"
-                    
-                    "🔸 <b>Payment Not Verified?</b>\n"
-                    "• Upload clear POP (Proof of Payment)\n"
-                    "• Include transaction ID and amount\n"
-                    "• Allow 1 hour for verification\n\n"
-                    
-                    "🔸 <b>Accepted Payment Methods:</b>\n"
-                    "• 🇳🇬 NGN: Opay & MoniePoint\n"
-                    "• 💎 USDT: BEP20, TRC20, or TON\n\n"
-                    
-                    "🔸 <b>Payment Security Tips:</b>\n"
-                    "• Verify account details before sending\n"
-                    "• Keep transaction screenshots\n"
-                    "• Contact us immediately for issues\n\n"
-                    
-                    "<b>Need help?</b> Contact @blockchainpluspro"
-                ),
-                "buttons": [
-                    {"text": "📞 Payment Support", "url": "https://t.me/blockchainpluspro"},
-                    {"text": "💳 Make Payment", "callback_data": "mainmenu_payment"},
-                    {"text": "📱 Back to Menu", "callback_data": "mainmenu_back"}
-                ]
-            },
-            "help_started": {
-                "title": "🚀 <b>Getting Started Guide</b>",
-                "content": (
-                    "<b>Welcome! Follow these steps:</b>\n\n"
-                    
-                    "1️⃣ <b>Choose Your Program</b>\n"
-                    "• Select Crypto or Forex\n"
-                    "• Use 'Switch Program' to change later\n\n"
-                    
-                    "2️⃣ <b>Subscribe to a Plan</b>\n"
-                    "• Academy: Complete education (1 year)\n"
-                    "• VIP: Premium signals (choose duration)\n"
-                    "• Use 'Make Payment' to subscribe\n\n"
-                    
-                    "3️⃣ <b>Join Your Groups</b>\n"
-                    "• Added automatically after approval\n"
-                    "• Save group links for easy access\n\n"
-                    
-                    "4️⃣ <b>Learn & Trade</b>\n"
-                    "• Watch tutorials in 'Tutorials'\n"
-                    "• Check subscription status anytime\n"
-                    "• Contact admin for guidance\n\n"
-                    
-                    "<b>Pro Tip:</b> Start with Academy + FREE VIP trial!"
-                ),
-                "buttons": [
-                    {"text": "🎥 Watch Tutorials", "callback_data": "mainmenu_tutorials"},
-                    {"text": "💳 Subscribe Now", "callback_data": "mainmenu_payment"},
-                    {"text": "📱 Back to Menu", "callback_data": "mainmenu_back"}
-                ]
-            },
-            "help_trading": {
-                "title": "🎯 <b>Trading Basics & Essentials</b>",
-                "content": (
-                    "<b>Essential Trading Knowledge:</b>\n\n"
-                    
-                    "📊 <b>Key Concepts:</b>\n"
-                    "• Spot vs Futures trading\n"
-                    "• Risk management strategies\n"
-                    "• Market analysis techniques\n"
-                    "• Position sizing basics\n\n"
-                    
-                    "🛡️ <b>Risk Management:</b>\n"
-                    "• Never risk more than 2% per trade\n"
-                    "• Always use stop-loss orders\n"
-                    "• Diversify your portfolio\n"
-                    "• Keep emotions in check\n\n"
-                    
-                    "📈 <b>Learning Path:</b>\n"
-                    "1. Start with our tutorial videos\n"
-                    "2. Join Academy for structured learning\n"
-                    "3. Practice with demo accounts first\n"
-                    "4. Apply VIP signals with small amounts\n"
-                ),
-                "buttons": [
-                    {"text": "🎬 Watch Tutorials", "callback_data": "tut_cat:strategies"},
-                    {"text": "📚 Beginner Guides", "callback_data": "tut_cat:education"},
-                    {"text": "📱 Back to Menu", "callback_data": "mainmenu_back"}
-                ]
-            },
-            "help_security": {
-                "title": "🔐 <b>Account Security Guide</b>",
-                "content": (
-                    "<b>Protect Your Accounts & Funds:</b>\n\n"
-                    
-                    "🛡️ <b>Essential Security:</b>\n"
-                    "• Use strong, unique passwords\n"
-                    "• Enable 2FA on all exchanges\n"
-                    "• Never share full-permission API keys\n"
-                    "• Beware of phishing links\n\n"
-                    
-                    "🚫 <b>Common Scams to Avoid:</b>\n"
-                    "• Fake support accounts\n"
-                    "• 'Guaranteed profit' schemes\n"
-                    "• Unverified investment opportunities\n"
-                    "• Impersonation of our team\n\n"
-                    
-                    "✅ <b>Official Channels Only:</b>\n"
-                    "• This bot is official\n"
-                    "• Admin: @blockchainpluspro\n"
-                    "• Never send funds to random addresses\n"
-                ),
-                "buttons": [
-                    {"text": "🎥 Security Tutorial", "callback_data": "tut_cat:security"},
-                    {"text": "📞 Report Issue", "url": "https://t.me/blockchainpluspro"},
-                    {"text": "📱 Back to Menu", "callback_data": "mainmenu_back"}
-                ]
-            },
-            "help_email": {
-                "title": "📧 <b>Email Support</b>",
-                "content": (
-                    "<b>For comprehensive support, email:</b>\n\n"
-                    "📨 <b>Support Email:</b>\n"
-                    "blockchainplushub@gmail.com\n\n"
-                    
-                    "<b>Include in your email:</b>\n"
-                    "1. Your Telegram ID\n"
-                    "2. Brief description of issue\n"
-                    "3. Screenshots if applicable\n"
-                    "4. Transaction IDs for payments\n\n"
-                    
-                    "<b>Response Time:</b>\n"
-                    "• Usually within 24 hours\n"
-                    "• Faster via Telegram\n"
-                    "• Business hours: 9 AM - 6 PM GMT+1\n"
-                ),
-                "buttons": [
-                    {"text": "📞 Telegram Support", "url": "https://t.me/blockchainpluspro"},
-                    {"text": "📱 Back to Menu", "callback_data": "mainmenu_back"}
-                ]
-            },
-            "help_official": {
-                "title": "🔗 <b>Official Channels & Social Media</b>",
-                "content": (
-                    "<b>Stay Connected with Blockchain Plus Hub:</b>\n\n"
-                    
-                    "📢 <b>Official Telegram Channel:</b>\n"
-                    "Get updates, announcements, and market insights\n\n"
-                    
-                    "🎬 <b>YouTube Channel:</b>\n"
-                    "Watch our latest tutorials, trading guides, and educational content\n\n"
-                    
-                    "🎵 <b>TikTok:</b>\n"
-                    "Short-form trading tips and market updates\n\n"
-                    
-                    "🐦 <b>Twitter/X:</b>\n"
-                    "Follow for crypto news, trading insights, and community updates\n\n"
-                    
-                    "📍 <b>Always verify you're following our official channels to avoid scams!</b>"
-                ),
-                "buttons": [
-                    {"text": "📢 Telegram Channel", "url": "https://t.me/blockchainplushub"},
-                    {"text": "🎬 YouTube Channel", "url": "https://www.youtube.com/@Blockchainplushub"},
-                    {"text": "🎵 TikTok", "url": "https://www.tiktok.com/@blockchainplus?_r=1&_t=ZS-92vZFPIWKV2"},
-                    {"text": "🐦 Twitter/X", "url": "https://x.com/bcplushub?t=aiphzEilvUyoptHO64MyEA&s=09"},
-                    {"text": "📞 Contact Admin", "url": "https://t.me/blockchainpluspro"},
-                    {"text": "📱 Back to Menu", "callback_data": "mainmenu_back"}
-                ]
-            }
-        }
-        
-        response = help_responses.get(help_type)
-        if not response:
+        if help_type not in HELP_TOPICS:
             bot.answer_callback_query(call.id, "Help topic not found.")
             return
         
-        # Create message text
-        message_text = f"{response['title']}\n\n{response['content']}"
-        
-        # Create keyboard
-        kb = types.InlineKeyboardMarkup(row_width=2)
-        
-        # Add buttons in rows
-        buttons = []
-        for btn in response.get("buttons", []):
-            if 'url' in btn:
-                buttons.append(types.InlineKeyboardButton(btn['text'], url=btn['url']))
-            else:
-                buttons.append(types.InlineKeyboardButton(btn['text'], callback_data=btn['callback_data']))
-        
-        # Arrange buttons in rows of 2
-        for i in range(0, len(buttons), 2):
-            if i + 1 < len(buttons):
-                kb.row(buttons[i], buttons[i+1])
-            else:
-                kb.row(buttons[i])
+        message_text, kb = screens.render('help_topic', topic=help_type)
         
         # Edit the message
         bot.edit_message_text(
@@ -5132,6 +5536,7 @@ def receive_pop(message: types.Message):
             if user_data and user_data.get('pending_pop'):
                 user_data['pending_pop']['currency'] = currency
                 user_data['pending_pop']['amount_text'] = amount_text
+                user_data['pending_pop']['file_kind'] = message.content_type
                 user_db.users[str(uid)] = user_data
                 user_db.save_database()
         except Exception as e:
@@ -5139,12 +5544,42 @@ def receive_pop(message: types.Message):
         
         bot.reply_to(message, "✅ Thanks, your payment has been received. An admin will approve and confirm your registration shortly.")
         
-        notify_admin_new_payment(uid, user_db.fetch_user(uid))
+        # Hashing needs a download, so the admin alert goes out once it's done
+        pending = user_db.fetch_user(uid).get('pending_pop') or {}
+        key = user_db.approval_key(uid, pending)
+        if not key:
+            notify_admin_new_payment(uid, user_db.fetch_user(uid))
+            return
+        
+        def on_hashed(phash, duplicates):
+            user_db.record_proof(uid, pending, phash)
+            notify_admin_new_payment(uid, user_db.fetch_user(uid), duplicates=duplicates)
+        
+        try:
+            pop_store.submit(key, pending['file_id'], on_hashed)
+        except Exception as e:
+            logger.error(f"Error queueing POP check for {uid}: {e}")
+            notify_admin_new_payment(uid, user_db.fetch_user(uid))
     except Exception as e:
         logger.error(f"Error receiving POP: {e}")
 
-def notify_admin_new_payment(user_id: int, user_record: dict):
-    """Notify admins about new payment"""
+def format_duplicate_warnings(duplicates: List[Tuple[int, str]]) -> str:
+    """Inline warning lines for proofs that look like earlier uploads"""
+    lines = []
+    for distance, key in duplicates[:3]:
+        proof = user_db.get_proof(key) or {}
+        match = "identical" if distance == 0 else f"distance {distance}"
+        lines.append(
+            f"⚠️ <b>Possible duplicate of payment</b> <code>{key}</code> "
+            f"(user <code>{proof.get('user_id', '-')}</code>, uploaded {proof.get('uploaded_at', '-')}, {match})"
+        )
+    if len(duplicates) > 3:
+        lines.append(f"⚠️ ...and {len(duplicates) - 3} more similar proofs")
+    return "\n".join(lines)
+
+@api_meter.track('payment_alert')
+def notify_admin_new_payment(user_id: int, user_record: dict, duplicates: List[Tuple[int, str]] = None):
+    """Notify admins about new payment (POP, details and actions in one message), flagging likely duplicates"""
     try:
         pending = user_record.get('pending_pop') or {}
         file_id = pending.get('file_id')
@@ -5177,8 +5612,9 @@ def notify_admin_new_payment(user_id: int, user_record: dict):
             f"💰 <b>Currency:</b> {currency.upper()}\n"
             f"💵 <b>Amount:</b> {amount_text}\n"
             f"⏰ <b>Uploaded at:</b> {pending.get('uploaded_at','-')}\n\n"
-            f"POP below:"
         )
+        if duplicates:
+            text += format_duplicate_warnings(duplicates)
         
         kb = types.InlineKeyboardMarkup(row_width=2)
         
@@ -5205,20 +5641,21 @@ def notify_admin_new_payment(user_id: int, user_record: dict):
                                              callback_data=f"reject:{user_id}")
                 )
         
+        media = None
+        if file_id and file_id != "PENDING":
+            media = (pending.get('file_kind') or 'document', file_id)
+        
         for aid in ADMIN_IDS:
             try:
-                bot.send_message(aid, text, parse_mode="HTML")
-                
-                if file_id and file_id != "PENDING":
-                    try:
-                        bot.send_document(aid, file_id)
-                    except Exception:
-                        try:
-                            bot.send_photo(aid, file_id)
-                        except Exception:
-                            pass
-                
-                bot.send_message(aid, "Action:", reply_markup=kb)
+                try:
+                    composer.send(aid, text.strip(), media=media, reply_markup=kb)
+                except Exception as e:
+                    if not media:
+                        raise
+                    # Older proofs have no file_kind; a photo sent as a document is rejected
+                    logger.warning(f"POP send as {media[0]} failed, retrying: {e}")
+                    other = 'photo' if media[0] == 'document' else 'document'
+                    composer.send(aid, text.strip(), media=(other, file_id), reply_markup=kb)
             except Exception as e:
                 logger.error(f"Failed to notify admin {aid}: {e}")
     except Exception as e:
@@ -5228,12 +5665,41 @@ def notify_admin_new_payment(user_id: int, user_record: dict):
 # ADMIN APPROVAL FLOWS
 # ====================
 
+APPROVAL_STATE_TEXT = {
+    'processing': "is being handled",
+    'approved': "was already approved",
+    'rejected': "was already rejected",
+    'failed': "failed part-way under another action and can only be retried with it"
+}
+
+def claim_approval(call: types.CallbackQuery, user_id: int, action: str) -> Optional[str]:
+    """Claim the user's POP for this admin; other admins / double taps get an instant answer"""
+    key, record = user_db.begin_approval(user_id, call.from_user.id, action)
+    if key:
+        return key
+    
+    if record:
+        by = "you" if record['admin_id'] == call.from_user.id else f"admin {record['admin_id']}"
+        bot.answer_callback_query(call.id, f"⚠️ This payment {APPROVAL_STATE_TEXT.get(record['state'], record['state'])} by {by}.")
+    else:
+        bot.answer_callback_query(call.id, "No pending payment found for this user.")
+    return None
+
+def run_approval_step(key: str, step: str, func: Callable, *args, **kwargs):
+    """Run one side effect of a claimed approval unless an earlier attempt already did"""
+    if user_db.approval_step_done(key, step):
+        logger.info(f"Approval {key}: step {step} already done, skipping")
+        return
+    func(*args, **kwargs)
+    user_db.complete_approval_step(key, step)
+
 def approve_academy(user_id: int, program: str, call: types.CallbackQuery):
     """Updated Academy approval with commission tracking"""
+    key = None
     try:
         user = user_db.fetch_user(user_id)
-        if not user or not user.get('pending_pop'):
-            bot.answer_callback_query(call.id, "No pending payment found for this user.")
+        key = claim_approval(call, user_id, 'academy')
+        if not key:
             return
         
         # Check if user has already used their trial
@@ -5243,32 +5709,35 @@ def approve_academy(user_id: int, program: str, call: types.CallbackQuery):
         referred_by_id = user.get('referred_by')
         amount_text = user.get('pending_pop', {}).get('amount_text', PRICING[program]['academy']['ngn'])
         
+        # Each side effect runs once per POP, even if a failed approval is retried
         # Activate Academy
-        user_db.set_subscription(user_id, program, "academy", PRICING[program]['academy']['days'])
+        run_approval_step(key, 'academy', user_db.set_subscription, user_id, program, "academy", PRICING[program]['academy']['days'])
         
         messages = [f"{program.capitalize()} Academy subscription activated for 1 year."]
         
         # Give FREE 3-month VIP trial to ALL new Academy users
-        user_db.set_subscription(user_id, program, "vip", 90)  # 3 months free
-        user_db.mark_trial_used(user_id, program)
+        run_approval_step(key, 'vip_trial', user_db.set_subscription, user_id, program, "vip", 90)  # 3 months free
+        run_approval_step(key, 'trial_used', user_db.mark_trial_used, user_id, program)
         messages.append("Granted 3 months FREE VIP Signals!")
         
         # Send VIP access immediately for trial
-        send_group_access(user_id, program, 'vip', 90)
-        
-        # Clear pending pop
-        user_db.clear_pending_pop(user_id)
+        run_approval_step(key, 'vip_access', send_group_access, user_id, program, 'vip', 90)
         
         # Send academy access
-        send_group_access(user_id, program, 'academy')
+        run_approval_step(key, 'academy_access', send_group_access, user_id, program, 'academy')
         
         # Add commission for affiliate if user was referred
         if referred_by_id:
-            add_commission_to_affiliate(
+            run_approval_step(
+                key, 'commission', add_commission_to_affiliate,
                 referred_by_id, user_id, program, 'academy', 
-                None, amount_text
+                None, amount_text, key
             )
         
+        # Clear pending pop last: a retry needs it to claim the approval again
+        user_db.clear_pending_pop(user_id)
+        
+        user_db.finish_approval(key, 'approved')
         bot.answer_callback_query(call.id, f"✅ {program.capitalize()} Academy approved.")
         bot.send_message(call.from_user.id, f"User {user_id} approved for {program.capitalize()} Academy.\n" + "\n".join(messages))
         
@@ -5291,11 +5760,14 @@ def approve_academy(user_id: int, program: str, call: types.CallbackQuery):
             
     except Exception as e:
         logger.error(f"Error approving academy: {e}")
+        if key:
+            user_db.finish_approval(key, 'failed')
         bot.answer_callback_query(call.id, "Error approving Academy.")
 
 @bot.callback_query_handler(func=lambda c: c.data.startswith("confirm_vip:"))
 def confirm_vip_approval(call: types.CallbackQuery):
     """Updated VIP approval with commission tracking"""
+    key = None
     try:
         if call.from_user.id not in ADMIN_IDS:
             bot.answer_callback_query(call.id, "❌ Not authorized.")
@@ -5309,8 +5781,8 @@ def confirm_vip_approval(call: types.CallbackQuery):
         logger.info(f"Confirming VIP approval: {program}, {duration}, {user_id}")
         
         user = user_db.fetch_user(user_id)
-        if not user or not user.get('pending_pop'):
-            bot.answer_callback_query(call.id, "No pending payment found for this user.")
+        key = claim_approval(call, user_id, f"vip:{duration}")
+        if not key:
             return
         
         # Map duration to days
@@ -5327,22 +5799,26 @@ def confirm_vip_approval(call: types.CallbackQuery):
         referred_by_id = user.get('referred_by')
         amount_text = user.get('pending_pop', {}).get('amount_text', PRICING[program]['vip'][duration]['ngn'])
         
+        # Each side effect runs once per POP, even if a failed approval is retried
         # Set subscription
-        user_db.set_subscription(user_id, program, "vip", days)
-        
-        # Clear pending pop
-        user_db.clear_pending_pop(user_id)
+        run_approval_step(key, 'vip', user_db.set_subscription, user_id, program, "vip", days)
         
         # Send VIP access
-        send_group_access(user_id, program, 'vip', days)
+        run_approval_step(key, 'vip_access', send_group_access, user_id, program, 'vip', days)
         
         # Add commission for affiliate if user was referred
         if referred_by_id:
-            add_commission_to_affiliate(
+            run_approval_step(
+                key, 'commission', add_commission_to_affiliate,
                 referred_by_id, user_id, program, 'vip', 
-                duration, amount_text
+                duration, amount_text, key
             )
         
+        # Clear pending pop last: a retry needs it to claim the approval again
+        user_db.clear_pending_pop(user_id)
+        
+        user_db.finish_approval(key, 'approved')
+        
         duration_display = {
             'monthly': 'Monthly',
             '3_months': '3 Months',
@@ -5366,6 +5842,8 @@ def confirm_vip_approval(call: types.CallbackQuery):
             
     except Exception as e:
         logger.error(f"Error in confirm_vip_approval: {e}")
+        if key:
+            user_db.finish_approval(key, 'failed')
         bot.answer_callback_query(call.id, "Error approving VIP.")
 
 @bot.callback_query_handler(func=lambda c: c.data.startswith("approve_"))
@@ -5487,7 +5965,12 @@ def on_admin_reject(call: types.CallbackQuery):
             bot.answer_callback_query(call.id, "Invalid callback.")
             return
         
+        key = claim_approval(call, user_id, 'reject')
+        if not key:
+            return
+        
         user_db.clear_pending_pop(user_id)
+        user_db.finish_approval(key, 'rejected')
         bot.answer_callback_query(call.id, "❌ Rejected.")
         bot.send_message(call.from_user.id, f"Rejected payment for user {user_id}.")
         
@@ -5723,7 +6206,7 @@ def set_webhook():
             bot.set_webhook(
                 url=webhook_url,
                 max_connections=50,
-                allowed_updates=["message", "callback_query"]
+                allowed_updates=["message", "callback_query", "chat_member", "my_chat_member"]
             )
             logger.info("✅ Webhook set successfully")
         else:
@@ -5748,7 +6231,7 @@ def start_bot():
         logger.info("=" * 50)
         logger.info("Starting BlockchainPlus Hub Bot with Complete Affiliate System...")
         logger.info(f"Admin IDs: {ADMIN_IDS}")
-        logger.info(f"Tutorial Videos Loaded: {len(TUTORIALS)}")
+        logger.info(f"Tutorial Videos Loaded: {len(tutorial_catalog)}")
         logger.info("=" * 50)
         
         # Start the scheduler for automated reminders
@@ -5783,6 +6266,31 @@ def start_bot():
             replace_existing=True
         )
         
+        # Nightly group membership reconciliation
+        scheduler.add_job(
+            run_membership_reconciliation,
+            trigger=CronTrigger(hour=4, minute=0),
+            id='membership_reconcile',
+            name='Membership reconciliation',
+            replace_existing=True
+        )
+        
+        # Drop prompts nobody answered
+        scheduler.add_job(
+            conversations.purge_expired,
+            trigger='interval',
+            hours=1,
+            id='conversation_purge',
+            name='Expired conversation cleanup',
+            replace_existing=True
+        )
+        
+        # Delayed actions left over from before a restart
+        deferred.restore()
+        
+        # Upload uncached tutorial media once the bot is up
+        schedule_media_warm_up()
+        
         scheduler.start()
         logger.info("Scheduler started successfully")
         logger.info(f"Reminders will be sent at: {REMINDER_DAYS} days before expiry")
@@ -5846,7 +6354,8 @@ def start_bot():
         except:
             pass
 
-if __name__ == "__main__":
+def run():
+    """Start Flask and the bot, then keep the process alive (called by run.py)"""
     # Start the Flask server in a separate thread
     flask_thread = Thread(target=run_flask, daemon=True)
     flask_thread.start()
@@ -5861,3 +6370,12 @@ if __name__ == "__main__":
     except KeyboardInterrupt:
         logger.info("Bot shutting down...")
         scheduler.shutdown()
+        chart_cache.shutdown()
+        report_jobs.shutdown()
+        pop_store.shutdown()
+        membership.shutdown()
+
+if __name__ == "__main__":
+    # Prefer `python run.py`: spawned chart workers re-import the script that
+    # started the process, and this one loads the database and builds the bot
+    run()
@@ -0,0 +1,78 @@
+# media_cache.py - Reuse Telegram file_ids for media the bot sends repeatedly
+import logging
+import time
+from typing import Iterable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Pause between warm-up uploads (seconds), well under Telegram's rate limits
+WARMUP_PAUSE = 1.0
+
+class MediaCache:
+    """Sends photos/videos by cached file_id, uploading from the source URL only once.
+
+    The first send of a URL returns a file_id; it is stored through `store`
+    (get_media_file_id / set_media_file_id / forget_media) and every later
+    send passes the file_id, so Telegram doesn't re-fetch the asset.
+    """
+
+    def __init__(self, bot, store):
+        self.bot = bot
+        self.store = store
+        self._senders = {'photo': bot.send_photo, 'video': bot.send_video}
+
+    @staticmethod
+    def _file_id(kind: str, message) -> Optional[str]:
+        if kind == 'photo' and message.photo:
+            return message.photo[-1].file_id
+        if kind == 'video' and message.video:
+            return message.video.file_id
+        return None
+
+    def _send(self, kind: str, chat_id: int, source: str, **kwargs):
+        send = self._senders[kind]
+        file_id = self.store.get_media_file_id(source)
+        if file_id:
+            try:
+                return send(chat_id, file_id, **kwargs)
+            except Exception as e:
+                # A file_id from another bot token or a deleted file: upload again
+                if getattr(e, 'error_code', None) != 400:
+                    raise
+                logger.warning(f"Cached file_id for {source} rejected, re-uploading: {e}")
+                self.store.forget_media(source)
+
+        message = send(chat_id, source, **kwargs)
+        new_file_id = self._file_id(kind, message)
+        if new_file_id:
+            self.store.set_media_file_id(source, kind, new_file_id)
+        return message
+
+    def send_photo(self, chat_id: int, source: str, **kwargs):
+        return self._send('photo', chat_id, source, **kwargs)
+
+    def send_video(self, chat_id: int, source: str, **kwargs):
+        return self._send('video', chat_id, source, **kwargs)
+
+    def warm_up(self, assets: Iterable[Tuple[str, str]], chat_id: int, pause: float = WARMUP_PAUSE) -> int:
+        """Upload uncached (kind, source) assets to a chat, keeping their file_ids.
+
+        The upload messages are deleted again. Returns how many were cached.
+        """
+        cached = 0
+        for kind, source in assets:
+            if not source or self.store.get_media_file_id(source):
+                continue
+            try:
+                message = self._send(kind, chat_id, source, disable_notification=True)
+                cached += 1
+                try:
+                    self.bot.delete_message(chat_id, message.message_id)
+                except Exception:
+                    pass
+            except Exception as e:
+                logger.error(f"Error warming up {kind} {source}: {e}")
+            time.sleep(pause)
+        if cached:
+            logger.info(f"Media cache warm-up: {cached} assets uploaded")
+        return cached
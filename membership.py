@@ -0,0 +1,232 @@
+# membership.py - Queued group access grants / removals with per-chat concurrency limits
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Hours a personal (single-use) invite link stays valid
+INVITE_HOURS = 7 * 24
+
+# Membership calls in flight per chat; Telegram throttles admin actions per chat
+PER_CHAT_CONCURRENCY = 2
+
+# Telegram chat member status -> local membership state. A ban ('kicked') is
+# 'removed'; bans the bot made itself are recorded as 'revoked' instead, and
+# only those are lifted automatically when the user is entitled again.
+STATUS_STATES = {
+    'creator': 'admin',
+    'administrator': 'admin',
+    'member': 'member',
+    'restricted': 'member',
+    'left': 'left',
+    'kicked': 'removed'
+}
+
+# Errors meaning the user already isn't in the chat
+NOT_IN_CHAT_ERRORS = ("USER_NOT_PARTICIPANT", "Chat not found", "PARTICIPANT_ID_INVALID")
+
+class ChatStats:
+    """Call counts and latency of membership operations in one chat"""
+
+    __slots__ = ('name', 'ops', 'skipped', 'failures', 'total_ms', 'max_ms')
+
+    def __init__(self, name: str):
+        self.name = name
+        self.ops = 0
+        self.skipped = 0
+        self.failures = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def record(self, elapsed_ms: float, ok: bool):
+        self.ops += 1
+        self.failures += 0 if ok else 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+
+class MembershipService:
+    """Runs group grants and removals as background jobs.
+
+    A grant issues a personal invite link (member_limit=1), falling back
+    to the chat's shared invite link when the bot can't create one. The
+    last known state per (chat, user) is kept in `store`
+    (get_membership / set_membership) and kept live by chat_member
+    updates, so calls are skipped for users already in the right state:
+    no unban for users who aren't banned, no ban for users who are out
+    of the group already. A grant for a recorded member is confirmed with
+    get_chat_member first, as leaves can go undelivered. Callers decide
+    whether a ban may be lifted: reconciliation only re-grants 'revoked'
+    users, never ones a chat admin banned. Chats where the
+    bot isn't an admin fail fast without calling Telegram.
+    Each job handles one user's chats and reports all results to its
+    `on_done` callback at once.
+    """
+
+    def __init__(self, bot, store, max_workers: int = 4,
+                 per_chat: int = PER_CHAT_CONCURRENCY, invite_hours: int = INVITE_HOURS):
+        self.bot = bot
+        self.store = store
+        self.per_chat = per_chat
+        self.invite_hours = invite_hours
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='membership')
+        self._gates: Dict[int, threading.Semaphore] = {}
+        self._stats: Dict[int, ChatStats] = {}
+        self._bot_is_admin: Dict[int, bool] = {}
+        self._lock = threading.Lock()
+
+    def set_bot_status(self, chat_id: int, is_admin: bool):
+        """From my_chat_member updates: whether the bot can manage the chat"""
+        self._bot_is_admin[chat_id] = is_admin
+
+    def _gate(self, chat_id: int) -> threading.Semaphore:
+        with self._lock:
+            gate = self._gates.get(chat_id)
+            if gate is None:
+                gate = self._gates[chat_id] = threading.Semaphore(self.per_chat)
+            return gate
+
+    def _chat_stats(self, chat_id: int, chat_name: str) -> ChatStats:
+        stats = self._stats.get(chat_id)
+        if stats is None:
+            stats = self._stats[chat_id] = ChatStats(chat_name)
+        return stats
+
+    def _record(self, chat_id: int, chat_name: str, started: float, ok: bool):
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self._chat_stats(chat_id, chat_name).record(elapsed_ms, ok)
+
+    def _skip(self, chat_id: int, chat_name: str, result: Dict, ok: bool, error: str = None) -> Dict:
+        with self._lock:
+            self._chat_stats(chat_id, chat_name).skipped += 1
+        result.update(ok=ok, error=error)
+        return result
+
+    # ====================
+    # OPERATIONS
+    # ====================
+
+    def _grant_one(self, user_id: int, chat_id: int, chat_name: str, fallback_link: Optional[str]) -> Dict:
+        result = {'chat_id': chat_id, 'chat_name': chat_name, 'ok': False, 'invite_link': fallback_link, 'error': None}
+        record = self.store.get_membership(chat_id, user_id) or {}
+        if record.get('state') in ('member', 'admin'):
+            # The table misses leaves Telegram didn't deliver; confirm before skipping the invite
+            state = self._confirm_state(user_id, chat_id, chat_name)
+            if state in ('member', 'admin'):
+                result.update(ok=True, invite_link=None, already_member=True)
+                return result
+            record = {'state': state}
+        if self._bot_is_admin.get(chat_id) is False:
+            return self._skip(chat_id, chat_name, result, False, "Bot is not an admin in this chat")
+
+        with self._gate(chat_id):
+            started = time.perf_counter()
+            try:
+                # Only banned (or never seen) users need an unban; an approved payment lifts any ban
+                if record.get('state') in (None, 'revoked', 'removed'):
+                    self.bot.unban_chat_member(chat_id, user_id, only_if_banned=True)
+
+                invite = self.bot.create_chat_invite_link(
+                    chat_id,
+                    name=f"user {user_id}",
+                    expire_date=int(time.time()) + self.invite_hours * 3600,
+                    member_limit=1
+                )
+                result.update(ok=True, invite_link=invite.invite_link)
+                self.store.set_membership(chat_id, user_id, 'invited', invite_link=invite.invite_link)
+            except Exception as e:
+                result['error'] = str(e)
+                logger.warning(f"Could not create invite for user {user_id} in {chat_name}: {e}")
+            self._record(chat_id, chat_name, started, result['ok'])
+        return result
+
+    def _confirm_state(self, user_id: int, chat_id: int, chat_name: str) -> Optional[str]:
+        """Current state from get_chat_member, stored; None if Telegram couldn't be asked"""
+        with self._gate(chat_id):
+            started = time.perf_counter()
+            try:
+                status = self.bot.get_chat_member(chat_id, user_id).status
+            except Exception as e:
+                logger.warning(f"Could not check user {user_id} in {chat_name}: {e}")
+                self._record(chat_id, chat_name, started, False)
+                return None
+            self._record(chat_id, chat_name, started, True)
+        state = STATUS_STATES.get(status, 'left')
+        self.store.set_membership(chat_id, user_id, state)
+        return state
+
+    def _revoke_one(self, user_id: int, chat_id: int, chat_name: str) -> Dict:
+        result = {'chat_id': chat_id, 'chat_name': chat_name, 'ok': False, 'error': None}
+        record = self.store.get_membership(chat_id, user_id) or {}
+        if record.get('state') in ('revoked', 'removed', 'left'):
+            # A user who left and rejoins shows up as a member again and gets removed then
+            return self._skip(chat_id, chat_name, result, True)
+        if record.get('state') == 'admin':
+            return self._skip(chat_id, chat_name, result, False, "User is a chat admin")
+        if self._bot_is_admin.get(chat_id) is False:
+            return self._skip(chat_id, chat_name, result, False, "Bot is not an admin in this chat")
+
+        with self._gate(chat_id):
+            started = time.perf_counter()
+            try:
+                # Banned so shared invite links can't be reused; unbanned on the next grant
+                self.bot.ban_chat_member(chat_id, user_id)
+                result['ok'] = True
+                logger.info(f"Removed user {user_id} from {chat_name}")
+            except Exception as e:
+                error_msg = str(e)
+                result['error'] = error_msg
+                if any(marker in error_msg for marker in NOT_IN_CHAT_ERRORS):
+                    logger.info(f"User {user_id} is not in {chat_name} or left already")
+                    result['ok'] = True
+                elif "CHAT_ADMIN_REQUIRED" in error_msg:
+                    logger.error(f"Bot is not admin in {chat_name}, cannot remove user")
+                else:
+                    logger.error(f"Error removing user {user_id} from {chat_name}: {error_msg}")
+            self._record(chat_id, chat_name, started, result['ok'])
+
+        if result['ok']:
+            self.store.set_membership(chat_id, user_id, 'revoked')
+        return result
+
+    def _run(self, job: Callable[[], List[Dict]], on_done: Optional[Callable[[List[Dict]], None]]) -> List[Dict]:
+        results = job()
+        if on_done:
+            try:
+                on_done(results)
+            except Exception as e:
+                logger.error(f"Error in membership callback: {e}")
+        return results
+
+    def grant(self, user_id: int, targets: Sequence[Tuple[int, str, Optional[str]]],
+              on_done: Optional[Callable[[List[Dict]], None]] = None) -> Future:
+        """Queue access to (chat_id, chat_name, fallback invite link) targets for a user"""
+        job = lambda: [self._grant_one(user_id, *target) for target in targets]
+        return self._executor.submit(self._run, job, on_done)
+
+    def revoke(self, user_id: int, targets: Sequence[Tuple[int, str]],
+               on_done: Optional[Callable[[List[Dict]], None]] = None) -> Future:
+        """Queue removal of a user from (chat_id, chat_name) targets"""
+        job = lambda: [self._revoke_one(user_id, *target) for target in targets]
+        return self._executor.submit(self._run, job, on_done)
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """{chat name: {'ops', 'skipped', 'failures', 'failure_rate', 'avg_ms', 'max_ms'}}"""
+        with self._lock:
+            return {
+                stats.name: {
+                    'ops': stats.ops,
+                    'skipped': stats.skipped,
+                    'failures': stats.failures,
+                    'failure_rate': stats.failures / stats.ops if stats.ops else 0.0,
+                    'avg_ms': stats.total_ms / stats.ops if stats.ops else 0.0,
+                    'max_ms': stats.max_ms
+                }
+                for stats in self._stats.values()
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,159 @@
+# message_composer.py - Fewest-call message sends/edits and per-action API call metrics
+import functools
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple
+
+from telebot import types
+
+logger = logging.getLogger(__name__)
+
+# Telegram's caption limit; longer texts go in their own message
+CAPTION_LIMIT = 1024
+
+# Bot methods that hit the Bot API and are counted by ApiCallMeter
+API_METHODS = (
+    'send_message', 'send_photo', 'send_document', 'send_video', 'send_media_group',
+    'edit_message_text', 'edit_message_caption', 'edit_message_media', 'edit_message_reply_markup',
+    'delete_message', 'answer_callback_query', 'copy_message', 'forward_message',
+    'get_chat', 'get_file', 'download_file'
+)
+
+INPUT_MEDIA = {
+    'photo': types.InputMediaPhoto,
+    'video': types.InputMediaVideo,
+    'document': types.InputMediaDocument
+}
+
+class ApiCallMeter:
+    """Counts Bot API calls made while handling each named user action"""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._stats: Dict[str, list] = {}
+        self._lock = threading.Lock()
+
+    def instrument(self, bot, methods=API_METHODS):
+        """Wrap the bot's API methods so calls count towards the current action.
+
+        Edits an EditDedupBot may skip are counted through its on_edit_sent
+        hook instead, so only the edits actually sent show up.
+        """
+        deduped = getattr(bot, 'DEDUPED_EDITS', ())
+        for name in methods:
+            method = getattr(bot, name, None)
+            if method is not None and name not in deduped:
+                setattr(bot, name, self._counted(method))
+        if deduped:
+            bot.on_edit_sent = self.count
+
+    def count(self):
+        """Count one API call towards the current action, if any"""
+        if getattr(self._local, 'action', None):
+            self._local.calls += 1
+
+    def _counted(self, method):
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            self.count()
+            return method(*args, **kwargs)
+        return wrapper
+
+    @contextmanager
+    def action(self, name: str):
+        """Count calls inside the block as one run of `name` (nested actions fold into the outer one)"""
+        if getattr(self._local, 'action', None):
+            yield
+            return
+        self._local.action, self._local.calls = name, 0
+        try:
+            yield
+        finally:
+            calls = self._local.calls
+            self._local.action = None
+            with self._lock:
+                stats = self._stats.setdefault(name, [0, 0])
+                stats[0] += 1
+                stats[1] += calls
+
+    def track(self, name: str):
+        """Decorator form of action()"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.action(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """{action: {'runs', 'calls', 'per_run'}}"""
+        with self._lock:
+            return {
+                name: {'runs': runs, 'calls': calls, 'per_run': calls / runs if runs else 0.0}
+                for name, (runs, calls) in self._stats.items()
+            }
+
+class MessageComposer:
+    """Delivers text + optional media + keyboard in as few API calls as Telegram allows.
+
+    Media is a (kind, file_id or URL) pair with kind 'photo', 'video' or
+    'document'. Photos/videos go through `media_cache` when given, so URLs
+    are uploaded once.
+    """
+
+    def __init__(self, bot, media_cache=None):
+        self.bot = bot
+        self.media_cache = media_cache
+
+    def _send_media(self, chat_id: int, kind: str, source: str, **kwargs):
+        if self.media_cache and kind in ('photo', 'video'):
+            return getattr(self.media_cache, f"send_{kind}")(chat_id, source, **kwargs)
+        return getattr(self.bot, f"send_{kind}")(chat_id, source, **kwargs)
+
+    def send(self, chat_id: int, text: str, media: Optional[Tuple[str, str]] = None,
+             reply_markup=None, parse_mode: str = 'HTML'):
+        """New message: media captioned with the text (one call), else text after media"""
+        if not media:
+            return self.bot.send_message(chat_id, text, parse_mode=parse_mode, reply_markup=reply_markup)
+
+        kind, source = media
+        if len(text) <= CAPTION_LIMIT:
+            return self._send_media(chat_id, kind, source, caption=text,
+                                    parse_mode=parse_mode, reply_markup=reply_markup)
+
+        self._send_media(chat_id, kind, source)
+        return self.bot.send_message(chat_id, text, parse_mode=parse_mode, reply_markup=reply_markup)
+
+    def replace(self, chat_id: int, message_id: int, text: str, media: Optional[Tuple[str, str]] = None,
+                reply_markup=None, has_media: bool = False, parse_mode: str = 'HTML'):
+        """Swap an existing message's content, editing in place whenever Telegram allows it.
+
+        `has_media` says whether the existing message is a media message:
+        text->text and media->media are single edits; switching between the
+        two needs a new message and a delete.
+        """
+        if not media and not has_media:
+            return self.bot.edit_message_text(text, chat_id, message_id, parse_mode=parse_mode,
+                                              reply_markup=reply_markup)
+
+        if media and has_media and len(text) <= CAPTION_LIMIT:
+            kind, source = media
+            file_id = source
+            if self.media_cache and kind in ('photo', 'video'):
+                file_id = self.media_cache.store.get_media_file_id(source) or source
+            try:
+                return self.bot.edit_message_media(
+                    INPUT_MEDIA[kind](file_id, caption=text, parse_mode=parse_mode),
+                    chat_id, message_id, reply_markup=reply_markup
+                )
+            except Exception as e:
+                logger.warning(f"edit_message_media failed, sending a new message: {e}")
+
+        message = self.send(chat_id, text, media=media, reply_markup=reply_markup, parse_mode=parse_mode)
+        try:
+            self.bot.delete_message(chat_id, message_id)
+        except Exception as e:
+            logger.error(f"Could not delete message: {e}")
+        return message
@@ -0,0 +1,87 @@
+# message_templates.py - Pre-rendered static screens and pre-serialized keyboards
+import json
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple, Union
+
+# (text, callback_data) or a full button dict such as {'text': ..., 'url': ...}
+Button = Union[Tuple[str, str], Dict]
+
+# Renders of screens whose parameters aren't enumerable up front (e.g. dates)
+MAX_DYNAMIC_RENDERS = 256
+
+def _button(button: Button) -> Dict:
+    if isinstance(button, dict):
+        return button
+    text, callback_data = button
+    return {'text': text, 'callback_data': callback_data}
+
+def inline_keyboard(rows: Iterable[Sequence[Button]]) -> str:
+    """Rows of buttons -> InlineKeyboardMarkup JSON, usable directly as reply_markup"""
+    return json.dumps({'inline_keyboard': [[_button(b) for b in row] for row in rows]}, ensure_ascii=False)
+
+def reply_keyboard(rows: Iterable[Sequence[str]], resize: bool = True) -> str:
+    """Rows of button labels -> ReplyKeyboardMarkup JSON"""
+    return json.dumps({
+        'keyboard': [[{'text': label} for label in row] for row in rows],
+        'resize_keyboard': resize
+    }, ensure_ascii=False)
+
+def pairs(buttons: List[Button]) -> List[List[Button]]:
+    """Lay buttons out two per row"""
+    return [buttons[i:i + 2] for i in range(0, len(buttons), 2)]
+
+class ScreenRegistry:
+    """Named screens rendered once into (html text, reply_markup JSON).
+
+    A screen's builder takes keyword parameters; the variants listed at
+    registration are rendered immediately, anything else on first use.
+    Handlers then pay a dict lookup per tap instead of rebuilding the
+    text and keyboard objects.
+    """
+
+    def __init__(self, max_dynamic: int = MAX_DYNAMIC_RENDERS):
+        self._builders: Dict[str, Callable[..., Tuple[str, str]]] = {}
+        self._static: Dict[Tuple, Tuple[str, str]] = {}
+        self._dynamic: 'OrderedDict[Tuple, Tuple[str, str]]' = OrderedDict()
+        self.max_dynamic = max_dynamic
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(name: str, params: Dict) -> Tuple:
+        return (name,) + tuple(sorted(params.items()))
+
+    def register(self, name: str, builder: Callable[..., Tuple[str, str]],
+                 variants: Iterable[Dict] = ({},)):
+        """Add a screen and pre-render its variants"""
+        self._builders[name] = builder
+        for params in variants:
+            self._static[self._key(name, params)] = builder(**params)
+
+    def render(self, name: str, **params) -> Tuple[str, str]:
+        """(text, reply_markup) for a screen"""
+        key = self._key(name, params)
+        screen = self._static.get(key)
+        if screen is not None:
+            return screen
+
+        with self._lock:
+            screen = self._dynamic.get(key)
+            if screen is not None:
+                self._dynamic.move_to_end(key)
+                return screen
+
+        screen = self._builders[name](**params)
+        with self._lock:
+            self._dynamic[key] = screen
+            if len(self._dynamic) > self.max_dynamic:
+                self._dynamic.popitem(last=False)
+        return screen
+
+    def refresh(self, name: str):
+        """Re-render a screen after the data it is built from changes"""
+        with self._lock:
+            for key in [k for k in self._dynamic if k[0] == name]:
+                del self._dynamic[key]
+        for key in [k for k in self._static if k[0] == name]:
+            self._static[key] = self._builders[name](**dict(key[1:]))
@@ -0,0 +1,14 @@
+# money.py - Naira amounts as integer kobo
+#
+# Stored amounts carry an `*_minor` integer (kobo) that all balance and
+# report arithmetic uses; the float `amount` fields remain for display.
+
+KOBO_PER_NAIRA = 100
+
+def to_minor(amount) -> int:
+    """₦ float/str -> kobo (rounded to the nearest kobo)"""
+    return int(round(float(amount or 0) * KOBO_PER_NAIRA))
+
+def from_minor(minor: int) -> float:
+    """kobo -> ₦ float for display and legacy fields"""
+    return minor / KOBO_PER_NAIRA
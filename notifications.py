@@ -0,0 +1,58 @@
+# notifications.py - Rate-limited outbound message queue
+import logging
+import queue
+import threading
+import time
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+class RateLimitedSender:
+    """Sends queued bot calls from one background thread at a bounded rate.
+
+    Telegram allows roughly 30 messages/second overall; bulk jobs (payout
+    runs, broadcasts) enqueue here instead of calling the API in a loop.
+    """
+
+    def __init__(self, per_second: float = 20.0, max_retries: int = 3):
+        self.interval = 1.0 / per_second
+        self.max_retries = max_retries
+        self._queue: 'queue.Queue' = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.sent = 0
+        self.failed = 0
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='rate-limited-sender', daemon=True)
+                self._thread.start()
+
+    def enqueue(self, func: Callable, *args, **kwargs):
+        """Queue a bot API call such as bot.send_message(chat_id, text)"""
+        self._queue.put((func, args, kwargs, 0))
+        self._ensure_started()
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def _run(self):
+        while True:
+            func, args, kwargs, attempt = self._queue.get()
+            try:
+                func(*args, **kwargs)
+                self.sent += 1
+            except Exception as e:
+                # Flood control: honour Telegram's retry_after, then requeue
+                if getattr(e, 'error_code', None) == 429 and attempt < self.max_retries:
+                    retry_after = (getattr(e, 'result_json', None) or {}).get('parameters', {}).get('retry_after', 1)
+                    logger.warning(f"Rate limited by Telegram, retrying in {retry_after}s")
+                    time.sleep(retry_after)
+                    self._queue.put((func, args, kwargs, attempt + 1))
+                else:
+                    self.failed += 1
+                    logger.error(f"Queued notification failed: {e}")
+            finally:
+                self._queue.task_done()
+            time.sleep(self.interval)
@@ -0,0 +1,118 @@
+# pop_store.py - Perceptual hashing and near-duplicate lookup for payment proofs
+import io
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Proofs within this Hamming distance are reported as possible duplicates
+MAX_DISTANCE = 5
+
+# Bit widths of the hash bands; with MAX_DISTANCE + 1 bands, any hash within
+# MAX_DISTANCE of another shares at least one band exactly (pigeonhole)
+BAND_WIDTHS = (11, 11, 11, 11, 10, 10)
+
+def dhash(image_bytes: bytes, size: int = 8) -> Optional[int]:
+    """64-bit difference hash of an image, or None if it can't be decoded (e.g. PDFs)"""
+    # Imported here so the bot still starts without Pillow
+    from PIL import Image
+
+    try:
+        img = Image.open(io.BytesIO(image_bytes)).convert('L').resize((size + 1, size), Image.LANCZOS)
+    except Exception as e:
+        logger.info(f"POP is not a decodable image: {e}")
+        return None
+
+    pixels = list(img.getdata())
+    value = 0
+    for row in range(size):
+        for col in range(size):
+            left = pixels[row * (size + 1) + col]
+            right = pixels[row * (size + 1) + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+def _bands(value: int) -> List[Tuple[int, int]]:
+    """(band index, band bits) pairs for a hash"""
+    bands = []
+    shift = 0
+    for i, width in enumerate(BAND_WIDTHS):
+        bands.append((i, (value >> shift) & ((1 << width) - 1)))
+        shift += width
+    return bands
+
+class PopHashIndex:
+    """Multi-index hash table for Hamming-distance lookups.
+
+    Each hash is filed under each of its bands, so a lookup only compares
+    against proofs sharing a band: a few dict probes plus a popcount per
+    candidate, rather than a scan of every stored proof.
+    """
+
+    def __init__(self):
+        self._hashes: Dict[Hashable, int] = {}
+        self._tables: List[Dict[int, List[Hashable]]] = [{} for _ in BAND_WIDTHS]
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._hashes)
+
+    def add(self, ref: Hashable, value: int):
+        with self._lock:
+            if ref in self._hashes:
+                return
+            self._hashes[ref] = value
+            for i, band in _bands(value):
+                self._tables[i].setdefault(band, []).append(ref)
+
+    def find(self, value: int, max_distance: int = MAX_DISTANCE) -> List[Tuple[int, Hashable]]:
+        """(distance, ref) for stored proofs within max_distance, closest first"""
+        with self._lock:
+            candidates = set()
+            for i, band in _bands(value):
+                candidates.update(self._tables[i].get(band, ()))
+            hashes = self._hashes
+            matches = [((hashes[ref] ^ value).bit_count(), ref) for ref in candidates]
+        return sorted(match for match in matches if match[0] <= max_distance)
+
+class PopStore:
+    """Downloads and hashes proofs on a small pool so upload handlers never wait.
+
+    `fetch(file_id) -> bytes` downloads a proof. Results are reported through
+    the `on_done(phash, duplicates)` callback given to submit().
+    """
+
+    def __init__(self, fetch: Callable[[str], bytes], max_workers: int = 2):
+        self.fetch = fetch
+        self.index = PopHashIndex()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='pop')
+
+    def load(self, entries: List[Tuple[Hashable, int]]):
+        """Index previously stored (ref, hash) pairs"""
+        for ref, value in entries:
+            self.index.add(ref, value)
+
+    def submit(self, ref: Hashable, file_id: str,
+               on_done: Callable[[Optional[int], List[Tuple[int, Hashable]]], None]):
+        """Hash a proof in the background, then index it and report near-duplicates"""
+        self._executor.submit(self._run, ref, file_id, on_done)
+
+    def _run(self, ref: Hashable, file_id: str, on_done: Callable):
+        phash, duplicates = None, []
+        try:
+            phash = dhash(self.fetch(file_id))
+            if phash is not None:
+                duplicates = [(d, other) for d, other in self.index.find(phash) if other != ref]
+                self.index.add(ref, phash)
+        except Exception as e:
+            logger.error(f"Error hashing POP {ref}: {e}")
+
+        try:
+            on_done(phash, duplicates)
+        except Exception as e:
+            logger.error(f"Error delivering POP check for {ref}: {e}")
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,145 @@
+# reconciliation.py - Diff group memberships against active subscriptions and queue the fixes
+import bisect
+import functools
+import logging
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from membership import STATUS_STATES
+
+logger = logging.getLogger(__name__)
+
+# Unknown users checked with get_chat_member per group per run
+VERIFY_BATCH = 100
+
+# Pause between get_chat_member calls (seconds)
+VERIFY_PAUSE = 0.05
+
+# Removals queued per group per run; the rest wait for the next run
+MAX_REVOKES = 50
+
+# A group: (key, chat_id, chat_name, shared invite link, entitled user ids)
+Group = Tuple[str, int, str, Optional[str], Iterable[int]]
+
+def diff_memberships(entitled: Sequence[int], known: Dict[int, Dict]) -> Tuple[List[int], List[int], List[int]]:
+    """Merge-walk sorted entitled ids against the known members.
+
+    Returns (grant, revoke, verify):
+    - grant: entitled but removed by the bot ('revoked'; admin bans are left alone)
+    - revoke: known members without an active subscription
+    - verify: entitled users never seen, or invited users no longer entitled
+    """
+    grant, revoke, verify = [], [], []
+    known_ids = sorted(known)
+    i = j = 0
+    while i < len(entitled) or j < len(known_ids):
+        if j == len(known_ids) or (i < len(entitled) and entitled[i] < known_ids[j]):
+            verify.append(entitled[i])
+            i += 1
+        elif i == len(entitled) or known_ids[j] < entitled[i]:
+            state = known[known_ids[j]].get('state')
+            if state == 'member':
+                revoke.append(known_ids[j])
+            elif state == 'invited':
+                verify.append(known_ids[j])
+            j += 1
+        else:
+            if known[known_ids[j]].get('state') == 'revoked':
+                grant.append(entitled[i])
+            i += 1
+            j += 1
+    verify.sort()
+    return grant, revoke, verify
+
+class MembershipReconciler:
+    """Keeps group members in line with the subscription records.
+
+    The Bot API can't list a group's members, so the local membership
+    table in `store` (filled by grants, removals and chat_member updates)
+    is diffed against the entitled users. Users the table doesn't know
+    are checked with get_chat_member, VERIFY_BATCH per run, continuing
+    from a per-group checkpoint so large groups are covered over several
+    runs. Fixes are queued on `membership` (a MembershipService).
+    """
+
+    def __init__(self, bot, store, membership, exempt: Iterable[int] = (),
+                 verify_batch: int = VERIFY_BATCH, max_revokes: int = MAX_REVOKES,
+                 on_granted: Optional[Callable[[int, List[Dict]], None]] = None):
+        self.bot = bot
+        self.store = store
+        self.membership = membership
+        self.exempt = set(exempt)
+        self.verify_batch = verify_batch
+        self.max_revokes = max_revokes
+        self.on_granted = on_granted
+
+    def _verify(self, key: str, chat_id: int, candidates: List[int]) -> Dict[int, str]:
+        """get_chat_member for the next batch after the checkpoint; returns user id -> state"""
+        checkpoint = self.store.get_reconcile_checkpoint(key) or 0
+        start = bisect.bisect_right(candidates, checkpoint)
+        batch = candidates[start:start + self.verify_batch]
+
+        states = {}
+        for user_id in batch:
+            try:
+                status = self.bot.get_chat_member(chat_id, user_id).status
+                states[user_id] = STATUS_STATES.get(status, 'left')
+            except Exception as e:
+                if 'user not found' in str(e).lower() or 'PARTICIPANT_ID_INVALID' in str(e):
+                    states[user_id] = 'left'
+                else:
+                    logger.warning(f"Could not check user {user_id} in {key}: {e}")
+                    continue
+            self.store.set_membership(chat_id, user_id, states[user_id])
+            time.sleep(VERIFY_PAUSE)
+
+        # Back to the start once the end is reached
+        checkpoint_after = 0 if start + len(batch) >= len(candidates) else batch[-1]
+        if checkpoint_after != checkpoint:
+            self.store.set_reconcile_checkpoint(key, checkpoint_after)
+        return states
+
+    def reconcile_group(self, key: str, chat_id: int, chat_name: str, invite_link: Optional[str],
+                        entitled_ids: Iterable[int]) -> Dict:
+        entitled = sorted(set(entitled_ids) - self.exempt)
+        known = {
+            user_id: record for user_id, record in self.store.get_chat_memberships(chat_id).items()
+            if user_id not in self.exempt and record.get('state') != 'admin'
+        }
+        grant, revoke, verify = diff_memberships(entitled, known)
+
+        entitled_set = set(entitled)
+        verified = self._verify(key, chat_id, verify)
+        # A ban seen through get_chat_member could be an admin's, so it is never re-granted
+        for user_id, state in verified.items():
+            if user_id not in entitled_set and state == 'member':
+                revoke.append(user_id)
+
+        for user_id in grant:
+            on_done = functools.partial(self.on_granted, user_id) if self.on_granted else None
+            self.membership.grant(user_id, [(chat_id, chat_name, invite_link)], on_done)
+        for user_id in revoke[:self.max_revokes]:
+            self.membership.revoke(user_id, [(chat_id, chat_name)])
+
+        summary = {
+            'entitled': len(entitled),
+            'known': len(known),
+            'granted': len(grant),
+            'revoked': min(len(revoke), self.max_revokes),
+            'revokes_deferred': max(len(revoke) - self.max_revokes, 0),
+            'checked': len(verified),
+            'unknown': len(verify)
+        }
+        logger.info(f"Reconciled {chat_name}: {summary}")
+        return summary
+
+    def run(self, groups: Iterable[Group]) -> Dict[str, Dict]:
+        """Reconcile every group; {chat name: summary}"""
+        report = {}
+        for key, chat_id, chat_name, invite_link, entitled_ids in groups:
+            try:
+                report[chat_name] = self.reconcile_group(key, chat_id, chat_name, invite_link, entitled_ids)
+            except Exception as e:
+                logger.error(f"Error reconciling {chat_name}: {e}")
+                report[chat_name] = {'error': str(e)}
+        return report
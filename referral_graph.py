@@ -0,0 +1,105 @@
+# referral_graph.py - Who-referred-whom graph with upline/downline queries
+import threading
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Tuple
+
+class ReferralGraph:
+    """Referral tree stored as adjacency in both directions.
+
+    `_parent` maps a user to their referrer and `_children` maps a referrer
+    to an insertion-ordered dict of referred users, so direct referrals are
+    O(degree) and upline walks are O(depth). A user has at most one referrer.
+    """
+
+    def __init__(self):
+        self._parent: Dict[int, int] = {}
+        self._children: Dict[int, Dict[int, None]] = {}
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._parent)
+
+    # ====================
+    # MAINTENANCE
+    # ====================
+
+    def _creates_cycle(self, referrer_id: int, user_id: int) -> bool:
+        node = referrer_id
+        while node is not None:
+            if node == user_id:
+                return True
+            node = self._parent.get(node)
+        return False
+
+    def link(self, referrer_id: int, user_id: int) -> Tuple[bool, Optional[int]]:
+        """Attach user under referrer, moving them if already attached elsewhere.
+
+        Returns (linked, previous_referrer). Self-referrals and links that would
+        make a user their own upline are refused.
+        """
+        referrer_id, user_id = int(referrer_id), int(user_id)
+        with self._lock:
+            previous = self._parent.get(user_id)
+            if previous == referrer_id:
+                return True, previous
+            if self._creates_cycle(referrer_id, user_id):
+                return False, previous
+
+            if previous is not None:
+                self._children.get(previous, {}).pop(user_id, None)
+            self._parent[user_id] = referrer_id
+            self._children.setdefault(referrer_id, {})[user_id] = None
+            return True, previous
+
+    def build(self, edges: Iterable[Tuple[int, int]]):
+        """Bulk load (referrer_id, user_id) pairs; later pairs win for the same user"""
+        with self._lock:
+            self._parent = {}
+            self._children = {}
+            for referrer_id, user_id in edges:
+                self.link(referrer_id, user_id)
+
+    # ====================
+    # QUERIES
+    # ====================
+
+    def referrer(self, user_id: int) -> Optional[int]:
+        with self._lock:
+            return self._parent.get(int(user_id))
+
+    def direct(self, referrer_id: int) -> List[int]:
+        """Users referred directly, in the order they were linked"""
+        with self._lock:
+            return list(self._children.get(int(referrer_id), {}))
+
+    def degree(self, referrer_id: int) -> int:
+        with self._lock:
+            return len(self._children.get(int(referrer_id), {}))
+
+    def upline(self, user_id: int, max_levels: int = None) -> List[int]:
+        """Referrer, referrer's referrer, ... (nearest first)"""
+        chain = []
+        with self._lock:
+            node = self._parent.get(int(user_id))
+            while node is not None and (max_levels is None or len(chain) < max_levels):
+                chain.append(node)
+                node = self._parent.get(node)
+        return chain
+
+    def depth(self, user_id: int) -> int:
+        """Number of referrers above a user (0 for users nobody referred)"""
+        return len(self.upline(user_id))
+
+    def level_counts(self, referrer_id: int, max_depth: int = 3) -> Dict[int, int]:
+        """Downline size per level: {1: direct referrals, 2: their referrals, ...}"""
+        counts: Dict[int, int] = {}
+        with self._lock:
+            frontier = deque([(int(referrer_id), 0)])
+            while frontier:
+                node, level = frontier.popleft()
+                if level == max_depth:
+                    continue
+                for child in self._children.get(node, {}):
+                    counts[level + 1] = counts.get(level + 1, 0) + 1
+                    frontier.append((child, level + 1))
+        return counts
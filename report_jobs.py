@@ -0,0 +1,85 @@
+# report_jobs.py - Bounded worker pool for heavy admin reports
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+class ReportJobQueue:
+    """Runs report builders off the bot's update threads.
+
+    Identical in-flight jobs (same key) are coalesced into one computation
+    whose result is handed to every waiter, and finished results are cached
+    for `ttl_seconds`.
+    """
+
+    def __init__(self, max_workers: int = 2, ttl_seconds: int = 30):
+        self.ttl_seconds = ttl_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='report')
+        self._lock = threading.Lock()
+        self._cache: Dict[Hashable, Tuple[float, Any]] = {}
+        self._waiters: Dict[Hashable, List[Tuple[Callable, Optional[Callable]]]] = {}
+
+    def submit(self, key: Hashable, build: Callable[[], Any],
+               deliver: Callable[[Any], None], on_error: Callable[[Exception], None] = None) -> str:
+        """Queue a report. Returns 'cached', 'joined' or 'queued'"""
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached and time.time() - cached[0] < self.ttl_seconds:
+                result = cached[1]
+                status = 'cached'
+            else:
+                self._cache.pop(key, None)
+                waiters = self._waiters.get(key)
+                if waiters is not None:
+                    waiters.append((deliver, on_error))
+                    return 'joined'
+                self._waiters[key] = [(deliver, on_error)]
+                status = 'queued'
+
+        if status == 'cached':
+            # Delivery still happens on the pool so callers never block on Telegram
+            self._executor.submit(self._safe_call, deliver, result)
+        else:
+            self._executor.submit(self._run, key, build)
+        return status
+
+    def _run(self, key: Hashable, build: Callable[[], Any]):
+        started = time.time()
+        try:
+            result = build()
+            error = None
+        except Exception as e:
+            logger.error(f"Report job {key} failed: {e}")
+            result, error = None, e
+
+        with self._lock:
+            waiters = self._waiters.pop(key, [])
+            if error is None:
+                self._cache[key] = (time.time(), result)
+                self._evict_expired()
+
+        logger.info(f"Report job {key} finished in {time.time() - started:.2f}s for {len(waiters)} waiter(s)")
+        for deliver, on_error in waiters:
+            if error is None:
+                self._safe_call(deliver, result)
+            elif on_error:
+                self._safe_call(on_error, error)
+
+    def _evict_expired(self):
+        now = time.time()
+        for key in [k for k, (ts, _) in self._cache.items() if now - ts >= self.ttl_seconds]:
+            del self._cache[key]
+
+    @staticmethod
+    def _safe_call(func: Callable, arg: Any):
+        try:
+            func(arg)
+        except Exception as e:
+            logger.error(f"Error delivering report: {e}")
+
+    def shutdown(self):
+        """Stop accepting jobs and let running ones finish"""
+        self._executor.shutdown(wait=False)
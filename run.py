@@ -0,0 +1,7 @@
+# run.py - Process entry point for the bot defined in main.py
+# Chart render workers are spawned and re-import this script, so main is only
+# imported under the guard: workers then load charts.py alone.
+
+if __name__ == "__main__":
+    import main
+    main.run()
@@ -0,0 +1,172 @@
+# search_index.py - In-memory inverted/prefix index for admin user lookup
+import bisect
+import heapq
+import re
+import threading
+from typing import Dict, List, Tuple
+
+# Field weights used for ranking (exact token matches score full weight,
+# prefix matches score half)
+FIELD_WEIGHTS = {
+    'tg_id': 100,
+    'payout_id': 80,
+    'affiliate_code': 60,
+    'username': 40,
+    'name': 20
+}
+
+# Upper bound on index tokens a single query prefix may expand to
+MAX_PREFIX_EXPANSION = 500
+
+TOKEN_RE = re.compile(r'\w+')
+
+def tokenize(text) -> List[str]:
+    """Lowercase word tokens (underscores kept, so payout ids stay whole)"""
+    if text is None:
+        return []
+    return TOKEN_RE.findall(str(text).lower())
+
+class UserSearchIndex:
+    """Inverted index: token -> {user_id: weight}, plus a sorted token list for prefix scans"""
+
+    def __init__(self):
+        self._postings: Dict[str, Dict[int, int]] = {}
+        self._tokens: List[str] = []
+        self._user_tokens: Dict[int, Dict[str, int]] = {}
+        self._payout_tokens: Dict[int, Dict[str, int]] = {}
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._user_tokens)
+
+    # ====================
+    # MAINTENANCE
+    # ====================
+
+    def _add_posting(self, token: str, user_id: int, weight: int):
+        postings = self._postings.get(token)
+        if postings is None:
+            postings = self._postings[token] = {}
+            bisect.insort(self._tokens, token)
+        postings[user_id] = weight
+
+    def _remove_posting(self, token: str, user_id: int):
+        postings = self._postings.get(token)
+        if postings is None:
+            return
+        postings.pop(user_id, None)
+        if not postings:
+            del self._postings[token]
+            i = bisect.bisect_left(self._tokens, token)
+            if i < len(self._tokens) and self._tokens[i] == token:
+                del self._tokens[i]
+
+    @staticmethod
+    def _user_field_tokens(user_id: int, user: Dict) -> Dict[str, int]:
+        tokens: Dict[str, int] = {}
+        fields = {
+            'tg_id': user_id,
+            'name': user.get('name'),
+            'username': user.get('username'),
+            'affiliate_code': user.get('affiliate_code')
+        }
+        for field, value in fields.items():
+            for token in tokenize(value):
+                tokens[token] = max(tokens.get(token, 0), FIELD_WEIGHTS[field])
+        return tokens
+
+    def build(self, users: Dict[str, Dict], payouts: List[Tuple[int, str]]):
+        """Bulk (re)build from all users and (user_id, payout_id) pairs; sorts tokens once"""
+        postings: Dict[str, Dict[int, int]] = {}
+        user_tokens: Dict[int, Dict[str, int]] = {}
+        payout_tokens: Dict[int, Dict[str, int]] = {}
+
+        for user_id_str, user in users.items():
+            user_id = int(user_id_str)
+            tokens = user_tokens[user_id] = self._user_field_tokens(user_id, user)
+            for token, weight in tokens.items():
+                postings.setdefault(token, {})[user_id] = weight
+
+        weight = FIELD_WEIGHTS['payout_id']
+        for user_id, payout_id in payouts:
+            user_id = int(user_id)
+            for token in tokenize(payout_id):
+                payout_tokens.setdefault(user_id, {})[token] = weight
+                token_postings = postings.setdefault(token, {})
+                token_postings[user_id] = max(weight, token_postings.get(user_id, 0))
+
+        with self._lock:
+            self._postings = postings
+            self._tokens = sorted(postings)
+            self._user_tokens = user_tokens
+            self._payout_tokens = payout_tokens
+
+    def index_user(self, user_id: int, user: Dict):
+        """(Re)index the searchable fields of one user record"""
+        user_id = int(user_id)
+        tokens = self._user_field_tokens(user_id, user)
+
+        with self._lock:
+            old_tokens = self._user_tokens.get(user_id, {})
+            payout_tokens = self._payout_tokens.get(user_id, {})
+            for token in old_tokens:
+                if token not in tokens and token not in payout_tokens:
+                    self._remove_posting(token, user_id)
+            for token, weight in tokens.items():
+                self._add_posting(token, user_id, max(weight, payout_tokens.get(token, 0)))
+            self._user_tokens[user_id] = tokens
+
+    def index_payout(self, user_id: int, payout_id: str):
+        """Make a payout id resolve to its affiliate"""
+        user_id = int(user_id)
+        weight = FIELD_WEIGHTS['payout_id']
+        with self._lock:
+            payout_tokens = self._payout_tokens.setdefault(user_id, {})
+            user_tokens = self._user_tokens.get(user_id, {})
+            for token in tokenize(payout_id):
+                payout_tokens[token] = weight
+                self._add_posting(token, user_id, max(weight, user_tokens.get(token, 0)))
+
+    # ====================
+    # QUERIES
+    # ====================
+
+    def _expand(self, query_token: str) -> List[Tuple[str, bool]]:
+        """Index tokens matching a query token as (token, is_exact)"""
+        matches = []
+        start = bisect.bisect_left(self._tokens, query_token)
+        for token in self._tokens[start:start + MAX_PREFIX_EXPANSION]:
+            if not token.startswith(query_token):
+                break
+            matches.append((token, token == query_token))
+        return matches
+
+    def search(self, query: str, limit: int = 200) -> List[Tuple[int, float]]:
+        """Ranked (user_id, score) matches; every query token must match as a prefix"""
+        query_tokens = tokenize(query.lstrip('@'))
+        if not query_tokens:
+            return []
+
+        with self._lock:
+            scores: Dict[int, float] = None
+            for query_token in query_tokens:
+                token_scores: Dict[int, float] = {}
+                for token, exact in self._expand(query_token):
+                    factor = 1.0 if exact else 0.5
+                    for user_id, weight in self._postings[token].items():
+                        score = weight * factor
+                        if score > token_scores.get(user_id, 0):
+                            token_scores[user_id] = score
+
+                if scores is None:
+                    scores = token_scores
+                else:
+                    scores = {
+                        user_id: score + token_scores[user_id]
+                        for user_id, score in scores.items()
+                        if user_id in token_scores
+                    }
+                if not scores:
+                    return []
+
+        return heapq.nsmallest(limit, scores.items(), key=lambda item: (-item[1], item[0]))
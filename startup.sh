@@ -18,4 +18,4 @@ if [ -f "database_recovery.py" ]; then
 fi
 
 # Start the bot
-python main.py
\ No newline at end of file
+python run.py
\ No newline at end of file
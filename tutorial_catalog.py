@@ -0,0 +1,210 @@
+# tutorial_catalog.py - Hot-reloadable tutorial library with id/category indexes and text search
+import bisect
+import heapq
+import json
+import logging
+import math
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from search_index import tokenize
+
+logger = logging.getLogger(__name__)
+
+# Tutorials per category page
+PER_PAGE = 5
+
+# How often (seconds) the data file is stat'ed for changes
+RELOAD_CHECK_SECONDS = 10
+
+# Search ranking: a query word matching the title counts most
+FIELD_WEIGHTS = {
+    'title': 3.0,
+    'category': 2.0,
+    'description': 1.0
+}
+
+# Upper bound on index words a single query prefix may expand to
+MAX_PREFIX_EXPANSION = 200
+
+class CatalogIndex:
+    """One immutable build of the catalog; readers never see a half-loaded library"""
+
+    def __init__(self, categories: Dict[str, str], tutorials: List[Dict], per_page: int = PER_PAGE):
+        self.categories = dict(categories)
+        self.tutorials = tutorials
+        self.by_id: Dict[int, Dict] = {}
+        self.by_category: Dict[str, List[Dict]] = {}
+        for tutorial in tutorials:
+            self.by_id[tutorial['id']] = tutorial
+            self.by_category.setdefault(tutorial['category'], []).append(tutorial)
+
+        self.pages: Dict[str, List[List[Dict]]] = {
+            category: [items[i:i + per_page] for i in range(0, len(items), per_page)]
+            for category, items in self.by_category.items()
+        }
+
+        # word -> {tutorial id: field weight}, plus idf per word
+        postings: Dict[str, Dict[int, float]] = {}
+        for tutorial in tutorials:
+            fields = {
+                'title': tutorial.get('title'),
+                'category': self.categories.get(tutorial['category'], tutorial['category']),
+                'description': tutorial.get('description')
+            }
+            for field, value in fields.items():
+                for word in tokenize(value):
+                    weights = postings.setdefault(word, {})
+                    weights[tutorial['id']] = max(weights.get(tutorial['id'], 0.0), FIELD_WEIGHTS[field])
+
+        total = max(len(tutorials), 1)
+        self.postings = postings
+        self.idf = {word: math.log(1 + total / len(ids)) for word, ids in postings.items()}
+        self.words = sorted(postings)
+
+    def _expand(self, query_word: str) -> List[Tuple[str, bool]]:
+        """Index words matching a query word as (word, is_exact)"""
+        matches = []
+        start = bisect.bisect_left(self.words, query_word)
+        for word in self.words[start:start + MAX_PREFIX_EXPANSION]:
+            if not word.startswith(query_word):
+                break
+            matches.append((word, word == query_word))
+        return matches
+
+    def search(self, query: str, limit: int) -> List[Dict]:
+        """Tutorials ranked by field-weighted idf over matched query words (prefixes count half)"""
+        scores: Dict[int, float] = {}
+        matched: Dict[int, int] = {}
+        for query_word in dict.fromkeys(tokenize(query)):
+            best: Dict[int, float] = {}
+            for word, exact in self._expand(query_word):
+                factor = self.idf[word] * (1.0 if exact else 0.5)
+                for tutorial_id, weight in self.postings[word].items():
+                    best[tutorial_id] = max(best.get(tutorial_id, 0.0), weight * factor)
+            for tutorial_id, score in best.items():
+                scores[tutorial_id] = scores.get(tutorial_id, 0.0) + score
+                matched[tutorial_id] = matched.get(tutorial_id, 0) + 1
+
+        # Tutorials matching more of the query words rank first
+        ranked = heapq.nsmallest(limit, scores, key=lambda tid: (-matched[tid], -scores[tid], tid))
+        return [self.by_id[tutorial_id] for tutorial_id in ranked]
+
+def load_catalog_file(path: str) -> Tuple[Dict[str, str], List[Dict]]:
+    """Read {"categories": {...}, "tutorials": [...]} and validate the entries"""
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+
+    categories = data.get('categories', {})
+    tutorials = []
+    seen = set()
+    for entry in data.get('tutorials', []):
+        if not entry.get('title') or not entry.get('category') or 'id' not in entry:
+            raise ValueError(f"Tutorial entry missing id/title/category: {entry}")
+        tutorial_id = int(entry['id'])
+        if tutorial_id in seen:
+            raise ValueError(f"Duplicate tutorial id {tutorial_id}")
+        seen.add(tutorial_id)
+        tutorials.append(dict(entry, id=tutorial_id, description=entry.get('description', '')))
+    return categories, tutorials
+
+class TutorialCatalog:
+    """Tutorial library loaded from a JSON data file and reloaded when the file changes.
+
+    A bad edit to the file is logged and the previous catalog kept.
+    `on_reload` callbacks run after each successful reload.
+    """
+
+    def __init__(self, path: str, per_page: int = PER_PAGE, check_seconds: float = RELOAD_CHECK_SECONDS):
+        self.path = path
+        self.per_page = per_page
+        self.check_seconds = check_seconds
+        self._index = CatalogIndex({}, [], per_page)
+        self._signature = None
+        self._next_check = 0.0
+        self._reload_lock = threading.Lock()
+        self._listeners: List[Callable[[], None]] = []
+        self.load()
+
+    def on_reload(self, callback: Callable[[], None]):
+        self._listeners.append(callback)
+
+    def _file_signature(self):
+        stat = os.stat(self.path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def load(self) -> bool:
+        """(Re)build the catalog from the data file"""
+        with self._reload_lock:
+            try:
+                signature = self._file_signature()
+                categories, tutorials = load_catalog_file(self.path)
+                self._index = CatalogIndex(categories, tutorials, self.per_page)
+                self._signature = signature
+            except Exception as e:
+                logger.error(f"Error loading tutorial catalog {self.path}: {e}")
+                return False
+
+        logger.info(f"Tutorial catalog loaded: {len(tutorials)} tutorials in {len(categories)} categories")
+        for callback in self._listeners:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"Error in tutorial catalog reload callback: {e}")
+        return True
+
+    def reload_if_changed(self) -> bool:
+        """Reload if the data file changed since the last load"""
+        try:
+            if self._file_signature() == self._signature:
+                return False
+        except OSError as e:
+            logger.error(f"Tutorial catalog {self.path} unavailable: {e}")
+            return False
+        return self.load()
+
+    def check_for_updates(self):
+        """Reload on a changed data file, stat'ing it at most every check_seconds"""
+        now = time.monotonic()
+        if now >= self._next_check:
+            self._next_check = now + self.check_seconds
+            self.reload_if_changed()
+
+    def _current(self) -> CatalogIndex:
+        self.check_for_updates()
+        return self._index
+
+    # ====================
+    # QUERIES
+    # ====================
+
+    def __len__(self):
+        return len(self._current().tutorials)
+
+    @property
+    def categories(self) -> Dict[str, str]:
+        return self._current().categories
+
+    def category_name(self, category: str) -> str:
+        return self._current().categories.get(category, category.title())
+
+    def all(self) -> List[Dict]:
+        return self._current().tutorials
+
+    def get(self, tutorial_id: int) -> Optional[Dict]:
+        return self._current().by_id.get(tutorial_id)
+
+    def count(self, category: str) -> int:
+        return len(self._current().by_category.get(category, ()))
+
+    def page(self, category: str, page: int) -> Tuple[List[Dict], int, int]:
+        """(tutorials on the page, number of pages, tutorials in the category)"""
+        index = self._current()
+        pages = index.pages.get(category, [])
+        items = pages[page] if 0 <= page < len(pages) else []
+        return items, len(pages), len(index.by_category.get(category, ()))
+
+    def search(self, query: str, limit: int = 10) -> List[Dict]:
+        return self._current().search(query, limit)